@@ -0,0 +1,334 @@
+"""
+Endpoints de administración del servicio de detección de amenazas.
+Requieren una API key de administración (ADMIN_API_KEYS).
+"""
+import asyncio
+import logging
+from typing import Dict, Any, Optional
+
+from fastapi import APIRouter, HTTPException, Depends, Query, status
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+
+# Importaciones locales
+from ..services.ml_service import ml_service
+from ..services.persistence import writer as persistence_writer
+from ..services.profiler import profiler
+from ..services.tracing import tracer
+from ..core.config import settings
+from ..core.security import get_admin_api_key
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Router de administración
+router = APIRouter(
+    prefix="/api/v1/admin",
+    tags=["admin"],
+    dependencies=[Depends(get_admin_api_key)],
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {"description": "API key de administración faltante o inválida"},
+        status.HTTP_403_FORBIDDEN: {"description": "Administración desactivada (ADMIN_API_KEYS vacío)"},
+    },
+)
+
+@router.get(
+    "/cidr",
+    status_code=status.HTTP_200_OK,
+    summary="Estado de las listas CIDR",
+    description="""
+    Devuelve la ruta, el número de reglas, la última carga, el último error y las
+    coincidencias por acción de las listas CIDR de permitidos/bloqueados.
+    """
+)
+async def get_cidr_status() -> Dict[str, Any]:
+    """
+    Obtiene el estado de las listas CIDR.
+    
+    Returns:
+        dict: Estado de la lista
+    """
+    return ml_service.cidr_list.stats()
+
+@router.post(
+    "/cidr/reload",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"description": "Lista no configurada o archivo inválido"},
+    },
+    summary="Recarga las listas CIDR",
+    description="""
+    Vuelve a leer `CIDR_LIST_PATH` y reemplaza el índice de forma atómica, sin
+    reiniciar el servicio. Si el archivo es inválido se conserva el índice anterior.
+    """
+)
+async def reload_cidr_list() -> Dict[str, Any]:
+    """
+    Recarga las listas CIDR desde el archivo configurado.
+    
+    Returns:
+        dict: Estado de la lista tras la recarga
+    """
+    try:
+        return await ml_service.reload_cidr_list()
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"No se pudo recargar la lista CIDR: {str(e)}"
+        )
+
+
+class ModelLoadRequest(BaseModel):
+    """Solicitud de carga de una nueva versión del modelo."""
+    path: str = Field(..., description="Ruta del artefacto .pkl dentro de MODEL_REGISTRY_DIR")
+    version: Optional[str] = Field(None, description="Identificador de la versión (por defecto, nombre y fecha del archivo)")
+    activate: bool = Field(True, description="Activar la versión al terminar el calentamiento")
+
+@router.get(
+    "/models",
+    status_code=status.HTTP_200_OK,
+    summary="Versiones del modelo",
+    description="""
+    Devuelve la versión activa, la anterior y las versiones cargadas en memoria,
+    con la fecha del artefacto y la duración de su calentamiento.
+    """
+)
+async def get_model_versions() -> Dict[str, Any]:
+    """
+    Obtiene el estado del registro de versiones.
+    
+    Returns:
+        dict: Estado del registro
+    """
+    return ml_service.get_registry_stats()
+
+@router.post(
+    "/models/load",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"description": "Ruta no permitida, artefacto inválido o calentamiento fallido"},
+    },
+    summary="Carga una nueva versión del modelo",
+    description="""
+    Carga el artefacto fuera del event loop, valida el ancho de sus características,
+    lo calienta con lotes sintéticos y, si `activate` es verdadero, lo activa con un
+    cambio atómico. Las solicitudes en curso terminan con la versión anterior.
+    """
+)
+async def load_model_version(
+    request: ModelLoadRequest,
+    api_key: str = Depends(get_admin_api_key)
+) -> Dict[str, Any]:
+    """
+    Carga y, opcionalmente, activa una versión del modelo.
+    
+    Args:
+        request: Ruta, versión y activación
+        api_key: API key de administración
+        
+    Returns:
+        dict: Versión cargada y estado del registro
+    """
+    try:
+        entry = await ml_service.load_model_version(request.path, request.version, request.activate)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"loaded": entry.info(), "registry": ml_service.get_registry_stats()}
+
+@router.post(
+    "/models/rollback",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_409_CONFLICT: {"description": "No hay una versión anterior o fue retirada del almacén compartido"},
+    },
+    summary="Vuelve a la versión anterior del modelo",
+    description="Reactiva de inmediato la versión que estaba activa antes del último cambio."
+)
+async def rollback_model(api_key: str = Depends(get_admin_api_key)) -> Dict[str, Any]:
+    """
+    Revierte a la versión anterior del modelo.
+    
+    Args:
+        api_key: API key de administración
+    
+    Returns:
+        dict: Estado del registro
+    """
+    try:
+        await ml_service.rollback_model()
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return ml_service.get_registry_stats()
+
+@router.post(
+    "/models/{version}/activate",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_404_NOT_FOUND: {"description": "Versión no cargada"},
+        status.HTTP_409_CONFLICT: {"description": "Versión retirada del almacén compartido"},
+    },
+    summary="Activa una versión cargada del modelo",
+    description="Cambia de inmediato el modelo activo a una versión ya cargada en memoria."
+)
+async def activate_model_version(version: str, api_key: str = Depends(get_admin_api_key)) -> Dict[str, Any]:
+    """
+    Activa una versión cargada.
+    
+    Args:
+        version: Identificador de la versión
+        api_key: API key de administración
+        
+    Returns:
+        dict: Estado del registro
+    """
+    try:
+        await ml_service.activate_model_version(version)
+    except KeyError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"La versión {version} no está cargada"
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return ml_service.get_registry_stats()
+
+@router.get(
+    "/workers",
+    status_code=status.HTTP_200_OK,
+    summary="Workers del supervisor multiproceso",
+    description="""
+    Devuelve la versión activa del almacén compartido de modelos y el último latido de
+    cada worker (fase de arranque, versión adjuntada, filas predichas y memoria
+    residente/compartida). Un worker sin latido reciente se marca como `stale`.
+    """
+)
+async def get_workers() -> Dict[str, Any]:
+    """
+    Obtiene el estado de los workers que comparten el modelo.
+    
+    Returns:
+        dict: Estado del almacén compartido y de cada worker
+    """
+    return ml_service.get_worker_stats()
+
+@router.post(
+    "/profile",
+    status_code=status.HTTP_200_OK,
+    response_class=PlainTextResponse,
+    responses={
+        status.HTTP_200_OK: {"description": "Pilas muestreadas en formato collapsed", "content": {"text/plain": {}}},
+        status.HTTP_409_CONFLICT: {"description": "Ya hay una sesión de perfilado en curso"},
+    },
+    summary="Perfila el proceso durante unos segundos",
+    description="""
+    Activa un profiler de muestreo sobre todos los hilos del proceso (event loop,
+    ejecutor de inferencia y tareas en segundo plano) y devuelve las pilas en formato
+    collapsed (`hilo;marco;marco muestras`), listo para `flamegraph.pl` o speedscope.
+    El servicio sigue atendiendo solicitudes durante la sesión. Con el supervisor
+    multiproceso se perfila solo el worker que atiende esta solicitud.
+    """
+)
+async def profile_process(
+    seconds: float = Query(10.0, gt=0, description="Duración de la sesión en segundos"),
+    interval_ms: Optional[float] = Query(None, ge=1, description="Intervalo entre muestras (por defecto, PROFILE_INTERVAL_MS)")
+) -> PlainTextResponse:
+    """
+    Muestrea las pilas del proceso y las devuelve en formato collapsed.
+    
+    Args:
+        seconds: Duración de la sesión (como máximo PROFILE_MAX_SECONDS)
+        interval_ms: Intervalo entre muestras
+        
+    Returns:
+        PlainTextResponse: Una línea por pila distinta con su número de muestras
+    """
+    seconds = min(seconds, settings.PROFILE_MAX_SECONDS)
+    try:
+        result = await asyncio.to_thread(
+            profiler.profile,
+            seconds,
+            interval_ms if interval_ms is not None else settings.PROFILE_INTERVAL_MS
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return PlainTextResponse(
+        result.collapsed(),
+        headers={
+            "X-Profile-Samples": str(result.samples),
+            "X-Profile-Seconds": str(result.seconds),
+            "Content-Disposition": 'attachment; filename="profile.collapsed"'
+        }
+    )
+
+
+class TracingConfigRequest(BaseModel):
+    """Cambio de la tasa de muestreo de las trazas."""
+    sample_rate: float = Field(..., ge=0.0, le=1.0, description="Fracción de solicitudes trazadas (0 desactiva)")
+
+@router.get(
+    "/tracing",
+    status_code=status.HTTP_200_OK,
+    summary="Estado de las trazas por solicitud",
+    description="""
+    Devuelve la tasa de muestreo, el archivo de spans (`TRACE_SPANS_PATH`) y los
+    traces creados, escritos y descartados por cola llena.
+    """
+)
+async def get_tracing_status() -> Dict[str, Any]:
+    """
+    Obtiene el estado de las trazas.
+    
+    Returns:
+        dict: Estado del trazador
+    """
+    return tracer.stats()
+
+@router.post(
+    "/tracing",
+    status_code=status.HTTP_200_OK,
+    summary="Cambia la tasa de muestreo de las trazas",
+    description="""
+    Cambia en caliente la fracción de solicitudes HTTP que reciben `Server-Timing`
+    con el desglose por etapa y se escriben en el archivo de spans. Con 0 se
+    desactivan las trazas.
+    """
+)
+async def set_tracing(request: TracingConfigRequest) -> Dict[str, Any]:
+    """
+    Cambia la tasa de muestreo de las trazas.
+    
+    Args:
+        request: Nueva tasa de muestreo
+        
+    Returns:
+        dict: Estado del trazador
+    """
+    tracer.set_sample_rate(request.sample_rate)
+    logger.info(f"Tasa de muestreo de trazas: {request.sample_rate}")
+    return tracer.stats()
+
+@router.get(
+    "/persistence",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_404_NOT_FOUND: {"description": "La persistencia está desactivada"},
+    },
+    summary="Estado de la persistencia de predicciones",
+    description="""
+    Devuelve el destino, la profundidad de la cola y las predicciones escritas,
+    descartadas, desbordadas a disco y reinsertadas, junto con el último error.
+    """
+)
+async def get_persistence_status() -> Dict[str, Any]:
+    """
+    Obtiene el estado de la persistencia.
+    
+    Returns:
+        dict: Métricas del escritor
+    """
+    if persistence_writer is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="La persistencia está desactivada (PERSIST_BACKEND=none)"
+        )
+    return persistence_writer.stats()
@@ -2,8 +2,14 @@
 Endpoints de la API para el servicio de detección de amenazas.
 Implementa el Model Context Protocol (MCP) para estandarizar las operaciones.
 """
+import asyncio
+import json
 import logging
-from typing import Dict, Any, List, Optional
+import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple, Union
 from uuid import uuid4
 from datetime import datetime, timezone
 
@@ -13,25 +19,45 @@ from fastapi import (
     Depends, 
     status,
     Request,
-    Security,
-    BackgroundTasks
+    BackgroundTasks,
+    Body,
+    Query
 )
-from fastapi.security import APIKeyHeader
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
 
 # Importaciones locales
+from ..services.admission import AdmissionRejected, admission, admission_slot, resolve_priority
+from ..services.metrics import STAGE_BACKGROUND, STAGE_SERIALIZATION, STAGE_VALIDATION
+from ..services.incidents import IncidentAggregator
 from ..services.ml_service import ml_service
-from ..schemas.mcp import ModelInput, ModelOutput, ModelMetadata, ThreatLevel, ProtocolType
+from ..services.columnar import (
+    COLUMNAR_MEDIA_TYPE,
+    ColumnarFormatError,
+    decode_columnar_batch,
+    encode_columnar_result
+)
+from ..services.persistence import persist_columnar, persist_outcomes
+from ..services.pcap import PcapFormatError, PcapReader, PcapStats, iter_capture_inputs, score_capture
+from ..services.streaming import LineTooLongError, iter_ndjson_lines, stream_micro_batches
+from ..services.tracing import record_since_start
+from ..schemas.mcp import (
+    ModelInput,
+    ModelOutput,
+    ModelMetadata,
+    ThreatLevel,
+    ProtocolType,
+    BatchAnalysisResponse,
+    BatchItemError
+)
 from ..core.config import settings
+from ..core.security import get_api_key
 
 # Configuración de logging
 logger = logging.getLogger(__name__)
 
-# Configuración de seguridad
-API_KEY_NAME = "X-API-Key"
-api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
-
 # Router principal
 router = APIRouter(
     prefix="/api/v1",
@@ -59,22 +85,44 @@ class ErrorResponse(BaseModel):
     request_id: str = Field(..., description="ID de la solicitud")
     timestamp: datetime = Field(..., description="Marca de tiempo del error")
 
+class TopSourceEntry(BaseModel):
+    """Origen entre los más activos de la ventana consultada."""
+    source_ip: str = Field(..., description="Dirección IP de origen")
+    count: int = Field(..., description="Conexiones estimadas (cota superior)")
+    count_lower_bound: int = Field(..., description="Cota inferior de conexiones según el error del sketch")
+    distinct_ports: Optional[int] = Field(None, description="Puertos de destino distintos estimados")
+    distinct_ports_relative_error: Optional[float] = Field(None, description="Error estándar relativo de distinct_ports")
+
+class TopSourcesResponse(BaseModel):
+    """Modelo de respuesta para el top-K de orígenes."""
+    window_seconds: float = Field(..., description="Ventana consultada en segundos")
+    epoch_seconds: float = Field(..., description="Granularidad temporal de los sketches")
+    total: int = Field(..., description="Conexiones registradas en la ventana")
+    error_bound: int = Field(..., description="Sobreestimación máxima de cada conteo")
+    error_probability: float = Field(..., description="Probabilidad de superar error_bound")
+    sources: List[TopSourceEntry] = Field(default_factory=list, description="Orígenes más activos")
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    Respuesta en streaming que se envía mientras se sigue leyendo el cuerpo.
+    
+    ``StreamingResponse`` detecta la desconexión del cliente leyendo mensajes de
+    ``receive`` en paralelo, lo que descartaría los fragmentos del cuerpo que el
+    endpoint todavía está consumiendo. Aquí la desconexión se detecta al leer el
+    cuerpo (``ClientDisconnect``) o al enviar.
+    """
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
 # Variables globales
 STARTUP_TIME = datetime.now(timezone.utc)
 
-# Dependencias de autenticación
-def get_api_key(api_key_header: str = Security(api_key_header)) -> str:
-    """Valida la API key proporcionada en el header."""
-    if settings.ENVIRONMENT == "development" and not settings.API_KEYS:
-        return "dev-key"
-        
-    if not api_key_header or api_key_header not in settings.API_KEYS.values():
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="API key inválida o faltante"
-        )
-    return api_key_header
-
 # Endpoints
 @router.post(
     "/analyze",
@@ -84,6 +132,7 @@ def get_api_key(api_key_header: str = Security(api_key_header)) -> str:
         status.HTTP_200_OK: {"description": "Análisis completado exitosamente"},
         status.HTTP_400_BAD_REQUEST: {"description": "Datos de entrada inválidos"},
         status.HTTP_422_UNPROCESSABLE_ENTITY: {"description": "Error de validación de datos"},
+        status.HTTP_503_SERVICE_UNAVAILABLE: {"description": "Sobrecarga: rechazada por el control de admisión (con Retry-After)"},
     },
     summary="Analiza una solicitud de red en busca de amenazas",
     description="""
@@ -111,7 +160,7 @@ async def analyze_threat(
     input_data: ModelInput,
     background_tasks: BackgroundTasks,
     api_key: str = Depends(get_api_key)
-) -> ModelOutput:
+) -> Response:
     """
     Analiza una solicitud de red en busca de patrones de amenaza.
     
@@ -122,32 +171,39 @@ async def analyze_threat(
         api_key: API key del cliente
         
     Returns:
-        ModelOutput: Resultado del análisis con predicción y metadatos
+        Response: ModelOutput serializado con el resultado del análisis
     """
+    # Lectura del cuerpo, validación de ModelInput y dependencias (solo en solicitudes trazadas)
+    record_since_start("parse")
+    
     # Registrar la solicitud
     request_id = request.headers.get("X-Request-ID", str(uuid4()))
     logger.info(f"Nueva solicitud de análisis - ID: {request_id}")
+    start_ns = time.perf_counter_ns()
     
     try:
         # Validar y procesar la solicitud
         if not input_data.request_id:
             input_data.request_id = request_id
-            
-        # Registrar la tarea en segundo plano (ejemplo: para análisis posteriores)
-        background_tasks.add_task(
-            log_analysis_request,
-            request_id=request_id,
-            client_ip=request.client.host if request.client else "unknown",
-            input_data=input_data
-        )
         
-        # Procesar la solicitud
-        result = await ml_service.analyze_threat(input_data)
+        # Procesar la solicitud con un cupo del control de admisión
+        async with _admitted(request, api_key) as degraded:
+            result = await ml_service.analyze_threat(input_data, rules_only=degraded)
         
         # Registrar resultado exitoso
         logger.info(f"Análisis completado - ID: {request_id}, Predicción: {result.prediction}")
         
-        return result
+        # Registro y persistencia después de enviar la respuesta
+        background_tasks.add_task(
+            log_analysis_request,
+            request_id=request_id,
+            client_ip=_client_ip(request),
+            input_data=input_data,
+            output=result,
+            latency_ms=(time.perf_counter_ns() - start_ns) / 1e6
+        )
+        
+        return _json_response(result)
         
     except HTTPException:
         # Re-lanzar excepciones HTTP existentes
@@ -157,6 +213,7 @@ async def analyze_threat(
         # Registrar el error
         error_msg = f"Error al procesar la solicitud: {str(e)}"
         logger.error(f"{error_msg} - ID: {request_id}", exc_info=True)
+        persist_outcomes([input_data], [e], _client_ip(request), (time.perf_counter_ns() - start_ns) / 1e6)
         
         # Devolver error 500 con formato estándar
         raise HTTPException(
@@ -164,6 +221,321 @@ async def analyze_threat(
             detail=error_msg
         )
 
+@router.post(
+    "/analyze/batch",
+    response_model=BatchAnalysisResponse,
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_200_OK: {"description": "Lote procesado; los errores se reportan por registro"},
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: {"description": "El lote supera el máximo de registros permitido"},
+        status.HTTP_503_SERVICE_UNAVAILABLE: {"description": "Sobrecarga: rechazada por el control de admisión (con Retry-After)"},
+    },
+    summary="Analiza un lote de solicitudes de red",
+    description="""
+    Analiza una lista de registros `ModelInput` construyendo una única matriz de
+    características. El modelo se invoca una vez por bloque de `MODEL_BATCH_SIZE`
+    filas. Los registros inválidos se reportan en `errors` sin afectar al resto;
+    los resultados incluyen `metadata.batch_index` con su posición en el lote.
+    Si un registro no trae `request_id`, se genera uno a partir del ID del lote.
+    """
+)
+async def analyze_batch(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    records: List[Any] = Body(..., description="Lista de registros ModelInput"),
+    api_key: str = Depends(get_api_key)
+) -> Response:
+    """
+    Analiza un lote de solicitudes de red en busca de patrones de amenaza.
+    
+    Args:
+        request: Objeto de solicitud HTTP
+        background_tasks: Tareas en segundo plano
+        records: Registros sin validar; cada uno se valida de forma independiente
+        api_key: API key del cliente
+        
+    Returns:
+        Response: BatchAnalysisResponse serializado con resultados y errores por registro
+    """
+    record_since_start("parse")
+    request_id = request.headers.get("X-Request-ID", str(uuid4()))
+    logger.info(f"Nueva solicitud de análisis por lotes - ID: {request_id}, registros: {len(records)}")
+    
+    if len(records) > settings.MODEL_MAX_BATCH_RECORDS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"El lote excede el máximo de {settings.MODEL_MAX_BATCH_RECORDS} registros"
+        )
+    
+    start_ns = time.perf_counter_ns()
+    errors: List[BatchItemError] = []
+    inputs: List[ModelInput] = []
+    positions: List[int] = []
+    
+    # Validar cada registro por separado para no invalidar el lote completo
+    for index, record in enumerate(records):
+        validated = _validate_record(record, index, request_id)
+        if isinstance(validated, ModelInput):
+            inputs.append(validated)
+            positions.append(index)
+        else:
+            errors.append(validated)
+    STAGE_VALIDATION.observe_ns(time.perf_counter_ns() - start_ns)
+    
+    async with _admitted(request, api_key) as degraded:
+        try:
+            outcomes = await ml_service.analyze_batch(inputs, rules_only=degraded)
+        except Exception as e:
+            error_msg = f"Error al procesar el lote: {str(e)}"
+            logger.error(f"{error_msg} - ID: {request_id}", exc_info=True)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=error_msg
+            )
+    
+    results: List[ModelOutput] = []
+    for index, input_data, outcome in zip(positions, inputs, outcomes):
+        if isinstance(outcome, ModelOutput):
+            outcome.metadata["batch_index"] = index
+            results.append(outcome)
+        else:
+            errors.append(BatchItemError(
+                index=index,
+                request_id=input_data.request_id,
+                error=str(outcome)
+            ))
+    errors.sort(key=lambda item: item.index)
+    
+    elapsed_ms = (time.perf_counter_ns() - start_ns) / 1e6
+    background_tasks.add_task(
+        log_batch_request,
+        request_id=request_id,
+        client_ip=_client_ip(request),
+        total=len(records),
+        failed=len(errors),
+        inputs=inputs,
+        outcomes=outcomes,
+        latency_ms=elapsed_ms
+    )
+    
+    logger.info(f"Lote completado - ID: {request_id}, correctos: {len(results)}, errores: {len(errors)}")
+    
+    return _json_response(BatchAnalysisResponse(
+        results=results,
+        errors=errors,
+        total=len(records),
+        succeeded=len(results),
+        failed=len(errors),
+        metadata={
+            "batch_id": request_id,
+            "batch_size": settings.MODEL_BATCH_SIZE,
+            "processing_time_ms": elapsed_ms,
+            **({"degraded": True} if degraded else {})
+        }
+    ))
+
+@router.post(
+    "/analyze/columnar",
+    status_code=status.HTTP_200_OK,
+    response_class=Response,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Resultado columnar: confianza, predicción, nivel de riesgo y estado por fila",
+            "content": {COLUMNAR_MEDIA_TYPE: {}}
+        },
+        status.HTTP_400_BAD_REQUEST: {"description": "El cuerpo no es un lote columnar válido"},
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: {"description": "El lote supera el máximo de registros permitido"},
+        status.HTTP_503_SERVICE_UNAVAILABLE: {"description": "Sobrecarga: rechazada por el control de admisión (con Retry-After)"},
+    },
+    summary="Analiza un lote binario columnar",
+    description=f"""
+    Analiza un lote en el formato binario columnar (`{COLUMNAR_MEDIA_TYPE}`):
+    una cabecera de 32 bytes seguida de columnas little-endian de ancho fijo (IPs,
+    puertos, protocolo, tamaño del payload y banderas como máscara de bits). Las
+    columnas se leen con `numpy.frombuffer` y se validan de forma vectorizada, sin
+    crear un `ModelInput` por registro.
+    
+    La respuesta usa la misma codificación: columnas `confidence` (f32),
+    `prediction`, `risk_level` y `status` (u8), en el orden del lote. Las filas que
+    no superan la validación tienen `status` 3 y no se analizan.
+    """
+)
+async def analyze_columnar(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    api_key: str = Depends(get_api_key)
+) -> Response:
+    """
+    Analiza un lote binario columnar de solicitudes de red.
+    
+    Args:
+        request: Objeto de solicitud HTTP con el lote en el cuerpo
+        background_tasks: Tareas en segundo plano
+        api_key: API key del cliente
+        
+    Returns:
+        Response: Resultado columnar en el orden del lote
+        
+    Raises:
+        HTTPException: 400 si el lote no es válido, 413 si excede el máximo de
+            registros y 500 si el análisis falla
+    """
+    request_id = request.headers.get("X-Request-ID", str(uuid4()))
+    try:
+        batch = decode_columnar_batch(await request.body())
+    except ColumnarFormatError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    logger.info(f"Nueva solicitud de análisis columnar - ID: {request_id}, registros: {len(batch)}")
+    
+    if len(batch) > settings.MODEL_MAX_BATCH_RECORDS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"El lote excede el máximo de {settings.MODEL_MAX_BATCH_RECORDS} registros"
+        )
+    
+    # El formato columnar no tiene estado para filas degradadas: sin cupo se rechaza
+    start_ns = time.perf_counter_ns()
+    async with _admitted(request, api_key, degradable=False):
+        try:
+            result = await ml_service.analyze_columnar(batch)
+        except Exception as e:
+            error_msg = f"Error al procesar el lote columnar: {str(e)}"
+            logger.error(f"{error_msg} - ID: {request_id}", exc_info=True)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=error_msg
+            )
+    
+    suppressed = result.pop("suppressed")
+    started_ns = time.perf_counter_ns()
+    content = encode_columnar_result(batch.batch_id, **result)
+    STAGE_SERIALIZATION.observe_ns(time.perf_counter_ns() - started_ns)
+    background_tasks.add_task(
+        persist_columnar,
+        batch,
+        {**result, "suppressed": suppressed},
+        request_id,
+        _client_ip(request),
+        (time.perf_counter_ns() - start_ns) / 1e6
+    )
+    return Response(
+        content=content,
+        media_type=COLUMNAR_MEDIA_TYPE,
+        headers={"X-Request-ID": request_id}
+    )
+
+@router.post(
+    "/analyze/stream",
+    status_code=status.HTTP_200_OK,
+    response_class=DuplexStreamingResponse,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Resultados NDJSON: un `ModelOutput` o un error por registro",
+            "content": {"application/x-ndjson": {}}
+        },
+    },
+    summary="Analiza un flujo continuo de registros NDJSON",
+    description="""
+    Consume un cuerpo NDJSON (un `ModelInput` por línea, p. ej. con
+    `Transfer-Encoding: chunked`) a medida que llega, sin almacenarlo completo.
+    Los registros se analizan en micro-lotes de hasta `STREAM_BATCH_SIZE` y la
+    respuesta devuelve una línea por registro, en orden: un `ModelOutput` con
+    `metadata.stream_index` o un error `{"index", "request_id", "error"}`.
+    
+    Si la inferencia se retrasa, el servidor deja de leer el cuerpo al acumular
+    `STREAM_MAX_PENDING_RECORDS` registros, y la contrapresión llega al cliente por
+    TCP; lo mismo ocurre si el cliente no lee la respuesta.
+    """
+)
+async def analyze_stream(
+    request: Request,
+    api_key: str = Depends(get_api_key)
+) -> DuplexStreamingResponse:
+    """
+    Analiza un flujo NDJSON de solicitudes de red.
+    
+    Args:
+        request: Objeto de solicitud HTTP (el cuerpo se lee de forma incremental)
+        api_key: API key del cliente
+        
+    Returns:
+        DuplexStreamingResponse: Resultados NDJSON en el orden de entrada
+    """
+    request_id = request.headers.get("X-Request-ID", str(uuid4()))
+    logger.info(f"Nuevo flujo de análisis - ID: {request_id}")
+    return DuplexStreamingResponse(
+        _analyze_ndjson_stream(request, request_id, _priority(request, api_key)),
+        media_type="application/x-ndjson"
+    )
+
+@router.post(
+    "/analyze/pcap",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Resultados NDJSON por flujo y una línea final `{\"summary\": ...}`",
+            "content": {"application/x-ndjson": {}}
+        },
+        status.HTTP_400_BAD_REQUEST: {"description": "El cuerpo no es una captura PCAP/PCAPNG"},
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: {"description": "La captura supera `PCAP_MAX_UPLOAD_MB`"},
+    },
+    summary="Analiza una captura PCAP/PCAPNG",
+    description="""
+    Recibe una captura PCAP o PCAPNG como cuerpo de la solicitud (p. ej.
+    `curl --data-binary @captura.pcap`), la guarda en un archivo temporal y la
+    recorre con memoria mapeada. Los paquetes se agrupan en flujos
+    bidireccionales, y cada flujo terminado se analiza como un `ModelInput` por la
+    ruta de lotes.
+    
+    La respuesta devuelve una línea NDJSON por flujo: un `ModelOutput` con los
+    contadores del flujo en `metadata.capture`, o un error
+    `{"index", "request_id", "error"}`. La última línea es `{"summary": ...}`, con
+    paquetes, flujos, amenazas y paquetes por segundo.
+    """
+)
+async def analyze_pcap(
+    request: Request,
+    threats_only: bool = Query(False, description="Devolver solo los flujos clasificados como amenaza"),
+    api_key: str = Depends(get_api_key)
+) -> StreamingResponse:
+    """
+    Analiza una captura de tráfico subida por el cliente.
+    
+    Args:
+        request: Objeto de solicitud HTTP con la captura en el cuerpo
+        threats_only: Si se omiten los flujos clasificados como normales
+        api_key: API key del cliente
+        
+    Returns:
+        StreamingResponse: Resultados NDJSON por flujo y el resumen de la lectura
+        
+    Raises:
+        HTTPException: 400 si no es una captura válida, 413 si supera el tamaño máximo
+    """
+    request_id = request.headers.get("X-Request-ID", str(uuid4()))
+    path = await _save_upload(request, settings.PCAP_MAX_UPLOAD_MB * 1024 * 1024)
+    size = os.path.getsize(path)
+    try:
+        PcapReader(path).close()
+    except Exception as e:
+        os.unlink(path)
+        # Los mensajes del lector citan la ruta del archivo temporal; al cliente no se le muestra
+        if isinstance(e, PcapFormatError):
+            reason = "el cuerpo está vacío" if size == 0 else "el cuerpo no es una captura PCAP ni PCAPNG"
+        else:
+            logger.error(f"No se pudo abrir la captura subida: {str(e)} - ID: {request_id}", exc_info=True)
+            reason = "no se pudo leer el cuerpo"
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Captura inválida: {reason}"
+        )
+    logger.info(f"Nueva captura para análisis - ID: {request_id}, bytes: {size}")
+    return StreamingResponse(
+        _analyze_capture(path, request_id, threats_only, _priority(request, api_key), _client_ip(request)),
+        media_type="application/x-ndjson"
+    )
+
 @router.get(
     "/health",
     response_model=HealthCheckResponse,
@@ -192,6 +564,30 @@ async def health_check() -> HealthCheckResponse:
         uptime_seconds=round(uptime, 2)
     )
 
+@router.get(
+    "/ready",
+    status_code=status.HTTP_200_OK,
+    summary="Verifica si el servicio puede atender solicitudes",
+    description="""
+    A diferencia de `/health`, que solo indica que el proceso está vivo, este endpoint
+    responde 503 mientras el modelo se carga y calienta, y 200 cuando está listo para
+    predecir. Pensado para la sonda de readiness del orquestador.
+    """,
+    responses={503: {"description": "El modelo todavía no está listo"}}
+)
+async def readiness_check() -> JSONResponse:
+    """
+    Verifica si el modelo está cargado y calentado.
+    
+    Returns:
+        JSONResponse: Estado de preparación (200 si está listo, 503 si no)
+    """
+    readiness = ml_service.get_readiness()
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if readiness["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=readiness
+    )
+
 @router.get(
     "/model/info",
     response_model=ModelMetadata,
@@ -211,22 +607,542 @@ async def get_model_info() -> ModelMetadata:
     """
     return await ml_service.get_model_info()
 
+@router.get(
+    "/stats/batching",
+    status_code=status.HTTP_200_OK,
+    summary="Métricas del micro-batching",
+    description="""
+    Devuelve la profundidad de la cola del micro-batcher, las filas en ejecución
+    y la distribución de tamaños de lote realizados para `/analyze`.
+    """
+)
+async def get_batching_stats(api_key: str = Depends(get_api_key)) -> Dict[str, Any]:
+    """
+    Obtiene las métricas del micro-batching.
+    
+    Returns:
+        dict: Métricas del micro-batcher
+    """
+    return ml_service.get_batching_stats()
+
+@router.get(
+    "/stats/admission",
+    status_code=status.HTTP_200_OK,
+    summary="Métricas del control de admisión",
+    description="""
+    Devuelve los cupos, las solicitudes en curso y en espera, la duración media de
+    una solicitud admitida y, por clase de prioridad, las solicitudes admitidas,
+    rechazadas por motivo (cola llena, desplazada, espera vencida) y atendidas en
+    modo degradado.
+    """
+)
+async def get_admission_stats(api_key: str = Depends(get_api_key)) -> Dict[str, Any]:
+    """
+    Obtiene las métricas del control de admisión.
+    
+    Returns:
+        dict: Estado del control de admisión o ``{"enabled": False}``
+    """
+    if admission is None:
+        return {"enabled": False}
+    return {"enabled": True, "degraded_mode": settings.ADMISSION_DEGRADED_MODE, **admission.stats()}
+
+@router.get(
+    "/stats/flows",
+    status_code=status.HTTP_200_OK,
+    summary="Métricas del estado por IP de origen",
+    description="""
+    Devuelve el número de fuentes en memoria, la memoria estimada y las
+    expulsiones por TTL o por capacidad del almacén de ventanas deslizantes.
+    """
+)
+async def get_flow_stats(api_key: str = Depends(get_api_key)) -> Dict[str, Any]:
+    """
+    Obtiene las métricas del almacén de estado por IP de origen.
+    
+    Returns:
+        dict: Métricas del almacén
+    """
+    return ml_service.get_flow_stats()
+
+@router.get(
+    "/stats/rules",
+    status_code=status.HTTP_200_OK,
+    summary="Métricas del prefiltro de reglas",
+    description="""
+    Devuelve, por regla, las filas evaluadas, los aciertos, las filas decididas sin
+    invocar el modelo y el costo acumulado de evaluación.
+    """
+)
+async def get_rule_stats(api_key: str = Depends(get_api_key)) -> Dict[str, Any]:
+    """
+    Obtiene las métricas del prefiltro de reglas.
+    
+    Returns:
+        dict: Métricas por regla
+    """
+    return ml_service.get_rule_stats()
+
+@router.get(
+    "/stats/cache",
+    status_code=status.HTTP_200_OK,
+    summary="Métricas de la caché de predicciones",
+    description="""
+    Devuelve entradas, memoria estimada, aciertos, fallos, solicitudes agrupadas
+    sobre un cálculo en curso, tasa de aciertos y expulsiones de la caché.
+    """
+)
+async def get_cache_stats(api_key: str = Depends(get_api_key)) -> Dict[str, Any]:
+    """
+    Obtiene las métricas de la caché de predicciones.
+    
+    Returns:
+        dict: Métricas de la caché
+    """
+    return ml_service.get_cache_stats()
+
+@router.get(
+    "/stats/cascade",
+    status_code=status.HTTP_200_OK,
+    summary="Métricas de la cascada de modelos",
+    description="""
+    Devuelve la banda de incertidumbre y, por etapa, las filas resueltas, las filas
+    escaladas a la siguiente etapa, la tasa de escalamiento y la latencia media.
+    """
+)
+async def get_cascade_stats(api_key: str = Depends(get_api_key)) -> Dict[str, Any]:
+    """
+    Obtiene las métricas de la cascada de modelos.
+    
+    Returns:
+        dict: Métricas por etapa
+    """
+    return ml_service.get_cascade_stats()
+
+@router.get(
+    "/stats/top-sources",
+    response_model=TopSourcesResponse,
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_404_NOT_FOUND: {"description": "Los sketches de top-K están desactivados"},
+    },
+    summary="Orígenes más activos",
+    description="""
+    Devuelve los K orígenes con más conexiones en la ventana indicada, estimados
+    con Count-Min Sketch, junto con sus puertos de destino distintos estimados con
+    HyperLogLog. Cada conteo incluye la cota de error del sketch.
+    """
+)
+async def get_top_sources(
+    window: Optional[float] = Query(None, gt=0, description="Ventana en segundos (por defecto, la máxima)"),
+    k: int = Query(10, ge=1, le=1000, description="Número de orígenes a devolver"),
+    api_key: str = Depends(get_api_key)
+) -> TopSourcesResponse:
+    """
+    Obtiene el top-K de orígenes por número de conexiones.
+    
+    Returns:
+        TopSourcesResponse: Orígenes más activos con conteos y cotas de error
+    """
+    result = ml_service.get_top_sources(k=k, window_seconds=window)
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Los sketches de top-K están desactivados (SKETCH_ENABLED=False)"
+        )
+    return TopSourcesResponse(**result)
+
+@router.get(
+    "/stats/incidents",
+    status_code=status.HTTP_200_OK,
+    summary="Métricas de la agregación de incidentes",
+    description="""
+    Devuelve las alertas recibidas, los incidentes abiertos, abiertos y cerrados en
+    total, las alertas suprimidas por sumarse a un incidente abierto y los
+    suscriptores del flujo de incidentes.
+    """
+)
+async def get_incident_stats(api_key: str = Depends(get_api_key)) -> Dict[str, Any]:
+    """
+    Obtiene las métricas del agregador de incidentes.
+    
+    Returns:
+        dict: Métricas del agregador
+    """
+    return ml_service.get_incident_stats()
+
+@router.get(
+    "/incidents",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_404_NOT_FOUND: {"description": "La agregación de incidentes está desactivada"},
+    },
+    summary="Incidentes agregados",
+    description="""
+    Devuelve los incidentes abiertos y los cerrados recientemente, del más reciente
+    al más antiguo. Cada incidente resume las alertas repetidas de una misma clave
+    (por defecto, IP de origen y nivel de riesgo): número de alertas, puertos y
+    destinos vistos y primer y último instante.
+    """
+)
+async def list_incidents(
+    incident_status: Optional[str] = Query(None, alias="status", pattern="^(open|closed)$", description="open o closed"),
+    limit: int = Query(100, ge=1, le=1000, description="Número máximo de incidentes"),
+    api_key: str = Depends(get_api_key)
+) -> Dict[str, Any]:
+    """
+    Lista los incidentes agregados.
+    
+    Returns:
+        dict: Incidentes y número devuelto
+    """
+    incidents = _require_incidents().list_incidents(status=incident_status, limit=limit)
+    return {"incidents": incidents, "count": len(incidents)}
+
+@router.get(
+    "/incidents/stream",
+    response_class=StreamingResponse,
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_404_NOT_FOUND: {"description": "La agregación de incidentes está desactivada"},
+    },
+    summary="Flujo de incidentes",
+    description="""
+    Emite en NDJSON un evento ``opened`` al abrirse cada incidente y un evento
+    ``closed`` con el resumen final al cerrarse. Las alertas que se suman a un
+    incidente abierto no generan eventos, de modo que el consumidor recibe un
+    volumen proporcional a los incidentes y no a los paquetes. Un consumidor lento
+    pierde eventos (``dropped_events`` en ``/stats/incidents``).
+    """
+)
+async def stream_incidents(request: Request, api_key: str = Depends(get_api_key)) -> StreamingResponse:
+    """
+    Suscribe al cliente a los eventos de incidentes.
+    
+    Returns:
+        StreamingResponse: Eventos NDJSON ``{"event", "incident"}``
+    """
+    aggregator = _require_incidents()
+    queue = aggregator.subscribe()
+    
+    async def events() -> AsyncIterator[bytes]:
+        try:
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    # Sin tráfico nadie cierra los incidentes inactivos
+                    aggregator.expire()
+                    continue
+                yield (json.dumps(message, separators=(",", ":")) + "\n").encode()
+        finally:
+            aggregator.unsubscribe(queue)
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@router.get(
+    "/incidents/{incident_id}",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_404_NOT_FOUND: {"description": "Incidente no encontrado o agregación desactivada"},
+    },
+    summary="Detalle de un incidente",
+    description="Devuelve un incidente abierto o cerrado recientemente."
+)
+async def get_incident(incident_id: str, api_key: str = Depends(get_api_key)) -> Dict[str, Any]:
+    """
+    Obtiene un incidente por su identificador.
+    
+    Returns:
+        dict: Resumen del incidente
+    """
+    incident = _require_incidents().get(incident_id)
+    if incident is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Incidente no encontrado: {incident_id}"
+        )
+    return incident
+
 # Funciones de utilidad
+@asynccontextmanager
+async def _admitted(request: Request, api_key: str, degradable: bool = True) -> AsyncIterator[bool]:
+    """
+    Ocupa un cupo del control de admisión mientras dura el análisis.
+    
+    La prioridad se resuelve por API key y ruta. Sin cupo, con
+    ``ADMISSION_DEGRADED_MODE`` la solicitud continúa en modo degradado; si no,
+    se rechaza con ``ADMISSION_REJECT_STATUS`` y ``Retry-After``.
+    
+    Args:
+        request: Solicitud HTTP (de ella se toma la ruta)
+        api_key: API key validada del cliente
+        degradable: Si el endpoint admite el modo degradado
+        
+    Yields:
+        bool: True si el análisis debe hacerse solo con listas CIDR y reglas
+        
+    Raises:
+        HTTPException: Si la solicitud se rechaza por sobrecarga
+    """
+    try:
+        async with admission_slot(_priority(request, api_key), degradable) as degraded:
+            yield degraded
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=settings.ADMISSION_REJECT_STATUS,
+            detail=f"Servicio sobrecargado ({e.reason}); reintente en {e.retry_after} s",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+def _priority(request: Request, api_key: str) -> str:
+    """Clase de prioridad de la solicitud según su API key y la plantilla de su ruta."""
+    return resolve_priority(api_key, getattr(request.scope.get("route"), "path", request.url.path))
+
+async def _analyze_admitted(inputs: List[ModelInput], priority: str) -> List[Union[ModelOutput, Exception]]:
+    """
+    Analiza un micro-lote de un flujo o de una captura con un cupo del control de admisión.
+    
+    Sin cupo (y sin modo degradado) espera el ``Retry-After`` sugerido y vuelve a
+    intentarlo: mientras tanto no se lee más del cuerpo, de modo que la
+    sobrecarga llega al cliente como contrapresión y no como registros perdidos.
+    """
+    if not inputs:
+        return []
+    while True:
+        try:
+            async with admission_slot(priority) as degraded:
+                return await ml_service.analyze_batch(inputs, rules_only=degraded)
+        except AdmissionRejected as e:
+            await asyncio.sleep(e.retry_after)
+
+def _require_incidents() -> IncidentAggregator:
+    """Devuelve el agregador de incidentes o responde 404 si está desactivado."""
+    if ml_service.incidents is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="La agregación de incidentes está desactivada (INCIDENTS_ENABLED=False)"
+        )
+    return ml_service.incidents
+
+def _client_ip(request: Request) -> str:
+    """IP del cliente de la solicitud, o ``unknown``."""
+    return request.client.host if request.client else "unknown"
+
+def _json_response(model: BaseModel) -> Response:
+    """Serializa un modelo de respuesta con Pydantic y mide la serialización."""
+    started_ns = time.perf_counter_ns()
+    content = model.model_dump_json()
+    STAGE_SERIALIZATION.observe_ns(time.perf_counter_ns() - started_ns)
+    return Response(content=content, media_type="application/json")
+
+def _validate_record(record: Any, index: int, request_id: str) -> Union[ModelInput, BatchItemError]:
+    """
+    Valida un registro de un lote o flujo de forma independiente.
+    
+    Args:
+        record: Registro sin validar
+        index: Posición del registro
+        request_id: ID del lote, base del ``request_id`` si el registro no trae uno
+        
+    Returns:
+        ModelInput o BatchItemError con los errores de validación
+    """
+    if isinstance(record, dict) and not record.get("request_id"):
+        record = {**record, "request_id": f"{request_id}-{index}"}
+    try:
+        return ModelInput.model_validate(record)
+    except ValidationError as e:
+        return BatchItemError(
+            index=index,
+            request_id=record.get("request_id") if isinstance(record, dict) else None,
+            error="; ".join(
+                f"{'.'.join(str(loc) for loc in err['loc']) or 'registro'}: {err['msg']}"
+                for err in e.errors()
+            )
+        )
+
+async def _parse_ndjson_records(
+    request: Request,
+    request_id: str
+) -> AsyncIterator[Tuple[int, Union[ModelInput, BatchItemError]]]:
+    """Lee el cuerpo NDJSON de forma incremental y valida cada línea no vacía."""
+    index = 0
+    async for line in iter_ndjson_lines(request.stream(), settings.STREAM_MAX_LINE_BYTES):
+        if isinstance(line, LineTooLongError):
+            yield index, BatchItemError(index=index, request_id=None, error=str(line))
+        else:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield index, BatchItemError(index=index, request_id=None, error=f"JSON inválido: {str(e)}")
+            else:
+                yield index, _validate_record(record, index, request_id)
+        index += 1
+
+async def _analyze_ndjson_stream(request: Request, request_id: str, priority: str) -> AsyncIterator[str]:
+    """
+    Analiza los registros de un flujo NDJSON por micro-lotes y produce líneas de respuesta.
+    
+    Solo se mantienen en memoria los registros pendientes (acotados por
+    ``STREAM_MAX_PENDING_RECORDS``) y el micro-lote en curso. Cada micro-lote
+    ocupa un cupo del control de admisión con la prioridad indicada. Un error que no
+    sea una desconexión termina el flujo con una línea ``{"error", "records"}``.
+    """
+    total = failed = 0
+    try:
+        async for batch in stream_micro_batches(
+            _parse_ndjson_records(request, request_id),
+            batch_size=settings.STREAM_BATCH_SIZE,
+            window_ms=settings.STREAM_BATCH_WINDOW_MS,
+            max_pending=settings.STREAM_MAX_PENDING_RECORDS
+        ):
+            inputs = [item for _, item in batch if isinstance(item, ModelInput)]
+            batch_ns = time.perf_counter_ns()
+            try:
+                scored = await _analyze_admitted(inputs, priority)
+            except Exception as e:
+                logger.error(f"Error al procesar un micro-lote del flujo: {str(e)} - ID: {request_id}", exc_info=True)
+                scored = [e] * len(inputs)
+            latency_ms = (time.perf_counter_ns() - batch_ns) / 1e6
+            outcomes = iter(scored)
+            
+            started_ns = time.perf_counter_ns()
+            lines = []
+            for index, item in batch:
+                if isinstance(item, ModelInput):
+                    outcome = next(outcomes)
+                    if isinstance(outcome, ModelOutput):
+                        outcome.metadata["stream_index"] = index
+                        lines.append(outcome.model_dump_json())
+                        continue
+                    item = BatchItemError(index=index, request_id=item.request_id, error=str(outcome))
+                failed += 1
+                lines.append(item.model_dump_json())
+            total += len(batch)
+            chunk = "\n".join(lines) + "\n"
+            STAGE_SERIALIZATION.observe_ns(time.perf_counter_ns() - started_ns)
+            yield chunk
+            persist_outcomes(inputs, scored, _client_ip(request), latency_ms)
+    except (ClientDisconnect, OSError) as e:
+        # El cliente se desconectó o el cuerpo se interrumpió: no hay a quién responder
+        logger.warning(f"Flujo interrumpido tras {total} registros: {str(e) or type(e).__name__} - ID: {request_id}")
+    except Exception as e:
+        # Un error propio del servicio: se informa al cliente en una última línea
+        logger.error(f"Error al procesar el flujo tras {total} registros: {str(e)} - ID: {request_id}", exc_info=True)
+        yield json.dumps({"error": f"Error al procesar el flujo: {str(e)}", "records": total}) + "\n"
+    finally:
+        logger.info(f"Flujo completado - ID: {request_id}, registros: {total}, errores: {failed}")
+
+async def _save_upload(request: Request, max_bytes: int) -> str:
+    """
+    Guarda el cuerpo de la solicitud en un archivo temporal sin acumularlo en memoria.
+    
+    Returns:
+        str: Ruta del archivo; quien la recibe debe eliminarlo
+        
+    Raises:
+        HTTPException: 413 si el cuerpo supera ``max_bytes``
+    """
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"La captura excede el máximo de {settings.PCAP_MAX_UPLOAD_MB} MB"
+    )
+    if int(request.headers.get("content-length") or 0) > max_bytes:
+        raise too_large
+    
+    handle = tempfile.NamedTemporaryFile(prefix="red-sentinel-", suffix=".pcap", delete=False)
+    try:
+        with handle:
+            size = 0
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > max_bytes:
+                    raise too_large
+                # La escritura puede bloquear con discos lentos: fuera del event loop
+                await asyncio.to_thread(handle.write, chunk)
+    except BaseException:
+        os.unlink(handle.name)
+        raise
+    return handle.name
+
+async def _analyze_capture(
+    path: str,
+    request_id: str,
+    threats_only: bool,
+    priority: str,
+    client_ip: str
+) -> AsyncIterator[str]:
+    """
+    Analiza una captura guardada y produce las líneas NDJSON de la respuesta.
+    
+    Cada lote de flujos ocupa un cupo del control de admisión con la prioridad
+    indicada. El archivo temporal se elimina al terminar, también si el cliente
+    se desconecta.
+    """
+    stats = PcapStats()
+    batches = iter_capture_inputs(
+        path,
+        batch_size=settings.PCAP_BATCH_SIZE,
+        idle_timeout=settings.PCAP_FLOW_IDLE_TIMEOUT_SECONDS,
+        active_timeout=settings.PCAP_FLOW_ACTIVE_TIMEOUT_SECONDS,
+        max_flows=settings.PCAP_MAX_ACTIVE_FLOWS,
+        stats=stats
+    )
+    flows = threats = failed = 0
+    lines: List[str] = []
+    scored_inputs: List[ModelInput] = []
+    scored: List[Union[ModelOutput, Exception]] = []
+    try:
+        async for input_data, outcome in score_capture(batches, lambda batch: _analyze_admitted(batch, priority)):
+            index, flows = flows, flows + 1
+            scored_inputs.append(input_data)
+            scored.append(outcome)
+            if not isinstance(outcome, ModelOutput):
+                failed += 1
+                lines.append(BatchItemError(index=index, request_id=input_data.request_id, error=str(outcome)).model_dump_json())
+            elif outcome.prediction == 1 or not threats_only:
+                threats += outcome.prediction == 1
+                lines.append(outcome.model_dump_json())
+            if len(scored) >= settings.PCAP_BATCH_SIZE:
+                if lines:
+                    yield "\n".join(lines) + "\n"
+                    lines = []
+                persist_outcomes(scored_inputs, scored, client_ip)
+                scored_inputs, scored = [], []
+        lines.append(json.dumps({"summary": {**stats.to_dict(), "threats": threats, "failed": failed}}))
+        yield "\n".join(lines) + "\n"
+        persist_outcomes(scored_inputs, scored, client_ip)
+    except Exception as e:
+        logger.error(f"Error al analizar la captura: {str(e)} - ID: {request_id}", exc_info=True)
+        yield json.dumps({"error": f"Error al analizar la captura: {str(e)}"}) + "\n"
+    finally:
+        os.unlink(path)
+        logger.info(
+            f"Captura analizada - ID: {request_id}, paquetes: {stats.packets}, flujos: {flows}, "
+            f"amenazas: {threats}, paquetes/s: {stats.packets_per_second:.0f}"
+        )
+
 async def log_analysis_request(
     request_id: str, 
     client_ip: str, 
-    input_data: ModelInput
+    input_data: ModelInput,
+    output: Optional[ModelOutput] = None,
+    latency_ms: Optional[float] = None
 ) -> None:
     """
-    Registra información sobre la solicitud de análisis.
+    Registra información sobre la solicitud de análisis y encola su persistencia.
     
     Args:
         request_id: ID único de la solicitud
         client_ip: Dirección IP del cliente
         input_data: Datos de entrada de la solicitud
+        output: Resultado del análisis
+        latency_ms: Duración del análisis en milisegundos
     """
-    # En una implementación real, esto podría guardar en una base de datos
-    # o enviar a un servicio de logging
+    started_ns = time.perf_counter_ns()
     log_entry = {
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "request_id": request_id,
@@ -237,5 +1153,44 @@ async def log_analysis_request(
     }
     
     logger.info(f"Registro de análisis: {log_entry}")
+    if output is not None:
+        persist_outcomes([input_data], [output], client_ip, latency_ms)
+    STAGE_BACKGROUND.observe_ns(time.perf_counter_ns() - started_ns)
+
+async def log_batch_request(
+    request_id: str,
+    client_ip: str,
+    total: int,
+    failed: int,
+    inputs: Optional[List[ModelInput]] = None,
+    outcomes: Optional[List[Union[ModelOutput, Exception]]] = None,
+    latency_ms: Optional[float] = None
+) -> None:
+    """
+    Registra información resumida sobre una solicitud de análisis por lotes y
+    encola la persistencia de cada registro analizado.
+    
+    Args:
+        request_id: ID único del lote
+        client_ip: Dirección IP del cliente
+        total: Número de registros recibidos
+        failed: Número de registros con error
+        inputs: Registros válidos del lote
+        outcomes: Resultado o excepción de cada registro válido
+        latency_ms: Duración del lote en milisegundos
+    """
+    started_ns = time.perf_counter_ns()
+    log_entry = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "request_id": request_id,
+        "client_ip": client_ip,
+        "total": total,
+        "failed": failed
+    }
+    
+    logger.info(f"Registro de análisis por lotes: {log_entry}")
+    if inputs:
+        persist_outcomes(inputs, outcomes, client_ip, latency_ms)
+    STAGE_BACKGROUND.observe_ns(time.perf_counter_ns() - started_ns)
 
 # Nota: Manejadores de errores globales deben registrarse en app, no en router.
\ No newline at end of file
@@ -0,0 +1,235 @@
+"""
+Exportación de métricas para Prometheus.
+Expone ``GET /metrics`` y el middleware que mide las solicitudes HTTP.
+"""
+import logging
+import time
+from typing import Iterable, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Security, status
+from fastapi.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Importaciones locales
+from ..services.metrics import (
+    CONTENT_TYPE,
+    LabelValues,
+    http_request_duration,
+    http_requests_in_flight,
+    http_requests_total,
+    registry
+)
+from ..services.admission import PRIORITY_CLASSES, admission
+from ..services.ml_service import ml_service
+from ..services.persistence import writer as persistence_writer
+from ..core.config import settings
+from ..core.security import api_key_header, check_api_key
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Router de métricas (sin prefijo: Prometheus consulta /metrics por defecto)
+router = APIRouter(tags=["metrics"])
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que cuenta y mide las solicitudes HTTP.
+
+    La ruta se toma de la plantilla del endpoint (``/api/v1/analyze``), no de la
+    URL, para que el número de series no dependa de los clientes; las URLs que
+    no corresponden a ningún endpoint se agrupan como ``unmatched``.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started_ns = time.perf_counter_ns()
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+            http_request_duration.labels(route, method).observe_ns(time.perf_counter_ns() - started_ns)
+            http_requests_total.labels(route, method, str(status_code)).inc()
+
+
+# ========== Gauges calculados al exportar ==========
+def _model_info() -> Iterable[Tuple[LabelValues, float]]:
+    if ml_service.ready:
+        yield (ml_service.metadata.version, ml_service.cascade.final.engine.kind), 1
+
+
+def _batchers() -> Iterable[Tuple[LabelValues, float]]:
+    if ml_service.ready:
+        for stage in ml_service.cascade.stages:
+            if stage.batcher is not None:
+                yield (stage.name,), stage.batcher.queue_depth
+
+
+def _cache_value(key: str) -> Iterable[Tuple[LabelValues, float]]:
+    if ml_service.prediction_cache is not None:
+        yield (), ml_service.prediction_cache.stats()[key]
+
+
+def _cache_lookups() -> Iterable[Tuple[LabelValues, float]]:
+    if ml_service.prediction_cache is not None:
+        stats = ml_service.prediction_cache.stats()
+        for result in ("hits", "misses", "coalesced"):
+            yield (result,), stats[result]
+
+
+def _flow_value(key: str) -> Iterable[Tuple[LabelValues, float]]:
+    if ml_service.flow_store is not None:
+        yield (), ml_service.flow_store.stats()[key]
+
+
+def _persistence() -> Iterable[Tuple[LabelValues, float]]:
+    if persistence_writer is not None:
+        for result in ("written", "dropped", "spilled", "replayed"):
+            yield (result,), getattr(persistence_writer, result)
+
+
+def _admission_requests() -> Iterable[Tuple[LabelValues, float]]:
+    if admission is not None:
+        for priority in PRIORITY_CLASSES:
+            yield (priority, "admitted"), admission.admitted[priority]
+            yield (priority, "degraded"), admission.degraded[priority]
+        for (priority, reason), count in admission.rejected.items():
+            yield (priority, reason), count
+
+
+def _incident_alerts() -> Iterable[Tuple[LabelValues, float]]:
+    if ml_service.incidents is not None:
+        stats = ml_service.incidents.stats()
+        yield ("opened",), stats["opened"]
+        yield ("suppressed",), stats["suppressed"]
+
+
+registry.callback(
+    "red_sentinel_model_ready",
+    "1 si el modelo está cargado y calentado.",
+    lambda: [((), int(ml_service.ready))]
+)
+registry.callback(
+    "red_sentinel_model_info",
+    "Versión y motor de inferencia del modelo activo.",
+    _model_info,
+    ("model_version", "engine")
+)
+registry.callback(
+    "red_sentinel_batcher_queue_depth",
+    "Filas en espera en el micro-batcher de cada etapa.",
+    _batchers,
+    ("stage",)
+)
+registry.callback(
+    "red_sentinel_prediction_cache_entries",
+    "Entradas en la caché de predicciones.",
+    lambda: _cache_value("entries")
+)
+registry.callback(
+    "red_sentinel_prediction_cache_bytes",
+    "Memoria estimada de la caché de predicciones.",
+    lambda: _cache_value("estimated_bytes")
+)
+registry.callback(
+    "red_sentinel_prediction_cache_lookups_total",
+    "Consultas a la caché de predicciones por resultado.",
+    _cache_lookups,
+    ("result",),
+    kind="counter"
+)
+registry.callback(
+    "red_sentinel_flow_state_sources",
+    "IPs de origen con estado en el almacén de flujos.",
+    lambda: _flow_value("sources")
+)
+registry.callback(
+    "red_sentinel_flow_state_bytes",
+    "Memoria estimada del almacén de flujos.",
+    lambda: _flow_value("estimated_bytes")
+)
+registry.callback(
+    "red_sentinel_persistence_queue_depth",
+    "Predicciones en espera de ser escritas en la base de datos.",
+    lambda: [((), persistence_writer.queue_depth)] if persistence_writer is not None else []
+)
+registry.callback(
+    "red_sentinel_persistence_records_total",
+    "Predicciones persistidas por resultado (written, dropped, spilled, replayed).",
+    _persistence,
+    ("result",),
+    kind="counter"
+)
+registry.callback(
+    "red_sentinel_admission_in_flight",
+    "Solicitudes de análisis en curso con cupo del control de admisión.",
+    lambda: [((), admission.in_flight)] if admission is not None else []
+)
+registry.callback(
+    "red_sentinel_admission_waiting",
+    "Solicitudes de análisis en espera de un cupo.",
+    lambda: [((), admission.waiting)] if admission is not None else []
+)
+registry.callback(
+    "red_sentinel_admission_requests_total",
+    "Solicitudes por clase de prioridad y resultado (admitted, degraded, queue_full, displaced, timeout).",
+    _admission_requests,
+    ("priority", "result"),
+    kind="counter"
+)
+registry.callback(
+    "red_sentinel_incidents_open",
+    "Incidentes abiertos en el agregador de alertas.",
+    lambda: [((), ml_service.incidents.open_count)] if ml_service.incidents is not None else []
+)
+registry.callback(
+    "red_sentinel_incident_alerts_total",
+    "Alertas de riesgo alto por resultado (opened abre un incidente, suppressed se suma a uno abierto).",
+    _incident_alerts,
+    ("result",),
+    kind="counter"
+)
+
+
+@router.get(
+    "/metrics",
+    response_class=Response,
+    summary="Métricas en formato Prometheus",
+    description="""
+    Histogramas de latencia por etapa (cidr, flow_state, rules, preprocess,
+    batch_wait, queue_wait, inference, explanation, serialization) y por ruta HTTP,
+    predicciones por nivel de riesgo, versión del modelo y camino de decisión,
+    solicitudes en curso y tamaño de la caché, del almacén de flujos y de las
+    conexiones WebSocket.
+    """
+)
+async def get_metrics(api_key: Optional[str] = Security(api_key_header)) -> Response:
+    """
+    Exporta las métricas del proceso.
+
+    Returns:
+        Response: Documento en formato de texto de Prometheus
+    """
+    if settings.METRICS_REQUIRE_API_KEY and check_api_key(api_key) is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="API key inválida o faltante"
+        )
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
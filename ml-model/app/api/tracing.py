@@ -0,0 +1,60 @@
+"""
+Trazas por solicitud HTTP.
+Adjunta el desglose de tiempos por etapa a una muestra de respuestas (``Server-Timing``).
+"""
+import logging
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Importaciones locales
+from ..services.tracing import current_trace, tracer
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+
+class TracingMiddleware:
+    """
+    Middleware ASGI que traza una muestra de las solicitudes HTTP.
+
+    En las solicitudes muestreadas agrega ``X-Trace-Id`` y ``Server-Timing`` con
+    las etapas medidas hasta el inicio de la respuesta, y al terminar (tareas en
+    segundo plano incluidas) entrega el trace completo al archivo de spans. Con
+    la tasa de muestreo en 0 solo cuesta una comparación por solicitud.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not tracer.sample_rate:
+            await self.app(scope, receive, send)
+            return
+        trace = tracer.start()
+        if trace is None:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Trace-Id", trace.trace_id)
+                headers.append("Server-Timing", trace.server_timing())
+            await send(message)
+
+        token = current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_trace.reset(token)
+            tracer.finish(
+                trace,
+                route=getattr(scope.get("route"), "path", None) or "unmatched",
+                method=scope["method"],
+                status=status_code
+            )
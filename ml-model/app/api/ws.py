@@ -0,0 +1,272 @@
+"""
+Canal WebSocket para sensores.
+Una conexión persistente se autentica una sola vez y admite muchas solicitudes en
+curso, correlacionadas por ``request_id`` y respondidas a medida que terminan.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+from uuid import uuid4
+
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, status
+from pydantic import ValidationError
+
+# Importaciones locales
+from ..services.admission import AdmissionRejected, admission_slot, resolve_priority
+from ..services.metrics import STAGE_SERIALIZATION, registry
+from ..services.ml_service import ml_service
+from ..services.persistence import persist_outcomes
+from ..schemas.mcp import ModelInput
+from ..core.config import settings
+from ..core.security import API_KEY_NAME, check_api_key, get_api_key
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Router del canal de sensores
+router = APIRouter(
+    prefix="/api/v1",
+    tags=["websocket"],
+)
+
+# Conexiones activas por ID de conexión
+_sessions: Dict[str, "SensorSession"] = {}
+
+registry.callback(
+    "red_sentinel_websocket_connections",
+    "Conexiones WebSocket de sensores abiertas.",
+    lambda: [((), len(_sessions))]
+)
+registry.callback(
+    "red_sentinel_websocket_requests_in_flight",
+    "Solicitudes en curso en las conexiones WebSocket.",
+    lambda: [((), sum(len(session._in_flight) for session in list(_sessions.values())))]
+)
+
+
+class SensorSession:
+    """
+    Conexión WebSocket de un sensor.
+
+    Cada mensaje de texto es un ``ModelInput``; su análisis se ejecuta en una tarea
+    propia y la respuesta (``ModelOutput`` o ``{"request_id", "error", "code"}``) se
+    envía al terminar, sin respetar el orden de llegada. Cada análisis ocupa un cupo
+    del control de admisión con la prioridad de la conexión; sin cupo se responde
+    con el código 429 y ``retry_after`` en segundos. Con ``max_in_flight``
+    solicitudes en curso se deja de leer del socket, de modo que un sensor no puede
+    acaparar el ejecutor de inferencia y la contrapresión le llega por TCP.
+    """
+
+    def __init__(self, websocket: WebSocket, connection_id: str, max_in_flight: int, priority: str):
+        """
+        Args:
+            websocket: Conexión ya aceptada
+            connection_id: Identificador de la conexión (base de los ``request_id`` generados)
+            max_in_flight: Solicitudes en curso permitidas
+            priority: Clase de prioridad de admisión de la conexión
+        """
+        self.websocket = websocket
+        self.connection_id = connection_id
+        self.max_in_flight = max(max_in_flight, 1)
+        self.priority = priority
+        self.client_ip = websocket.client.host if websocket.client else "unknown"
+        self.client = f"{self.client_ip}:{websocket.client.port}" if websocket.client else "unknown"
+        self.connected_at = time.time()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._send_lock = asyncio.Lock()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._sequence = 0
+
+        # Métricas de la conexión
+        self.received = 0
+        self.completed = 0
+        self.failed = 0
+        self.throttled = 0
+        self.rejected = 0
+
+    async def run(self) -> None:
+        """Atiende la conexión hasta que el cliente la cierra."""
+        try:
+            while True:
+                if self._slots.locked():
+                    self.throttled += 1
+                await self._slots.acquire()
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    self._slots.release()
+                    break
+                self.received += 1
+                if message.get("text") is None:
+                    self._spawn(None, self._reply_error(None, "Solo se aceptan mensajes de texto JSON", 400))
+                    continue
+                self._dispatch(message["text"])
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for task in self._in_flight.values():
+                task.cancel()
+            logger.info(
+                f"Conexión WebSocket {self.connection_id} cerrada - recibidos: {self.received}, "
+                f"completados: {self.completed}, errores: {self.failed}, rechazados: {self.rejected}"
+            )
+
+    def _dispatch(self, text: str) -> None:
+        """Valida un mensaje y lanza su análisis; los errores se responden de inmediato."""
+        try:
+            record = json.loads(text)
+        except ValueError as e:
+            self._spawn(None, self._reply_error(None, f"JSON inválido: {str(e)}", 400))
+            return
+
+        request_id = record.get("request_id") if isinstance(record, dict) else None
+        if isinstance(record, dict) and not request_id:
+            self._sequence += 1
+            request_id = f"{self.connection_id}-{self._sequence}"
+            record = {**record, "request_id": request_id}
+        if request_id is not None and request_id in self._in_flight:
+            self._spawn(None, self._reply_error(request_id, "Ya hay una solicitud en curso con este request_id", 409))
+            return
+        try:
+            input_data = ModelInput.model_validate(record)
+        except ValidationError as e:
+            self._spawn(None, self._reply_error(request_id, "; ".join(
+                f"{'.'.join(str(loc) for loc in err['loc']) or 'registro'}: {err['msg']}"
+                for err in e.errors()
+            ), 422))
+            return
+        self._spawn(request_id, self._analyze(input_data))
+
+    def _spawn(self, request_id: Optional[str], coroutine: Any) -> None:
+        """Ejecuta una respuesta en segundo plano; libera su lugar al terminar."""
+        task = asyncio.create_task(coroutine)
+        key = request_id if request_id is not None else f"_{id(task)}"
+        self._in_flight[key] = task
+
+        def done(_: asyncio.Task) -> None:
+            self._in_flight.pop(key, None)
+            self._slots.release()
+
+        task.add_done_callback(done)
+
+    async def _analyze(self, input_data: ModelInput) -> None:
+        """Analiza una solicitud, envía el resultado y encola su persistencia."""
+        analysis_ns = time.perf_counter_ns()
+        try:
+            async with admission_slot(self.priority) as degraded:
+                result = await ml_service.analyze_threat(input_data, rules_only=degraded)
+        except AdmissionRejected as e:
+            self.rejected += 1
+            await self._reply_error(
+                input_data.request_id,
+                f"Servicio sobrecargado ({e.reason}); reintente en {e.retry_after} s",
+                429,
+                retry_after=e.retry_after
+            )
+            return
+        except Exception as e:
+            logger.error(f"Error al procesar la solicitud {input_data.request_id} por WebSocket: {str(e)}", exc_info=True)
+            await self._reply_error(input_data.request_id, f"Error al procesar la solicitud: {str(e)}", 500)
+            persist_outcomes([input_data], [e], self.client_ip, (time.perf_counter_ns() - analysis_ns) / 1e6)
+            return
+        latency_ms = (time.perf_counter_ns() - analysis_ns) / 1e6
+        self.completed += 1
+        started_ns = time.perf_counter_ns()
+        text = result.model_dump_json()
+        STAGE_SERIALIZATION.observe_ns(time.perf_counter_ns() - started_ns)
+        await self._send(text)
+        persist_outcomes([input_data], [result], self.client_ip, latency_ms)
+
+    async def _reply_error(
+        self, request_id: Optional[str], error: str, code: int, retry_after: Optional[int] = None
+    ) -> None:
+        """Envía un error asociado a una solicitud; ``retry_after`` acompaña a los rechazos por sobrecarga."""
+        if retry_after is None:
+            # Los rechazos por sobrecarga ya se cuentan en ``rejected``
+            self.failed += 1
+        reply: Dict[str, Any] = {"request_id": request_id, "error": error, "code": code}
+        if retry_after is not None:
+            reply["retry_after"] = retry_after
+        await self._send(json.dumps(reply))
+
+    async def _send(self, text: str) -> None:
+        """Envía un mensaje; los envíos de distintas tareas no se intercalan."""
+        try:
+            async with self._send_lock:
+                await self.websocket.send_text(text)
+        except (WebSocketDisconnect, RuntimeError):
+            pass  # El cliente se desconectó; la conexión se cierra en run()
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas de la conexión."""
+        return {
+            "connection_id": self.connection_id,
+            "client": self.client,
+            "connected_seconds": round(time.time() - self.connected_at, 2),
+            "in_flight": len(self._in_flight),
+            "max_in_flight": self.max_in_flight,
+            "received": self.received,
+            "completed": self.completed,
+            "failed": self.failed,
+            "throttled": self.throttled,
+            "rejected": self.rejected,
+            "priority": self.priority
+        }
+
+
+@router.websocket("/ws/analyze")
+async def analyze_websocket(websocket: WebSocket) -> None:
+    """
+    Canal persistente de análisis para sensores.
+
+    La API key se valida una sola vez al abrir la conexión, con el header
+    ``X-API-Key`` o el parámetro ``api_key`` (para clientes que no pueden enviar
+    headers). Sin una key válida la conexión se cierra con el código 1008.
+
+    Args:
+        websocket: Conexión WebSocket entrante
+    """
+    api_key = check_api_key(websocket.headers.get(API_KEY_NAME) or websocket.query_params.get("api_key"))
+    if api_key is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="API key inválida o faltante")
+        return
+
+    await websocket.accept()
+    session = SensorSession(
+        websocket,
+        str(uuid4()),
+        max_in_flight=settings.WS_MAX_IN_FLIGHT,
+        priority=resolve_priority(api_key, websocket.url.path)
+    )
+    logger.info(f"Conexión WebSocket {session.connection_id} abierta desde {session.client}")
+    _sessions[session.connection_id] = session
+    try:
+        await session.run()
+    finally:
+        _sessions.pop(session.connection_id, None)
+
+
+@router.get(
+    "/stats/websocket",
+    status_code=status.HTTP_200_OK,
+    summary="Métricas del canal WebSocket",
+    description="""
+    Devuelve, por cada conexión WebSocket activa, las solicitudes en curso, su
+    límite, los mensajes recibidos, completados, con error y rechazados por el
+    control de admisión, y cuántas veces se dejó de leer del socket por alcanzar el
+    límite.
+    """
+)
+async def get_websocket_stats(api_key: str = Depends(get_api_key)) -> Dict[str, Any]:
+    """
+    Obtiene las métricas de las conexiones WebSocket activas.
+
+    Returns:
+        dict: Número de conexiones y métricas de cada una
+    """
+    return {
+        "connections": len(_sessions),
+        "max_in_flight": settings.WS_MAX_IN_FLIGHT,
+        "sessions": [session.stats() for session in _sessions.values()]
+    }
@@ -1,7 +1,7 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field, HttpUrl, AnyUrl
 from functools import lru_cache
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 import json
 
@@ -20,6 +20,9 @@ class Settings(BaseSettings):
     MODEL_PATH: str = Field("models/dummy_model.pkl", env="MODEL_PATH")
     MODEL_FRAMEWORK: str = Field("scikit-learn", env="MODEL_FRAMEWORK")
     MODEL_FRAMEWORK_VERSION: str = Field("1.2.2", env="MODEL_FRAMEWORK_VERSION")
+    MODEL_COMPILED_INFERENCE: bool = Field(True, env="MODEL_COMPILED_INFERENCE")
+    # Carga el artefacto con joblib mmap_mode="r": los workers del host comparten sus páginas
+    MODEL_MMAP: bool = Field(True, env="MODEL_MMAP")
     
     # ========== Metadatos del modelo ==========
     MODEL_DESCRIPTION: str = Field(
@@ -35,7 +38,168 @@ class Settings(BaseSettings):
     
     # ========== Configuración de rendimiento ==========
     MODEL_BATCH_SIZE: int = Field(32, env="MODEL_BATCH_SIZE")
+    MODEL_MAX_BATCH_RECORDS: int = Field(10000, env="MODEL_MAX_BATCH_RECORDS")
     MODEL_MAX_CONCURRENT_REQUESTS: int = Field(10, env="MODEL_MAX_CONCURRENT_REQUESTS")
+    MODEL_EXECUTOR_TYPE: str = Field("thread", env="MODEL_EXECUTOR_TYPE")  # thread | process
+    MODEL_MICRO_BATCHING: bool = Field(True, env="MODEL_MICRO_BATCHING")
+    MODEL_BATCH_WINDOW_MS: float = Field(2.0, env="MODEL_BATCH_WINDOW_MS")
+    # Cascada: artefactos más baratos evaluados antes de MODEL_PATH, en orden
+    MODEL_CASCADE_PATHS: List[str] = Field(default_factory=list, env="MODEL_CASCADE_PATHS")
+    # Se escala a la siguiente etapa si inferior <= confianza < superior
+    MODEL_CASCADE_UNCERTAINTY_BAND: List[float] = Field([0.5, 0.8], env="MODEL_CASCADE_UNCERTAINTY_BAND")
+    
+    # ========== Control de admisión ==========
+    # Las solicitudes de análisis en curso se limitan a ADMISSION_MAX_CONCURRENT;
+    # el resto espera en una cola acotada y se rechaza al llenarse o al vencer la espera
+    ADMISSION_ENABLED: bool = Field(True, env="ADMISSION_ENABLED")
+    # Sin valor: MODEL_MAX_CONCURRENT_REQUESTS. Con micro-batching, fijarlo hasta
+    # MODEL_BATCH_SIZE x MODEL_MAX_CONCURRENT_REQUESTS permite lotes llenos en cada worker
+    ADMISSION_MAX_CONCURRENT: Optional[int] = Field(None, env="ADMISSION_MAX_CONCURRENT")
+    ADMISSION_QUEUE_SIZE: int = Field(100, env="ADMISSION_QUEUE_SIZE")
+    ADMISSION_MAX_WAIT_MS: float = Field(1000.0, env="ADMISSION_MAX_WAIT_MS")
+    ADMISSION_REJECT_STATUS: int = Field(503, env="ADMISSION_REJECT_STATUS")  # 429 | 503
+    # Responder con listas CIDR y reglas, sin el modelo, en lugar de rechazar
+    ADMISSION_DEGRADED_MODE: bool = Field(False, env="ADMISSION_DEGRADED_MODE")
+    # Clases de prioridad: critical | interactive | bulk
+    ADMISSION_DEFAULT_PRIORITY: str = Field("interactive", env="ADMISSION_DEFAULT_PRIORITY")
+    # Por nombre de API key (clave de API_KEYS), con precedencia sobre la ruta
+    ADMISSION_KEY_PRIORITIES: Dict[str, str] = Field(default_factory=dict, env="ADMISSION_KEY_PRIORITIES")
+    ADMISSION_ROUTE_PRIORITIES: Dict[str, str] = Field(
+        default_factory=lambda: {
+            "/api/v1/analyze/batch": "bulk",
+            "/api/v1/analyze/columnar": "bulk",
+            "/api/v1/analyze/stream": "bulk",
+            "/api/v1/analyze/pcap": "bulk"
+        },
+        env="ADMISSION_ROUTE_PRIORITIES"
+    )
+    # Fracción máxima de los cupos que puede ocupar cada clase
+    ADMISSION_CLASS_MAX_SHARE: Dict[str, float] = Field(
+        default_factory=lambda: {"bulk": 0.5},
+        env="ADMISSION_CLASS_MAX_SHARE"
+    )
+    
+    # ========== Registro de versiones del modelo ==========
+    # Directorio desde el que se permite cargar artefactos en caliente
+    MODEL_REGISTRY_DIR: str = Field("models", env="MODEL_REGISTRY_DIR")
+    MODEL_REGISTRY_MAX_VERSIONS: int = Field(3, env="MODEL_REGISTRY_MAX_VERSIONS")
+    MODEL_REGISTRY_RETIRE_GRACE_SECONDS: float = Field(30.0, env="MODEL_REGISTRY_RETIRE_GRACE_SECONDS")
+    # Intervalo de revisión de MODEL_PATH para recargar el modelo (0 desactiva)
+    MODEL_WATCH_INTERVAL_SECONDS: float = Field(0.0, env="MODEL_WATCH_INTERVAL_SECONDS")
+    
+    # ========== Ingesta en streaming (NDJSON) ==========
+    # Registros por micro-lote y espera máxima para completar un lote iniciado
+    STREAM_BATCH_SIZE: int = Field(256, env="STREAM_BATCH_SIZE")
+    STREAM_BATCH_WINDOW_MS: float = Field(20.0, env="STREAM_BATCH_WINDOW_MS")
+    # Registros leídos por adelantado; al llenarse se deja de leer el cuerpo (contrapresión)
+    STREAM_MAX_PENDING_RECORDS: int = Field(1024, env="STREAM_MAX_PENDING_RECORDS")
+    STREAM_MAX_LINE_BYTES: int = Field(65536, env="STREAM_MAX_LINE_BYTES")
+    
+    # ========== Canal WebSocket de sensores ==========
+    # Solicitudes en curso por conexión; al alcanzarlo se deja de leer del socket
+    WS_MAX_IN_FLIGHT: int = Field(64, env="WS_MAX_IN_FLIGHT")
+    
+    # ========== Métricas Prometheus ==========
+    # Endpoint /metrics y middleware de métricas HTTP
+    METRICS_ENABLED: bool = Field(True, env="METRICS_ENABLED")
+    # Exigir API key en /metrics (por defecto el scraper no la envía)
+    METRICS_REQUIRE_API_KEY: bool = Field(False, env="METRICS_REQUIRE_API_KEY")
+    
+    # ========== Perfilado y trazas ==========
+    # Duración máxima e intervalo por defecto del profiler de muestreo (/api/v1/admin/profile)
+    PROFILE_MAX_SECONDS: float = Field(60.0, env="PROFILE_MAX_SECONDS")
+    PROFILE_INTERVAL_MS: float = Field(5.0, env="PROFILE_INTERVAL_MS")
+    # Fracción de solicitudes HTTP con desglose de tiempos por etapa (0 desactiva)
+    TRACE_SAMPLE_RATE: float = Field(0.0, env="TRACE_SAMPLE_RATE")
+    # Archivo NDJSON donde se escriben los spans de las solicitudes trazadas (opcional)
+    TRACE_SPANS_PATH: Optional[str] = Field(None, env="TRACE_SPANS_PATH")
+    TRACE_QUEUE_SIZE: int = Field(10000, env="TRACE_QUEUE_SIZE")
+    
+    # ========== Persistencia de predicciones (write-behind) ==========
+    # Destino de las tablas predictions y audit_log: none | sqlite | postgres
+    PERSIST_BACKEND: str = Field("none", env="PERSIST_BACKEND")
+    PERSIST_SQLITE_PATH: str = Field("data/predictions.db", env="PERSIST_SQLITE_PATH")
+    PERSIST_DATABASE_URL: Optional[str] = Field(None, env="PERSIST_DATABASE_URL")
+    PERSIST_POSTGRES_METHOD: str = Field("copy", env="PERSIST_POSTGRES_METHOD")  # copy | insert
+    # Predicciones en memoria, filas por escritura y espera máxima de un lote incompleto
+    PERSIST_QUEUE_SIZE: int = Field(50000, env="PERSIST_QUEUE_SIZE")
+    PERSIST_BATCH_SIZE: int = Field(500, env="PERSIST_BATCH_SIZE")
+    PERSIST_FLUSH_INTERVAL_MS: float = Field(1000.0, env="PERSIST_FLUSH_INTERVAL_MS")
+    # Con la base lenta o caída: drop (retener y descartar al llenarse) | spill (desbordar a disco)
+    PERSIST_OVERFLOW_POLICY: str = Field("drop", env="PERSIST_OVERFLOW_POLICY")
+    PERSIST_SPILL_DIR: str = Field("data/spill", env="PERSIST_SPILL_DIR")
+    # Fracción de la cola a partir de la cual los lotes se desbordan en lugar de esperar a la base
+    PERSIST_SPILL_HIGH_WATERMARK: float = Field(0.5, env="PERSIST_SPILL_HIGH_WATERMARK")
+    PERSIST_RETRY_MAX_SECONDS: float = Field(30.0, env="PERSIST_RETRY_MAX_SECONDS")
+    
+    # ========== Ingesta de capturas PCAP ==========
+    # Un flujo se entrega tras este tiempo sin paquetes o esta duración (tiempo de la captura)
+    PCAP_FLOW_IDLE_TIMEOUT_SECONDS: float = Field(60.0, env="PCAP_FLOW_IDLE_TIMEOUT_SECONDS")
+    PCAP_FLOW_ACTIVE_TIMEOUT_SECONDS: float = Field(300.0, env="PCAP_FLOW_ACTIVE_TIMEOUT_SECONDS")
+    # Flujos activos en memoria; al superarse se entrega el menos reciente
+    PCAP_MAX_ACTIVE_FLOWS: int = Field(100000, env="PCAP_MAX_ACTIVE_FLOWS")
+    PCAP_BATCH_SIZE: int = Field(256, env="PCAP_BATCH_SIZE")
+    # Tamaño máximo de una captura subida a /api/v1/analyze/pcap
+    PCAP_MAX_UPLOAD_MB: int = Field(2048, env="PCAP_MAX_UPLOAD_MB")
+    
+    # ========== Servicio multiproceso con modelo compartido ==========
+    # Almacén de modelos compilados; el supervisor (python -m app.supervisor) lo define
+    # para sus workers, que adjuntan el modelo publicado en lugar de cargar MODEL_PATH
+    SHARED_MODEL_DIR: Optional[str] = Field(None, env="SHARED_MODEL_DIR")
+    # Intervalo con el que cada worker sigue la versión activa y publica su latido
+    SHARED_MODEL_POLL_SECONDS: float = Field(1.0, env="SHARED_MODEL_POLL_SECONDS")
+    # Workers del supervisor (0 = uno por núcleo)
+    SERVE_WORKERS: int = Field(0, env="SERVE_WORKERS")
+    
+    # ========== Caché de predicciones ==========
+    PREDICTION_CACHE_ENABLED: bool = Field(True, env="PREDICTION_CACHE_ENABLED")
+    PREDICTION_CACHE_MAX_ENTRIES: int = Field(100000, env="PREDICTION_CACHE_MAX_ENTRIES")
+    PREDICTION_CACHE_MAX_MB: int = Field(64, env="PREDICTION_CACHE_MAX_MB")
+    PREDICTION_CACHE_TTL_SECONDS: float = Field(60.0, env="PREDICTION_CACHE_TTL_SECONDS")
+    
+    # ========== Estado por IP de origen (ventanas deslizantes) ==========
+    FLOW_STATE_ENABLED: bool = Field(True, env="FLOW_STATE_ENABLED")
+    FLOW_WINDOWS_SECONDS: List[float] = Field(default_factory=lambda: [1, 10, 60], env="FLOW_WINDOWS_SECONDS")
+    FLOW_STATE_TTL_SECONDS: float = Field(300.0, env="FLOW_STATE_TTL_SECONDS")
+    FLOW_STATE_MAX_SOURCES: int = Field(200000, env="FLOW_STATE_MAX_SOURCES")
+    FLOW_STATE_MAX_MEMORY_MB: int = Field(256, env="FLOW_STATE_MAX_MEMORY_MB")
+    FLOW_STATE_MAX_EVENTS_PER_SOURCE: int = Field(1024, env="FLOW_STATE_MAX_EVENTS_PER_SOURCE")
+    FLOW_SCAN_PORT_THRESHOLD: int = Field(20, env="FLOW_SCAN_PORT_THRESHOLD")
+    
+    # ========== Sketches de heavy hitters (top-K de orígenes) ==========
+    SKETCH_ENABLED: bool = Field(True, env="SKETCH_ENABLED")
+    SKETCH_EPOCH_SECONDS: float = Field(60.0, env="SKETCH_EPOCH_SECONDS")
+    SKETCH_EPOCHS: int = Field(60, env="SKETCH_EPOCHS")
+    SKETCH_WIDTH: int = Field(2048, env="SKETCH_WIDTH")
+    SKETCH_DEPTH: int = Field(4, env="SKETCH_DEPTH")
+    SKETCH_CANDIDATES: int = Field(100, env="SKETCH_CANDIDATES")
+    SKETCH_HLL_PRECISION: int = Field(10, env="SKETCH_HLL_PRECISION")
+    
+    # ========== Agregación de alertas en incidentes ==========
+    INCIDENTS_ENABLED: bool = Field(True, env="INCIDENTS_ENABLED")
+    # Campos de la clave: source_ip, destination_ip, destination_port, protocol, risk_level
+    INCIDENT_KEY_FIELDS: List[str] = Field(default_factory=lambda: ["source_ip", "risk_level"], env="INCIDENT_KEY_FIELDS")
+    INCIDENT_RISK_LEVELS: List[str] = Field(default_factory=lambda: ["high", "critical"], env="INCIDENT_RISK_LEVELS")
+    # Un incidente se cierra tras esta inactividad o al superar la duración máxima
+    INCIDENT_WINDOW_SECONDS: float = Field(300.0, env="INCIDENT_WINDOW_SECONDS")
+    INCIDENT_MAX_DURATION_SECONDS: float = Field(3600.0, env="INCIDENT_MAX_DURATION_SECONDS")
+    INCIDENT_MAX_OPEN: int = Field(10000, env="INCIDENT_MAX_OPEN")
+    INCIDENT_MAX_PORTS: int = Field(1024, env="INCIDENT_MAX_PORTS")
+    INCIDENT_HISTORY_SIZE: int = Field(1000, env="INCIDENT_HISTORY_SIZE")
+    INCIDENT_STREAM_QUEUE_SIZE: int = Field(1000, env="INCIDENT_STREAM_QUEUE_SIZE")
+    # No persistir las alertas que se suman a un incidente ya abierto
+    INCIDENT_SUPPRESS_PERSISTENCE: bool = Field(True, env="INCIDENT_SUPPRESS_PERSISTENCE")
+    
+    # ========== Listas CIDR de permitidos/bloqueados ==========
+    CIDR_LIST_PATH: Optional[str] = Field(None, env="CIDR_LIST_PATH")
+    CIDR_RELOAD_INTERVAL_SECONDS: float = Field(5.0, env="CIDR_RELOAD_INTERVAL_SECONDS")
+    CIDR_DENY_RISK_LEVEL: str = Field("high", env="CIDR_DENY_RISK_LEVEL")
+    
+    # ========== Prefiltro de reglas ==========
+    # Archivo JSON con el conjunto de reglas; si no se define se usan las reglas por defecto
+    RULES_PATH: Optional[str] = Field(None, env="RULES_PATH")
+    # Si las reglas de veredicto evitan la llamada al modelo (False: solo aportan indicadores)
+    RULES_SHORT_CIRCUIT: bool = Field(True, env="RULES_SHORT_CIRCUIT")
     
     # ========== Configuración de seguridad ==========
     SECRET_KEY: str = Field("your-secret-key-here", env="SECRET_KEY")
@@ -45,6 +209,7 @@ class Settings(BaseSettings):
         default_factory=lambda: {"default": "test-key"},
         env="API_KEYS"
     )
+    ADMIN_API_KEYS: Dict[str, str] = Field(default_factory=dict, env="ADMIN_API_KEYS")
     
     # ========== Configuración de registro ==========
     LOG_LEVEL: str = Field("INFO", env="LOG_LEVEL")
@@ -0,0 +1,56 @@
+"""
+Dependencias de autenticación por API key.
+"""
+from typing import Optional
+
+from fastapi import HTTPException, Security, status
+from fastapi.security import APIKeyHeader
+
+from .config import settings
+
+# Configuración de seguridad
+API_KEY_NAME = "X-API-Key"
+api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
+
+def check_api_key(api_key: Optional[str]) -> Optional[str]:
+    """
+    Comprueba una API key de cliente.
+    
+    Returns:
+        La API key (``dev-key`` en modo dev sin claves configuradas) o None si no es válida
+    """
+    if settings.ENVIRONMENT == "development" and not settings.API_KEYS:
+        return "dev-key"
+    if not api_key or api_key not in settings.API_KEYS.values():
+        return None
+    return api_key
+
+def get_api_key(api_key_header: str = Security(api_key_header)) -> str:
+    """Valida la API key proporcionada en el header."""
+    api_key = check_api_key(api_key_header)
+    if api_key is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="API key inválida o faltante"
+        )
+    return api_key
+
+def get_admin_api_key(api_key_header: str = Security(api_key_header)) -> str:
+    """
+    Valida que la API key del header tenga permisos de administración.
+    
+    Sin ``ADMIN_API_KEYS`` la administración queda desactivada (403) en cualquier
+    entorno: estos endpoints cambian el modelo y el comportamiento del servicio.
+    """
+    if not settings.ADMIN_API_KEYS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Administración desactivada: defina ADMIN_API_KEYS"
+        )
+    
+    if not api_key_header or api_key_header not in settings.ADMIN_API_KEYS.values():
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="API key de administración inválida o faltante"
+        )
+    return api_key_header
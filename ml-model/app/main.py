@@ -1,13 +1,47 @@
 # En app/main.py
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .core.config import settings
 from .api.endpoints import router as api_router
+from .api.admin import router as admin_router
+from .api.ws import router as ws_router
+from .api.metrics import MetricsMiddleware, router as metrics_router
+from .api.tracing import TracingMiddleware
+from .services.ml_service import ml_service
+from .services.persistence import writer as persistence_writer
+from .services.tracing import tracer
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Carga y calentamiento del modelo en segundo plano: el proceso acepta conexiones
+    # de inmediato y /api/v1/ready responde 503 hasta que el modelo está listo
+    ml_service.start()
+    # Escritura en lotes de predicciones y auditoría en la base de datos (PERSIST_BACKEND)
+    if persistence_writer is not None:
+        persistence_writer.start()
+    # Revisión en segundo plano de MODEL_PATH para recargar el modelo sin reiniciar
+    watcher = asyncio.create_task(ml_service.watch_model_file())
+    # Recarga de CIDR_LIST_PATH en un hilo aparte cuando cambia el archivo
+    cidr_watcher = asyncio.create_task(ml_service.cidr_list.watch())
+    yield
+    for task in (watcher, cidr_watcher):
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    # Los incidentes abiertos se cierran para publicar su resumen final
+    if ml_service.incidents is not None:
+        ml_service.incidents.close_all()
+    tracer.close()
+    if persistence_writer is not None:
+        await asyncio.to_thread(persistence_writer.close)
 
 app = FastAPI(
     title="Red Sentinel ML API",
     description="API para análisis de amenazas de red con IA",
-    version=getattr(settings, "MODEL_VERSION", "0.1.0")
+    version=getattr(settings, "MODEL_VERSION", "0.1.0"),
+    lifespan=lifespan
 )
 
 # Configuración de CORS (ajusta orígenes según tu entorno)
@@ -21,11 +55,22 @@ app.add_middleware(
 
 # Incluir los endpoints MCP (ya llevan prefijo /api/v1 en el router)
 app.include_router(api_router)
+app.include_router(admin_router)
+app.include_router(ws_router)
+
+# Métricas en formato Prometheus (/metrics) y medición de las solicitudes HTTP
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics_router)
+
+# Desglose de tiempos por etapa de una muestra de solicitudes (TRACE_SAMPLE_RATE)
+app.add_middleware(TracingMiddleware)
 
 @app.get("/")
 async def root():
     return {
         "message": "Red Sentinel ML API",
         "docs": "/docs",
-        "health": "/api/v1/health"
+        "health": "/api/v1/health",
+        "ready": "/api/v1/ready"
     }
\ No newline at end of file
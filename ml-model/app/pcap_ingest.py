@@ -0,0 +1,115 @@
+"""
+Analiza capturas PCAP/PCAPNG: agrupa los paquetes en flujos y los evalúa por lotes.
+
+Uso (desde ``ml-model/``)::
+
+    python -m app.pcap_ingest captura.pcap --output resultados.ndjson
+
+Escribe un ``ModelOutput`` (o un error) por flujo en NDJSON, con los contadores del
+flujo en ``metadata.capture``, e informa periódicamente los paquetes por segundo.
+Al terminar imprime el resumen de la lectura en la salida de errores.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from typing import List, TextIO
+
+from .core.config import settings
+from .schemas.mcp import BatchItemError, ModelOutput
+from .services.ml_service import ml_service
+from .services.pcap import PcapFormatError, PcapStats, iter_capture_inputs, score_capture
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Intervalo entre reportes de progreso
+_PROGRESS_SECONDS = 5.0
+
+
+async def ingest(path: str, output: TextIO, args: argparse.Namespace) -> PcapStats:
+    """
+    Analiza una captura y escribe los resultados.
+
+    Returns:
+        PcapStats: Contadores de la lectura
+    """
+    stats = PcapStats()
+    batches = iter_capture_inputs(
+        path,
+        batch_size=args.batch_size,
+        idle_timeout=args.idle_timeout,
+        active_timeout=args.active_timeout,
+        max_flows=args.max_flows,
+        stats=stats
+    )
+    await ml_service.ensure_ready()
+    flows = threats = 0
+    next_report = time.monotonic() + _PROGRESS_SECONDS
+    async for input_data, outcome in score_capture(batches, ml_service.analyze_batch):
+        index, flows = flows, flows + 1
+        if not isinstance(outcome, ModelOutput):
+            error = BatchItemError(index=index, request_id=input_data.request_id, error=str(outcome))
+            output.write(error.model_dump_json() + "\n")
+        elif outcome.prediction == 1 or not args.threats_only:
+            threats += outcome.prediction == 1
+            output.write(outcome.model_dump_json() + "\n")
+        if time.monotonic() >= next_report:
+            next_report = time.monotonic() + _PROGRESS_SECONDS
+            logger.info(
+                f"{stats.packets} paquetes ({stats.packets_per_second:.0f} paquetes/s), "
+                f"{stats.flows} flujos, {threats} amenazas"
+            )
+    logger.info(f"Captura {path} analizada: {stats.flows} flujos, {threats} amenazas")
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Análisis de capturas PCAP/PCAPNG por flujos")
+    parser.add_argument("captures", nargs="+", help="Capturas a analizar")
+    parser.add_argument("--output", default="-", help="Archivo NDJSON de resultados (por defecto, salida estándar)")
+    parser.add_argument("--threats-only", action="store_true", help="Escribir solo los flujos clasificados como amenaza")
+    parser.add_argument("--batch-size", type=int, default=settings.PCAP_BATCH_SIZE, help="Flujos por lote")
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=settings.PCAP_FLOW_IDLE_TIMEOUT_SECONDS,
+        help="Segundos sin paquetes tras los que se cierra un flujo"
+    )
+    parser.add_argument(
+        "--active-timeout",
+        type=float,
+        default=settings.PCAP_FLOW_ACTIVE_TIMEOUT_SECONDS,
+        help="Duración máxima de un flujo"
+    )
+    parser.add_argument("--max-flows", type=int, default=settings.PCAP_MAX_ACTIVE_FLOWS, help="Flujos activos en memoria")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.LOG_LEVEL, format=settings.LOG_FORMAT, stream=sys.stderr)
+
+    async def run() -> List[dict]:
+        ml_service.start()
+        summaries = []
+        output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+        try:
+            for path in args.captures:
+                stats = await ingest(path, output, args)
+                summaries.append({"capture": path, **stats.to_dict()})
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        return summaries
+
+    try:
+        summaries = asyncio.run(run())
+    except (OSError, PcapFormatError) as e:
+        logger.error(str(e))
+        sys.exit(1)
+    for summary in summaries:
+        print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+"""
+Reproduce tráfico grabado contra ``MLService`` en el mismo proceso, sin HTTP.
+
+Uso (desde ``ml-model/``)::
+
+    python -m app.replay trafico.jsonl --output resultados.ndjson --model models/candidato.pkl
+
+El archivo tiene un ``ModelInput`` por línea (``.jsonl`` o ``.jsonl.gz``). Los
+registros se agrupan en micro-lotes igual que en ``/analyze/stream`` y se analizan
+con ``analyze_batch``, el mismo camino que en producción (listas CIDR, reglas,
+agregados por origen y cascada). Los resultados se escriben en NDJSON en el orden de
+entrada y al terminar se imprime un informe con registros por segundo, percentiles
+de latencia por etapa, decisiones por camino y, si los registros traen etiqueta,
+la matriz de confusión.
+
+Con ``--speed N`` cada registro se envía cuando le corresponde según su
+``timestamp``, a N veces la velocidad original, para reproducir la forma de la
+carga de producción.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import random
+import sys
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Deque, Dict, IO, List, Optional, TextIO, Tuple, Union
+
+import numpy as np
+from pydantic import ValidationError
+
+from .core.config import settings
+from .schemas.mcp import BatchItemError, ModelInput, ModelOutput
+from .services.flow_state import event_time
+from .services.ml_service import ml_service
+from .services import persistence
+from .services.streaming import stream_micro_batches
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Intervalo entre reportes de progreso
+_PROGRESS_SECONDS = 5.0
+
+# Muestras retenidas por serie de latencia
+_RESERVOIR_SIZE = 100000
+
+# Registro leído: posición en el archivo, entrada (o error de lectura) y etiqueta
+ReplayItem = Tuple[int, Union[ModelInput, Exception], Optional[int]]
+
+
+class LatencyReservoir:
+    """
+    Muestra uniforme de tamaño fijo de una serie de latencias.
+
+    Los percentiles de una repetición de un día de tráfico se calculan sobre a lo
+    sumo ``size`` muestras (muestreo de reservorio), así que la memoria no crece con
+    el número de registros; la media y el máximo son exactos.
+    """
+
+    def __init__(self, size: int = _RESERVOIR_SIZE, seed: int = 0):
+        self.size = size
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self._samples: List[float] = []
+        self._random = random.Random(seed)
+
+    def add(self, value: float) -> None:
+        """Agrega una medición en milisegundos."""
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+        if len(self._samples) < self.size:
+            self._samples.append(value)
+        else:
+            slot = self._random.randrange(self.count)
+            if slot < self.size:
+                self._samples[slot] = value
+
+    def summary(self) -> Dict[str, float]:
+        """Percentiles p50/p90/p99, media y máximo."""
+        if not self.count:
+            return {"count": 0}
+        p50, p90, p99 = np.percentile(np.asarray(self._samples), [50, 90, 99])
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3),
+            "p50_ms": round(float(p50), 3),
+            "p90_ms": round(float(p90), 3),
+            "p99_ms": round(float(p99), 3),
+            "max_ms": round(self.maximum, 3)
+        }
+
+
+def parse_label(value: Any) -> Optional[int]:
+    """
+    Interpreta la etiqueta de un registro (1 = amenaza, 0 = benigno).
+
+    Acepta enteros, booleanos y los textos ``threat``/``malicious``/``attack`` o
+    ``benign``/``normal``; cualquier otro valor deja el registro sin etiqueta.
+    """
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return int(value)
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in ("1", "true", "threat", "malicious", "attack"):
+            return 1
+        if text in ("0", "false", "benign", "normal"):
+            return 0
+    return None
+
+
+class ReplayReport:
+    """Contadores, latencias y matriz de confusión de una repetición."""
+
+    def __init__(self):
+        self.records = 0
+        self.invalid = 0
+        self.failed = 0
+        self.threats = 0
+        self.decisions: Counter = Counter()
+        self.latencies: Dict[str, LatencyReservoir] = {}
+        self.confusion = {"tp": 0, "fp": 0, "tn": 0, "fn": 0}
+        self.labeled = 0
+        self.max_lag_ms = 0.0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def latency(self, name: str, value: float) -> None:
+        """Agrega una latencia a la serie ``name``."""
+        reservoir = self.latencies.get(name)
+        if reservoir is None:
+            reservoir = self.latencies[name] = LatencyReservoir()
+        reservoir.add(value)
+
+    def add(self, outcome: Union[ModelOutput, Exception], label: Optional[int]) -> None:
+        """Registra el resultado de un registro analizado."""
+        if not isinstance(outcome, ModelOutput):
+            self.failed += 1
+            return
+        self.threats += outcome.prediction == 1
+        metadata = outcome.metadata or {}
+        cascade = metadata.get("cascade")
+        if metadata.get("short_circuit"):
+            self.decisions[metadata["short_circuit"]] += 1
+        elif cascade:
+            self.decisions[f"model:{cascade['stage_name']}"] += 1
+            for stage_name, value in cascade.get("stage_latency_ms", {}).items():
+                self.latency(f"stage:{stage_name}", value)
+        for key in ("queue_wait_ms", "execution_ms"):
+            if key in metadata:
+                self.latency(key, metadata[key])
+        if label is not None:
+            self.labeled += 1
+            key = ("tp" if label else "fp") if outcome.prediction == 1 else ("fn" if label else "tn")
+            self.confusion[key] += 1
+
+    @property
+    def records_per_second(self) -> float:
+        """Registros procesados por segundo desde el inicio."""
+        elapsed = self.elapsed or time.perf_counter() - self.started
+        return self.records / elapsed if elapsed > 0 else 0.0
+
+    def classification(self) -> Optional[Dict[str, Any]]:
+        """Matriz de confusión y métricas derivadas, si hubo registros etiquetados."""
+        if not self.labeled:
+            return None
+        tp, fp, tn, fn = (self.confusion[key] for key in ("tp", "fp", "tn", "fn"))
+
+        def ratio(numerator: int, denominator: int) -> Optional[float]:
+            return round(numerator / denominator, 4) if denominator else None
+
+        precision, recall = ratio(tp, tp + fp), ratio(tp, tp + fn)
+        return {
+            "labeled": self.labeled,
+            **self.confusion,
+            "accuracy": ratio(tp + tn, self.labeled),
+            "precision": precision,
+            "recall": recall,
+            "f1": round(2 * precision * recall / (precision + recall), 4) if precision and recall else None,
+            "false_positive_rate": ratio(fp, fp + tn)
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Informe final en forma serializable."""
+        return {
+            "records": self.records,
+            "invalid": self.invalid,
+            "failed": self.failed,
+            "threats": self.threats,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "records_per_second": round(self.records_per_second, 1),
+            "max_lag_ms": round(self.max_lag_ms, 3),
+            "decisions": dict(self.decisions),
+            "latency": {name: reservoir.summary() for name, reservoir in sorted(self.latencies.items())},
+            "classification": self.classification()
+        }
+
+
+def _open_records(path: str) -> IO[bytes]:
+    """Abre el archivo de registros, comprimido con gzip si termina en ``.gz``."""
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+async def iter_records(
+    path: str,
+    label_field: str,
+    speed: Optional[float],
+    report: ReplayReport
+) -> AsyncIterator[ReplayItem]:
+    """
+    Lee los registros del archivo y los entrega a su ritmo.
+
+    Sin ``speed`` los registros se entregan tan rápido como se consumen. Con
+    ``speed`` cada registro espera hasta ``inicio + (timestamp - primer timestamp) / speed``;
+    si el consumo no da abasto, el retraso máximo respecto al horario queda en
+    ``report.max_lag_ms``.
+
+    Args:
+        path: Archivo JSONL de ``ModelInput``
+        label_field: Clave de la etiqueta; se quita del registro antes de validarlo
+        speed: Factor de velocidad respecto a los timestamps originales
+        report: Informe donde se cuentan los registros inválidos y el retraso
+
+    Yields:
+        tuple: Posición, ``ModelInput`` (o el error de lectura) y etiqueta
+    """
+    loop = asyncio.get_running_loop()
+    origin: Optional[Tuple[float, float]] = None
+    with _open_records(path) as records:
+        for index, line in enumerate(records):
+            if not line.strip():
+                continue
+            label = None
+            try:
+                record = json.loads(line)
+                if isinstance(record, dict):
+                    label = parse_label(record.pop(label_field, None))
+                item: Union[ModelInput, Exception] = ModelInput.model_validate(record)
+            except (ValueError, ValidationError) as e:
+                report.invalid += 1
+                yield index, e, label
+                continue
+
+            if speed:
+                offset = event_time(item.timestamp)
+                if origin is None:
+                    origin = (loop.time(), offset)
+                due = origin[0] + (offset - origin[1]) / speed
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    report.max_lag_ms = max(report.max_lag_ms, -delay * 1000)
+            yield index, item, label
+
+
+async def replay(args: argparse.Namespace, output: TextIO) -> ReplayReport:
+    """
+    Reproduce un archivo de registros y escribe los resultados.
+
+    Hasta ``args.concurrency`` lotes se analizan a la vez; los resultados se
+    escriben en el orden de entrada.
+
+    Returns:
+        ReplayReport: Informe de la repetición
+    """
+    await ml_service.ensure_ready()
+    report = ReplayReport()
+    items = iter_records(args.records, args.label_field, args.speed, report)
+    batches = stream_micro_batches(
+        items,
+        batch_size=args.batch_size,
+        window_ms=args.window_ms,
+        max_pending=max(settings.STREAM_MAX_PENDING_RECORDS, args.batch_size * args.concurrency)
+    )
+
+    async def score(batch: List[ReplayItem]) -> Tuple[List[Union[ModelOutput, Exception]], float]:
+        started = time.perf_counter()
+        outcomes = await ml_service.analyze_batch([item for _, item, _ in batch if isinstance(item, ModelInput)])
+        return outcomes, (time.perf_counter() - started) * 1000
+
+    def write(batch: List[ReplayItem], outcomes: List[Union[ModelOutput, Exception]], batch_ms: float) -> None:
+        results = iter(outcomes)
+        report.latency("batch_ms", batch_ms)
+        scored_inputs: List[ModelInput] = []
+        scored: List[Union[ModelOutput, Exception]] = []
+        for index, item, label in batch:
+            report.records += 1
+            if not isinstance(item, ModelInput):
+                output.write(BatchItemError(index=index, request_id=None, error=str(item)).model_dump_json() + "\n")
+                continue
+            outcome = next(results)
+            report.add(outcome, label)
+            scored_inputs.append(item)
+            scored.append(outcome)
+            if isinstance(outcome, ModelOutput):
+                output.write(outcome.model_dump_json() + "\n")
+            else:
+                error = BatchItemError(index=index, request_id=item.request_id, error=str(outcome))
+                output.write(error.model_dump_json() + "\n")
+        if args.persist:
+            persistence.persist_outcomes(scored_inputs, scored, None, batch_ms)
+
+    in_flight: Deque[Tuple[List[ReplayItem], asyncio.Task]] = deque()
+    next_report = time.monotonic() + _PROGRESS_SECONDS
+    try:
+        async for batch in batches:
+            in_flight.append((batch, asyncio.create_task(score(batch))))
+            while len(in_flight) >= args.concurrency or (in_flight and in_flight[0][1].done()):
+                done_batch, task = in_flight.popleft()
+                write(done_batch, *await task)
+            if time.monotonic() >= next_report:
+                next_report = time.monotonic() + _PROGRESS_SECONDS
+                logger.info(
+                    f"{report.records} registros ({report.records_per_second:.0f} registros/s), "
+                    f"{report.threats} amenazas"
+                )
+        while in_flight:
+            done_batch, task = in_flight.popleft()
+            write(done_batch, *await task)
+    finally:
+        for _, task in in_flight:
+            task.cancel()
+    report.elapsed = time.perf_counter() - report.started
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Repetición offline de tráfico grabado contra el servicio ML")
+    parser.add_argument("records", help="Archivo JSONL de ModelInput (.jsonl o .jsonl.gz)")
+    parser.add_argument("--output", default="-", help="Archivo NDJSON de resultados (por defecto, salida estándar)")
+    parser.add_argument("--report", help="Archivo JSONL al que se agrega el informe final")
+    parser.add_argument("--model", help="Artefacto del modelo (por defecto, MODEL_PATH)")
+    parser.add_argument("--model-version", help="Versión con la que se etiqueta el modelo (por defecto, MODEL_VERSION)")
+    parser.add_argument("--batch-size", type=int, default=settings.STREAM_BATCH_SIZE, help="Registros por lote")
+    parser.add_argument(
+        "--window-ms",
+        type=float,
+        default=settings.STREAM_BATCH_WINDOW_MS,
+        help="Espera máxima para completar un lote"
+    )
+    parser.add_argument("--concurrency", type=int, default=4, help="Lotes analizados a la vez")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.MODEL_MAX_CONCURRENT_REQUESTS,
+        help="Workers del ejecutor de inferencia"
+    )
+    parser.add_argument(
+        "--executor",
+        choices=("thread", "process"),
+        default=settings.MODEL_EXECUTOR_TYPE,
+        help="Tipo de ejecutor de inferencia"
+    )
+    parser.add_argument("--speed", type=float, help="Reproducir a N veces la velocidad original según los timestamps")
+    parser.add_argument("--label-field", default="label", help="Clave de la etiqueta en cada registro")
+    parser.add_argument(
+        "--no-persist",
+        dest="persist",
+        action="store_false",
+        help="No guardar las predicciones aunque PERSIST_BACKEND esté configurado"
+    )
+    args = parser.parse_args()
+    if args.speed is not None and args.speed <= 0:
+        parser.error("--speed debe ser mayor que 0")
+    args.batch_size, args.concurrency = max(args.batch_size, 1), max(args.concurrency, 1)
+
+    logging.basicConfig(level=settings.LOG_LEVEL, format=settings.LOG_FORMAT, stream=sys.stderr)
+
+    # El modelo y el ejecutor se construyen en start() a partir de la configuración
+    if args.model:
+        settings.MODEL_PATH = args.model
+    if args.model_version:
+        settings.MODEL_VERSION = args.model_version
+    settings.MODEL_MAX_CONCURRENT_REQUESTS = max(args.workers, 1)
+    settings.MODEL_EXECUTOR_TYPE = args.executor
+
+    async def run() -> ReplayReport:
+        ml_service.start()
+        if args.persist and persistence.writer is not None:
+            persistence.writer.start()
+        output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+        try:
+            return await replay(args, output)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+            if args.persist and persistence.writer is not None:
+                await asyncio.to_thread(persistence.writer.close)
+
+    try:
+        report = asyncio.run(run())
+    except OSError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "records_file": args.records,
+        "model_path": settings.MODEL_PATH,
+        "model_version": ml_service.metadata.version,
+        "batch_size": args.batch_size,
+        "concurrency": args.concurrency,
+        "workers": settings.MODEL_MAX_CONCURRENT_REQUESTS,
+        "executor": settings.MODEL_EXECUTOR_TYPE,
+        "speed": args.speed,
+        **report.to_dict()
+    }
+    print(json.dumps(result, indent=2), file=sys.stderr)
+    if args.report:
+        with open(args.report, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -156,3 +156,33 @@ class ModelMetadata(BaseModel):
                 "documentation_url": "https://github.com/yourorg/red-sentinel/docs"
             }
         }
+
+class BatchItemError(BaseModel):
+    """
+    Error asociado a un registro individual dentro de un lote.
+    Permite reportar fallos por fila sin invalidar el lote completo.
+    """
+    index: int = Field(..., description="Posición del registro dentro del lote")
+    request_id: Optional[str] = Field(None, description="Identificador de la solicitud, si pudo determinarse")
+    error: str = Field(..., description="Descripción del error")
+
+class BatchAnalysisResponse(BaseModel):
+    """
+    Respuesta del análisis por lotes.
+    Cada resultado incluye `metadata.batch_index` con su posición en el lote.
+    """
+    results: List[ModelOutput] = Field(
+        default_factory=list,
+        description="Resultados de los registros analizados correctamente"
+    )
+    errors: List[BatchItemError] = Field(
+        default_factory=list,
+        description="Errores de los registros que no pudieron analizarse"
+    )
+    total: int = Field(..., description="Número de registros recibidos")
+    succeeded: int = Field(..., description="Número de registros analizados")
+    failed: int = Field(..., description="Número de registros con error")
+    metadata: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="Metadatos del procesamiento del lote"
+    )
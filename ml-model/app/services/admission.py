@@ -0,0 +1,361 @@
+"""
+Control de admisión y descarte de carga por prioridad.
+
+Cada solicitud de análisis ocupa un cupo de ``max_concurrent`` mientras se
+resuelve. Sin cupo libre espera en una cola acotada por clase de prioridad; al
+liberarse un cupo se atiende primero la clase más prioritaria. Cuando la cola
+está llena, una solicitud desplaza a la más reciente de una clase inferior o se
+rechaza, y ninguna espera más de ``max_wait_seconds``: bajo sobrecarga la
+latencia queda acotada y el tráfico crítico no espera detrás del masivo.
+
+Todo ocurre en el event loop, sin locks.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Mapping, Optional
+
+from ..core.config import settings
+from .metrics import STAGE_ADMISSION
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Clases de prioridad, de la más a la menos prioritaria
+PRIORITY_CLASSES = ("critical", "interactive", "bulk")
+
+# Motivos de rechazo
+REJECT_QUEUE_FULL = "queue_full"
+REJECT_DISPLACED = "displaced"
+REJECT_TIMEOUT = "timeout"
+
+# Cota del Retry-After sugerido, en segundos
+_MAX_RETRY_AFTER = 60
+
+
+class AdmissionRejected(Exception):
+    """La solicitud no obtuvo cupo; ``retry_after`` es la espera sugerida en segundos."""
+
+    def __init__(self, priority: str, reason: str, retry_after: int):
+        super().__init__(f"Solicitud {priority} rechazada por sobrecarga ({reason})")
+        self.priority = priority
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Limita las solicitudes en curso con una cola de espera acotada por prioridad.
+
+    Una clase con ``class_max_share`` no ocupa más de esa fracción de los cupos,
+    de modo que el tráfico masivo deja capacidad libre a las clases superiores
+    aunque llegue primero.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        queue_size: int = 100,
+        max_wait_seconds: float = 1.0,
+        class_max_share: Optional[Mapping[str, float]] = None
+    ):
+        """
+        Args:
+            max_concurrent: Solicitudes en curso como máximo
+            queue_size: Solicitudes en espera como máximo, entre todas las clases
+            max_wait_seconds: Espera máxima por un cupo antes de rechazar
+            class_max_share: Fracción máxima de los cupos por clase (p. ej. ``{"bulk": 0.5}``)
+
+        Raises:
+            ValueError: Si una clase de ``class_max_share`` no existe
+        """
+        unknown = [name for name in (class_max_share or {}) if name not in PRIORITY_CLASSES]
+        if unknown:
+            raise ValueError(f"Clases de prioridad no válidas: {unknown}; use {PRIORITY_CLASSES}")
+        self.max_concurrent = max(max_concurrent, 1)
+        self.queue_size = max(queue_size, 0)
+        self.max_wait_seconds = max_wait_seconds
+        self.class_limits = {
+            name: max(1, math.floor((class_max_share or {}).get(name, 1.0) * self.max_concurrent))
+            for name in PRIORITY_CLASSES
+        }
+
+        self._in_flight = 0
+        self._running: Counter = Counter()
+        self._waiting: Dict[str, Deque[asyncio.Future]] = {name: deque() for name in PRIORITY_CLASSES}
+        # Duración media de una solicitud admitida (EWMA), para estimar Retry-After
+        self._service_seconds = 0.0
+
+        # Métricas acumuladas
+        self.admitted: Counter = Counter()
+        self.rejected: Counter = Counter()
+        self.degraded: Counter = Counter()
+
+    @property
+    def in_flight(self) -> int:
+        """Solicitudes en curso."""
+        return self._in_flight
+
+    @property
+    def waiting(self) -> int:
+        """Solicitudes en espera de un cupo."""
+        return sum(len(queue) for queue in self._waiting.values())
+
+    @asynccontextmanager
+    async def admit(self, priority: str) -> AsyncIterator[None]:
+        """
+        Ocupa un cupo durante el bloque ``async with``.
+
+        Args:
+            priority: Clase de prioridad de la solicitud
+
+        Raises:
+            AdmissionRejected: Si la cola está llena, la solicitud fue desplazada por
+                otra más prioritaria o venció la espera máxima
+        """
+        await self.acquire(priority)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(priority, time.perf_counter() - started)
+
+    def record_degraded(self, priority: str) -> None:
+        """Cuenta una solicitud rechazada que se atendió en modo degradado."""
+        self.degraded[priority] += 1
+
+    async def acquire(self, priority: str) -> None:
+        """
+        Espera un cupo; cada cupo obtenido debe devolverse con ``release``.
+
+        Raises:
+            AdmissionRejected: Si no se obtuvo cupo
+        """
+        rank = PRIORITY_CLASSES.index(priority)
+        ahead = any(self._waiting[name] for name in PRIORITY_CLASSES[:rank + 1])
+        if not ahead and self._has_slot(priority):
+            self._take(priority)
+            return
+
+        if self.waiting >= self.queue_size and not self._displace(rank):
+            raise self._reject(priority, REJECT_QUEUE_FULL)
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._waiting[priority].append(future)
+        try:
+            await asyncio.wait((future,), timeout=self.max_wait_seconds)
+        except asyncio.CancelledError:
+            # Cliente desconectado: devolver el cupo si ya se había concedido
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release(priority, None)
+            else:
+                self._forget(priority, future)
+            raise
+        if not future.done():
+            self._forget(priority, future)
+            raise self._reject(priority, REJECT_TIMEOUT)
+        future.result()
+
+    def _displace(self, rank: int) -> bool:
+        """Rechaza la espera más reciente de la clase más baja inferior a ``rank``."""
+        for name in reversed(PRIORITY_CLASSES[rank + 1:]):
+            queue = self._waiting[name]
+            if queue:
+                queue.pop().set_exception(self._reject(name, REJECT_DISPLACED))
+                return True
+        return False
+
+    def _forget(self, priority: str, future: asyncio.Future) -> None:
+        try:
+            self._waiting[priority].remove(future)
+        except ValueError:
+            pass
+        future.cancel()
+
+    def _has_slot(self, priority: str) -> bool:
+        return self._in_flight < self.max_concurrent and self._running[priority] < self.class_limits[priority]
+
+    def _take(self, priority: str) -> None:
+        self._in_flight += 1
+        self._running[priority] += 1
+        self.admitted[priority] += 1
+
+    def release(self, priority: str, elapsed: Optional[float]) -> None:
+        """Devuelve un cupo; ``elapsed`` (segundos en curso) alimenta la estimación de Retry-After."""
+        self._in_flight -= 1
+        self._running[priority] -= 1
+        if elapsed is not None:
+            self._service_seconds = elapsed if not self._service_seconds else 0.9 * self._service_seconds + 0.1 * elapsed
+        # Conceder los cupos libres empezando por la clase más prioritaria
+        for name in PRIORITY_CLASSES:
+            queue = self._waiting[name]
+            while queue and self._has_slot(name):
+                future = queue.popleft()
+                if future.done():
+                    continue
+                self._take(name)
+                future.set_result(None)
+
+    def _reject(self, priority: str, reason: str) -> AdmissionRejected:
+        self.rejected[(priority, reason)] += 1
+        return AdmissionRejected(priority, reason, self.retry_after())
+
+    def retry_after(self) -> int:
+        """
+        Espera sugerida hasta que se vacíe la cola actual.
+
+        Returns:
+            int: Segundos, entre 1 y 60
+        """
+        pending = self.waiting + self._in_flight
+        estimate = self._service_seconds * pending / self.max_concurrent
+        return min(max(math.ceil(estimate), 1), _MAX_RETRY_AFTER)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Devuelve el estado del control de admisión.
+
+        Returns:
+            dict: Cupos, solicitudes en curso y en espera y, por clase, admitidas,
+            rechazadas por motivo y atendidas en modo degradado
+        """
+        return {
+            "max_concurrent": self.max_concurrent,
+            "queue_size": self.queue_size,
+            "max_wait_seconds": self.max_wait_seconds,
+            "in_flight": self._in_flight,
+            "waiting": self.waiting,
+            "avg_service_ms": round(self._service_seconds * 1000, 3),
+            "retry_after_seconds": self.retry_after(),
+            "classes": {
+                name: {
+                    "limit": self.class_limits[name],
+                    "in_flight": self._running[name],
+                    "waiting": len(self._waiting[name]),
+                    "admitted": self.admitted[name],
+                    "rejected": {
+                        reason: self.rejected[(name, reason)]
+                        for reason in (REJECT_QUEUE_FULL, REJECT_DISPLACED, REJECT_TIMEOUT)
+                    },
+                    "degraded": self.degraded[name]
+                }
+                for name in PRIORITY_CLASSES
+            }
+        }
+
+
+def resolve_priority(api_key: Optional[str], route: str) -> str:
+    """
+    Clase de prioridad de una solicitud.
+
+    Se usa la de ``ADMISSION_KEY_PRIORITIES`` para el nombre de la API key (el de
+    ``API_KEYS``), si no la de ``ADMISSION_ROUTE_PRIORITIES`` para la ruta y si no
+    ``ADMISSION_DEFAULT_PRIORITY``.
+
+    Args:
+        api_key: API key validada del cliente
+        route: Plantilla de la ruta (``/api/v1/analyze/batch``)
+
+    Returns:
+        str: Una de ``PRIORITY_CLASSES``
+    """
+    for name, value in settings.API_KEYS.items():
+        if value == api_key and name in settings.ADMISSION_KEY_PRIORITIES:
+            return settings.ADMISSION_KEY_PRIORITIES[name]
+    return settings.ADMISSION_ROUTE_PRIORITIES.get(route, settings.ADMISSION_DEFAULT_PRIORITY)
+
+
+@asynccontextmanager
+async def admission_slot(priority: str, degradable: bool = True) -> AsyncIterator[bool]:
+    """
+    Ocupa un cupo del control de admisión del proceso mientras dura el bloque.
+
+    Sin cupo, con ``ADMISSION_DEGRADED_MODE`` el bloque se ejecuta igualmente en
+    modo degradado (sin cupo y sin el modelo); si no, se propaga el rechazo. La
+    espera por el cupo se mide en la etapa ``admission``.
+
+    Args:
+        priority: Clase de prioridad de la solicitud
+        degradable: Si quien llama admite el modo degradado
+
+    Yields:
+        bool: True si el análisis debe hacerse solo con listas CIDR y reglas
+
+    Raises:
+        AdmissionRejected: Si no hay cupo y no se puede degradar
+    """
+    if admission is None:
+        yield False
+        return
+    started_ns = time.perf_counter_ns()
+    try:
+        await admission.acquire(priority)
+    except AdmissionRejected as e:
+        STAGE_ADMISSION.observe_ns(time.perf_counter_ns() - started_ns)
+        if not (degradable and settings.ADMISSION_DEGRADED_MODE):
+            logger.info(f"{e} - en curso: {admission.in_flight}, en espera: {admission.waiting}")
+            raise
+        admission.record_degraded(priority)
+        yield True
+        return
+    STAGE_ADMISSION.observe_ns(time.perf_counter_ns() - started_ns)
+    started = time.perf_counter()
+    try:
+        yield False
+    finally:
+        admission.release(priority, time.perf_counter() - started)
+
+
+def admission_capacity() -> int:
+    """
+    Cupos del control de admisión.
+
+    Por defecto, uno por worker del ejecutor (``MODEL_MAX_CONCURRENT_REQUESTS``).
+    Con micro-batching ese valor solo deja formar lotes parciales: para que cada
+    worker reciba lotes de ``MODEL_BATCH_SIZE`` registros hacen falta
+    ``MODEL_BATCH_SIZE x MODEL_MAX_CONCURRENT_REQUESTS`` solicitudes en curso, y
+    ese margen se habilita explícitamente con ``ADMISSION_MAX_CONCURRENT``.
+
+    Returns:
+        int: Número máximo de solicitudes de análisis en curso
+    """
+    if settings.ADMISSION_MAX_CONCURRENT is not None:
+        return settings.ADMISSION_MAX_CONCURRENT
+    return settings.MODEL_MAX_CONCURRENT_REQUESTS
+
+
+def build_admission() -> Optional[AdmissionController]:
+    """
+    Construye el control de admisión con ``admission_capacity()`` cupos.
+
+    Returns:
+        AdmissionController o None si ``ADMISSION_ENABLED=False``
+
+    Raises:
+        ValueError: Si una clase de prioridad configurada no existe
+    """
+    if not settings.ADMISSION_ENABLED:
+        return None
+    configured = [
+        settings.ADMISSION_DEFAULT_PRIORITY,
+        *settings.ADMISSION_KEY_PRIORITIES.values(),
+        *settings.ADMISSION_ROUTE_PRIORITIES.values()
+    ]
+    unknown = sorted({name for name in configured if name not in PRIORITY_CLASSES})
+    if unknown:
+        raise ValueError(f"Clases de prioridad no válidas: {unknown}; use {PRIORITY_CLASSES}")
+    if settings.ADMISSION_REJECT_STATUS not in (429, 503):
+        raise ValueError("ADMISSION_REJECT_STATUS debe ser 429 o 503")
+    return AdmissionController(
+        max_concurrent=admission_capacity(),
+        queue_size=settings.ADMISSION_QUEUE_SIZE,
+        max_wait_seconds=settings.ADMISSION_MAX_WAIT_MS / 1000,
+        class_max_share=settings.ADMISSION_CLASS_MAX_SHARE
+    )
+
+
+# Control de admisión del proceso (None con ADMISSION_ENABLED=False)
+admission = build_admission()
@@ -0,0 +1,152 @@
+"""
+Micro-batching dinámico de solicitudes individuales.
+Agrupa las llamadas concurrentes a /analyze en una sola llamada vectorizada al modelo.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .metrics import STAGE_BATCH_WAIT
+from .tracing import record_batched_row
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Función que resuelve un bloque: devuelve (predicciones, confianzas, tiempos)
+BatchPredictFn = Callable[[np.ndarray], Awaitable[Tuple[np.ndarray, np.ndarray, Dict[str, float]]]]
+
+
+class MicroBatcher:
+    """
+    Acumula filas individuales durante una ventana corta y las resuelve juntas.
+
+    Un lote se despacha cuando transcurre ``window_ms`` desde la primera fila
+    pendiente o cuando se alcanzan ``max_batch_size`` filas, lo que ocurra antes.
+    Cada llamador recibe únicamente el resultado de su fila.
+    """
+
+    def __init__(self, predict_fn: BatchPredictFn, max_batch_size: int = 32, window_ms: float = 2.0):
+        """
+        Args:
+            predict_fn: Corrutina que predice una matriz de filas
+            max_batch_size: Número máximo de filas por lote
+            window_ms: Tiempo máximo de espera para completar un lote
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(max_batch_size, 1)
+        self.window_ms = max(window_ms, 0.0)
+
+        self._pending: List[Tuple[np.ndarray, asyncio.Future, int]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._in_flight = 0
+
+        # Métricas acumuladas
+        self._batches = 0
+        self._records = 0
+        self._last_batch_size = 0
+        self._max_realized_batch_size = 0
+        self._batch_size_counts: Dict[int, int] = {}
+
+    async def submit(self, row: np.ndarray) -> Tuple[Any, float, Dict[str, float]]:
+        """
+        Encola una fila y espera su resultado.
+
+        Args:
+            row: Vector de características de una solicitud (forma (n,) o (1, n))
+
+        Returns:
+            tuple: (predicción, confianza, tiempos) de la fila enviada
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((np.asarray(row).reshape(-1), future, time.perf_counter_ns()))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_ms / 1000, self._flush)
+
+        result = await future
+        record_batched_row(result[2])
+        return result
+
+    def _flush(self) -> None:
+        """Despacha las filas pendientes como un lote."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        # El lote se ejecuta en un contexto vacío: sus tiempos no pertenecen al trace
+        # de la solicitud que lo despachó, cada llamador los agrega al suyo
+        task = contextvars.Context().run(asyncio.get_running_loop().create_task, self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[np.ndarray, asyncio.Future, int]]) -> None:
+        """Resuelve un lote y reparte los resultados entre los llamadores."""
+        batch_size = len(batch)
+        dispatched_ns = time.perf_counter_ns()
+        self._record_batch(batch_size)
+        self._in_flight += batch_size
+
+        try:
+            features = np.vstack([row for row, _, _ in batch])
+            predictions, confidences, timing = await self.predict_fn(features)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._in_flight -= batch_size
+
+        for (_, future, enqueued_ns), prediction, confidence in zip(batch, predictions, confidences):
+            if future.done():  # El llamador canceló la espera
+                continue
+            STAGE_BATCH_WAIT.observe_ns(dispatched_ns - enqueued_ns)
+            future.set_result((prediction, confidence, {
+                **timing,
+                "batch_wait_ms": (dispatched_ns - enqueued_ns) / 1e6,
+                "batch_size": batch_size
+            }))
+
+    def _record_batch(self, batch_size: int) -> None:
+        """Actualiza las métricas de tamaño de lote realizado."""
+        self._batches += 1
+        self._records += batch_size
+        self._last_batch_size = batch_size
+        self._max_realized_batch_size = max(self._max_realized_batch_size, batch_size)
+        self._batch_size_counts[batch_size] = self._batch_size_counts.get(batch_size, 0) + 1
+
+    @property
+    def queue_depth(self) -> int:
+        """Filas en espera de ser despachadas."""
+        return len(self._pending)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Devuelve las métricas del micro-batcher.
+
+        Returns:
+            dict: Profundidad de cola, filas en ejecución y tamaños de lote realizados
+        """
+        return {
+            "queue_depth": self.queue_depth,
+            "in_flight": self._in_flight,
+            "window_ms": self.window_ms,
+            "max_batch_size": self.max_batch_size,
+            "batches": self._batches,
+            "records": self._records,
+            "avg_batch_size": self._records / self._batches if self._batches else 0.0,
+            "last_batch_size": self._last_batch_size,
+            "max_realized_batch_size": self._max_realized_batch_size,
+            "batch_size_histogram": dict(sorted(self._batch_size_counts.items()))
+        }
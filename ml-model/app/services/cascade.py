@@ -0,0 +1,443 @@
+"""
+Cascada de modelos con escalamiento por confianza.
+Un modelo barato resuelve primero cada registro y solo los registros cuya confianza
+cae dentro de la banda de incertidumbre pasan a la siguiente etapa.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from ..schemas.mcp import ModelInput
+from .batcher import MicroBatcher
+from .executor import InferenceExecutor
+from .columnar import ColumnarBatch
+from .features import FeatureExtractor, FeatureSpec, take_records
+from .metrics import STAGE_PREPROCESS
+from .prediction_cache import CACHE_HIT_TIMING, PredictionCache
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+
+def take_context(context: Optional[Dict[str, np.ndarray]], rows: np.ndarray) -> Optional[Dict[str, np.ndarray]]:
+    """Selecciona un subconjunto de filas de las columnas de contexto."""
+    if context is None:
+        return None
+    return {name: column[rows] for name, column in context.items()}
+
+
+class ModelStage:
+    """
+    Etapa de la cascada: modelo, especificación de características, motor de
+    inferencia, ejecutor y, opcionalmente, su propio micro-batcher.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        model: Any,
+        spec: FeatureSpec,
+        engine: Any,
+        executor: InferenceExecutor,
+        batcher_window_ms: Optional[float] = None,
+        batcher_size: int = 32,
+        cache: Optional[PredictionCache] = None,
+        version: str = ""
+    ):
+        """
+        Args:
+            name: Nombre de la etapa (p. ej. el nombre del artefacto)
+            model: Modelo entrenado
+            spec: Especificación de características del modelo
+            engine: Motor de inferencia (ver ``build_engine``)
+            executor: Ejecutor donde corre la inferencia de la etapa
+            batcher_window_ms: Ventana del micro-batcher; None lo desactiva
+            batcher_size: Filas máximas por lote del micro-batcher
+            cache: Caché de predicciones compartida (opcional)
+            version: Versión del modelo, incluida en las claves de la caché
+        """
+        self.name = name
+        self.model = model
+        self.spec = spec
+        self.extractor = FeatureExtractor(spec)
+        self.engine = engine
+        self.executor = executor
+        self.batcher: Optional[MicroBatcher] = None
+        if batcher_window_ms is not None:
+            self.batcher = MicroBatcher(self.predict_batch, max_batch_size=batcher_size, window_ms=batcher_window_ms)
+        # Cada etapa construida tiene su propio espacio de claves: al reemplazar el
+        # modelo, las predicciones anteriores dejan de coincidir
+        self.cache = cache
+        self.cache_namespace = f"{name}:{version}:{uuid.uuid4().hex[:12]}"
+
+        # Métricas acumuladas
+        self.rows = 0
+        self.calls = 0
+        self.escalated = 0
+        self.execution_ms = 0.0
+
+    async def predict_batch(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray, Dict[str, float]]:
+        """
+        Predice un bloque de filas en el ejecutor de la etapa.
+
+        Returns:
+            tuple: (predicciones, confianzas, tiempos de cola y ejecución en ms)
+        """
+        (predictions, confidences), timing = await self.executor.run(features)
+        self.calls += 1
+        self.rows += len(features)
+        self.execution_ms += timing["execution_ms"]
+        return predictions, confidences, timing
+
+    async def predict_claimed(
+        self,
+        features: np.ndarray,
+        keys: Sequence[bytes]
+    ) -> Tuple[np.ndarray, np.ndarray, Dict[str, float]]:
+        """
+        Predice un bloque cuyas claves se reservaron con ``PredictionCache.claim``.
+
+        Resuelve las claves en cuanto termina el bloque, sin esperar al resto del
+        lote, para que quien espera alguna de estas filas no dependa de otras.
+
+        Returns:
+            tuple: (predicciones, confianzas, tiempos de cola y ejecución en ms)
+        """
+        try:
+            predictions, confidences, timing = await self.predict_batch(features)
+        except BaseException as e:
+            for key in keys:
+                self.cache.fail(key, e)
+            raise
+        for key, prediction, confidence in zip(keys, predictions, confidences):
+            self.cache.resolve(key, (prediction, confidence, timing))
+        return predictions, confidences, timing
+
+    async def predict_row(self, features: np.ndarray) -> Tuple[Any, float, Dict[str, float]]:
+        """
+        Predice una sola fila, compartiendo la llamada con otras solicitudes si hay micro-batcher.
+
+        Con caché, las filas ya vistas no llegan al modelo y las idénticas en curso
+        esperan un único cálculo; ``tiempos["cache"]`` indica ``hit``, ``coalesced`` o ``miss``.
+
+        Returns:
+            tuple: (predicción, confianza, tiempos en ms)
+        """
+        if self.cache is not None:
+            key = self.cache.key(self.cache_namespace, features)
+            (prediction, confidence, timing), status = await self.cache.get_or_compute(
+                key, lambda: self._predict_row(features)
+            )
+            return prediction, confidence, {**timing, "cache": status}
+        return await self._predict_row(features)
+
+    async def _predict_row(self, features: np.ndarray) -> Tuple[Any, float, Dict[str, float]]:
+        """Predice una fila con el micro-batcher o con una llamada directa."""
+        if self.batcher is not None:
+            return await self.batcher.submit(features)
+        predictions, confidences, timing = await self.predict_batch(features)
+        return predictions[0], confidences[0], timing
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas de la etapa: filas, llamadas, escalamiento y latencia media."""
+        return {
+            "name": self.name,
+            "inference_engine": self.engine.kind,
+            "rows": self.rows,
+            "calls": self.calls,
+            "escalated": self.escalated,
+            "escalation_rate": self.escalated / self.rows if self.rows else 0.0,
+            "avg_execution_ms": self.execution_ms / self.calls if self.calls else 0.0
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Libera el ejecutor de la etapa.
+
+        Args:
+            wait: Esperar a que terminen las inferencias en curso; desde el event
+                loop se usa ``False`` para no bloquearlo
+        """
+        self.executor.shutdown(wait=wait)
+
+
+class CascadeResult:
+    """Resultado por fila de un lote resuelto por la cascada."""
+
+    def __init__(self, n_rows: int, n_stages: int):
+        self.predictions = np.zeros(n_rows, dtype=np.int64)
+        self.confidences = np.zeros(n_rows, dtype=np.float64)
+        self.stage = np.zeros(n_rows, dtype=np.int64)
+        self.stage_ms = np.full((n_rows, n_stages), np.nan)
+        self.queue_wait_ms = np.zeros(n_rows, dtype=np.float64)
+        self.chunk_rows = np.zeros(n_rows, dtype=np.int64)
+        self.cache_status = np.full(n_rows, "", dtype=object)
+        self.errors: Dict[int, Exception] = {}
+
+
+class ModelCascade:
+    """
+    Etapas ordenadas de la más barata a la final.
+
+    Un registro escala a la siguiente etapa solo si la confianza de la etapa actual
+    cumple ``band_low <= confianza < band_high``; la última etapa siempre decide.
+    Con una sola etapa se comporta como el modelo único.
+    """
+
+    def __init__(self, stages: Sequence[ModelStage], band: Sequence[float] = (0.5, 0.8)):
+        """
+        Args:
+            stages: Etapas en orden de ejecución (al menos una)
+            band: Banda de incertidumbre ``[inferior, superior)`` sobre la confianza
+
+        Raises:
+            ValueError: Si no hay etapas o la banda no es válida
+        """
+        if not stages:
+            raise ValueError("La cascada requiere al menos una etapa")
+        if len(band) != 2 or band[0] > band[1]:
+            raise ValueError("La banda de incertidumbre debe ser [inferior, superior] con inferior <= superior")
+        self.stages = list(stages)
+        self.band_low, self.band_high = float(band[0]), float(band[1])
+
+    @property
+    def final(self) -> ModelStage:
+        """Etapa final (el modelo principal)."""
+        return self.stages[-1]
+
+    def with_final(self, stage: ModelStage) -> "ModelCascade":
+        """Devuelve una cascada con las mismas etapas previas y otra etapa final."""
+        return ModelCascade([*self.stages[:-1], stage], band=(self.band_low, self.band_high))
+
+    def uncertain(self, confidences: np.ndarray) -> np.ndarray:
+        """Máscara de filas cuya confianza cae dentro de la banda de incertidumbre."""
+        confidences = np.asarray(confidences, dtype=np.float64)
+        return (confidences >= self.band_low) & (confidences < self.band_high)
+
+    async def predict_one(
+        self,
+        record: ModelInput,
+        context: Optional[Dict[str, np.ndarray]] = None
+    ) -> Tuple[int, float, Dict[str, float], Dict[str, Any]]:
+        """
+        Resuelve un registro, escalando mientras la confianza sea incierta.
+
+        Args:
+            record: Datos de entrada
+            context: Columnas de contexto de una fila (agregados ``flow.*``)
+
+        Returns:
+            tuple: (predicción, confianza, tiempos de la última etapa, metadatos de la cascada)
+        """
+        latencies: List[float] = []
+        last = len(self.stages) - 1
+        for index, stage in enumerate(self.stages):
+            started_ns = time.perf_counter_ns()
+            features = stage.extractor.transform([record], context=context)
+            STAGE_PREPROCESS.observe_ns(time.perf_counter_ns() - started_ns)
+            prediction, confidence, timing = await stage.predict_row(features)
+            latencies.append(timing["execution_ms"])
+            if index == last or not self.uncertain(np.array([confidence]))[0]:
+                break
+            stage.escalated += 1
+        return int(prediction), float(confidence), timing, self._row_metadata(index, latencies)
+
+    async def predict_many(
+        self,
+        records: Union[Sequence[ModelInput], ColumnarBatch],
+        context: Optional[Dict[str, np.ndarray]] = None,
+        chunk_size: int = 32
+    ) -> CascadeResult:
+        """
+        Resuelve un lote; cada etapa recibe solo las filas inciertas de la anterior.
+
+        Cada etapa construye su propia matriz de características para las filas
+        activas y la resuelve en bloques de ``chunk_size`` filas en paralelo. Un
+        bloque que falla marca sus filas con la excepción y no escala. Con caché, las
+        filas que ya calcula otra solicitud esperan ese resultado en lugar de
+        volver a calcularse, y las que calcula el lote pueden esperarlas otras.
+
+        Args:
+            records: Lote de datos de entrada (registros o lote columnar)
+            context: Columnas de contexto del lote
+            chunk_size: Filas por llamada al modelo
+
+        Returns:
+            CascadeResult: Predicción, confianza, etapa alcanzada y tiempos por fila
+        """
+        result = CascadeResult(len(records), len(self.stages))
+        chunk_size = max(chunk_size, 1)
+        active = np.arange(len(records))
+        last = len(self.stages) - 1
+
+        for index, stage in enumerate(self.stages):
+            if not len(active):
+                break
+            started_ns = time.perf_counter_ns()
+            features = stage.extractor.transform(
+                take_records(records, active),
+                context=take_context(context, active)
+            )
+            STAGE_PREPROCESS.observe_ns(time.perf_counter_ns() - started_ns)
+            escalate: List[np.ndarray] = []
+
+            # Resolver desde la caché, agrupar las filas repetidas dentro del lote y
+            # esperar las que ya calcula otra solicitud; las demás quedan reservadas
+            compute = np.arange(len(active))
+            duplicates: Dict[int, List[int]] = {}
+            joined: Dict[int, asyncio.Future] = {}
+            keys: List[bytes] = []
+            if stage.cache is not None:
+                compute_list: List[int] = []
+                first_by_key: Dict[bytes, int] = {}
+                keys = [stage.cache.key(stage.cache_namespace, row) for row in features]
+                for position, key in enumerate(keys):
+                    first = first_by_key.get(key)
+                    if first is not None:
+                        duplicates.setdefault(first, []).append(position)
+                        stage.cache.record_coalesced()
+                        continue
+                    status, value = stage.cache.claim(key)
+                    if status == "hit":
+                        row = active[position]
+                        self._record(result, row, index, value[0], value[1], CACHE_HIT_TIMING, 0, "hit")
+                        if index < last and self.uncertain(np.array([value[1]]))[0]:
+                            escalate.append(np.array([row]))
+                        continue
+                    first_by_key[key] = position
+                    if status == "coalesced":
+                        joined[position] = value
+                    else:
+                        compute_list.append(position)
+                compute = np.array(compute_list, dtype=np.int64)
+
+            offsets = range(0, len(compute), chunk_size)
+            calls = []
+            for offset in offsets:
+                positions = compute[offset:offset + chunk_size]
+                if stage.cache is not None:
+                    calls.append(stage.predict_claimed(features[positions], [keys[p] for p in positions]))
+                else:
+                    calls.append(stage.predict_batch(features[positions]))
+            try:
+                outcomes = await asyncio.gather(
+                    *calls,
+                    *(asyncio.shield(future) for future in joined.values()),
+                    return_exceptions=True
+                )
+            except BaseException as e:
+                # Lote cancelado: liberar las reservas que ningún bloque llegó a cerrar
+                if stage.cache is not None:
+                    for position in compute:
+                        stage.cache.fail(keys[position], e)
+                raise
+
+            chunks = [(compute[offset:offset + chunk_size], outcome) for offset, outcome in zip(offsets, outcomes)]
+            retry = [position for position, outcome in zip(joined, outcomes[len(calls):])
+                     if isinstance(outcome, asyncio.CancelledError)]
+            if retry:
+                # El cálculo al que se unieron estas filas se canceló: se calculan aquí
+                positions = np.array(retry, dtype=np.int64)
+                try:
+                    outcome = await stage.predict_batch(features[positions])
+                except Exception as e:
+                    outcome = e
+                if not isinstance(outcome, Exception):
+                    for position, prediction, confidence in zip(positions, outcome[0], outcome[1]):
+                        stage.cache.put(keys[position], (prediction, confidence))
+                chunks.append((positions, outcome))
+
+            for positions, outcome in chunks:
+                if isinstance(outcome, Exception):
+                    logger.error(f"Error en la etapa {stage.name} para un bloque de {len(positions)} filas: {str(outcome)}")
+                    for position in positions:
+                        result.errors.update(
+                            (int(active[p]), outcome) for p in [position, *duplicates.get(int(position), [])]
+                        )
+                    continue
+
+                predictions, confidences, timing = outcome
+                uncertain = self.uncertain(confidences)
+                for position, prediction, confidence, is_uncertain in zip(positions, predictions, confidences, uncertain):
+                    copies = duplicates.get(int(position), [])
+                    status = "miss" if stage.cache is not None else ""
+                    self._record(result, active[position], index, prediction, confidence, timing, len(positions), status)
+                    for copy in copies:
+                        self._record(result, active[copy], index, prediction, confidence, timing, len(positions), "coalesced")
+                    if index < last and is_uncertain:
+                        escalate.append(active[[position, *copies]])
+
+            for position, outcome in zip(joined, outcomes[len(calls):]):
+                if isinstance(outcome, asyncio.CancelledError):
+                    continue
+                rows = [position, *duplicates.get(position, [])]
+                if isinstance(outcome, Exception):
+                    result.errors.update((int(active[p]), outcome) for p in rows)
+                    continue
+                prediction, confidence, timing = outcome
+                for p in rows:
+                    self._record(result, active[p], index, prediction, confidence, timing, 0, "coalesced")
+                if index < last and self.uncertain(np.array([confidence]))[0]:
+                    escalate.append(active[rows])
+
+            active = np.concatenate(escalate) if escalate else np.empty(0, dtype=np.int64)
+            stage.escalated += len(active)
+
+        return result
+
+    @staticmethod
+    def _record(
+        result: CascadeResult,
+        row: int,
+        stage: int,
+        prediction: Any,
+        confidence: float,
+        timing: Dict[str, float],
+        chunk_rows: int,
+        cache_status: str
+    ) -> None:
+        """Anota el resultado de una fila en una etapa."""
+        result.predictions[row] = prediction
+        result.confidences[row] = confidence
+        result.stage[row] = stage
+        result.stage_ms[row, stage] = timing["execution_ms"]
+        result.queue_wait_ms[row] = timing["queue_wait_ms"]
+        result.chunk_rows[row] = chunk_rows
+        result.cache_status[row] = cache_status
+
+    def row_metadata(self, result: CascadeResult, row: int) -> Dict[str, Any]:
+        """Metadatos de la cascada para una fila de ``predict_many``."""
+        stage = int(result.stage[row])
+        return self._row_metadata(stage, result.stage_ms[row, :stage + 1].tolist())
+
+    def _row_metadata(self, stage: int, latencies: List[float]) -> Dict[str, Any]:
+        """Etapa alcanzada y latencia de cada etapa recorrida."""
+        return {
+            "stage": stage,
+            "stage_name": self.stages[stage].name,
+            "stages_total": len(self.stages),
+            "stage_latency_ms": {
+                self.stages[index].name: latency for index, latency in enumerate(latencies)
+            }
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Devuelve las métricas de la cascada.
+
+        Returns:
+            dict: Banda de incertidumbre y métricas por etapa
+        """
+        return {
+            "uncertainty_band": [self.band_low, self.band_high],
+            "stages": [stage.stats() for stage in self.stages]
+        }
+
+    def shutdown(self) -> None:
+        """Libera los ejecutores de todas las etapas."""
+        for stage in self.stages:
+            stage.shutdown()
@@ -0,0 +1,345 @@
+"""
+Índice de listas CIDR de permitidos/bloqueados con coincidencia del prefijo más largo.
+Permite resolver el tráfico de escáneres conocidos o de rangos internos de confianza
+sin pasar por el preprocesamiento ni por el modelo.
+"""
+import asyncio
+import ipaddress
+import logging
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+CIDR_ACTIONS = ("allow", "deny")
+
+
+class CidrRule(NamedTuple):
+    """Regla de una lista CIDR."""
+    action: str
+    network: str
+    label: str
+
+
+class CidrMatch(NamedTuple):
+    """Coincidencia de una regla con una IP de la solicitud."""
+    rule: CidrRule
+    field: str   # source_ip | destination_ip
+    ip: str
+
+
+def parse_cidr_rules(lines: Sequence[str]) -> List[CidrRule]:
+    """
+    Interpreta reglas con el formato ``<allow|deny> <cidr> [etiqueta]``.
+
+    Las líneas vacías y el texto tras ``#`` se ignoran.
+
+    Raises:
+        ValueError: Si una línea no es válida (indica el número de línea)
+    """
+    rules = []
+    for number, raw in enumerate(lines, start=1):
+        line = raw.split("#", 1)[0].strip()
+        if not line:
+            continue
+        parts = line.split(None, 2)
+        if len(parts) < 2 or parts[0].lower() not in CIDR_ACTIONS:
+            raise ValueError(f"Línea {number}: se esperaba '<allow|deny> <cidr> [etiqueta]'")
+        try:
+            network = ipaddress.ip_network(parts[1], strict=False)
+        except ValueError as e:
+            raise ValueError(f"Línea {number}: {str(e)}")
+        rules.append(CidrRule(parts[0].lower(), str(network), parts[2].strip() if len(parts) > 2 else ""))
+    return rules
+
+
+def _ip_to_int(ip: str) -> Tuple[int, int]:
+    """Convierte una IP a (versión, entero); (0, 0) si no es válida."""
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except OSError:
+        pass
+    try:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+    except OSError:
+        return 0, 0
+
+
+class PrefixIndex:
+    """
+    Índice de coincidencia del prefijo más largo para IPv4 e IPv6.
+
+    Los prefijos se agrupan por longitud en tablas hash; una búsqueda enmascara la
+    IP con cada longitud presente, de la más larga a la más corta, por lo que su
+    costo depende del número de longitudes distintas y no del número de prefijos.
+    Para IPv4 cada longitud mantiene además un arreglo ordenado que permite resolver
+    lotes completos con ``np.searchsorted``.
+    """
+
+    def __init__(self, rules: Sequence[CidrRule]):
+        self.rules = list(rules)
+        self._tables: Dict[int, Dict[int, Dict[int, int]]] = {4: {}, 6: {}}
+
+        for position, rule in enumerate(self.rules):
+            network = ipaddress.ip_network(rule.network)
+            table = self._tables[network.version].setdefault(network.prefixlen, {})
+            key = int(network.network_address)
+            current = table.get(key)
+            # Ante el mismo prefijo repetido, prevalece el bloqueo
+            if current is None or (rule.action == "deny" and self.rules[current].action != "deny"):
+                table[key] = position
+
+        self._lengths = {
+            version: sorted(tables, reverse=True) for version, tables in self._tables.items()
+        }
+        self._masks = {
+            4: {length: ((1 << length) - 1) << (32 - length) for length in self._lengths[4]},
+            6: {length: ((1 << length) - 1) << (128 - length) for length in self._lengths[6]}
+        }
+
+        # Arreglos ordenados por longitud para la búsqueda vectorizada de IPv4
+        self._v4_arrays: List[Tuple[np.uint32, np.ndarray, np.ndarray]] = []
+        for length in self._lengths[4]:
+            table = self._tables[4][length]
+            networks = np.fromiter(table.keys(), dtype=np.uint32, count=len(table))
+            positions = np.fromiter(table.values(), dtype=np.int64, count=len(table))
+            order = np.argsort(networks)
+            self._v4_arrays.append((np.uint32(self._masks[4][length]), networks[order], positions[order]))
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def lookup(self, ip: str) -> Optional[CidrRule]:
+        """
+        Busca la regla del prefijo más largo que contiene la IP.
+
+        Returns:
+            CidrRule o None si no hay coincidencia o la IP no es válida
+        """
+        version, value = _ip_to_int(ip)
+        if not version:
+            return None
+        position = self._lookup_position(version, value)
+        return self.rules[position] if position >= 0 else None
+
+    def _lookup_position(self, version: int, value: int) -> int:
+        """Posición de la regla del prefijo más largo para una IP ya convertida, o -1."""
+        tables = self._tables[version]
+        masks = self._masks[version]
+        for length in self._lengths[version]:
+            position = tables[length].get(value & masks[length])
+            if position is not None:
+                return position
+        return -1
+
+    def lookup_many(self, ips: Sequence[str]) -> List[Optional[CidrRule]]:
+        """
+        Busca la regla del prefijo más largo para un lote de IPs.
+
+        Las IPv4 se resuelven de forma vectorizada; las IPv6 una por una.
+        """
+        return [self.rules[position] if position >= 0 else None for position in self.lookup_positions(ips).tolist()]
+
+    def lookup_positions(self, ips: Sequence[str]) -> np.ndarray:
+        """Versión de ``lookup_many`` que devuelve la posición de cada regla en ``rules`` (-1 sin coincidencia)."""
+        found = np.full(len(ips), -1, dtype=np.int64)
+        v4_rows: List[int] = []
+        v4_values: List[int] = []
+        for row, ip in enumerate(ips):
+            version, value = _ip_to_int(ip)
+            if version == 4:
+                v4_rows.append(row)
+                v4_values.append(value)
+            elif version == 6:
+                found[row] = self._lookup_position(6, value)
+        if v4_rows:
+            found[v4_rows] = self.lookup_v4(np.array(v4_values, dtype=np.uint32))
+        return found
+
+    def lookup_v4(self, values: np.ndarray) -> np.ndarray:
+        """
+        Busca el prefijo más largo para IPv4 dadas como enteros, sin convertirlas a texto.
+
+        Args:
+            values: IPv4 como enteros (uint32)
+
+        Returns:
+            np.ndarray: Posición de la regla en ``rules`` por IP, o -1
+        """
+        values = np.asarray(values, dtype=np.uint32)
+        found = np.full(len(values), -1, dtype=np.int64)
+        for mask, networks, positions in self._v4_arrays:
+            pending = found < 0
+            if not pending.any():
+                break
+            masked = values & mask
+            index = np.minimum(np.searchsorted(networks, masked), len(networks) - 1)
+            hit = pending & (networks[index] == masked)
+            found[hit] = positions[index[hit]]
+        return found
+
+
+class CidrListManager:
+    """
+    Lista CIDR cargada desde archivo con recarga sin reinicio.
+
+    El índice se reemplaza de forma atómica. ``watch`` revisa el archivo cada
+    ``check_interval`` segundos y lo recarga en un hilo aparte, y ``reload`` lo
+    recarga de forma explícita; las consultas nunca leen ni compilan el archivo,
+    porque con cientos de miles de prefijos eso tarda segundos. Un archivo
+    inválido mantiene el índice anterior.
+    """
+
+    def __init__(self, path: Optional[str], check_interval: float = 5.0):
+        self.path = Path(path) if path else None
+        self.check_interval = check_interval
+        self.index = PrefixIndex([])
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self._loaded_at: Optional[float] = None
+        self._last_error: Optional[str] = None
+        self._hits = {action: 0 for action in CIDR_ACTIONS}
+        if self.path is not None:
+            try:
+                self.reload()
+            except ValueError:
+                pass  # El servicio arranca sin lista; el error queda en stats()
+
+    def reload(self) -> int:
+        """
+        Recarga la lista desde el archivo.
+
+        Returns:
+            int: Número de reglas cargadas
+
+        Raises:
+            ValueError: Si el archivo no existe o contiene líneas inválidas
+        """
+        if self.path is None:
+            raise ValueError("No hay una lista CIDR configurada (CIDR_LIST_PATH)")
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime
+                with open(self.path, encoding="utf-8") as handle:
+                    rules = parse_cidr_rules(handle.readlines())
+            except (OSError, ValueError) as e:
+                self._last_error = str(e)
+                logger.error(f"Error al cargar la lista CIDR {self.path}: {str(e)}")
+                raise ValueError(str(e))
+
+            self.index = PrefixIndex(rules)
+            self._mtime = mtime
+            self._loaded_at = time.time()
+            self._last_error = None
+        logger.info(f"Lista CIDR cargada desde {self.path}: {len(rules)} reglas")
+        return len(rules)
+
+    def changed(self) -> bool:
+        """Indica si el archivo cambió desde la última carga."""
+        if self.path is None:
+            return False
+        try:
+            return os.stat(self.path).st_mtime != self._mtime
+        except OSError:
+            return False
+
+    async def watch(self) -> None:
+        """
+        Recarga la lista cuando cambia el archivo, fuera del event loop.
+
+        Se ejecuta como tarea de fondo mientras la aplicación está activa; no hace
+        nada sin ``CIDR_LIST_PATH`` o con ``check_interval`` en 0.
+        """
+        if self.path is None or self.check_interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.check_interval)
+            if not self.changed():
+                continue
+            try:
+                await asyncio.to_thread(self.reload)
+            except ValueError:
+                pass  # Se conserva el índice anterior; el error queda en stats()
+
+    def match(self, source_ip: str, destination_ip: str) -> Optional[CidrMatch]:
+        """
+        Busca reglas para el origen y el destino de una conexión.
+
+        Un bloqueo tiene prioridad sobre un permiso; a igualdad, el origen sobre el destino.
+        """
+        return self.match_many([source_ip], [destination_ip])[0]
+
+    def match_many(self, source_ips: Sequence[str], destination_ips: Sequence[str]) -> List[Optional[CidrMatch]]:
+        """Versión por lotes de ``match``."""
+        index = self.index
+        if not len(index):
+            return [None] * len(source_ips)
+
+        matches: List[Optional[CidrMatch]] = []
+        for source_ip, destination_ip, source_rule, destination_rule in zip(
+            source_ips, destination_ips, index.lookup_many(source_ips), index.lookup_many(destination_ips)
+        ):
+            candidates = [
+                CidrMatch(rule, field, ip)
+                for rule, field, ip in (
+                    (source_rule, "source_ip", source_ip),
+                    (destination_rule, "destination_ip", destination_ip)
+                )
+                if rule is not None
+            ]
+            denied = [match for match in candidates if match.rule.action == "deny"]
+            match = (denied or candidates or [None])[0]
+            if match is not None:
+                self._hits[match.rule.action] += 1
+            matches.append(match)
+        return matches
+
+    def match_positions(
+        self,
+        source_ips: Union[np.ndarray, Sequence[str]],
+        destination_ips: Union[np.ndarray, Sequence[str]]
+    ) -> Tuple[np.ndarray, List[CidrRule]]:
+        """
+        Versión vectorizada de ``match_many`` para lotes columnares.
+
+        Args:
+            source_ips: IPv4 como enteros uint32, o IPs como texto
+            destination_ips: Igual que ``source_ips``
+
+        Returns:
+            tuple: (posición de la regla que decide cada fila o -1, reglas del índice usado)
+        """
+        index = self.index
+        if not len(index):
+            return np.full(len(source_ips), -1, dtype=np.int64), index.rules
+
+        def positions(ips: Union[np.ndarray, Sequence[str]]) -> np.ndarray:
+            return index.lookup_v4(ips) if isinstance(ips, np.ndarray) else index.lookup_positions(ips)
+
+        source, destination = positions(source_ips), positions(destination_ips)
+        denies = np.array([rule.action == "deny" for rule in index.rules] + [False])
+        # Un bloqueo tiene prioridad sobre un permiso; a igualdad, el origen sobre el destino
+        from_source = (source >= 0) & (denies[source] | ~denies[destination])
+        chosen = np.where(from_source, source, destination)
+        matched = chosen[chosen >= 0]
+        denied = int(np.count_nonzero(denies[matched]))
+        self._hits["deny"] += denied
+        self._hits["allow"] += len(matched) - denied
+        return chosen, index.rules
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado de la lista: ruta, reglas, última carga, último error y coincidencias."""
+        return {
+            "path": str(self.path) if self.path else None,
+            "rules": len(self.index),
+            "loaded_at": self._loaded_at,
+            "last_error": self._last_error,
+            "hits": dict(self._hits)
+        }
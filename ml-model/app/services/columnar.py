@@ -0,0 +1,385 @@
+"""
+Formato binario columnar para lotes de sensores de alto volumen.
+Los lotes se decodifican con ``numpy.frombuffer`` sobre el cuerpo recibido, sin
+crear objetos Python por registro, y se validan columna a columna.
+
+Lote de entrada (little-endian)::
+
+    cabecera (32 bytes)  magic "RSC1", versión u8, ancho de IP u8 (4 o 16), 2 bytes
+                         reservados, filas u32, tiempo base f64 (segundos epoch;
+                         0 = hora de llegada), batch_id u64, 4 bytes reservados
+    source_ip            filas × ancho de IP (u32 o 16 bytes, orden de red)
+    destination_ip       filas × ancho de IP
+    time_offset_us       u32, microsegundos desde el tiempo base
+    payload_size         u32 (0xFFFFFFFF = ausente)
+    source_port          u16 (0 = ausente)
+    destination_port     u16
+    protocol             u8 (0 tcp, 1 udp, 2 icmp, 3 other)
+    flags                u8: bits 0-5 SYN, ACK, FIN, RST, PSH, URG; bit 7 = banderas presentes
+
+Respuesta (little-endian)::
+
+    cabecera (32 bytes)  magic "RSR1", versión u8, 3 bytes reservados, filas u32,
+                         batch_id u64, filas inválidas u32, filas con error u32, 4 bytes reservados
+    confidence           f32
+    prediction           u8
+    risk_level           u8 (0 low, 1 medium, 2 high, 3 critical, 255 sin resultado)
+    status               u8 (ver ``STATUS_*``)
+
+Las columnas se ordenan por ancho decreciente, por lo que todas quedan alineadas.
+"""
+import socket
+import struct
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..schemas.mcp import ModelInput, ThreatLevel
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.red-sentinel.columnar"
+
+BATCH_MAGIC = b"RSC1"
+RESULT_MAGIC = b"RSR1"
+FORMAT_VERSION = 1
+
+_BATCH_HEADER = struct.Struct("<4sBBHIdQ4x")
+_RESULT_HEADER = struct.Struct("<4sB3xIQII4x")
+
+# Códigos de las columnas enumeradas
+PROTOCOL_CODES = ("tcp", "udp", "icmp", "other")
+FLAG_BITS = ("SYN", "ACK", "FIN", "RST", "PSH", "URG")
+FLAGS_PRESENT = 0x80
+_FLAGS_RESERVED = 0xFF & ~FLAGS_PRESENT & ~((1 << len(FLAG_BITS)) - 1)
+PAYLOAD_ABSENT = 0xFFFFFFFF
+_V4_MAPPED_PREFIX = b"\x00" * 10 + b"\xff\xff"
+
+RISK_CODES = {ThreatLevel.LOW: 0, ThreatLevel.MEDIUM: 1, ThreatLevel.HIGH: 2, ThreatLevel.CRITICAL: 3}
+RISK_NONE = 255
+
+# Origen del resultado de cada fila
+STATUS_MODEL = 0
+STATUS_CIDR = 1
+STATUS_RULE = 2
+STATUS_INVALID = 3
+STATUS_ERROR = 4
+
+# (nombre, dtype) de las columnas de ancho fijo que siguen a las IPs
+_FIXED_COLUMNS = (
+    ("time_offset_us", np.dtype("<u4")),
+    ("payload_size", np.dtype("<u4")),
+    ("source_port", np.dtype("<u2")),
+    ("destination_port", np.dtype("<u2")),
+    ("protocol", np.dtype("u1")),
+    ("flags", np.dtype("u1")),
+)
+_RESULT_COLUMNS = (
+    ("confidence", np.dtype("<f4")),
+    ("prediction", np.dtype("u1")),
+    ("risk_level", np.dtype("u1")),
+    ("status", np.dtype("u1")),
+)
+
+
+class ColumnarFormatError(ValueError):
+    """El cuerpo no es un lote columnar válido (cabecera, versión o longitud)."""
+
+
+def _ipv6_text(value: bytes) -> str:
+    """Texto de una IP de 16 bytes; las IPv4 mapeadas (``::ffff:a.b.c.d``) se devuelven como IPv4."""
+    if value[:12] == _V4_MAPPED_PREFIX:
+        return socket.inet_ntop(socket.AF_INET, value[12:])
+    return socket.inet_ntop(socket.AF_INET6, value)
+
+
+def _ip_dtype(ip_width: int) -> np.dtype:
+    """Tipo de la columna de IPs: u32 en orden de red o 16 bytes."""
+    return np.dtype(">u4") if ip_width == 4 else np.dtype("S16")
+
+
+class ColumnarBatch:
+    """
+    Lote de registros como columnas numpy.
+
+    Las columnas de un lote decodificado son vistas de solo lectura sobre el cuerpo
+    recibido; ``take`` devuelve otro lote con las filas seleccionadas.
+    """
+
+    def __init__(
+        self,
+        columns: Dict[str, np.ndarray],
+        ip_width: int,
+        base_time: float,
+        batch_id: int = 0
+    ):
+        """
+        Args:
+            columns: Columnas ``source_ip``, ``destination_ip`` y las de ``_FIXED_COLUMNS``
+            ip_width: 4 (IPv4 como u32) o 16 (IPv6)
+            base_time: Tiempo base de ``time_offset_us`` en segundos epoch
+            batch_id: Identificador del lote, devuelto en la respuesta
+        """
+        self.columns = columns
+        self.ip_width = ip_width
+        self.base_time = base_time
+        self.batch_id = batch_id
+
+    def __len__(self) -> int:
+        return len(self.columns["destination_port"])
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def take(self, rows: np.ndarray) -> "ColumnarBatch":
+        """Lote con las filas indicadas (índices o máscara booleana)."""
+        return ColumnarBatch(
+            {name: column[rows] for name, column in self.columns.items()},
+            self.ip_width,
+            self.base_time,
+            self.batch_id
+        )
+
+    def timestamps(self) -> np.ndarray:
+        """Marca de tiempo de cada fila en segundos epoch."""
+        return self.base_time + self.columns["time_offset_us"] / 1e6
+
+    def ip_strings(self, name: str) -> List[str]:
+        """
+        IPs de una columna como texto, para los componentes con estado por IP.
+
+        Es el único paso con un objeto por fila; solo se usa si el almacén de flujos
+        o el top-K de orígenes están activos.
+        """
+        column = self.columns[name]
+        if self.ip_width == 4:
+            octets = column.astype(">u4").view(np.uint8).reshape(-1, 4).astype(str)
+            return np.char.add(
+                np.char.add(np.char.add(octets[:, 0], "."), np.char.add(octets[:, 1], ".")),
+                np.char.add(np.char.add(octets[:, 2], "."), octets[:, 3])
+            ).tolist()
+        return [_ipv6_text(value.ljust(16, b"\x00")) for value in column.tolist()]
+
+    def to_inputs(self, request_id: str, row_ids: Optional[Sequence[int]] = None) -> List[ModelInput]:
+        """
+        Reconstruye un ``ModelInput`` por fila (``request_id`` ``<lote>-<fila>``).
+
+        Solo se usa fuera del camino de inferencia, para persistir el lote; una
+        columna ausente se convierte en ``None`` como en el registro JSON original.
+
+        Args:
+            request_id: ID de la solicitud del lote
+            row_ids: Número de fila en el lote original de cada fila (tras ``take``)
+        """
+        columns = self.columns
+        sources, destinations = self.ip_strings("source_ip"), self.ip_strings("destination_ip")
+        timestamps = self.timestamps().tolist()
+        inputs = []
+        for row, (source_port, destination_port, protocol, payload_size, flags) in enumerate(zip(
+            columns["source_port"].tolist(),
+            columns["destination_port"].tolist(),
+            columns["protocol"].tolist(),
+            columns["payload_size"].tolist(),
+            columns["flags"].tolist()
+        )):
+            inputs.append(ModelInput(
+                request_id=f"{request_id}-{row_ids[row] if row_ids is not None else row}",
+                source_ip=sources[row],
+                source_port=source_port or None,
+                destination_ip=destinations[row],
+                destination_port=destination_port,
+                protocol=PROTOCOL_CODES[protocol] if protocol < len(PROTOCOL_CODES) else "other",
+                timestamp=datetime.fromtimestamp(timestamps[row], timezone.utc),
+                payload_size=None if payload_size == PAYLOAD_ABSENT else payload_size,
+                flags={name: bool(flags & (1 << bit)) for bit, name in enumerate(FLAG_BITS)}
+                if flags & FLAGS_PRESENT else None
+            ))
+        return inputs
+
+    def raw(self, source: str) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """
+        Valores de una fuente de característica y máscara de presencia.
+
+        Equivale a leer la fuente de cada ``ModelInput``: un valor ausente es el que
+        en JSON llegaría como ``null`` (puerto de origen 0, ``payload_size``
+        0xFFFFFFFF, banderas sin el bit de presencia). El protocolo se devuelve por
+        nombre para aplicar la misma codificación que los registros JSON.
+
+        Returns:
+            tuple: (valores, presentes); (None, None) si la fuente no existe en el
+            formato binario (p. ej. ``metadata.*``) y toma su valor por defecto
+        """
+        columns = self.columns
+        if source == "source_port":
+            values = columns["source_port"]
+            return values, values != 0
+        if source == "destination_port":
+            values = columns["destination_port"]
+            return values, np.ones(len(values), dtype=bool)
+        if source == "payload_size":
+            values = columns["payload_size"]
+            return values, values != PAYLOAD_ABSENT
+        if source == "protocol":
+            return np.array(PROTOCOL_CODES)[columns["protocol"]], np.ones(len(self), dtype=bool)
+
+        flags = columns["flags"]
+        present = (flags & FLAGS_PRESENT) != 0
+        if source == "flags_present":
+            return present, np.ones(len(flags), dtype=bool)
+        prefix, _, key = source.partition(".")
+        if prefix == "flags" and key:
+            if key in FLAG_BITS:
+                return (flags & (1 << FLAG_BITS.index(key))) != 0, present
+            # Una bandera que el formato no transporta vale False si hay banderas
+            return np.zeros(len(flags), dtype=bool), present
+        return None, None
+
+
+def decode_columnar_batch(body: bytes) -> ColumnarBatch:
+    """
+    Decodifica un lote columnar sin copiar sus columnas.
+
+    Args:
+        body: Cuerpo de la solicitud
+
+    Returns:
+        ColumnarBatch: Columnas como vistas sobre ``body``
+
+    Raises:
+        ColumnarFormatError: Si la cabecera, la versión o la longitud no son válidas
+    """
+    if len(body) < _BATCH_HEADER.size:
+        raise ColumnarFormatError(f"El lote debe tener al menos {_BATCH_HEADER.size} bytes de cabecera")
+    magic, version, ip_width, _, rows, base_time, batch_id = _BATCH_HEADER.unpack_from(body)
+    if magic != BATCH_MAGIC:
+        raise ColumnarFormatError("Cabecera desconocida; se esperaba un lote RSC1")
+    if version != FORMAT_VERSION:
+        raise ColumnarFormatError(f"Versión de formato no soportada: {version}")
+    if ip_width not in (4, 16):
+        raise ColumnarFormatError(f"Ancho de IP no soportado: {ip_width} (debe ser 4 o 16)")
+
+    ip_dtype = _ip_dtype(ip_width)
+    expected = _BATCH_HEADER.size + rows * (2 * ip_dtype.itemsize + sum(dtype.itemsize for _, dtype in _FIXED_COLUMNS))
+    if len(body) != expected:
+        raise ColumnarFormatError(f"Longitud inválida: {len(body)} bytes para {rows} filas (se esperaban {expected})")
+
+    columns: Dict[str, np.ndarray] = {}
+    offset = _BATCH_HEADER.size
+    for name, dtype in (("source_ip", ip_dtype), ("destination_ip", ip_dtype), *_FIXED_COLUMNS):
+        columns[name] = np.frombuffer(body, dtype=dtype, count=rows, offset=offset)
+        offset += rows * dtype.itemsize
+    return ColumnarBatch(columns, ip_width, base_time or time.time(), batch_id)
+
+
+def validate_columnar_batch(batch: ColumnarBatch) -> np.ndarray:
+    """
+    Valida las columnas de un lote de forma vectorizada.
+
+    Una fila es inválida si su puerto de destino es 0, su código de protocolo no
+    existe o sus banderas usan bits reservados o no traen el bit de presencia.
+
+    Returns:
+        np.ndarray: Máscara booleana de filas válidas
+    """
+    flags = batch["flags"]
+    valid = batch["destination_port"] != 0
+    valid &= batch["protocol"] < len(PROTOCOL_CODES)
+    valid &= (flags & _FLAGS_RESERVED) == 0
+    valid &= ((flags & FLAGS_PRESENT) != 0) | (flags == 0)
+    return valid
+
+
+def encode_columnar_batch(
+    source_ips: Sequence[str],
+    destination_ips: Sequence[str],
+    destination_ports: Sequence[int],
+    protocols: Sequence[str],
+    source_ports: Optional[Sequence[Optional[int]]] = None,
+    payload_sizes: Optional[Sequence[Optional[int]]] = None,
+    flags: Optional[Sequence[Optional[Dict[str, bool]]]] = None,
+    time_offsets_us: Optional[Sequence[int]] = None,
+    base_time: float = 0.0,
+    batch_id: int = 0
+) -> bytes:
+    """
+    Codifica un lote en el formato columnar (para clientes, pruebas y benchmarks).
+
+    Usa IPs de 4 bytes si todas son IPv4 y de 16 bytes en caso contrario.
+
+    Returns:
+        bytes: Cuerpo listo para ``POST /api/v1/analyze/columnar``
+    """
+    rows = len(destination_ports)
+    ips = [*source_ips, *destination_ips]
+    packed = [socket.inet_pton(socket.AF_INET6 if ":" in ip else socket.AF_INET, ip) for ip in ips]
+    ip_width = 4 if all(len(value) == 4 for value in packed) else 16
+    if ip_width == 16:
+        packed = [value if len(value) == 16 else _V4_MAPPED_PREFIX + value for value in packed]
+
+    def flag_mask(value: Optional[Dict[str, bool]]) -> int:
+        if not value:
+            return 0  # Como en ModelInput, un diccionario vacío equivale a no traer banderas
+        return FLAGS_PRESENT | sum(1 << bit for bit, name in enumerate(FLAG_BITS) if value.get(name))
+
+    fixed = {
+        "time_offset_us": time_offsets_us if time_offsets_us is not None else [0] * rows,
+        "payload_size": [PAYLOAD_ABSENT if v is None else v for v in (payload_sizes or [None] * rows)],
+        "source_port": [v or 0 for v in (source_ports or [None] * rows)],
+        "destination_port": destination_ports,
+        "protocol": [PROTOCOL_CODES.index(p.lower()) if p.lower() in PROTOCOL_CODES else 3 for p in protocols],
+        "flags": [flag_mask(v) for v in (flags or [None] * rows)],
+    }
+    parts = [
+        _BATCH_HEADER.pack(BATCH_MAGIC, FORMAT_VERSION, ip_width, 0, rows, base_time, batch_id),
+        b"".join(packed)
+    ]
+    parts.extend(np.asarray(fixed[name], dtype=dtype).tobytes() for name, dtype in _FIXED_COLUMNS)
+    return b"".join(parts)
+
+
+def encode_columnar_result(
+    batch_id: int,
+    confidence: np.ndarray,
+    prediction: np.ndarray,
+    risk_level: np.ndarray,
+    status: np.ndarray
+) -> bytes:
+    """
+    Codifica el resultado de un lote en el formato columnar de respuesta.
+
+    Returns:
+        bytes: Cabecera y columnas ``confidence``, ``prediction``, ``risk_level`` y ``status``
+    """
+    values = {"confidence": confidence, "prediction": prediction, "risk_level": risk_level, "status": status}
+    header = _RESULT_HEADER.pack(
+        RESULT_MAGIC,
+        FORMAT_VERSION,
+        len(status),
+        batch_id,
+        int(np.count_nonzero(status == STATUS_INVALID)),
+        int(np.count_nonzero(status == STATUS_ERROR))
+    )
+    return header + b"".join(np.asarray(values[name], dtype=dtype).tobytes() for name, dtype in _RESULT_COLUMNS)
+
+
+def decode_columnar_result(body: bytes) -> Dict[str, np.ndarray]:
+    """
+    Decodifica una respuesta columnar (para clientes y pruebas).
+
+    Returns:
+        dict: Columnas del resultado y ``batch_id``
+
+    Raises:
+        ColumnarFormatError: Si la respuesta no es válida
+    """
+    if len(body) < _RESULT_HEADER.size:
+        raise ColumnarFormatError("Respuesta demasiado corta")
+    magic, version, rows, batch_id, _, _ = _RESULT_HEADER.unpack_from(body)
+    if magic != RESULT_MAGIC or version != FORMAT_VERSION:
+        raise ColumnarFormatError("Cabecera de respuesta desconocida")
+    result: Dict[str, np.ndarray] = {}
+    offset = _RESULT_HEADER.size
+    for name, dtype in _RESULT_COLUMNS:
+        result[name] = np.frombuffer(body, dtype=dtype, count=rows, offset=offset)
+        offset += rows * dtype.itemsize
+    return {**result, "batch_id": batch_id}
@@ -0,0 +1,149 @@
+"""
+Ejecutor acotado para la inferencia del modelo.
+Saca las llamadas bloqueantes al modelo del event loop de FastAPI/uvicorn.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .metrics import STAGE_INFERENCE, STAGE_QUEUE_WAIT
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+EXECUTOR_KINDS = ("thread", "process")
+
+# Estado del proceso worker (solo se usa con el pool de procesos)
+_WORKER_FN: Optional[Callable[..., Any]] = None
+_WORKER_MODEL: Any = None
+
+
+def _init_worker(fn: Callable[..., Any], model: Any) -> None:
+    """Instala la función de predicción y el modelo en el proceso worker."""
+    global _WORKER_FN, _WORKER_MODEL
+    _WORKER_FN = fn
+    _WORKER_MODEL = model
+
+
+def _timed_call(fn: Callable[..., Any], model: Any, *args: Any) -> Tuple[Any, int, int]:
+    """Ejecuta ``fn(model, *args)`` y devuelve el resultado con sus marcas de tiempo."""
+    started_ns = time.perf_counter_ns()
+    result = fn(model, *args)
+    return result, started_ns, time.perf_counter_ns()
+
+
+def _timed_worker_call(*args: Any) -> Tuple[Any, int, int]:
+    """Equivalente de ``_timed_call`` usando el modelo instalado en el worker."""
+    return _timed_call(_WORKER_FN, _WORKER_MODEL, *args)
+
+
+class InferenceExecutor:
+    """
+    Pool de hilos o de procesos dedicado a la inferencia.
+
+    El número de workers limita cuántas inferencias se ejecutan a la vez; el resto
+    espera en la cola del pool. Cada llamada reporta el tiempo de espera en cola y
+    el tiempo de ejecución para poder dimensionar los workers con datos reales.
+    El pool puede liberarse con ``release`` y se vuelve a crear en la siguiente llamada.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[..., Any],
+        model: Any,
+        kind: str = "thread",
+        max_workers: int = 4
+    ):
+        """
+        Args:
+            fn: Función de predicción ``fn(model, *args)``; debe ser serializable
+                (definida a nivel de módulo) si se usa el pool de procesos
+            model: Modelo que se pasa como primer argumento a ``fn``
+            kind: Tipo de pool, ``"thread"`` o ``"process"``
+            max_workers: Número máximo de inferencias simultáneas
+        """
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Tipo de ejecutor no soportado: {kind} (opciones: {', '.join(EXECUTOR_KINDS)})")
+        if max_workers < 1:
+            raise ValueError("max_workers debe ser al menos 1")
+
+        self.fn = fn
+        self.kind = kind
+        self.max_workers = max_workers
+        self._model = model
+        self._pool: Optional[Executor] = self._create_pool()
+        logger.info(f"Ejecutor de inferencia iniciado: pool de {kind} con {max_workers} workers")
+
+    def _create_pool(self) -> Executor:
+        """Crea el pool subyacente según el tipo configurado."""
+        if self.kind == "process":
+            return ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(self.fn, self._model)
+            )
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="inference"
+        )
+
+    @property
+    def model(self) -> Any:
+        """Modelo usado por los workers."""
+        return self._model
+
+    async def run(self, *args: Any) -> Tuple[Any, Dict[str, float]]:
+        """
+        Ejecuta la predicción en el pool sin bloquear el event loop.
+
+        Args:
+            *args: Argumentos adicionales para la función de predicción
+
+        Returns:
+            tuple: (resultado, tiempos) donde tiempos contiene ``queue_wait_ms`` y
+            ``execution_ms``
+        """
+        loop = asyncio.get_running_loop()
+        if self._pool is None:
+            self._pool = self._create_pool()
+        submitted_ns = time.perf_counter_ns()
+
+        if self.kind == "process":
+            call = loop.run_in_executor(self._pool, _timed_worker_call, *args)
+        else:
+            call = loop.run_in_executor(self._pool, _timed_call, self.fn, self._model, *args)
+
+        result, started_ns, finished_ns = await call
+        queue_wait_ns = max(started_ns - submitted_ns, 0)
+        STAGE_QUEUE_WAIT.observe_ns(queue_wait_ns)
+        STAGE_INFERENCE.observe_ns(finished_ns - started_ns)
+        timing = {
+            "queue_wait_ms": queue_wait_ns / 1e6,
+            "execution_ms": (finished_ns - started_ns) / 1e6
+        }
+        return result, timing
+
+    @property
+    def active(self) -> bool:
+        """Indica si el pool de workers está creado."""
+        return self._pool is not None
+
+    def release(self) -> None:
+        """
+        Libera el pool sin esperar a las inferencias en curso, que terminan igual.
+
+        La siguiente llamada a ``run`` crea un pool nuevo (con el pool de procesos,
+        los workers vuelven a instalar el modelo).
+        """
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+            logger.info(f"Pool de {self.kind} del ejecutor de inferencia liberado")
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Detiene el pool de workers."""
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
@@ -0,0 +1,295 @@
+"""
+Especificación declarativa de características del modelo.
+Define nombre, orden, valores por defecto y codificaciones de cada característica, y
+la compila en un extractor que llena una matriz float32 para un lote completo.
+"""
+import json
+import logging
+import math
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from ..schemas.mcp import ModelInput
+from .columnar import ColumnarBatch
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Sufijo del archivo con la especificación que acompaña al artefacto del modelo
+FEATURE_SPEC_SUFFIX = ".features.json"
+
+PROTOCOL_ENCODING = {"tcp": 0.0, "udp": 1.0, "icmp": 2.0, "other": 3.0}
+TCP_FLAGS = ("SYN", "ACK", "FIN", "RST", "PSH", "URG")
+
+# Campos directos de ModelInput que pueden usarse como fuente
+_INPUT_FIELDS = ("source_port", "destination_port", "payload_size", "protocol")
+
+# Fuentes calculadas por el servicio y entregadas como columnas de contexto
+CONTEXT_SOURCE_PREFIXES = ("flow",)
+
+
+class FeatureSpecError(ValueError):
+    """La especificación de características es inválida o no coincide con el modelo."""
+
+
+class FeatureDefinition(BaseModel):
+    """
+    Definición de una columna de la matriz de características.
+
+    Fuentes soportadas:
+    - ``source_port``, ``destination_port``, ``payload_size``, ``protocol``
+    - ``flags.<FLAG>`` (por ejemplo ``flags.SYN``) y ``flags_present``
+    - ``metadata.<clave>`` para valores de ``additional_metadata`` (por ejemplo ``metadata.ttl``)
+    - ``flow.<ventana>.<agregado>`` para agregados por IP de origen (por ejemplo
+      ``flow.10s.distinct_ports``), calculados por el almacén de ventanas deslizantes
+    """
+    name: str = Field(..., description="Nombre de la característica")
+    source: str = Field(..., description="Campo de ModelInput del que se obtiene el valor")
+    default: float = Field(0.0, description="Valor cuando el campo falta o no puede convertirse")
+    encoding: Optional[Dict[str, float]] = Field(
+        None,
+        description="Codificación de valores categóricos (p. ej. protocolo o servicio)"
+    )
+
+
+class FeatureSpec(BaseModel):
+    """Especificación ordenada de las características que espera un modelo."""
+    version: int = Field(1, description="Versión del formato de la especificación")
+    features: List[FeatureDefinition] = Field(..., description="Características en el orden del modelo")
+
+    @property
+    def width(self) -> int:
+        """Número de columnas de la matriz de características."""
+        return len(self.features)
+
+    @property
+    def names(self) -> List[str]:
+        """Nombres de las características en orden."""
+        return [feature.name for feature in self.features]
+
+
+# Especificación por defecto: la disposición histórica de _preprocess_input con flags
+DEFAULT_FEATURE_SPEC = FeatureSpec(features=[
+    FeatureDefinition(name="source_port", source="source_port"),
+    FeatureDefinition(name="destination_port", source="destination_port"),
+    FeatureDefinition(name="protocol", source="protocol", default=3.0, encoding=PROTOCOL_ENCODING),
+    FeatureDefinition(name="payload_size", source="payload_size"),
+    *[FeatureDefinition(name=f"flag_{flag.lower()}", source=f"flags.{flag}") for flag in TCP_FLAGS]
+])
+
+
+def _to_float(value: Any, default: float) -> float:
+    """Convierte un valor a float, usando el valor por defecto si no es posible."""
+    if value is None or isinstance(value, (dict, list)):
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return default
+    return default if math.isnan(number) else number
+
+
+def _compile_getter(feature: FeatureDefinition) -> Callable[[ModelInput], Any]:
+    """Devuelve una función que lee el valor crudo de la fuente de una característica."""
+    source = feature.source
+
+    if source in _INPUT_FIELDS:
+        if source == "protocol":
+            return lambda record: record.protocol.value.lower()
+        return lambda record: getattr(record, source)
+
+    if source == "flags_present":
+        return lambda record: bool(record.flags)
+
+    prefix, _, key = source.partition(".")
+    if prefix == "flags" and key:
+        return lambda record: bool(record.flags.get(key, False)) if record.flags else None
+    if prefix == "metadata" and key:
+        return lambda record: record.additional_metadata.get(key) if record.additional_metadata else None
+
+    raise FeatureSpecError(f"Fuente de característica desconocida: {source}")
+
+
+def is_context_source(source: str) -> bool:
+    """Indica si la fuente se entrega como columna de contexto en lugar de leerse del registro."""
+    return source.partition(".")[0] in CONTEXT_SOURCE_PREFIXES
+
+
+def _compile_column(feature: FeatureDefinition) -> Optional[Callable[[Sequence[ModelInput]], Any]]:
+    """Compila una característica en un generador de valores float para un lote."""
+    if is_context_source(feature.source):
+        return None
+
+    getter = _compile_getter(feature)
+    default = feature.default
+
+    if feature.encoding is not None:
+        encoding = {str(key).lower(): float(value) for key, value in feature.encoding.items()}
+
+        def encode(records: Sequence[ModelInput]):
+            for record in records:
+                value = getter(record)
+                yield default if value is None else encoding.get(str(value).lower(), default)
+        return encode
+
+    def convert(records: Sequence[ModelInput]):
+        for record in records:
+            yield _to_float(getter(record), default)
+    return convert
+
+
+def _compile_columnar(feature: FeatureDefinition) -> Optional[Callable[[ColumnarBatch], np.ndarray]]:
+    """
+    Compila una característica para lotes columnares.
+
+    Produce los mismos valores que ``_compile_column`` para los registros JSON
+    equivalentes; las codificaciones se aplican una vez por valor distinto.
+    """
+    if is_context_source(feature.source):
+        return None
+
+    source = feature.source
+    default = feature.default
+    encoding = None
+    if feature.encoding is not None:
+        encoding = {str(key).lower(): float(value) for key, value in feature.encoding.items()}
+
+    def column(batch: ColumnarBatch) -> np.ndarray:
+        values, present = batch.raw(source)
+        if values is None:
+            return np.full(len(batch), default, dtype=np.float32)
+        if encoding is not None:
+            distinct, inverse = np.unique(values, return_inverse=True)
+            table = np.array(
+                [encoding.get(str(value).lower(), default) for value in distinct.tolist()],
+                dtype=np.float32
+            )
+            encoded = table[inverse.reshape(-1)] if len(distinct) else np.empty(0, dtype=np.float32)
+            return np.where(present, encoded, np.float32(default))
+        if values.dtype.kind in "US":
+            # Igual que _to_float: un texto no numérico toma el valor por defecto
+            return np.full(len(batch), default, dtype=np.float32)
+        return np.where(present, values.astype(np.float32), np.float32(default))
+    return column
+
+
+class FeatureExtractor:
+    """
+    Extractor compilado a partir de una FeatureSpec.
+
+    Cada característica se compila una sola vez en una función de columna; al
+    transformar un lote se reserva una matriz float32 y se llena columna a columna.
+    """
+
+    def __init__(self, spec: FeatureSpec):
+        """
+        Args:
+            spec: Especificación de características
+
+        Raises:
+            FeatureSpecError: Si alguna fuente no es válida
+        """
+        self.spec = spec
+        self._columns = [_compile_column(feature) for feature in spec.features]
+        self._columnar = [_compile_columnar(feature) for feature in spec.features]
+        self.context_sources = [
+            feature.source for feature in spec.features if is_context_source(feature.source)
+        ]
+
+    @property
+    def width(self) -> int:
+        """Número de columnas que produce el extractor."""
+        return self.spec.width
+
+    def transform(
+        self,
+        records: Union[Sequence[ModelInput], ColumnarBatch],
+        out: Optional[np.ndarray] = None,
+        context: Optional[Dict[str, np.ndarray]] = None
+    ) -> np.ndarray:
+        """
+        Construye la matriz de características de un lote.
+
+        Args:
+            records: Lote de datos de entrada (registros o lote columnar)
+            out: Matriz float32 de forma (len(records), width) a reutilizar (opcional)
+            context: Columnas precalculadas por fuente (p. ej. agregados ``flow.*``);
+                las fuentes de contexto ausentes toman su valor por defecto
+
+        Returns:
+            np.ndarray: Matriz float32 de forma (len(records), width)
+        """
+        n_rows = len(records)
+        if out is None:
+            out = np.empty((n_rows, self.width), dtype=np.float32)
+        elif out.shape != (n_rows, self.width) or out.dtype != np.float32:
+            raise ValueError(f"La matriz de salida debe ser float32 de forma ({n_rows}, {self.width})")
+
+        columns = self._columnar if isinstance(records, ColumnarBatch) else self._columns
+        for column, (feature, values) in enumerate(zip(self.spec.features, columns)):
+            if context is not None and feature.source in context:
+                out[:, column] = context[feature.source]
+            elif values is None:
+                out[:, column] = feature.default
+            elif isinstance(records, ColumnarBatch):
+                out[:, column] = values(records)
+            else:
+                out[:, column] = np.fromiter(values(records), dtype=np.float32, count=n_rows)
+        return out
+
+
+def take_records(
+    records: Union[Sequence[ModelInput], ColumnarBatch],
+    rows: np.ndarray
+) -> Union[List[ModelInput], ColumnarBatch]:
+    """Selecciona filas de un lote de registros o de un lote columnar."""
+    if isinstance(records, ColumnarBatch):
+        return records.take(rows)
+    return [records[row] for row in rows]
+
+
+def spec_path_for(model_path: Path) -> Path:
+    """Ruta del archivo de especificación que acompaña a un artefacto de modelo."""
+    return model_path.with_name(model_path.stem + FEATURE_SPEC_SUFFIX)
+
+
+def load_feature_spec(model_path: Path, artifact: Any = None) -> Optional[FeatureSpec]:
+    """
+    Obtiene la especificación de características asociada a un artefacto.
+
+    Se busca, en orden, la clave ``feature_spec`` de un artefacto empaquetado como
+    diccionario y el archivo ``<modelo>.features.json`` junto al artefacto.
+
+    Args:
+        model_path: Ruta del artefacto del modelo
+        artifact: Objeto cargado del artefacto (opcional)
+
+    Returns:
+        FeatureSpec o None si el artefacto no declara ninguna
+    """
+    if isinstance(artifact, dict) and artifact.get("feature_spec") is not None:
+        return FeatureSpec.model_validate(artifact["feature_spec"])
+
+    sidecar = spec_path_for(model_path)
+    if sidecar.exists():
+        with open(sidecar, encoding="utf-8") as handle:
+            return FeatureSpec.model_validate(json.load(handle))
+    return None
+
+
+def validate_spec_for_model(spec: FeatureSpec, model: Any) -> None:
+    """
+    Comprueba una sola vez, al cargar, que el modelo acepta el ancho de la especificación.
+
+    Raises:
+        FeatureSpecError: Si el número de características no coincide
+    """
+    expected = getattr(model, "n_features_in_", None)
+    if expected is not None and int(expected) != spec.width:
+        raise FeatureSpecError(
+            f"El modelo espera {expected} características, pero la especificación define "
+            f"{spec.width}: {', '.join(spec.names)}"
+        )
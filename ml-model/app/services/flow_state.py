@@ -0,0 +1,335 @@
+"""
+Almacén de estado por IP de origen con ventanas deslizantes.
+Mantiene agregados por ventana (puertos y hosts de destino distintos, proporción de
+SYN sin ACK y tasa de paquetes) para detectar escaneos que un registro aislado no revela.
+"""
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from ..schemas.mcp import ModelInput
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Prefijo de las fuentes de características que provee este almacén
+FLOW_SOURCE_PREFIX = "flow"
+FLOW_AGGREGATES = ("distinct_ports", "distinct_hosts", "syn_ratio", "packet_rate")
+
+# Posiciones dentro de los contadores de cada ventana
+_START, _PORTS, _HOSTS, _SYN, _PACKETS = range(5)
+_WINDOW_FIELDS = 5
+
+# Estimación de memoria (bytes) usada para aplicar el límite duro
+_STATE_BYTES = 400       # Objeto, lista de eventos, diccionarios vacíos y contadores
+_EVENT_BYTES = 120       # Tupla de evento y sus valores
+_ENTRY_BYTES = 100       # Entrada en el índice de puertos u hosts
+
+
+def window_label(seconds: float) -> str:
+    """Etiqueta de una ventana, p. ej. ``10s``."""
+    return f"{seconds:g}s"
+
+
+def event_time(timestamp: datetime) -> float:
+    """Convierte la marca de tiempo de un registro a segundos epoch (UTC si no trae zona)."""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+class _SourceState:
+    """
+    Estado compacto de una IP de origen.
+
+    Los eventos se guardan una sola vez; cada ventana solo lleva su posición de
+    inicio y cuatro contadores. Los índices ``port_last``/``host_last`` guardan la
+    secuencia del último evento de cada puerto/host, lo que permite mantener los
+    conteos de distintos en O(1) al entrar y salir eventos de la ventana.
+    """
+    __slots__ = ("events", "offset", "port_last", "host_last", "windows", "last_ts", "touched", "cost")
+
+    def __init__(self, n_windows: int, touched: float):
+        self.events: List[tuple] = []   # (ts, puerto, host, syn_sin_ack)
+        self.offset = 0                 # Secuencia del evento en events[0]
+        self.port_last: Dict[int, int] = {}
+        self.host_last: Dict[int, int] = {}
+        self.windows = [0] * (n_windows * _WINDOW_FIELDS)
+        self.last_ts = float("-inf")
+        self.touched = touched
+        self.cost = _STATE_BYTES
+
+
+class SourceWindowStore:
+    """
+    Agregados por IP de origen sobre varias ventanas deslizantes.
+
+    Las actualizaciones son O(1) amortizado por ventana. El número de fuentes está
+    acotado por ``max_sources`` y por una estimación de memoria (``max_bytes``); las
+    fuentes inactivas durante ``ttl_seconds`` y, ante presión de memoria, las menos
+    recientes, se descartan.
+    """
+
+    def __init__(
+        self,
+        windows: Sequence[float] = (1, 10, 60),
+        ttl_seconds: float = 300.0,
+        max_sources: int = 100_000,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_events_per_source: int = 1024
+    ):
+        """
+        Args:
+            windows: Duración de cada ventana en segundos
+            ttl_seconds: Inactividad tras la cual se descarta una fuente
+            max_sources: Número máximo de fuentes en memoria
+            max_bytes: Memoria estimada máxima del almacén
+            max_events_per_source: Eventos retenidos por fuente en la ventana mayor
+        """
+        if not windows:
+            raise ValueError("Se requiere al menos una ventana")
+        if any(w <= 0 for w in windows):
+            raise ValueError("Las ventanas deben durar más de 0 segundos")
+        self.windows = sorted(float(w) for w in windows)
+        self.ttl_seconds = ttl_seconds
+        self.max_sources = max(max_sources, 1)
+        self.max_bytes = max_bytes
+        self.max_events_per_source = max(max_events_per_source, 1)
+
+        self._sources: "OrderedDict[str, _SourceState]" = OrderedDict()
+        self._bytes = 0
+        self._events = 0
+        self._evicted_ttl = 0
+        self._evicted_capacity = 0
+
+        self.feature_names = [
+            f"{FLOW_SOURCE_PREFIX}.{window_label(w)}.{aggregate}"
+            for w in self.windows
+            for aggregate in FLOW_AGGREGATES
+        ]
+
+    def observe(
+        self,
+        source_ip: str,
+        timestamp: float,
+        destination_ip: str,
+        destination_port: int,
+        syn_only: bool
+    ) -> List[float]:
+        """
+        Registra un evento y devuelve los agregados de su fuente.
+
+        Args:
+            source_ip: IP de origen (clave del estado)
+            timestamp: Marca de tiempo del evento en segundos
+            destination_ip: IP de destino
+            destination_port: Puerto de destino
+            syn_only: Si el paquete lleva SYN sin ACK
+
+        Returns:
+            list: Valores en el orden de ``feature_names``
+        """
+        now = time.monotonic()
+        self._evict_expired(now)
+
+        state = self._sources.get(source_ip)
+        if state is None:
+            state = _SourceState(len(self.windows), now)
+            self._sources[source_ip] = state
+            self._bytes += state.cost
+        else:
+            state.touched = now
+            self._sources.move_to_end(source_ip)
+
+        # Los eventos fuera de orden se tratan como simultáneos al último visto
+        ts = max(timestamp, state.last_ts)
+        state.last_ts = ts
+        self._append(state, ts, destination_port, hash(destination_ip), int(syn_only))
+        self._events += 1
+
+        cost = _STATE_BYTES + (len(state.events) * _EVENT_BYTES
+                               + (len(state.port_last) + len(state.host_last)) * _ENTRY_BYTES)
+        self._bytes += cost - state.cost
+        state.cost = cost
+        self._enforce_capacity()
+
+        return self._aggregates(state)
+
+    def observe_batch(self, records: Sequence[ModelInput]) -> Dict[str, np.ndarray]:
+        """
+        Registra un lote de eventos en orden y devuelve sus agregados como columnas.
+
+        Args:
+            records: Lote de datos de entrada
+
+        Returns:
+            dict: Columna por nombre de ``feature_names``
+        """
+        return self.observe_columns(
+            [record.source_ip for record in records],
+            [event_time(record.timestamp) for record in records],
+            [record.destination_ip for record in records],
+            [record.destination_port for record in records],
+            [bool((record.flags or {}).get("SYN")) and not (record.flags or {}).get("ACK") for record in records]
+        )
+
+    def observe_columns(
+        self,
+        source_ips: Sequence[str],
+        timestamps: Sequence[float],
+        destination_ips: Sequence[str],
+        destination_ports: Sequence[int],
+        syn_only: Sequence[bool]
+    ) -> Dict[str, np.ndarray]:
+        """
+        Registra un lote dado por columnas (p. ej. un lote binario columnar).
+
+        Returns:
+            dict: Columna por nombre de ``feature_names``
+        """
+        values = np.empty((len(source_ips), len(self.feature_names)), dtype=np.float64)
+        for row, event in enumerate(zip(source_ips, timestamps, destination_ips, destination_ports, syn_only)):
+            values[row] = self.observe(*event)
+        return {name: values[:, column] for column, name in enumerate(self.feature_names)}
+
+    def _append(self, state: _SourceState, ts: float, port: int, host: int, syn: int) -> None:
+        """Añade un evento a todas las ventanas y expira los que quedaron fuera."""
+        seq = state.offset + len(state.events)
+        state.events.append((ts, port, host, syn))
+        prev_port = state.port_last.get(port)
+        prev_host = state.host_last.get(host)
+        state.port_last[port] = seq
+        state.host_last[host] = seq
+
+        counters = state.windows
+        for base in range(0, len(counters), _WINDOW_FIELDS):
+            start = counters[base + _START]
+            counters[base + _PACKETS] += 1
+            counters[base + _SYN] += syn
+            if prev_port is None or prev_port < start:
+                counters[base + _PORTS] += 1
+            if prev_host is None or prev_host < start:
+                counters[base + _HOSTS] += 1
+
+        largest = (len(self.windows) - 1) * _WINDOW_FIELDS
+        for index, seconds in enumerate(self.windows):
+            base = index * _WINDOW_FIELDS
+            cutoff = ts - seconds
+            while counters[base + _START] <= seq:
+                position = counters[base + _START] - state.offset
+                # Límite de eventos por fuente: se fuerza la salida de los más antiguos
+                over_cap = seq - counters[largest + _START] + 1 > self.max_events_per_source
+                if state.events[position][0] > cutoff and not (over_cap and counters[base + _START] == counters[largest + _START]):
+                    break
+                self._expire(state, base, base == largest)
+
+        # Compactar la lista de eventos de forma amortizada
+        head = counters[largest + _START] - state.offset
+        if head >= 32 and head * 2 >= len(state.events):
+            del state.events[:head]
+            state.offset += head
+
+    def _expire(self, state: _SourceState, base: int, prune: bool) -> None:
+        """Saca de una ventana el evento en su posición de inicio."""
+        counters = state.windows
+        seq = counters[base + _START]
+        _, port, host, syn = state.events[seq - state.offset]
+
+        counters[base + _START] = seq + 1
+        counters[base + _PACKETS] -= 1
+        counters[base + _SYN] -= syn
+        if state.port_last[port] == seq:
+            counters[base + _PORTS] -= 1
+            if prune:
+                del state.port_last[port]
+        if state.host_last[host] == seq:
+            counters[base + _HOSTS] -= 1
+            if prune:
+                del state.host_last[host]
+
+    def _aggregates(self, state: _SourceState) -> List[float]:
+        """Calcula los agregados de cada ventana en el orden de ``feature_names``."""
+        values: List[float] = []
+        counters = state.windows
+        for index, seconds in enumerate(self.windows):
+            base = index * _WINDOW_FIELDS
+            packets = counters[base + _PACKETS]
+            values.extend((
+                counters[base + _PORTS],
+                counters[base + _HOSTS],
+                counters[base + _SYN] / packets if packets else 0.0,
+                packets / seconds
+            ))
+        return values
+
+    def _remove(self, source_ip: str) -> None:
+        """Elimina una fuente y descuenta su memoria."""
+        state = self._sources.pop(source_ip)
+        self._bytes -= state.cost
+
+    def _evict_expired(self, now: float) -> None:
+        """Descarta las fuentes inactivas más allá del TTL (las más antiguas están al frente)."""
+        cutoff = now - self.ttl_seconds
+        while self._sources:
+            source_ip, state = next(iter(self._sources.items()))
+            if state.touched >= cutoff:
+                break
+            self._remove(source_ip)
+            self._evicted_ttl += 1
+
+    def _enforce_capacity(self) -> None:
+        """Aplica los límites de fuentes y memoria descartando las menos recientes."""
+        while len(self._sources) > 1 and (len(self._sources) > self.max_sources or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._sources)))
+            self._evicted_capacity += 1
+
+    def get(self, source_ip: str) -> Optional[Dict[str, float]]:
+        """
+        Consulta los agregados actuales de una fuente sin registrar eventos.
+
+        Returns:
+            dict o None si la fuente no está en memoria
+        """
+        state = self._sources.get(source_ip)
+        if state is None:
+            return None
+        return dict(zip(self.feature_names, self._aggregates(state)))
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Devuelve las métricas del almacén.
+
+        Returns:
+            dict: Fuentes en memoria, memoria estimada, eventos y expulsiones
+        """
+        return {
+            "windows_seconds": self.windows,
+            "sources": len(self._sources),
+            "max_sources": self.max_sources,
+            "estimated_bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "events": self._events,
+            "evicted_ttl": self._evicted_ttl,
+            "evicted_capacity": self._evicted_capacity
+        }
+
+
+def split_flow_features(values: Dict[str, float]) -> Dict[str, Dict[str, float]]:
+    """
+    Agrupa los agregados planos (``flow.10s.distinct_ports``) por ventana.
+
+    Returns:
+        dict: ``{"10s": {"distinct_ports": ..., ...}, ...}``
+    """
+    grouped: Dict[str, Dict[str, float]] = {}
+    for name, value in values.items():
+        _, window, aggregate = name.split(".", 2)
+        grouped.setdefault(window, {})[aggregate] = float(value)
+    return grouped
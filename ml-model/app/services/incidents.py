@@ -0,0 +1,356 @@
+"""
+Agregación de alertas en incidentes.
+
+Las alertas repetidas con la misma clave (por defecto, IP de origen y nivel de
+riesgo) se agrupan en un único incidente mientras lleguen dentro de la ventana de
+inactividad: un barrido de puertos produce un incidente con el número de alertas,
+los puertos y destinos vistos y el primer y último instante, en lugar de miles de
+alertas. La memoria está acotada: los incidentes abiertos se expulsan por orden de
+actividad, los conjuntos de puertos y destinos tienen un tamaño máximo y solo se
+conservan los últimos incidentes cerrados.
+
+Los incidentes se publican al abrirse y al cerrarse a los suscriptores del flujo
+``/api/v1/incidents/stream``, de modo que la carga aguas abajo depende del número
+de incidentes y no del de paquetes. Todo ocurre en el event loop, sin locks.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from uuid import uuid4
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Campos que pueden formar la clave de agregación
+KEY_FIELDS = ("source_ip", "destination_ip", "destination_port", "protocol", "risk_level")
+
+# Orden de severidad para quedarse con el nivel más alto del incidente
+_SEVERITY = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+
+# Límites por incidente
+_MAX_DESTINATIONS = 256
+_MAX_INDICATORS = 32
+_MAX_REQUEST_IDS = 5
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+class Incident:
+    """Alertas agrupadas bajo una misma clave."""
+
+    __slots__ = (
+        "incident_id", "key", "source_ip", "risk_level", "first_seen", "last_seen", "count",
+        "ports", "ports_truncated", "destinations", "protocols", "max_confidence",
+        "indicators", "decisions", "request_ids", "closed_reason"
+    )
+
+    def __init__(self, key: Tuple[Any, ...], source_ip: str, risk_level: str, now: float):
+        self.incident_id = uuid4().hex
+        self.key = key
+        self.source_ip = source_ip
+        self.risk_level = risk_level
+        self.first_seen = now
+        self.last_seen = now
+        self.count = 0
+        self.ports: Set[int] = set()
+        self.ports_truncated = False
+        self.destinations: Set[str] = set()
+        self.protocols: Set[str] = set()
+        self.max_confidence = 0.0
+        self.indicators: Counter = Counter()
+        self.decisions: Counter = Counter()
+        self.request_ids: List[str] = []
+        self.closed_reason: Optional[str] = None
+
+    def add(
+        self,
+        destination_ip: str,
+        destination_port: int,
+        protocol: str,
+        risk_level: str,
+        confidence: float,
+        indicators: Iterable[str],
+        request_id: Optional[str],
+        decision: str,
+        now: float,
+        max_ports: int
+    ) -> None:
+        """Suma una alerta al incidente."""
+        self.count += 1
+        self.last_seen = now
+        if destination_port not in self.ports:
+            if len(self.ports) < max_ports:
+                self.ports.add(destination_port)
+            else:
+                self.ports_truncated = True
+        if len(self.destinations) < _MAX_DESTINATIONS:
+            self.destinations.add(destination_ip)
+        self.protocols.add(protocol)
+        if _SEVERITY.get(risk_level, 0) > _SEVERITY.get(self.risk_level, 0):
+            self.risk_level = risk_level
+        self.max_confidence = max(self.max_confidence, confidence)
+        for indicator in indicators:
+            if indicator in self.indicators or len(self.indicators) < _MAX_INDICATORS:
+                self.indicators[indicator] += 1
+        self.decisions[decision] += 1
+        if request_id and len(self.request_ids) < _MAX_REQUEST_IDS:
+            self.request_ids.append(request_id)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Resumen del incidente.
+
+        Returns:
+            dict: Clave, conteos, puertos, destinos, instantes y estado
+        """
+        return {
+            "incident_id": self.incident_id,
+            "status": "open" if self.closed_reason is None else "closed",
+            "closed_reason": self.closed_reason,
+            "source_ip": self.source_ip,
+            "risk_level": self.risk_level,
+            "key": list(self.key),
+            "count": self.count,
+            "first_seen": _isoformat(self.first_seen),
+            "last_seen": _isoformat(self.last_seen),
+            "duration_seconds": round(self.last_seen - self.first_seen, 3),
+            "distinct_ports": len(self.ports),
+            "ports": sorted(self.ports),
+            "ports_truncated": self.ports_truncated,
+            "destinations": sorted(self.destinations),
+            "protocols": sorted(self.protocols),
+            "max_confidence": self.max_confidence,
+            "indicators": dict(self.indicators.most_common(10)),
+            "decisions": dict(self.decisions),
+            "sample_request_ids": list(self.request_ids)
+        }
+
+
+class IncidentAggregator:
+    """
+    Agrupa las alertas de riesgo alto en incidentes por clave y ventana.
+
+    Un incidente se cierra cuando pasa ``window_seconds`` sin alertas, cuando dura
+    más de ``max_duration_seconds`` (la siguiente alerta abre otro) o cuando se
+    expulsa por superar ``max_open`` incidentes abiertos.
+    """
+
+    def __init__(
+        self,
+        key_fields: Sequence[str] = ("source_ip", "risk_level"),
+        risk_levels: Sequence[str] = ("high", "critical"),
+        window_seconds: float = 300.0,
+        max_duration_seconds: float = 3600.0,
+        max_open: int = 10000,
+        max_ports: int = 1024,
+        history_size: int = 1000,
+        subscriber_queue_size: int = 1000
+    ):
+        """
+        Args:
+            key_fields: Campos que forman la clave (ver ``KEY_FIELDS``)
+            risk_levels: Niveles de riesgo que se agregan; el resto se ignora
+            window_seconds: Inactividad tras la que se cierra un incidente
+            max_duration_seconds: Duración máxima de un incidente
+            max_open: Incidentes abiertos en memoria
+            max_ports: Puertos distintos guardados por incidente
+            history_size: Incidentes cerrados que se conservan para consulta
+            subscriber_queue_size: Eventos en espera por suscriptor del flujo
+
+        Raises:
+            ValueError: Si un campo de la clave o un nivel de riesgo no es válido
+        """
+        unknown = [name for name in key_fields if name not in KEY_FIELDS]
+        if unknown or not key_fields:
+            raise ValueError(f"Campos de clave no válidos: {unknown or key_fields}; use {KEY_FIELDS}")
+        levels = [level.lower() for level in risk_levels]
+        if any(level not in _SEVERITY for level in levels):
+            raise ValueError(f"Niveles de riesgo no válidos: {risk_levels}")
+        self.key_fields = tuple(key_fields)
+        self.risk_levels = frozenset(levels)
+        self.window_seconds = window_seconds
+        self.max_duration_seconds = max_duration_seconds
+        self.max_open = max(max_open, 1)
+        self.max_ports = max(max_ports, 1)
+        self.subscriber_queue_size = max(subscriber_queue_size, 1)
+
+        # Incidentes abiertos ordenados por última alerta (el primero es el más inactivo)
+        self._open: "OrderedDict[Tuple[Any, ...], Incident]" = OrderedDict()
+        self._closed: Deque[Incident] = deque(maxlen=max(history_size, 0))
+        self._subscribers: Set[asyncio.Queue] = set()
+
+        # Métricas acumuladas
+        self.alerts = 0
+        self.opened = 0
+        self.closed = 0
+        self.evicted = 0
+        self.dropped_events = 0
+
+    @property
+    def open_count(self) -> int:
+        """Incidentes abiertos."""
+        return len(self._open)
+
+    def observe(
+        self,
+        source_ip: str,
+        destination_ip: str,
+        destination_port: int,
+        protocol: str,
+        risk_level: str,
+        confidence: float,
+        indicators: Iterable[str] = (),
+        request_id: Optional[str] = None,
+        decision: str = "model",
+        now: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Registra una alerta si su nivel de riesgo se agrega.
+
+        Returns:
+            dict o None: ``incident_id``, ``count`` y ``suppressed`` (True si la alerta
+            se sumó a un incidente ya abierto), o None si el nivel no se agrega
+        """
+        if risk_level not in self.risk_levels:
+            return None
+        now = time.time() if now is None else now
+        fields = {
+            "source_ip": source_ip,
+            "destination_ip": destination_ip,
+            "destination_port": destination_port,
+            "protocol": protocol,
+            "risk_level": risk_level
+        }
+        key = tuple(fields[name] for name in self.key_fields)
+
+        incident = self._open.get(key)
+        if incident is not None:
+            if now - incident.last_seen > self.window_seconds:
+                self._close(incident, "inactive")
+                incident = None
+            elif now - incident.first_seen > self.max_duration_seconds:
+                self._close(incident, "max_duration")
+                incident = None
+        if incident is None:
+            self.expire(now)
+            if len(self._open) >= self.max_open:
+                self.evicted += 1
+                self._close(next(iter(self._open.values())), "evicted")
+            incident = self._open[key] = Incident(key, source_ip, risk_level, now)
+            self.opened += 1
+            suppressed = False
+        else:
+            self._open.move_to_end(key)
+            suppressed = True
+
+        self.alerts += 1
+        incident.add(
+            destination_ip, destination_port, protocol, risk_level, confidence,
+            indicators, request_id, decision, now, self.max_ports
+        )
+        if not suppressed:
+            self._publish("opened", incident)
+        return {"incident_id": incident.incident_id, "count": incident.count, "suppressed": suppressed}
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """
+        Cierra los incidentes sin alertas durante la ventana.
+
+        Returns:
+            int: Incidentes cerrados
+        """
+        now = time.time() if now is None else now
+        closed = 0
+        while self._open:
+            incident = next(iter(self._open.values()))
+            if now - incident.last_seen <= self.window_seconds:
+                break
+            self._close(incident, "inactive")
+            closed += 1
+        return closed
+
+    def close_all(self, reason: str = "shutdown") -> None:
+        """Cierra todos los incidentes abiertos."""
+        for incident in list(self._open.values()):
+            self._close(incident, reason)
+
+    def _close(self, incident: Incident, reason: str) -> None:
+        del self._open[incident.key]
+        incident.closed_reason = reason
+        self._closed.append(incident)
+        self.closed += 1
+        self._publish("closed", incident)
+
+    # ========== Consulta y suscripción ==========
+    def list_incidents(self, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Devuelve los incidentes más recientes primero.
+
+        Args:
+            status: ``open``, ``closed`` o None para ambos
+            limit: Número máximo de incidentes
+
+        Returns:
+            list: Resúmenes de incidentes
+        """
+        self.expire()
+        selected: List[Incident] = []
+        if status in (None, "open"):
+            selected.extend(reversed(self._open.values()))
+        if status in (None, "closed"):
+            selected.extend(reversed(self._closed))
+        return [incident.to_dict() for incident in selected[:limit]]
+
+    def get(self, incident_id: str) -> Optional[Dict[str, Any]]:
+        """Devuelve un incidente abierto o reciente por su identificador."""
+        self.expire()
+        for incident in (*self._open.values(), *self._closed):
+            if incident.incident_id == incident_id:
+                return incident.to_dict()
+        return None
+
+    def subscribe(self) -> asyncio.Queue:
+        """Registra un suscriptor; recibe eventos ``{"event", "incident"}``."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.subscriber_queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def _publish(self, event: str, incident: Incident) -> None:
+        if not self._subscribers:
+            return
+        message = {"event": event, "incident": incident.to_dict()}
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Un suscriptor lento pierde eventos en lugar de frenar el análisis
+                self.dropped_events += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Devuelve las métricas del agregador.
+
+        Returns:
+            dict: Alertas, incidentes abiertos/cerrados, alertas suprimidas y suscriptores
+        """
+        return {
+            "key_fields": list(self.key_fields),
+            "risk_levels": sorted(self.risk_levels, key=_SEVERITY.get),
+            "window_seconds": self.window_seconds,
+            "open": self.open_count,
+            "alerts": self.alerts,
+            "opened": self.opened,
+            "closed": self.closed,
+            "evicted": self.evicted,
+            "suppressed": self.alerts - self.opened,
+            "subscribers": len(self._subscribers),
+            "dropped_events": self.dropped_events
+        }
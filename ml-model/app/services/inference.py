@@ -0,0 +1,129 @@
+"""
+Funciones puras de inferencia.
+Se mantienen en un módulo sin efectos secundarios al importarse para que puedan
+ejecutarse tanto en hilos como en procesos worker.
+"""
+import logging
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from .features import DEFAULT_FEATURE_SPEC, FeatureSpec, load_feature_spec, validate_spec_for_model
+from .tree_engine import CompiledForest, UnsupportedModelError, verify_compiled
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+
+class SklearnEngine:
+    """
+    Motor que delega en el estimador de scikit-learn original.
+    Se usa para los estimadores que no pueden compilarse.
+    """
+
+    kind = "sklearn"
+
+    def __init__(self, model: Any):
+        self.model = model
+        self.classes_ = getattr(model, "classes_", None)
+        self.n_features = getattr(model, "n_features_in_", None)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Probabilidades por clase del estimador original."""
+        return self.model.predict_proba(X)
+
+    def predict(self, X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Obtiene predicción y confianza.
+
+        Si el modelo expone ``predict_proba`` y ``classes_``, ambas salen de una sola
+        llamada; en otro caso se usa ``predict`` con confianza 1.0.
+        """
+        if hasattr(self.model, "predict_proba") and self.classes_ is not None:
+            proba = self.model.predict_proba(X)
+            best = proba.argmax(axis=1)
+            return self.classes_.take(best), proba[np.arange(len(best)), best]
+
+        predictions = self.model.predict(X)
+        return predictions, np.ones(len(predictions))  # Valor por defecto si no hay probabilidades
+
+
+def load_model_artifact(model_path: Path, mmap: bool = True) -> tuple[Any, FeatureSpec]:
+    """
+    Carga un artefacto de modelo y valida su especificación de características.
+
+    Args:
+        model_path: Ruta del artefacto (.pkl)
+        mmap: Si los arreglos del artefacto se abren con memoria mapeada
+            (``joblib.load(..., mmap_mode="r")``), compartida entre procesos
+
+    Returns:
+        tuple: (modelo, especificación de características)
+
+    Raises:
+        Exception: Si el artefacto no puede cargarse o su especificación no coincide
+    """
+    import joblib  # Importación diferida: evita cargar joblib/sklearn al importar el módulo
+
+    logger.info(f"Cargando modelo desde {model_path.absolute()}")
+    artifact = joblib.load(model_path, mmap_mode="r" if mmap else None)
+    model = artifact["model"] if isinstance(artifact, dict) else artifact
+
+    spec = load_feature_spec(model_path, artifact)
+    if spec is None:
+        logger.warning("El artefacto no declara especificación de características, se usa la predeterminada")
+        spec = DEFAULT_FEATURE_SPEC
+    validate_spec_for_model(spec, model)
+
+    logger.info(f"Modelo cargado exitosamente ({spec.width} características: {', '.join(spec.names)})")
+    return model, spec
+
+
+def build_engine(model: Any, compiled: bool = True) -> Any:
+    """
+    Prepara el motor de inferencia para un modelo cargado.
+
+    Intenta compilar el ensamble de árboles y verifica que reproduce las salidas de
+    scikit-learn; si el estimador no está soportado o la verificación falla, usa el
+    estimador original.
+
+    Args:
+        model: Modelo entrenado (interfaz scikit-learn)
+        compiled: Si es False, usa siempre el estimador original
+
+    Returns:
+        CompiledForest o SklearnEngine
+    """
+    if not compiled:
+        return SklearnEngine(model)
+
+    try:
+        engine = CompiledForest.from_estimator(model)
+    except UnsupportedModelError as e:
+        logger.info(f"Modelo no compilable, se usa scikit-learn: {str(e)}")
+        return SklearnEngine(model)
+
+    if not verify_compiled(engine, model):
+        logger.warning("El modelo compilado no coincide con scikit-learn, se usa el estimador original")
+        return SklearnEngine(model)
+
+    logger.info(
+        f"Modelo compilado: {engine.n_trees} árboles, {len(engine.feature)} nodos, "
+        f"profundidad máxima {engine.max_depth}"
+    )
+    return engine
+
+
+def predict_features(engine: Any, features: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Realiza la predicción para un lote de filas de características.
+
+    Args:
+        engine: Motor de inferencia (ver ``build_engine``)
+        features: Matriz de características de forma (n_filas, n_características)
+
+    Returns:
+        tuple: (predicciones, confianzas) como arreglos de longitud n_filas
+    """
+    return engine.predict(features)
@@ -0,0 +1,371 @@
+"""
+Métricas del servicio en formato de texto de Prometheus.
+Histogramas de latencia por etapa, contadores de predicciones y gauges del estado
+del servicio, pensados para quedar activos en producción.
+
+Las actualizaciones no toman locks: todas ocurren en el hilo del event loop (los
+tiempos medidos en el ejecutor de inferencia vuelven al loop junto con el
+resultado), así que un ``observe`` cuesta una búsqueda binaria sobre los límites
+y dos sumas. Los gauges que dependen del estado (caché, almacén de flujos,
+conexiones) se calculan al exportar, sin costo por solicitud. Las etapas del
+análisis se agregan además al trace de la solicitud cuando está muestreada.
+"""
+import logging
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from .tracing import current_trace
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Límites en segundos, de 50 µs a 5 s
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+)
+
+# Valores de etiqueta de una serie
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    """Escapa el valor de una etiqueta según el formato de texto."""
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Formatea ``{nombre="valor",...}`` (vacío sin etiquetas)."""
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    """Formatea un valor de muestra."""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Familia de series con nombre, ayuda y nombres de etiqueta."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, object] = {}
+
+    def labels(self, *values: str):
+        """
+        Devuelve la serie de unos valores de etiqueta, creándola si no existe.
+
+        Conviene guardar la serie devuelta cuando las etiquetas son fijas, para no
+        repetir la búsqueda en cada solicitud.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} espera las etiquetas {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> Iterable[str]:
+        """Líneas de muestra en formato de texto."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """Familia completa con sus líneas ``HELP`` y ``TYPE``."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    """Serie de un contador."""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Suma ``amount`` (no negativo)."""
+        self.value += amount
+
+
+class Counter(_Metric):
+    """Contador monótono por etiquetas."""
+
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Suma a la serie sin etiquetas."""
+        self.labels().inc(amount)
+
+    def samples(self) -> Iterable[str]:
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class _GaugeChild:
+    """Serie de un gauge."""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class Gauge(_Metric):
+    """Valor que sube y baja, actualizado por el código instrumentado."""
+
+    kind = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def samples(self) -> Iterable[str]:
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class CallbackMetric(_Metric):
+    """
+    Gauge o contador cuyo valor se obtiene al exportar.
+
+    ``collect`` devuelve pares (valores de etiqueta, valor); si falla, la familia se
+    omite de la exportación en lugar de romperla.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        collect: Callable[[], Iterable[Tuple[LabelValues, float]]],
+        labelnames: Sequence[str] = (),
+        kind: str = "gauge"
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.collect = collect
+
+    def samples(self) -> Iterable[str]:
+        for values, value in self.collect():
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"
+
+
+class _HistogramChild:
+    """Serie de un histograma: conteo por intervalo y suma."""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Registra una medición en segundos."""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def observe_ns(self, elapsed_ns: int) -> None:
+        """Registra una duración medida con ``time.perf_counter_ns``."""
+        self.observe(elapsed_ns / 1e9)
+
+
+class Histogram(_Metric):
+    """Histograma acumulativo con límites fijos."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(bound) for bound in buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def samples(self) -> Iterable[str]:
+        bounds = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+        names = (*self.labelnames, "le")
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, list(child.counts)):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(names, (*values, bound))} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class _StageChild(_HistogramChild):
+    """Serie de una etapa del análisis; la medición se agrega también al trace activo."""
+
+    __slots__ = ("stage",)
+
+    def __init__(self, bounds: Tuple[float, ...], stage: str):
+        super().__init__(bounds)
+        self.stage = stage
+
+    def observe_ns(self, elapsed_ns: int) -> None:
+        self.observe(elapsed_ns / 1e9)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add(self.stage, elapsed_ns)
+
+
+class StageHistogram(Histogram):
+    """Histograma con una única etiqueta ``stage`` cuyas series alimentan las trazas."""
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, ("stage",), buckets)
+
+    def labels(self, *values: str) -> _StageChild:
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != 1:
+                raise ValueError(f"{self.name} espera las etiquetas {self.labelnames}")
+            child = self._children[values] = _StageChild(self.buckets, values[0])
+        return child
+
+
+class MetricsRegistry:
+    """Conjunto de familias exportadas por ``/metrics``."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        """
+        Agrega una familia.
+
+        Raises:
+            ValueError: Si ya hay una familia con ese nombre
+        """
+        if metric.name in self._metrics:
+            raise ValueError(f"La métrica {metric.name} ya está registrada")
+        if not metric.labelnames and not isinstance(metric, CallbackMetric):
+            metric.labels()  # Una familia sin etiquetas se exporta aunque no tenga mediciones
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        collect: Callable[[], Iterable[Tuple[LabelValues, float]]],
+        labelnames: Sequence[str] = (),
+        kind: str = "gauge"
+    ) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, collect, labelnames, kind))
+
+    def render(self) -> str:
+        """
+        Exporta todas las familias en el formato de texto de Prometheus.
+
+        Returns:
+            str: Documento terminado en salto de línea
+        """
+        blocks: List[str] = []
+        for metric in list(self._metrics.values()):
+            try:
+                blocks.append(metric.render())
+            except Exception as e:
+                logger.warning(f"No se pudo exportar la métrica {metric.name}: {str(e)}")
+        return "\n".join(blocks) + "\n"
+
+
+# Registro del proceso
+registry = MetricsRegistry()
+
+# ========== Métricas del análisis ==========
+stage_duration = registry.register(StageHistogram(
+    "red_sentinel_stage_duration_seconds",
+    "Duración de cada etapa del análisis en segundos."
+))
+STAGE_ADMISSION = stage_duration.labels("admission")
+STAGE_VALIDATION = stage_duration.labels("validation")
+STAGE_CIDR = stage_duration.labels("cidr")
+STAGE_FLOW_STATE = stage_duration.labels("flow_state")
+STAGE_RULES = stage_duration.labels("rules")
+STAGE_PREPROCESS = stage_duration.labels("preprocess")
+STAGE_BATCH_WAIT = stage_duration.labels("batch_wait")
+STAGE_QUEUE_WAIT = stage_duration.labels("queue_wait")
+STAGE_INFERENCE = stage_duration.labels("inference")
+STAGE_EXPLANATION = stage_duration.labels("explanation")
+STAGE_SERIALIZATION = stage_duration.labels("serialization")
+STAGE_BACKGROUND = stage_duration.labels("background")
+
+predictions_total = registry.counter(
+    "red_sentinel_predictions_total",
+    "Registros analizados por nivel de riesgo, versión del modelo y camino de decisión (model, cidr, rule, degraded).",
+    ("risk_level", "model_version", "decision")
+)
+prediction_errors_total = registry.counter(
+    "red_sentinel_prediction_errors_total",
+    "Registros cuyo análisis falló."
+)
+
+# ========== Métricas HTTP ==========
+http_requests_total = registry.counter(
+    "red_sentinel_http_requests_total",
+    "Solicitudes HTTP atendidas por ruta, método y código de estado.",
+    ("route", "method", "status")
+)
+http_request_duration = registry.histogram(
+    "red_sentinel_http_request_duration_seconds",
+    "Duración de las solicitudes HTTP en segundos, hasta el último byte de la respuesta.",
+    ("route", "method")
+)
+http_requests_in_flight = registry.gauge(
+    "red_sentinel_http_requests_in_flight",
+    "Solicitudes HTTP en curso."
+).labels()
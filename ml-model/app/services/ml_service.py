@@ -2,17 +2,53 @@
 Servicio de Machine Learning para detección de amenazas en tráfico de red.
 Implementa el Model Context Protocol (MCP) para estandarizar las entradas/salidas.
 """
+import asyncio
 import json
 import logging
-import joblib
+import os
+import time
 import numpy as np
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Set, Union
 from datetime import datetime, timezone
 
 # Importaciones locales
 from ..core.config import settings
 from ..schemas.mcp import ModelInput, ModelOutput, ModelMetadata, ThreatLevel
+from .cascade import ModelCascade, ModelStage, take_context
+from .cidr_index import CidrListManager, CidrMatch
+from .columnar import (
+    FLAG_BITS,
+    PROTOCOL_CODES,
+    RISK_CODES,
+    RISK_NONE,
+    STATUS_CIDR,
+    STATUS_ERROR,
+    STATUS_INVALID,
+    STATUS_MODEL,
+    STATUS_RULE,
+    ColumnarBatch,
+    validate_columnar_batch
+)
+from .executor import InferenceExecutor
+from .flow_state import SourceWindowStore, split_flow_features
+from .incidents import IncidentAggregator
+from .sketches import TopSourcesTracker
+from .features import DEFAULT_FEATURE_SPEC, FeatureSpec
+from .inference import build_engine, load_model_artifact, predict_features
+from .metrics import (
+    STAGE_CIDR,
+    STAGE_EXPLANATION,
+    STAGE_FLOW_STATE,
+    STAGE_INFERENCE,
+    STAGE_RULES,
+    prediction_errors_total,
+    predictions_total
+)
+from .model_registry import ModelRegistry, ModelVersion, warm_up_stage
+from .prediction_cache import PredictionCache
+from .rules import DEFAULT_RULE_SET, RuleEngine, RuleMatches, load_rule_set
+from .shared_model import SharedModelStore, process_memory
 
 # Configuración de logging
 logger = logging.getLogger(__name__)
@@ -24,28 +60,320 @@ class MLService:
     """
     
     def __init__(self):
-        """Inicializa el servicio cargando el modelo y metadatos."""
-        self.model = self._load_model()
-        self.metadata = self._create_model_metadata()
-        logger.info(f"Servicio ML inicializado con modelo: {self.metadata.name} v{self.metadata.version}")
+        """
+        Prepara los componentes ligeros del servicio.
+        
+        El modelo no se carga aquí, sino en ``start`` (llamado desde el lifespan de
+        FastAPI o, de forma perezosa, en la primera solicitud), para que importar el
+        módulo no tenga efectos costosos.
+        """
+        # Caché de predicciones por vector de características, compartida por las etapas
+        self.prediction_cache: Optional[PredictionCache] = None
+        if settings.PREDICTION_CACHE_ENABLED:
+            self.prediction_cache = PredictionCache(
+                max_entries=settings.PREDICTION_CACHE_MAX_ENTRIES,
+                max_bytes=settings.PREDICTION_CACHE_MAX_MB * 1024 * 1024,
+                ttl_seconds=settings.PREDICTION_CACHE_TTL_SECONDS
+            )
+        # Versiones cargadas del modelo principal; la activa es la última etapa de la cascada
+        self.registry = ModelRegistry(
+            max_versions=settings.MODEL_REGISTRY_MAX_VERSIONS,
+            retire_grace_seconds=settings.MODEL_REGISTRY_RETIRE_GRACE_SECONDS
+        )
+        # Protege el registro y el cambio de versión; la carga y el calentamiento corren fuera
+        self._model_lock = asyncio.Lock()
+        self._loading: Set[str] = set()
+        self._watched_mtime: Optional[datetime] = None
+        # Con el supervisor multiproceso el modelo se adjunta desde el almacén compartido
+        self.shared_store: Optional[SharedModelStore] = None
+        if settings.SHARED_MODEL_DIR:
+            self.shared_store = SharedModelStore(settings.SHARED_MODEL_DIR)
+        self._started_at = time.time()
+        # Se completan en start(): cascada (etapas previas + modelo principal) y metadatos
+        self.cascade: Optional[ModelCascade] = None
+        self.metadata: Optional[ModelMetadata] = None
+        self._startup: Optional[asyncio.Task] = None
+        self._startup_ms: Optional[float] = None
+        # Listas CIDR de permitidos/bloqueados consultadas antes del modelo
+        self.cidr_list = CidrListManager(
+            settings.CIDR_LIST_PATH,
+            check_interval=settings.CIDR_RELOAD_INTERVAL_SECONDS
+        )
+        self.cidr_deny_risk_level = ThreatLevel(settings.CIDR_DENY_RISK_LEVEL.lower())
+        # Agregados por IP de origen para detectar escaneos entre registros
+        self.flow_store: Optional[SourceWindowStore] = None
+        if settings.FLOW_STATE_ENABLED:
+            self.flow_store = SourceWindowStore(
+                windows=settings.FLOW_WINDOWS_SECONDS,
+                ttl_seconds=settings.FLOW_STATE_TTL_SECONDS,
+                max_sources=settings.FLOW_STATE_MAX_SOURCES,
+                max_bytes=settings.FLOW_STATE_MAX_MEMORY_MB * 1024 * 1024,
+                max_events_per_source=settings.FLOW_STATE_MAX_EVENTS_PER_SOURCE
+            )
+        # Orígenes más activos con memoria fija (Count-Min Sketch + HyperLogLog)
+        self.top_sources: Optional[TopSourcesTracker] = None
+        if settings.SKETCH_ENABLED:
+            self.top_sources = TopSourcesTracker(
+                epoch_seconds=settings.SKETCH_EPOCH_SECONDS,
+                n_epochs=settings.SKETCH_EPOCHS,
+                width=settings.SKETCH_WIDTH,
+                depth=settings.SKETCH_DEPTH,
+                capacity=settings.SKETCH_CANDIDATES,
+                hll_precision=settings.SKETCH_HLL_PRECISION
+            )
+        # Alertas de riesgo alto agrupadas en incidentes por clave y ventana
+        self.incidents: Optional[IncidentAggregator] = None
+        if settings.INCIDENTS_ENABLED:
+            self.incidents = IncidentAggregator(
+                key_fields=settings.INCIDENT_KEY_FIELDS,
+                risk_levels=settings.INCIDENT_RISK_LEVELS,
+                window_seconds=settings.INCIDENT_WINDOW_SECONDS,
+                max_duration_seconds=settings.INCIDENT_MAX_DURATION_SECONDS,
+                max_open=settings.INCIDENT_MAX_OPEN,
+                max_ports=settings.INCIDENT_MAX_PORTS,
+                history_size=settings.INCIDENT_HISTORY_SIZE,
+                subscriber_queue_size=settings.INCIDENT_STREAM_QUEUE_SIZE
+            )
+        # Prefiltro de reglas evaluado antes del modelo
+        self.rules = self._load_rules()
+    
+    def start(self) -> "asyncio.Task":
+        """
+        Inicia la carga y el calentamiento del modelo en segundo plano (idempotente).
+        
+        Returns:
+            asyncio.Task: Tarea de arranque
+        """
+        if self._startup is None:
+            self._startup = asyncio.get_running_loop().create_task(self._start())
+        return self._startup
+    
+    async def ensure_ready(self) -> None:
+        """Espera a que el modelo esté cargado y calentado, iniciando el arranque si hace falta."""
+        if self.cascade is None:
+            await asyncio.shield(self.start())
+    
+    @property
+    def ready(self) -> bool:
+        """Indica si el modelo está cargado, calentado y sirviendo."""
+        return self.cascade is not None
+    
+    async def _start(self) -> None:
+        """Carga el modelo principal y las etapas de la cascada fuera del event loop y las calienta."""
+        start_ns = time.perf_counter_ns()
+        
+        initial = await asyncio.to_thread(self._load_model)
+        stages = [*await asyncio.to_thread(self._load_cascade_stages), initial.stage]
+        warmup_ms = 0.0
+        for stage in stages:
+            warmup_ms += await warm_up_stage(stage, batch_sizes=(1, settings.MODEL_BATCH_SIZE))
+        initial.warmup_ms = warmup_ms
+        
+        self.registry.register(initial)
+        self.registry.activate(initial.version)
+        self._watched_mtime = self._artifact_mtime(Path(settings.MODEL_PATH))
+        self.metadata = self._create_model_metadata(initial)
+        self.cascade = ModelCascade(stages, band=settings.MODEL_CASCADE_UNCERTAINTY_BAND)
+        
+        self._startup_ms = (time.perf_counter_ns() - start_ns) / 1e6
+        logger.info(
+            f"Servicio ML listo con modelo: {self.metadata.name} v{self.metadata.version} "
+            f"(arranque {self._startup_ms:.2f}ms, calentamiento {warmup_ms:.2f}ms)"
+        )
+    
+    def get_readiness(self) -> Dict[str, Any]:
+        """
+        Obtiene el estado de preparación del servicio.
+        
+        Returns:
+            dict: ``ready``, fase de arranque y, si está listo, versión y tiempos
+        """
+        if self.ready:
+            return {
+                "ready": True,
+                "phase": "ready",
+                "model_version": self.metadata.version,
+                "startup_ms": self._startup_ms,
+                "warmup_ms": self.registry.active.warmup_ms
+            }
+        startup = self._startup
+        if startup is not None and startup.done() and not startup.cancelled() and startup.exception() is not None:
+            return {"ready": False, "phase": "failed", "error": str(startup.exception())}
+        return {"ready": False, "phase": "loading" if startup is not None else "pending"}
     
-    def _load_model(self):
-        """Carga el modelo desde la ruta especificada en la configuración."""
+    def _load_model(self) -> ModelVersion:
+        """
+        Carga el modelo y su especificación de características desde la ruta configurada.
+        
+        El ancho de la especificación se valida contra el modelo una sola vez aquí,
+        en lugar de descubrir la discrepancia en cada solicitud.
+        
+        Returns:
+            ModelVersion: Versión inicial (``MODEL_VERSION``) del modelo principal
+        """
+        if self.shared_store is not None:
+            version = self.shared_store.current()
+            if version is not None:
+                return self._attach_shared(version)
+            logger.warning("El almacén compartido no tiene versión activa, este worker carga MODEL_PATH")
+        
+        model_path = Path(settings.MODEL_PATH)
         try:
-            model_path = Path(settings.MODEL_PATH)
             if not model_path.exists():
                 logger.warning(f"Modelo no encontrado en {model_path.absolute()}, usando modelo dummy")
-                return self._create_dummy_model()
-                
-            logger.info(f"Cargando modelo desde {model_path.absolute()}")
-            model = joblib.load(model_path)
-            logger.info("Modelo cargado exitosamente")
-            return model
+                model, spec, path = self._create_dummy_model(), DEFAULT_FEATURE_SPEC, None
+            else:
+                (model, spec), path = self._load_artifact(model_path), str(model_path)
             
         except Exception as e:
             logger.error(f"Error al cargar el modelo: {str(e)}", exc_info=True)
             logger.info("Usando modelo dummy como respaldo")
-            return self._create_dummy_model()
+            model, spec, path = self._create_dummy_model(), DEFAULT_FEATURE_SPEC, None
+        
+        return ModelVersion(
+            settings.MODEL_VERSION,
+            path,
+            self._build_stage(model_path.stem, model, spec, version=settings.MODEL_VERSION),
+            updated_at=self._artifact_mtime(model_path) if path else datetime.now(timezone.utc)
+        )
+    
+    def _attach_shared(self, version: str) -> ModelVersion:
+        """
+        Adjunta una versión publicada en el almacén compartido sin copiar sus arreglos.
+        
+        Raises:
+            KeyError: Si la versión no está publicada
+        """
+        engine, spec, manifest = self.shared_store.attach(version)
+        return ModelVersion(
+            version,
+            manifest["source"],
+            self._build_stage(manifest["name"], engine, spec, version=version, engine=engine),
+            updated_at=datetime.fromisoformat(manifest["updated_at"])
+        )
+    
+    def _publish_shared(
+        self,
+        version: str,
+        model_path: Path,
+        model: Any,
+        spec: FeatureSpec,
+        updated_at: datetime
+    ) -> ModelVersion:
+        """Compila una versión, la publica en el almacén compartido y la adjunta."""
+        engine = build_engine(model, compiled=settings.MODEL_COMPILED_INFERENCE)
+        self.shared_store.publish(version, engine, spec, model_path.stem, str(model_path), updated_at)
+        return self._attach_shared(version)
+    
+    @staticmethod
+    def _artifact_mtime(model_path: Path) -> Optional[datetime]:
+        """Fecha de modificación de un artefacto, o None si no existe."""
+        try:
+            return datetime.fromtimestamp(model_path.stat().st_mtime, tz=timezone.utc)
+        except OSError:
+            return None
+    
+    def _load_artifact(self, model_path: Path) -> tuple[Any, FeatureSpec]:
+        """
+        Carga un artefacto de modelo y valida su especificación de características.
+        
+        Args:
+            model_path: Ruta del artefacto (.pkl)
+            
+        Returns:
+            tuple: (modelo, especificación de características)
+            
+        Raises:
+            Exception: Si el artefacto no puede cargarse o su especificación no coincide
+        """
+        # Con mmap los arreglos del artefacto se comparten entre los workers del host
+        return load_model_artifact(model_path, mmap=settings.MODEL_MMAP)
+    
+    def _load_cascade_stages(self) -> List[ModelStage]:
+        """
+        Carga las etapas previas de la cascada (``MODEL_CASCADE_PATHS``).
+        
+        Una etapa que no puede cargarse se omite y la cascada continúa con las demás;
+        el modelo principal siempre es la última etapa.
+        
+        Returns:
+            list: Etapas previas en orden de ejecución
+        """
+        stages = []
+        for path in settings.MODEL_CASCADE_PATHS:
+            try:
+                model, spec = self._load_artifact(Path(path))
+            except Exception as e:
+                logger.error(f"Error al cargar la etapa de cascada {path}, se omite: {str(e)}")
+                continue
+            stages.append(self._build_stage(Path(path).stem, model, spec))
+        return stages
+    
+    def _build_stage(
+        self,
+        name: str,
+        model: Any,
+        spec: FeatureSpec,
+        version: str = "",
+        engine: Any = None
+    ) -> ModelStage:
+        """
+        Prepara una etapa de la cascada con su motor, ejecutor y micro-batcher.
+        
+        Args:
+            name: Nombre de la etapa
+            model: Modelo entrenado
+            spec: Especificación de características del modelo
+            version: Versión del modelo (forma parte de las claves de la caché)
+            engine: Motor ya construido (p. ej. adjuntado del almacén compartido)
+            
+        Returns:
+            ModelStage: Etapa lista para predecir
+        """
+        if engine is None:
+            engine = build_engine(model, compiled=settings.MODEL_COMPILED_INFERENCE)
+        return ModelStage(
+            name,
+            model,
+            spec,
+            engine,
+            InferenceExecutor(
+                predict_features,
+                engine,
+                kind=settings.MODEL_EXECUTOR_TYPE,
+                max_workers=settings.MODEL_MAX_CONCURRENT_REQUESTS
+            ),
+            # Agrupa las solicitudes individuales concurrentes en una sola llamada al modelo
+            batcher_window_ms=settings.MODEL_BATCH_WINDOW_MS if settings.MODEL_MICRO_BATCHING else None,
+            batcher_size=settings.MODEL_BATCH_SIZE,
+            cache=self.prediction_cache,
+            version=version
+        )
+    
+    def _load_rules(self) -> RuleEngine:
+        """
+        Compila el conjunto de reglas configurado.
+        
+        Si el archivo de reglas no es válido se registra el error y se usan las
+        reglas por defecto, igual que con el modelo.
+        
+        Returns:
+            RuleEngine: Reglas compiladas
+        """
+        try:
+            engine = RuleEngine(load_rule_set(settings.RULES_PATH), short_circuit=settings.RULES_SHORT_CIRCUIT)
+        except ValueError as e:
+            logger.error(f"Error al cargar las reglas: {str(e)}")
+            logger.info("Usando reglas por defecto")
+            engine = RuleEngine(DEFAULT_RULE_SET, short_circuit=settings.RULES_SHORT_CIRCUIT)
+        
+        available = set(self.flow_store.feature_names) if self.flow_store is not None else set()
+        missing = [source for source in engine.context_sources if source not in available]
+        if missing:
+            logger.warning(f"Fuentes de reglas sin datos (estado por IP desactivado o ventana no configurada): {', '.join(missing)}")
+        
+        logger.info(f"Prefiltro de reglas compilado: {len(engine.rule_set.rules)} reglas")
+        return engine
     
     def _create_dummy_model(self):
         """Crea un modelo dummy para desarrollo y pruebas."""
@@ -55,7 +383,7 @@ class MLService:
         # Generar datos de ejemplo para el modelo dummy
         X, y = make_classification(
             n_samples=100, 
-            n_features=10, 
+            n_features=DEFAULT_FEATURE_SPEC.width, 
             n_classes=2, 
             random_state=42
         )
@@ -67,13 +395,13 @@ class MLService:
         logger.info("Modelo dummy creado exitosamente")
         return model
     
-    def _create_model_metadata(self) -> ModelMetadata:
-        """Crea los metadatos del modelo según el estándar MCP."""
+    def _create_model_metadata(self, entry: ModelVersion) -> ModelMetadata:
+        """Crea los metadatos del modelo activo según el estándar MCP."""
         from ..schemas.mcp import ModelInput, ModelOutput
         
         return ModelMetadata(
             name=settings.MODEL_NAME,
-            version=settings.MODEL_VERSION,
+            version=entry.version,
             model_id=settings.MODEL_ID,
             framework=settings.MODEL_FRAMEWORK,
             framework_version=settings.MODEL_FRAMEWORK_VERSION,
@@ -83,133 +411,836 @@ class MLService:
             author=settings.MODEL_AUTHOR,
             license=settings.MODEL_LICENSE,
             created_at=datetime(2025, 1, 1, tzinfo=timezone.utc),
-            last_updated=datetime.now(timezone.utc),
+            last_updated=entry.updated_at,
             performance_metrics=settings.model_performance_metrics,
             documentation_url=settings.MODEL_DOCS_URL
         )
     
-    async def analyze_threat(self, input_data: ModelInput) -> ModelOutput:
+    async def load_model_version(
+        self,
+        path: str,
+        version: Optional[str] = None,
+        activate: bool = True
+    ) -> ModelVersion:
+        """
+        Carga un artefacto en segundo plano, lo calienta y, opcionalmente, lo activa.
+        
+        La carga, la compilación y el calentamiento corren fuera del event loop; las
+        solicitudes siguen usando la versión activa hasta el cambio, que es un solo
+        reemplazo de referencia.
+        
+        Args:
+            path: Ruta del artefacto, dentro de ``MODEL_REGISTRY_DIR``
+            version: Identificador de la versión (por defecto, nombre y fecha del archivo)
+            activate: Si la versión se activa al terminar el calentamiento
+            
+        Returns:
+            ModelVersion: Versión registrada
+            
+        Raises:
+            ValueError: Si la ruta no está permitida, el artefacto es inválido o la versión ya existe
+        """
+        await self.ensure_ready()
+        model_path = Path(path)
+        allowed = Path(settings.MODEL_REGISTRY_DIR).resolve()
+        if not model_path.resolve().is_relative_to(allowed):
+            raise ValueError(f"El artefacto debe estar dentro de {allowed}")
+        updated_at = self._artifact_mtime(model_path)
+        if updated_at is None:
+            raise ValueError(f"No existe el artefacto {model_path}")
+        version = version or f"{model_path.stem}-{updated_at:%Y%m%d%H%M%S}"
+        
+        async with self._model_lock:
+            if version in self._loading or self.registry.get(version) is not None or (
+                self.shared_store is not None and self.shared_store.has_version(version)
+            ):
+                raise ValueError(f"La versión {version} ya está registrada")
+            self._loading.add(version)
+        
+        # Sin el lock: una activación o un rollback no esperan a que termine la carga
+        try:
+            try:
+                model, spec = await asyncio.to_thread(self._load_artifact, model_path)
+            except Exception as e:
+                raise ValueError(f"No se pudo cargar el artefacto {model_path}: {str(e)}")
+            if self.shared_store is not None:
+                # Se publica compilada para que los demás workers la adjunten sin recargarla
+                stage = (await asyncio.to_thread(
+                    self._publish_shared, version, model_path, model, spec, updated_at
+                )).stage
+            else:
+                stage = await asyncio.to_thread(self._build_stage, model_path.stem, model, spec, version)
+            try:
+                warmup_ms = await warm_up_stage(stage, batch_sizes=(1, settings.MODEL_BATCH_SIZE))
+            except Exception as e:
+                stage.shutdown(wait=False)
+                raise ValueError(f"El calentamiento de la versión {version} falló: {str(e)}")
+            
+            entry = ModelVersion(version, str(model_path), stage, updated_at=updated_at, warmup_ms=warmup_ms)
+            async with self._model_lock:
+                self.registry.register(entry)
+                logger.info(f"Versión {version} del modelo cargada y calentada en {warmup_ms:.2f}ms")
+                if activate:
+                    # Se activa sobre el estado actual del registro, que pudo cambiar durante la carga
+                    self._activate(entry.version)
+            return entry
+        finally:
+            self._loading.discard(version)
+    
+    async def activate_model_version(self, version: str) -> ModelVersion:
+        """
+        Activa una versión ya cargada (cambio inmediato).
+        
+        No espera a las cargas en curso: el lock solo cubre el registro y el cambio.
+        
+        Raises:
+            KeyError: Si la versión no está registrada
+            ValueError: Si en un worker la versión ya no está en el almacén compartido
+        """
+        async with self._model_lock:
+            if self.registry.get(version) is None:
+                raise KeyError(version)
+            self._require_published(version)
+            return self._activate(version)
+    
+    async def rollback_model(self) -> ModelVersion:
+        """
+        Vuelve a la versión activa anterior (cambio inmediato).
+        
+        No espera a las cargas en curso: el lock solo cubre el registro y el cambio.
+        
+        Raises:
+            ValueError: Si no hay versión anterior o, en un worker, ya no está en el almacén compartido
+        """
+        async with self._model_lock:
+            if self.registry.previous is not None:
+                self._require_published(self.registry.previous.version)
+            entry = self.registry.rollback()
+            self._swap_in(entry)
+            return entry
+    
+    def _require_published(self, version: str) -> None:
+        """
+        En un worker, exige que la versión siga publicada en el almacén compartido.
+        
+        Los workers siguen la versión activa del almacén: una versión retirada de él
+        no puede marcarse como activa, y activarla solo en este worker se revertiría
+        en el siguiente ciclo de ``_follow_shared_store``.
+        
+        Raises:
+            ValueError: Si la versión no está publicada
+        """
+        if self.shared_store is not None and not self.shared_store.has_version(version):
+            raise ValueError(
+                f"La versión {version} ya no está en el almacén compartido; vuelva a cargarla para activarla"
+            )
+    
+    def _activate(self, version: str) -> ModelVersion:
+        """Marca una versión como activa y la coloca como etapa final de la cascada."""
+        entry = self.registry.activate(version)
+        self._swap_in(entry)
+        return entry
+    
+    def _swap_in(self, entry: ModelVersion) -> None:
+        """Reemplaza de forma atómica la etapa final y los metadatos del modelo activo."""
+        self.cascade = self.cascade.with_final(entry.stage)
+        self.metadata = self.metadata.model_copy(update={
+            "version": entry.version,
+            "last_updated": entry.updated_at
+        })
+        logger.info(f"Modelo activo: versión {entry.version}")
+        # Los demás workers siguen la versión activa del almacén compartido
+        store = self.shared_store
+        if store is not None and store.has_version(entry.version) and store.current() != entry.version:
+            store.activate(entry.version)
+    
+    async def watch_model_file(self) -> None:
+        """
+        Recarga el modelo cuando cambia el archivo ``MODEL_PATH``.
+        
+        Se ejecuta como tarea de fondo mientras la aplicación está activa; se desactiva
+        con ``MODEL_WATCH_INTERVAL_SECONDS=0``. En un worker del supervisor es el
+        supervisor quien vigila el archivo, y el worker sigue el almacén compartido.
+        """
+        if self.shared_store is not None:
+            await self._follow_shared_store()
+            return
+        interval = settings.MODEL_WATCH_INTERVAL_SECONDS
+        if interval <= 0:
+            return
+        await self.ensure_ready()
+        model_path = Path(settings.MODEL_PATH)
+        while True:
+            await asyncio.sleep(interval)
+            mtime = self._artifact_mtime(model_path)
+            if mtime is None or mtime == self._watched_mtime:
+                continue
+            self._watched_mtime = mtime
+            logger.info(f"Cambio detectado en {model_path}, cargando nueva versión")
+            try:
+                await self.load_model_version(str(model_path))
+            except ValueError as e:
+                logger.error(f"No se pudo recargar el modelo: {str(e)}")
+    
+    async def _follow_shared_store(self) -> None:
+        """
+        Publica el latido del worker y activa la versión marcada en el almacén compartido.
+        
+        Una versión que no puede adjuntarse o calentarse no se reintenta hasta que
+        cambie la versión activa.
+        """
+        store = self.shared_store
+        pid = os.getpid()
+        failed: Optional[str] = None
+        try:
+            while True:
+                store.write_heartbeat(pid, self._worker_status())
+                version = store.current() if self.ready else None
+                if version is not None and version not in (self.registry.active.version, failed):
+                    try:
+                        await self._follow_shared_version(version)
+                        failed = None
+                    except Exception as e:
+                        failed = version
+                        logger.error(f"No se pudo activar la versión compartida {version}: {str(e)}")
+                await asyncio.sleep(settings.SHARED_MODEL_POLL_SECONDS)
+        finally:
+            store.remove_heartbeat(pid)
+    
+    async def _follow_shared_version(self, version: str) -> None:
+        """Adjunta (si hace falta), calienta y activa una versión del almacén compartido."""
+        entry = None
+        if self.registry.get(version) is None:
+            # Adjuntar y calentar sin el lock, como en load_model_version
+            entry = await asyncio.to_thread(self._attach_shared, version)
+            try:
+                entry.warmup_ms = await warm_up_stage(entry.stage, batch_sizes=(1, settings.MODEL_BATCH_SIZE))
+            except Exception:
+                entry.stage.shutdown(wait=False)
+                raise
+        async with self._model_lock:
+            if entry is not None:
+                if self.registry.get(version) is None:
+                    self.registry.register(entry)
+                else:
+                    entry.stage.shutdown(wait=False)
+            self._activate(version)
+    
+    def _worker_status(self) -> Dict[str, Any]:
+        """Estado de este proceso para el latido del almacén compartido."""
+        return {
+            **self.get_readiness(),
+            "started_at": self._started_at,
+            "rows_predicted": sum(stage.rows for stage in self.cascade.stages) if self.ready else 0,
+            **process_memory()
+        }
+    
+    async def analyze_threat(self, input_data: ModelInput, rules_only: bool = False) -> ModelOutput:
         """
         Analiza una solicitud de red en busca de amenazas.
         
         Args:
             input_data: Datos de entrada según el esquema ModelInput
+            rules_only: Modo degradado: resolver con listas CIDR y reglas sin invocar el modelo
             
         Returns:
             ModelOutput: Resultado del análisis con predicción y metadatos
         """
+        await self.ensure_ready()
         try:
             logger.info(f"Analizando solicitud {input_data.request_id}")
-            start_time = datetime.now(timezone.utc)
+            start_ns = time.perf_counter_ns()
             
-            # Preprocesar los datos de entrada
-            features = self._preprocess_input(input_data)
+            # Las IPs en listas CIDR se resuelven sin preprocesar ni invocar el modelo
+            match = self.cidr_list.match(input_data.source_ip, input_data.destination_ip)
+            STAGE_CIDR.observe_ns(time.perf_counter_ns() - start_ns)
+            if match is not None:
+                return self._build_cidr_output(
+                    input_data,
+                    match,
+                    {"inference_time_ms": (time.perf_counter_ns() - start_ns) / 1e6}
+                )
             
-            # Realizar la predicción
-            prediction, confidence = self._predict(features)
+            # Actualizar los agregados de la IP de origen y evaluar las reglas
+            context = self._observe_flows([input_data])
+            matches = self._evaluate_rules([input_data], context)
+            if matches.verdict(0) is not None:
+                return self._build_rule_output(
+                    input_data,
+                    matches,
+                    0,
+                    {"inference_time_ms": (time.perf_counter_ns() - start_ns) / 1e6},
+                    flow=self._flow_row(context, 0)
+                )
+            if rules_only:
+                return self._build_degraded_output(
+                    input_data,
+                    {"inference_time_ms": (time.perf_counter_ns() - start_ns) / 1e6},
+                    flow=self._flow_row(context, 0),
+                    rule_indicators=matches.indicators(0, input_data)
+                )
             
-            # Determinar el nivel de amenaza
-            risk_level = self._determine_risk_level(prediction, confidence)
-            
-            # Generar explicación
-            explanation, indicators = self._generate_explanation(
-                input_data, 
-                prediction, 
-                confidence, 
-                risk_level
-            )
+            # Realizar la predicción fuera del event loop, escalando si la confianza es incierta
+            prediction, confidence, timing, cascade = await self.cascade.predict_one(input_data, context)
             
             # Calcular tiempo de inferencia
-            inference_time_ms = (datetime.now(timezone.utc) - start_time).total_seconds() * 1000
+            inference_time_ms = (time.perf_counter_ns() - start_ns) / 1e6
             
             logger.info(f"Análisis completado en {inference_time_ms:.2f}ms - Predicción: {prediction} (Confianza: {confidence:.2f})")
             
             # Crear y retornar la respuesta
-            return ModelOutput(
-                request_id=input_data.request_id,
-                timestamp=datetime.now(timezone.utc),
-                prediction=prediction,
-                confidence=float(confidence),
-                risk_level=risk_level,
-                explanation=explanation,
-                indicators=indicators,
-                metadata={
-                    "inference_time_ms": inference_time_ms,
-                    "model_version": self.metadata.version,
-                    "environment": settings.ENVIRONMENT
-                }
+            return self._build_output(
+                input_data,
+                prediction,
+                confidence,
+                {"inference_time_ms": inference_time_ms, **timing, "cascade": cascade},
+                flow=self._flow_row(context, 0),
+                rule_indicators=matches.indicators(0, input_data)
             )
             
         except Exception as e:
+            prediction_errors_total.inc()
             logger.error(f"Error en analyze_threat: {str(e)}", exc_info=True)
             raise
     
-    def _preprocess_input(self, input_data: ModelInput) -> np.ndarray:
+    async def analyze_batch(
+        self,
+        inputs: List[ModelInput],
+        rules_only: bool = False
+    ) -> List[Union[ModelOutput, Exception]]:
         """
-        Preprocesa los datos de entrada para el modelo.
+        Analiza un lote de solicitudes con una matriz de características única.
+        
+        Las filas se agrupan en bloques de ``MODEL_BATCH_SIZE`` y cada bloque se
+        resuelve con una sola llamada al modelo; los bloques se reparten entre los
+        workers del ejecutor de inferencia.
         
         Args:
-            input_data: Datos de entrada según el esquema ModelInput
+            inputs: Lista de datos de entrada según el esquema ModelInput
+            rules_only: Modo degradado: resolver con listas CIDR y reglas sin invocar el modelo
             
         Returns:
-            np.ndarray: Características procesadas para el modelo
+            list: Por cada entrada, su ModelOutput o la excepción que impidió analizarla
         """
-        # TODO: Implementar preprocesamiento específico según las necesidades del modelo
-        # Este es un ejemplo básico que debe adaptarse al modelo real
+        await self.ensure_ready()
+        start_ns = time.perf_counter_ns()
+        results: List[Union[ModelOutput, Exception, None]] = [None] * len(inputs)
+        
+        # Resolver directamente las filas que coinciden con las listas CIDR
+        matches = self.cidr_list.match_many(
+            [input_data.source_ip for input_data in inputs],
+            [input_data.destination_ip for input_data in inputs]
+        )
+        STAGE_CIDR.observe_ns(time.perf_counter_ns() - start_ns)
+        pending: List[int] = []
+        for index, match in enumerate(matches):
+            if match is None:
+                pending.append(index)
+            else:
+                results[index] = self._build_cidr_output(inputs[index], match, {"batch_index": index})
+        records = [inputs[index] for index in pending]
+        
+        # Actualizar los agregados por IP de origen y resolver las filas con veredicto de reglas
+        context = self._observe_flows(records)
+        rule_matches = self._evaluate_rules(records, context)
+        model_rows: List[int] = []
+        for row, index in enumerate(pending):
+            if rule_matches.verdict(row) is None:
+                model_rows.append(row)
+            else:
+                results[index] = self._build_rule_output(
+                    inputs[index],
+                    rule_matches,
+                    row,
+                    {"batch_index": index},
+                    flow=self._flow_row(context, row)
+                )
         
-        # Convertir datos categóricos a numéricos
-        protocol_map = {"tcp": 0, "udp": 1, "icmp": 2, "other": 3}
+        if rules_only:
+            for row in model_rows:
+                index = pending[row]
+                results[index] = self._build_degraded_output(
+                    inputs[index],
+                    {"batch_index": index},
+                    flow=self._flow_row(context, row),
+                    rule_indicators=rule_matches.indicators(row, inputs[index])
+                )
+            logger.info(f"Lote de {len(inputs)} solicitudes analizado en modo degradado (solo listas CIDR y reglas)")
+            return results
         
-        # Extraer características básicas
-        features = [
-            input_data.source_port or 0,
-            input_data.destination_port,
-            protocol_map.get(input_data.protocol.value.lower(), 3),
-            input_data.payload_size or 0,
-            # Agregar más características según sea necesario
-        ]
+        # Resolver las filas restantes con la cascada en bloques de MODEL_BATCH_SIZE filas
+        model_rows_array = np.array(model_rows, dtype=np.int64)
+        outcome = await self.cascade.predict_many(
+            [records[row] for row in model_rows],
+            context=take_context(context, model_rows_array),
+            chunk_size=settings.MODEL_BATCH_SIZE
+        )
         
-        # Agregar flags binarios si existen
-        if input_data.flags:
-            flags = [
-                int(input_data.flags.get("SYN", False)),
-                int(input_data.flags.get("ACK", False)),
-                int(input_data.flags.get("FIN", False)),
-                int(input_data.flags.get("RST", False)),
-                int(input_data.flags.get("PSH", False)),
-                int(input_data.flags.get("URG", False))
-            ]
-            features.extend(flags)
+        if outcome.errors:
+            prediction_errors_total.inc(len(outcome.errors))
+        for position, row in enumerate(model_rows):
+            index = pending[row]
+            if position in outcome.errors:
+                results[index] = outcome.errors[position]
+                continue
+            
+            stage = int(outcome.stage[position])
+            results[index] = self._build_output(
+                inputs[index],
+                int(outcome.predictions[position]),
+                float(outcome.confidences[position]),
+                {
+                    "batch_index": index,
+                    "batch_rows": int(outcome.chunk_rows[position]),
+                    "queue_wait_ms": float(outcome.queue_wait_ms[position]),
+                    "execution_ms": float(outcome.stage_ms[position, stage]),
+                    **({"cache": outcome.cache_status[position]} if outcome.cache_status[position] else {}),
+                    "cascade": self.cascade.row_metadata(outcome, position)
+                },
+                flow=self._flow_row(context, row),
+                rule_indicators=rule_matches.indicators(row, inputs[index])
+            )
         
-        return np.array([features])
+        elapsed_ms = (time.perf_counter_ns() - start_ns) / 1e6
+        logger.info(
+            f"Lote de {len(inputs)} solicitudes analizado en {elapsed_ms:.2f}ms "
+            f"({len(inputs) - len(pending)} por listas CIDR, {len(pending) - len(model_rows)} por reglas, "
+            f"{int(np.count_nonzero(outcome.stage))} escaladas en la cascada)"
+        )
+        return results
     
-    def _predict(self, features: np.ndarray) -> tuple[int, float]:
+    async def analyze_columnar(self, batch: ColumnarBatch) -> Dict[str, np.ndarray]:
         """
-        Realiza la predicción con el modelo.
+        Analiza un lote columnar sin construir un ModelInput por registro.
+        
+        Sigue el mismo orden que ``analyze_batch`` (listas CIDR, agregados por origen,
+        reglas y cascada) operando sobre columnas. Las filas que no superan la
+        validación por columnas se marcan como inválidas y no se analizan.
         
         Args:
-            features: Características de entrada ya preprocesadas
+            batch: Lote decodificado con ``decode_columnar_batch``
             
         Returns:
-            tuple: (predicción, confianza)
+            dict: Columnas ``confidence``, ``prediction``, ``risk_level`` y ``status``,
+            una fila por registro del lote, y ``suppressed`` (bool) con las alertas que
+            se sumaron a un incidente ya abierto
         """
-        try:
-            # Realizar predicción
-            prediction = self.model.predict(features)[0]
+        await self.ensure_ready()
+        start_ns = time.perf_counter_ns()
+        n_rows = len(batch)
+        confidence = np.zeros(n_rows, dtype=np.float32)
+        prediction = np.zeros(n_rows, dtype=np.uint8)
+        risk_level = np.full(n_rows, RISK_NONE, dtype=np.uint8)
+        status = np.full(n_rows, STATUS_INVALID, dtype=np.uint8)
+        
+        valid = np.flatnonzero(validate_columnar_batch(batch))
+        records = batch.take(valid)
+        
+        # Resolver directamente las filas que coinciden con las listas CIDR
+        cidr_ns = time.perf_counter_ns()
+        if records.ip_width == 4:
+            positions, cidr_rules = self.cidr_list.match_positions(
+                records["source_ip"].astype(np.uint32),
+                records["destination_ip"].astype(np.uint32)
+            )
+        else:
+            positions, cidr_rules = self.cidr_list.match_positions(
+                records.ip_strings("source_ip"),
+                records.ip_strings("destination_ip")
+            )
+        STAGE_CIDR.observe_ns(time.perf_counter_ns() - cidr_ns)
+        matched = np.flatnonzero(positions >= 0)
+        if len(matched):
+            denied = np.array([rule.action == "deny" for rule in cidr_rules])[positions[matched]]
+            rows = valid[matched]
+            prediction[rows] = denied
+            confidence[rows] = 1.0
+            risk_level[rows] = np.where(denied, RISK_CODES[self.cidr_deny_risk_level], RISK_CODES[ThreatLevel.LOW])
+            status[rows] = STATUS_CIDR
+        pending = np.flatnonzero(positions < 0)
+        records = records.take(pending)
+        
+        # Actualizar los agregados por IP de origen y resolver las filas con veredicto de reglas
+        context = self._observe_flow_columns(records)
+        rule_matches = self._evaluate_rules(records, context)
+        decided = np.flatnonzero(rule_matches.verdicts >= 0)
+        if len(decided):
+            rules = rule_matches.rules
+            verdicts = rule_matches.verdicts[decided]
+            rows = valid[pending[decided]]
+            prediction[rows] = np.array([rule.prediction for rule in rules])[verdicts]
+            confidence[rows] = np.array([rule.confidence for rule in rules])[verdicts]
+            risk_level[rows] = np.array([
+                RISK_CODES[rule.risk_level if rule.prediction == 1 else ThreatLevel.LOW] for rule in rules
+            ])[verdicts]
+            status[rows] = STATUS_RULE
+        
+        # Resolver las filas restantes con la cascada en bloques de MODEL_BATCH_SIZE filas
+        model_rows = np.flatnonzero(rule_matches.verdicts < 0)
+        outcome = await self.cascade.predict_many(
+            records.take(model_rows),
+            context=take_context(context, model_rows),
+            chunk_size=settings.MODEL_BATCH_SIZE
+        )
+        rows = valid[pending[model_rows]]
+        prediction[rows] = outcome.predictions
+        confidence[rows] = outcome.confidences
+        risk_level[rows] = self._risk_level_codes(outcome.predictions, outcome.confidences)
+        status[rows] = STATUS_MODEL
+        if outcome.errors:
+            failed = rows[list(outcome.errors)]
+            prediction[failed] = 0
+            confidence[failed] = 0.0
+            risk_level[failed] = RISK_NONE
+            status[failed] = STATUS_ERROR
+            prediction_errors_total.inc(len(failed))
+        self._count_columnar(risk_level, status)
+        suppressed = np.zeros(n_rows, dtype=bool)
+        if self.incidents is not None:
+            self._track_columnar_incidents(batch, risk_level, confidence, status, suppressed)
+        
+        elapsed_ms = (time.perf_counter_ns() - start_ns) / 1e6
+        logger.info(
+            f"Lote columnar de {n_rows} registros analizado en {elapsed_ms:.2f}ms "
+            f"({n_rows - len(valid)} inválidos, {len(matched)} por listas CIDR, {len(decided)} por reglas, "
+            f"{len(outcome.errors)} con error)"
+        )
+        return {
+            "confidence": confidence,
+            "prediction": prediction,
+            "risk_level": risk_level,
+            "status": status,
+            "suppressed": suppressed
+        }
+    
+    def _observe_flow_columns(self, batch: ColumnarBatch) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Versión columnar de ``_observe_flows``.
+        
+        Las IPs se convierten a texto solo si el almacén de flujos o el top-K de
+        orígenes están activos, ya que ambos mantienen estado por IP.
+        """
+        if self.top_sources is None and self.flow_store is None:
+            return None
+        started_ns = time.perf_counter_ns()
+        source_ips = batch.ip_strings("source_ip")
+        ports = batch["destination_port"].tolist()
+        if self.top_sources is not None:
+            self.top_sources.observe(source_ips, ports)
+        context = None
+        if self.flow_store is not None:
+            syn_ack = (1 << FLAG_BITS.index("SYN")) | (1 << FLAG_BITS.index("ACK"))
+            context = self.flow_store.observe_columns(
+                source_ips,
+                batch.timestamps().tolist(),
+                batch.ip_strings("destination_ip"),
+                ports,
+                ((batch["flags"] & syn_ack) == 1 << FLAG_BITS.index("SYN")).tolist()
+            )
+        STAGE_FLOW_STATE.observe_ns(time.perf_counter_ns() - started_ns)
+        return context
+    
+    def _build_output(
+        self,
+        input_data: ModelInput,
+        prediction: int,
+        confidence: float,
+        metadata: Dict[str, Any],
+        flow: Optional[Dict[str, float]] = None,
+        rule_indicators: Optional[List[str]] = None
+    ) -> ModelOutput:
+        """
+        Construye la respuesta MCP a partir de la predicción del modelo.
+        
+        Args:
+            input_data: Datos de entrada originales
+            prediction: Predicción del modelo (0 o 1)
+            confidence: Nivel de confianza de la predicción
+            metadata: Metadatos específicos de la ejecución (tiempos, lote, etc.)
+            flow: Agregados por ventana de la IP de origen (opcional)
+            rule_indicators: Indicadores de las reglas que cumple la solicitud (opcional)
             
-            # Obtener probabilidades (si el modelo lo soporta)
-            if hasattr(self.model, "predict_proba"):
-                proba = self.model.predict_proba(features)[0]
-                confidence = float(max(proba))
-            else:
-                confidence = 1.0  # Valor por defecto si no hay probabilidades
-                
-            return int(prediction), confidence
+        Returns:
+            ModelOutput: Resultado del análisis con predicción y metadatos
+        """
+        # Determinar el nivel de amenaza
+        risk_level = self._determine_risk_level(prediction, confidence)
+        
+        # Generar explicación
+        started_ns = time.perf_counter_ns()
+        explanation, indicators = self._generate_explanation(
+            input_data, 
+            prediction, 
+            confidence, 
+            risk_level,
+            flow,
+            rule_indicators
+        )
+        STAGE_EXPLANATION.observe_ns(time.perf_counter_ns() - started_ns)
+        predictions_total.labels(risk_level.value, self.metadata.version, "model").inc()
+        
+        if flow is not None:
+            metadata = {**metadata, "flow": split_flow_features(flow)}
+        
+        return self._track_incident(input_data, "model", ModelOutput(
+            request_id=input_data.request_id,
+            timestamp=datetime.now(timezone.utc),
+            prediction=prediction,
+            confidence=float(confidence),
+            risk_level=risk_level,
+            explanation=explanation,
+            indicators=indicators,
+            metadata={
+                **metadata,
+                "model_version": self.metadata.version,
+                "inference_engine": self.cascade.stages[metadata.get("cascade", {}).get("stage", -1)].engine.kind,
+                "environment": settings.ENVIRONMENT
+            }
+        ))
+    
+    def _build_cidr_output(
+        self,
+        input_data: ModelInput,
+        match: CidrMatch,
+        metadata: Dict[str, Any]
+    ) -> ModelOutput:
+        """
+        Construye la respuesta para una solicitud resuelta por las listas CIDR.
+        
+        Args:
+            input_data: Datos de entrada originales
+            match: Regla que coincidió y campo de la solicitud
+            metadata: Metadatos específicos de la ejecución
             
-        except Exception as e:
-            logger.error(f"Error en la predicción: {str(e)}", exc_info=True)
-            # En caso de error, retornar predicción segura (sin amenaza)
-            return 0, 0.5
+        Returns:
+            ModelOutput: Resultado con la regla aplicada en ``metadata.matched_rule``
+        """
+        rule = match.rule
+        label = f" ({rule.label})" if rule.label else ""
+        if rule.action == "deny":
+            prediction, risk_level = 1, self.cidr_deny_risk_level
+            explanation = f"La IP {match.ip} ({match.field}) pertenece al rango bloqueado {rule.network}{label}."
+            indicators = [f"IP en lista de bloqueo: {rule.network}{label}"]
+        else:
+            prediction, risk_level = 0, ThreatLevel.LOW
+            explanation = f"La IP {match.ip} ({match.field}) pertenece al rango de confianza {rule.network}{label}."
+            indicators = []
+        predictions_total.labels(risk_level.value, self.metadata.version, "cidr").inc()
+        
+        return self._track_incident(input_data, "cidr", ModelOutput(
+            request_id=input_data.request_id,
+            timestamp=datetime.now(timezone.utc),
+            prediction=prediction,
+            confidence=1.0,
+            risk_level=risk_level,
+            explanation=explanation,
+            indicators=indicators,
+            metadata={
+                **metadata,
+                "short_circuit": "cidr",
+                "matched_rule": {
+                    "action": rule.action,
+                    "network": rule.network,
+                    "label": rule.label,
+                    "field": match.field
+                },
+                "model_version": self.metadata.version,
+                "environment": settings.ENVIRONMENT
+            }
+        ))
+    
+    def _build_rule_output(
+        self,
+        input_data: ModelInput,
+        matches: RuleMatches,
+        row: int,
+        metadata: Dict[str, Any],
+        flow: Optional[Dict[str, float]] = None
+    ) -> ModelOutput:
+        """
+        Construye la respuesta para una solicitud decidida por una regla de veredicto.
+        
+        Args:
+            input_data: Datos de entrada originales
+            matches: Resultado de evaluar las reglas sobre el lote
+            row: Fila de la solicitud dentro del lote evaluado
+            metadata: Metadatos específicos de la ejecución
+            flow: Agregados por ventana de la IP de origen (opcional)
+            
+        Returns:
+            ModelOutput: Resultado con la regla aplicada en ``metadata.matched_rule``
+        """
+        rule = matches.verdict(row)
+        indicators = matches.indicators(row, input_data)
+        risk_level = rule.risk_level if rule.prediction == 1 else ThreatLevel.LOW
+        
+        if flow is not None:
+            metadata = {**metadata, "flow": split_flow_features(flow)}
+        predictions_total.labels(risk_level.value, self.metadata.version, "rule").inc()
+        
+        return self._track_incident(input_data, "rule", ModelOutput(
+            request_id=input_data.request_id,
+            timestamp=datetime.now(timezone.utc),
+            prediction=rule.prediction,
+            confidence=rule.confidence,
+            risk_level=risk_level,
+            explanation=f"Decidido por la regla '{rule.name}': {indicators[0]}.",
+            indicators=indicators,
+            metadata={
+                **metadata,
+                "short_circuit": "rule",
+                "matched_rule": {"action": rule.action, "name": rule.name},
+                "model_version": self.metadata.version,
+                "environment": settings.ENVIRONMENT
+            }
+        ))
+    
+    def _build_degraded_output(
+        self,
+        input_data: ModelInput,
+        metadata: Dict[str, Any],
+        flow: Optional[Dict[str, float]] = None,
+        rule_indicators: Optional[List[str]] = None
+    ) -> ModelOutput:
+        """
+        Construye la respuesta de una solicitud atendida en modo degradado.
+        
+        El modelo no se invoca y ninguna regla de veredicto coincidió: el resultado
+        es "sin amenaza detectada" con confianza 0 y ``metadata.degraded``, y lleva
+        los indicadores de las reglas para que el cliente pueda revisarlo.
+        
+        Args:
+            input_data: Datos de entrada originales
+            metadata: Metadatos específicos de la ejecución
+            flow: Agregados por ventana de la IP de origen (opcional)
+            rule_indicators: Indicadores de las reglas que cumple la solicitud (opcional)
+            
+        Returns:
+            ModelOutput: Resultado con ``metadata.short_circuit="degraded"``
+        """
+        if flow is not None:
+            metadata = {**metadata, "flow": split_flow_features(flow)}
+        predictions_total.labels(ThreatLevel.LOW.value, self.metadata.version, "degraded").inc()
+        
+        return self._track_incident(input_data, "degraded", ModelOutput(
+            request_id=input_data.request_id,
+            timestamp=datetime.now(timezone.utc),
+            prediction=0,
+            confidence=0.0,
+            risk_level=ThreatLevel.LOW,
+            explanation="Análisis degradado por sobrecarga: el modelo no se evaluó y ninguna regla de veredicto coincidió.",
+            indicators=rule_indicators or [],
+            metadata={
+                **metadata,
+                "short_circuit": "degraded",
+                "degraded": True,
+                "model_version": self.metadata.version,
+                "environment": settings.ENVIRONMENT
+            }
+        ))
+    
+    def _track_incident(self, input_data: ModelInput, decision: str, output: ModelOutput) -> ModelOutput:
+        """
+        Suma una alerta de riesgo alto a su incidente.
+        
+        El resultado lleva ``metadata.incident`` con el identificador del incidente,
+        las alertas acumuladas y ``suppressed`` si el incidente ya estaba abierto.
+        """
+        if self.incidents is not None:
+            incident = self.incidents.observe(
+                input_data.source_ip,
+                input_data.destination_ip,
+                input_data.destination_port,
+                input_data.protocol.value,
+                output.risk_level.value,
+                output.confidence,
+                output.indicators,
+                input_data.request_id,
+                decision
+            )
+            if incident is not None:
+                output.metadata["incident"] = incident
+        return output
+    
+    def _track_columnar_incidents(
+        self,
+        batch: ColumnarBatch,
+        risk_level: np.ndarray,
+        confidence: np.ndarray,
+        status: np.ndarray,
+        suppressed: np.ndarray
+    ) -> None:
+        """Suma a sus incidentes las filas de riesgo alto de un lote columnar y marca en ``suppressed`` las ya abiertas."""
+        tracked = np.array([RISK_CODES[ThreatLevel(level)] for level in self.incidents.risk_levels], dtype=np.uint8)
+        rows = np.flatnonzero(np.isin(risk_level, tracked))
+        if not len(rows):
+            return
+        records = batch.take(rows)
+        source_ips = records.ip_strings("source_ip")
+        destination_ips = records.ip_strings("destination_ip")
+        levels = {code: level.value for level, code in RISK_CODES.items()}
+        decisions = {STATUS_MODEL: "model", STATUS_CIDR: "cidr", STATUS_RULE: "rule"}
+        for index, row in enumerate(rows):
+            incident = self.incidents.observe(
+                source_ips[index],
+                destination_ips[index],
+                int(records["destination_port"][index]),
+                PROTOCOL_CODES[int(records["protocol"][index])],
+                levels[int(risk_level[row])],
+                float(confidence[row]),
+                decision=decisions.get(int(status[row]), "model")
+            )
+            suppressed[row] = incident is not None and incident["suppressed"]
+    
+    def _evaluate_rules(
+        self,
+        records: Union[List[ModelInput], ColumnarBatch],
+        context: Optional[Dict[str, np.ndarray]]
+    ) -> RuleMatches:
+        """Evalúa el prefiltro de reglas midiendo su duración."""
+        started_ns = time.perf_counter_ns()
+        matches = self.rules.evaluate(records, context)
+        STAGE_RULES.observe_ns(time.perf_counter_ns() - started_ns)
+        return matches
+    
+    def _count_columnar(self, risk_level: np.ndarray, status: np.ndarray) -> None:
+        """Suma las filas de un lote columnar a los contadores de predicciones."""
+        levels = {code: level.value for level, code in RISK_CODES.items()}
+        decisions = {STATUS_MODEL: "model", STATUS_CIDR: "cidr", STATUS_RULE: "rule"}
+        for status_code, decision in decisions.items():
+            rows = status == status_code
+            if not rows.any():
+                continue
+            counts = np.bincount(risk_level[rows], minlength=len(levels))
+            for code in np.flatnonzero(counts):
+                predictions_total.labels(levels[int(code)], self.metadata.version, decision).inc(int(counts[code]))
+    
+    def _observe_flows(self, inputs: List[ModelInput]) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Registra los registros en el almacén por IP de origen y en los sketches de top-K.
+        
+        Args:
+            inputs: Registros en orden de llegada
+            
+        Returns:
+            dict: Columnas ``flow.*`` por registro, o None si el almacén está desactivado
+        """
+        started_ns = time.perf_counter_ns()
+        if self.top_sources is not None:
+            self.top_sources.observe(
+                [input_data.source_ip for input_data in inputs],
+                [input_data.destination_port for input_data in inputs]
+            )
+        context = self.flow_store.observe_batch(inputs) if self.flow_store is not None else None
+        STAGE_FLOW_STATE.observe_ns(time.perf_counter_ns() - started_ns)
+        return context
+    
+    @staticmethod
+    def _flow_row(context: Optional[Dict[str, np.ndarray]], index: int) -> Optional[Dict[str, float]]:
+        """Extrae los agregados de una fila de las columnas de contexto."""
+        if context is None:
+            return None
+        return {name: float(column[index]) for name, column in context.items()}
     
     def _determine_risk_level(self, prediction: int, confidence: float) -> ThreatLevel:
         """
@@ -233,12 +1264,24 @@ class MLService:
         else:
             return ThreatLevel.MEDIUM
     
+    @staticmethod
+    def _risk_level_codes(predictions: np.ndarray, confidences: np.ndarray) -> np.ndarray:
+        """Versión vectorizada de ``_determine_risk_level`` con los códigos de ``RISK_CODES``."""
+        codes = np.select(
+            [confidences >= 0.9, confidences >= 0.7],
+            [RISK_CODES[ThreatLevel.CRITICAL], RISK_CODES[ThreatLevel.HIGH]],
+            RISK_CODES[ThreatLevel.MEDIUM]
+        )
+        return np.where(predictions == 0, RISK_CODES[ThreatLevel.LOW], codes).astype(np.uint8)
+    
     def _generate_explanation(
         self, 
         input_data: ModelInput, 
         prediction: int, 
         confidence: float, 
-        risk_level: ThreatLevel
+        risk_level: ThreatLevel,
+        flow: Optional[Dict[str, float]] = None,
+        rule_indicators: Optional[List[str]] = None
     ) -> tuple[str, List[str]]:
         """
         Genera una explicación legible de la predicción.
@@ -248,6 +1291,8 @@ class MLService:
             prediction: Predicción del modelo (0 o 1)
             confidence: Nivel de confianza de la predicción
             risk_level: Nivel de riesgo determinado
+            flow: Agregados por ventana de la IP de origen (opcional)
+            rule_indicators: Indicadores de las reglas que cumple la solicitud (opcional)
             
         Returns:
             tuple: (explicación, lista de indicadores)
@@ -263,15 +1308,17 @@ class MLService:
                 f"Confianza del modelo: {confidence*100:.1f}%."
             )
             
-            # Añadir indicadores específicos
-            if input_data.destination_port in [22, 23, 3389]:
-                indicators.append(f"Conexión a servicio de administración remota (puerto {input_data.destination_port})")
-                
-            if input_data.flags and input_data.flags.get("SYN") and not input_data.flags.get("ACK"):
-                indicators.append("Paquete SYN sin ACK (posible escaneo de puertos)")
-                
-            if input_data.payload_size and input_data.payload_size > 1000:
-                indicators.append(f"Tamaño de paquete inusualmente grande: {input_data.payload_size} bytes")
+            # Añadir los indicadores de las reglas (evaluadas antes del modelo)
+            if rule_indicators:
+                indicators.extend(rule_indicators)
+            
+            if flow:
+                window, ports = self._max_distinct_ports(flow)
+                if ports >= settings.FLOW_SCAN_PORT_THRESHOLD:
+                    indicators.append(
+                        f"El origen {input_data.source_ip} contactó {ports} puertos distintos en {window} "
+                        "(posible escaneo de puertos)"
+                    )
         
         # Si no hay indicadores específicos, usar uno genérico
         if prediction == 1 and not indicators:
@@ -279,16 +1326,152 @@ class MLService:
         
         return explanation, indicators
     
+    @staticmethod
+    def _max_distinct_ports(flow: Dict[str, float]) -> tuple[str, int]:
+        """Devuelve la ventana con más puertos de destino distintos y su conteo."""
+        best_window, best_ports = "", 0
+        for window, aggregates in split_flow_features(flow).items():
+            ports = int(aggregates.get("distinct_ports", 0))
+            if ports > best_ports:
+                best_window, best_ports = window, ports
+        return best_window, best_ports
+    
+    def get_top_sources(self, k: int = 10, window_seconds: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene los orígenes más activos según los sketches.
+        
+        Args:
+            k: Número de orígenes a devolver
+            window_seconds: Ventana a consultar (por defecto, la máxima retenida)
+            
+        Returns:
+            dict: Resultado de ``TopSourcesTracker.top`` o None si está desactivado
+        """
+        if self.top_sources is None:
+            return None
+        return self.top_sources.top(k=k, window_seconds=window_seconds)
+    
+    async def reload_cidr_list(self) -> Dict[str, Any]:
+        """
+        Recarga las listas CIDR desde el archivo configurado, fuera del event loop.
+        
+        Returns:
+            dict: Estado de la lista tras la recarga
+            
+        Raises:
+            ValueError: Si no hay lista configurada o el archivo es inválido
+        """
+        await asyncio.to_thread(self.cidr_list.reload)
+        return self.cidr_list.stats()
+    
+    def get_rule_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene las métricas del prefiltro de reglas.
+        
+        Returns:
+            dict: Aciertos, filas decididas y costo por regla
+        """
+        return self.rules.stats()
+    
+    def get_incident_stats(self) -> Dict[str, Any]:
+        """
+        Devuelve las métricas de la agregación de alertas en incidentes.
+        
+        Returns:
+            dict: Estado del agregador o ``{"enabled": False}``
+        """
+        if self.incidents is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.incidents.stats()}
+    
+    def get_flow_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene las métricas del almacén de estado por IP de origen.
+        
+        Returns:
+            dict: Métricas del almacén (vacío salvo ``enabled`` si está desactivado)
+        """
+        if self.flow_store is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.flow_store.stats()}
+    
+    def get_batching_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene las métricas del micro-batching de solicitudes individuales.
+        
+        Returns:
+            dict: Métricas del micro-batcher (vacío salvo ``enabled`` si está desactivado)
+        """
+        batcher = self.cascade.stages[0].batcher if self.ready else None
+        if batcher is None:
+            return {"enabled": False}
+        return {"enabled": True, **batcher.stats()}
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene las métricas de la caché de predicciones.
+        
+        Returns:
+            dict: Métricas de la caché (vacío salvo ``enabled`` si está desactivada)
+        """
+        if self.prediction_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.prediction_cache.stats()}
+    
+    def get_cascade_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene las métricas de la cascada de modelos.
+        
+        Returns:
+            dict: Banda de incertidumbre y, por etapa, filas, escalamiento y latencia media
+                (solo ``ready`` mientras el modelo se carga)
+        """
+        if not self.ready:
+            return {"ready": False}
+        return self.cascade.stats()
+    
     async def get_model_info(self) -> ModelMetadata:
         """
         Obtiene los metadatos del modelo según el estándar MCP.
         
         Returns:
-            ModelMetadata: Metadatos actualizados del modelo
+            ModelMetadata: Metadatos del modelo activo
+        """
+        await self.ensure_ready()
+        if not STAGE_INFERENCE.count:
+            return self.metadata
+        # Tiempo medio de inferencia medido en este proceso, en lugar del valor de referencia
+        return self.metadata.model_copy(update={"performance_metrics": {
+            **self.metadata.performance_metrics,
+            "inference_time_ms": round(STAGE_INFERENCE.sum / STAGE_INFERENCE.count * 1000, 3)
+        }})
+    
+    def get_worker_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene el estado de los workers que comparten el modelo.
+        
+        Returns:
+            dict: Versión activa del almacén, versiones publicadas y latido de cada
+                worker (vacío salvo ``enabled`` fuera del supervisor multiproceso)
+        """
+        if self.shared_store is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "store": str(self.shared_store.root),
+            "current_version": self.shared_store.current(),
+            "versions": self.shared_store.versions(),
+            "workers": self.shared_store.heartbeats(stale_after=3 * settings.SHARED_MODEL_POLL_SECONDS)
+        }
+    
+    def get_registry_stats(self) -> Dict[str, Any]:
+        """
+        Obtiene el estado del registro de versiones del modelo.
+        
+        Returns:
+            dict: Versión activa, anterior y versiones cargadas
         """
-        # Actualizar la marca de tiempo de última actualización
-        self.metadata.last_updated = datetime.now(timezone.utc)
-        return self.metadata
+        return self.registry.stats()
 
 # Instancia global del servicio
 ml_service = MLService()
\ No newline at end of file
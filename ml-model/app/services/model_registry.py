@@ -0,0 +1,222 @@
+"""
+Registro de versiones del modelo con cambio atómico, calentamiento y reversión.
+Permite desplegar un artefacto reentrenado sin reiniciar los workers ni perder las
+solicitudes en curso.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .cascade import ModelStage
+from .tree_engine import probe_features
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+
+class ModelVersion:
+    """Versión registrada: etapa lista para predecir y datos de su artefacto."""
+    __slots__ = ("version", "path", "stage", "loaded_at", "updated_at", "warmup_ms")
+
+    def __init__(
+        self,
+        version: str,
+        path: Optional[str],
+        stage: ModelStage,
+        updated_at: datetime,
+        warmup_ms: float = 0.0
+    ):
+        """
+        Args:
+            version: Identificador de la versión
+            path: Ruta del artefacto (None para el modelo dummy)
+            stage: Etapa construida con el modelo
+            updated_at: Fecha de modificación del artefacto
+            warmup_ms: Duración del calentamiento
+        """
+        self.version = version
+        self.path = path
+        self.stage = stage
+        self.loaded_at = datetime.now(updated_at.tzinfo)
+        self.updated_at = updated_at
+        self.warmup_ms = warmup_ms
+
+    def info(self) -> Dict[str, Any]:
+        """Resumen serializable de la versión."""
+        return {
+            "version": self.version,
+            "path": self.path,
+            "loaded_at": self.loaded_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+            "warmup_ms": self.warmup_ms,
+            "inference_engine": self.stage.engine.kind,
+            "n_features": self.stage.spec.width,
+            "workers_running": self.stage.executor.active
+        }
+
+
+async def warm_up_stage(stage: ModelStage, batch_sizes: Sequence[int] = (1, 32), seed: int = 0) -> float:
+    """
+    Ejecuta lotes sintéticos en una etapa antes de activarla.
+
+    Inicia los workers del ejecutor (los procesos se crean de forma perezosa) y
+    comprueba que el modelo acepta el ancho de la especificación y devuelve una
+    predicción y una confianza válidas por fila. Usa el ejecutor directamente para
+    no contar el calentamiento en las métricas de la etapa.
+
+    Args:
+        stage: Etapa a calentar
+        batch_sizes: Tamaños de los lotes sintéticos
+        seed: Semilla del generador aleatorio
+
+    Returns:
+        float: Duración del calentamiento en ms
+
+    Raises:
+        ValueError: Si el modelo no acepta el ancho o devuelve salidas inválidas
+    """
+    width = stage.spec.width
+    engine_width = getattr(stage.engine, "n_features", None)
+    if engine_width is not None and int(engine_width) != width:
+        raise ValueError(f"El modelo espera {engine_width} características y la especificación define {width}")
+
+    rng = np.random.default_rng(seed)
+    start_ns = time.perf_counter_ns()
+    for size in batch_sizes:
+        if stage.engine.kind == "compiled":
+            features = probe_features(stage.engine, n_samples=size, seed=seed).astype(np.float32)
+        else:
+            features = rng.uniform(0.0, 1024.0, size=(size, width)).astype(np.float32)
+        (predictions, confidences), _ = await stage.executor.run(features)
+        confidences = np.asarray(confidences, dtype=np.float64)
+        if len(predictions) != size or len(confidences) != size:
+            raise ValueError(f"El modelo devolvió {len(predictions)} predicciones para {size} filas")
+        if not np.all(np.isfinite(confidences) & (confidences >= 0.0) & (confidences <= 1.0)):
+            raise ValueError("El modelo devolvió confianzas fuera del rango [0, 1]")
+    return (time.perf_counter_ns() - start_ns) / 1e6
+
+
+class ModelRegistry:
+    """
+    Versiones cargadas del modelo principal, con una activa.
+
+    Activar una versión ya cargada es solo un cambio de referencia, por lo que la
+    reversión es inmediata. Se conservan hasta ``max_versions`` versiones; las más
+    antiguas se retiran (salvo la activa y la anterior) y su ejecutor se detiene
+    tras ``retire_grace_seconds`` para que terminen las solicitudes en curso.
+    Solo la versión activa y la anterior mantienen sus workers: las demás versiones
+    retenidas liberan el pool tras el mismo periodo y lo recrean si se reactivan.
+    """
+
+    def __init__(self, max_versions: int = 3, retire_grace_seconds: float = 30.0):
+        """
+        Args:
+            max_versions: Versiones retenidas en memoria (mínimo 2 para poder revertir)
+            retire_grace_seconds: Espera antes de detener el ejecutor de una versión retirada
+        """
+        self.max_versions = max(max_versions, 2)
+        self.retire_grace_seconds = retire_grace_seconds
+        self._versions: "OrderedDict[str, ModelVersion]" = OrderedDict()
+        self.active: Optional[ModelVersion] = None
+        self.previous: Optional[ModelVersion] = None
+        self._swaps = 0
+
+    def register(self, entry: ModelVersion) -> None:
+        """
+        Añade una versión cargada y retira las más antiguas si se supera el límite.
+
+        Raises:
+            ValueError: Si la versión ya está registrada
+        """
+        if entry.version in self._versions:
+            raise ValueError(f"La versión {entry.version} ya está registrada")
+        self._versions[entry.version] = entry
+
+        for version in list(self._versions):
+            if len(self._versions) <= self.max_versions:
+                break
+            candidate = self._versions[version]
+            if candidate is self.active or candidate is self.previous or candidate is entry:
+                continue
+            del self._versions[version]
+            self._retire(candidate)
+
+    def _retire(self, entry: ModelVersion) -> None:
+        """Detiene el ejecutor de una versión retirada tras el periodo de gracia."""
+        logger.info(f"Retirando la versión del modelo {entry.version}")
+        # Sin esperar: el callback corre en el event loop y las inferencias en curso terminan igual
+        self._after_grace(entry.stage.shutdown, False)
+
+    def _park(self, entry: ModelVersion) -> None:
+        """Libera los workers de una versión retenida que ya no es la activa ni la anterior."""
+        if entry is self.active or entry is self.previous or self._versions.get(entry.version) is not entry:
+            return
+        logger.info(f"Liberando los workers de la versión del modelo {entry.version}")
+        entry.stage.executor.release()
+
+    def _after_grace(self, callback: Callable[..., Any], *args: Any) -> None:
+        """Ejecuta ``callback`` tras ``retire_grace_seconds`` (de inmediato fuera del event loop)."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            callback(*args)
+            return
+        loop.call_later(self.retire_grace_seconds, callback, *args)
+
+    def activate(self, version: str) -> ModelVersion:
+        """
+        Marca una versión registrada como activa.
+
+        Raises:
+            KeyError: Si la versión no está registrada
+        """
+        entry = self._versions[version]
+        if entry is not self.active:
+            displaced = self.previous
+            self.previous, self.active = self.active, entry
+            self._swaps += 1
+            if displaced is not None and displaced is not entry:
+                self._after_grace(self._park, displaced)
+        return entry
+
+    def rollback(self) -> ModelVersion:
+        """
+        Vuelve a activar la versión anterior.
+
+        Raises:
+            ValueError: Si no hay una versión anterior disponible
+        """
+        if self.previous is None or self.previous.version not in self._versions:
+            raise ValueError("No hay una versión anterior a la que volver")
+        return self.activate(self.previous.version)
+
+    def get(self, version: str) -> Optional[ModelVersion]:
+        """Busca una versión registrada."""
+        return self._versions.get(version)
+
+    def versions(self) -> List[ModelVersion]:
+        """Versiones registradas, de la más antigua a la más reciente."""
+        return list(self._versions.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Devuelve el estado del registro.
+
+        Returns:
+            dict: Versión activa, anterior, cambios realizados y versiones cargadas
+        """
+        return {
+            "active": self.active.version if self.active else None,
+            "previous": self.previous.version if self.previous else None,
+            "swaps": self._swaps,
+            "max_versions": self.max_versions,
+            "versions": [
+                {**entry.info(), "active": entry is self.active}
+                for entry in self._versions.values()
+            ]
+        }
@@ -0,0 +1,633 @@
+"""
+Lectura de capturas PCAP/PCAPNG y agregación de paquetes en flujos.
+El archivo se recorre con memoria mapeada y los encabezados se leen en su posición
+con ``struct.unpack_from``, sin copiar los paquetes; los flujos terminados se
+convierten en ``ModelInput`` y se entregan por lotes a medida que avanza la lectura.
+"""
+import asyncio
+import logging
+import mmap
+import socket
+import struct
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from ..schemas.mcp import ModelInput, ModelOutput
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Números mágicos de PCAP (microsegundos / nanosegundos) y tipo del bloque de sección PCAPNG
+_PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+_PCAPNG_SECTION = 0x0A0D0D0A
+_PCAPNG_BYTE_ORDER = 0x1A2B3C4D
+
+# Tipos de enlace soportados (LINKTYPE_*)
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+_ETHERTYPE_IPV4 = 0x0800
+_ETHERTYPE_IPV6 = 0x86DD
+_ETHERTYPE_VLAN = (0x8100, 0x88A8, 0x9100)
+
+# Protocolos IP y cabeceras de extensión de IPv6 que se recorren
+_IPPROTO_ICMP = 1
+_IPPROTO_TCP = 6
+_IPPROTO_UDP = 17
+_IPPROTO_ICMPV6 = 58
+_IPV6_EXTENSIONS = (0, 43, 60)   # Hop-by-hop, routing, opciones de destino
+_IPV6_FRAGMENT = 44
+_IPV6_AUTH = 51
+
+# Banderas TCP en el orden de sus bits en la cabecera
+TCP_FLAG_BITS = (("FIN", 0x01), ("SYN", 0x02), ("RST", 0x04), ("PSH", 0x08), ("ACK", 0x10), ("URG", 0x20))
+_TCP_FIN, _TCP_RST = 0x01, 0x04
+
+_U16_BE = struct.Struct(">H")
+_IPV4_HEADER = struct.Struct(">BxHHHBB")      # versión/IHL, longitud total, id, flags/offset, TTL, protocolo
+_IPV6_HEADER = struct.Struct(">4xHBB")        # longitud del payload, siguiente cabecera, hop limit
+_PORTS = struct.Struct(">HH")
+
+
+class PcapFormatError(ValueError):
+    """El archivo no es una captura PCAP/PCAPNG válida o su enlace no está soportado."""
+
+
+class Packet(NamedTuple):
+    """Campos de un paquete IP relevantes para los flujos."""
+    timestamp: float
+    source_ip: str
+    destination_ip: str
+    source_port: int
+    destination_port: int
+    protocol: str          # tcp | udp | icmp | other
+    payload_size: int      # Bytes de payload de capa 4 según las cabeceras (no lo capturado)
+    tcp_flags: int
+
+
+class PcapStats:
+    """Contadores de una lectura: paquetes, bytes, descartes, flujos y velocidad."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.packets = 0
+        self.bytes = 0
+        self.ip_packets = 0
+        self.skipped = 0        # Enlace o protocolo de red no soportado, o paquete truncado
+        self.fragments = 0      # Fragmentos IP sin cabecera de capa 4
+        self.flows = 0
+        self.evicted_flows = 0  # Flujos cerrados antes de tiempo por el límite de flujos activos
+
+    @property
+    def elapsed_seconds(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def packets_per_second(self) -> float:
+        elapsed = self.elapsed_seconds
+        return self.packets / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "ip_packets": self.ip_packets,
+            "skipped": self.skipped,
+            "fragments": self.fragments,
+            "flows": self.flows,
+            "evicted_flows": self.evicted_flows,
+            "elapsed_seconds": round(self.elapsed_seconds, 3),
+            "packets_per_second": round(self.packets_per_second, 1)
+        }
+
+
+class PcapReader:
+    """
+    Captura PCAP o PCAPNG abierta con memoria mapeada.
+
+    ``frames`` recorre los registros sin copiarlos: entrega la posición y longitud de
+    cada paquete dentro de ``buffer``. Las páginas del archivo las gestiona el
+    sistema, por lo que la memoria no crece con el tamaño de la captura.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Args:
+            path: Ruta de la captura
+
+        Raises:
+            PcapFormatError: Si el archivo está vacío o su formato no es PCAP/PCAPNG
+        """
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        try:
+            self.buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise PcapFormatError(f"La captura {self.path} está vacía")
+        head = self.buffer[:4]
+        if head in _PCAP_MAGIC:
+            self.format = "pcap"
+        elif len(head) == 4 and struct.unpack("<I", head)[0] == _PCAPNG_SECTION:
+            self.format = "pcapng"
+        else:
+            self.close()
+            raise PcapFormatError(f"{self.path} no es una captura PCAP ni PCAPNG")
+
+    def __enter__(self) -> "PcapReader":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Libera el mapeo y el archivo."""
+        self.buffer.close()
+        self._file.close()
+
+    def frames(self) -> Iterator[Tuple[float, int, int, int, int]]:
+        """
+        Recorre los paquetes de la captura.
+
+        Yields:
+            tuple: (marca de tiempo, tipo de enlace, posición, longitud capturada, longitud original)
+
+        Raises:
+            PcapFormatError: Si la cabecera o un bloque no son válidos
+        """
+        if self.format == "pcap":
+            return self._pcap_frames()
+        return self._pcapng_frames()
+
+    def _pcap_frames(self) -> Iterator[Tuple[float, int, int, int, int]]:
+        buffer = self.buffer
+        if len(buffer) < 24:
+            raise PcapFormatError("Cabecera PCAP incompleta")
+        order, resolution = _PCAP_MAGIC[buffer[:4]]
+        linktype = struct.unpack_from(order + "I", buffer, 20)[0] & 0x0FFFFFFF
+        record = struct.Struct(order + "IIII")
+        offset, end = 24, len(buffer)
+        while offset + 16 <= end:
+            seconds, fraction, captured, original = record.unpack_from(buffer, offset)
+            offset += 16
+            if offset + captured > end:
+                logger.warning(f"Registro truncado al final de {self.path}; se ignora")
+                break
+            yield seconds + fraction * resolution, linktype, offset, captured, original
+            offset += captured
+
+    def _pcapng_frames(self) -> Iterator[Tuple[float, int, int, int, int]]:
+        buffer = self.buffer
+        offset, end = 0, len(buffer)
+        order = "<"
+        interfaces: List[Tuple[int, float, int]] = []   # (tipo de enlace, resolución, snaplen)
+        while offset + 12 <= end:
+            block_type = struct.unpack_from(order + "I", buffer, offset)[0]
+            if block_type == _PCAPNG_SECTION:
+                # El orden de bytes se fija en cada sección
+                magic = buffer[offset + 8:offset + 12]
+                order = "<" if struct.unpack("<I", magic)[0] == _PCAPNG_BYTE_ORDER else ">"
+                if struct.unpack(order + "I", magic)[0] != _PCAPNG_BYTE_ORDER:
+                    raise PcapFormatError(f"Sección PCAPNG inválida en el byte {offset}")
+                interfaces = []
+            length = struct.unpack_from(order + "I", buffer, offset + 4)[0]
+            if length < 12 or length % 4 or offset + length > end:
+                if offset + length > end:
+                    logger.warning(f"Bloque truncado al final de {self.path}; se ignora")
+                    break
+                raise PcapFormatError(f"Bloque PCAPNG de longitud inválida en el byte {offset}")
+            body = offset + 8
+
+            if block_type == 1:      # Descripción de interfaz
+                linktype, _, snaplen = struct.unpack_from(order + "HHI", buffer, body)
+                interfaces.append((linktype, self._pcapng_resolution(order, body + 8, offset + length - 4), snaplen))
+            elif block_type == 6:    # Paquete mejorado
+                interface, high, low, captured, original = struct.unpack_from(order + "IIIII", buffer, body)
+                if interface < len(interfaces):
+                    linktype, resolution, _ = interfaces[interface]
+                    yield ((high << 32) | low) * resolution, linktype, body + 20, captured, original
+            elif block_type == 3:    # Paquete simple: sin marca de tiempo, interfaz 0
+                if interfaces:
+                    linktype, _, snaplen = interfaces[0]
+                    original = struct.unpack_from(order + "I", buffer, body)[0]
+                    captured = min(original, snaplen or original, length - 16)
+                    yield 0.0, linktype, body + 4, captured, original
+            offset += length
+
+    def _pcapng_resolution(self, order: str, offset: int, end: int) -> float:
+        """Resolución de las marcas de tiempo de una interfaz (opción ``if_tsresol``)."""
+        buffer = self.buffer
+        while offset + 4 <= end:
+            code, length = struct.unpack_from(order + "HH", buffer, offset)
+            if code == 0:
+                break
+            if code == 9 and length >= 1:
+                value = buffer[offset + 4]
+                return 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+            offset += 4 + ((length + 3) & ~3)
+        return 1e-6
+
+
+def _network_offset(buffer: Any, linktype: int, offset: int, end: int) -> Tuple[int, int]:
+    """
+    Salta la cabecera de enlace.
+
+    Returns:
+        tuple: (versión IP 4/6 o 0 si no es IP, posición de la cabecera IP)
+    """
+    if linktype == LINKTYPE_ETHERNET:
+        offset += 12
+        if offset + 2 > end:
+            return 0, offset
+        ethertype = _U16_BE.unpack_from(buffer, offset)[0]
+        while ethertype in _ETHERTYPE_VLAN and offset + 6 <= end:
+            offset += 4
+            ethertype = _U16_BE.unpack_from(buffer, offset)[0]
+        offset += 2
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if offset + 16 > end:
+            return 0, offset
+        ethertype = _U16_BE.unpack_from(buffer, offset + 14)[0]
+        offset += 16
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        if offset + 20 > end:
+            return 0, offset
+        ethertype = _U16_BE.unpack_from(buffer, offset)[0]
+        offset += 20
+    elif linktype == LINKTYPE_NULL:
+        if offset + 4 > end:
+            return 0, offset
+        # La familia va en el orden de bytes del equipo que capturó
+        family = struct.unpack_from("<I", buffer, offset)[0]
+        if family > 0xFFFF:
+            family = struct.unpack_from(">I", buffer, offset)[0]
+        ethertype = _ETHERTYPE_IPV4 if family == 2 else _ETHERTYPE_IPV6 if family in (10, 24, 28, 30) else 0
+        offset += 4
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        if offset >= end:
+            return 0, offset
+        version = buffer[offset] >> 4
+        return (version if version in (4, 6) else 0), offset
+    else:
+        return 0, offset
+
+    if ethertype == _ETHERTYPE_IPV4:
+        return 4, offset
+    if ethertype == _ETHERTYPE_IPV6:
+        return 6, offset
+    return 0, offset
+
+
+def parse_packet(
+    buffer: Any,
+    timestamp: float,
+    linktype: int,
+    offset: int,
+    captured: int,
+    stats: Optional[PcapStats] = None
+) -> Optional[Packet]:
+    """
+    Extrae direcciones, puertos, protocolo, payload y banderas de un paquete.
+
+    El tamaño del payload se calcula con las longitudes de las cabeceras IP/UDP, por
+    lo que es correcto aunque la captura se haya hecho con un snaplen corto.
+
+    Args:
+        buffer: Buffer de la captura (``PcapReader.buffer``)
+        timestamp: Marca de tiempo del paquete
+        linktype: Tipo de enlace de la interfaz
+        offset: Posición del paquete en ``buffer``
+        captured: Bytes capturados del paquete
+        stats: Contadores a actualizar (opcional)
+
+    Returns:
+        Packet o None si no es un paquete IP analizable
+    """
+    end = offset + captured
+    version, offset = _network_offset(buffer, linktype, offset, end)
+
+    if version == 4:
+        if offset + 20 > end:
+            return _skip(stats)
+        version_ihl, total_length, _, fragment, _, proto = _IPV4_HEADER.unpack_from(buffer, offset)
+        header_length = (version_ihl & 0x0F) * 4
+        if header_length < 20:
+            return _skip(stats)
+        source_ip = socket.inet_ntop(socket.AF_INET, buffer[offset + 12:offset + 16])
+        destination_ip = socket.inet_ntop(socket.AF_INET, buffer[offset + 16:offset + 20])
+        if total_length == 0:
+            total_length = end - offset   # Segmentación delegada a la tarjeta (TSO): longitud 0
+        l4_length = total_length - header_length
+        is_fragment = bool(fragment & 0x1FFF)   # Solo el primer fragmento trae la cabecera de capa 4
+        offset += header_length
+    elif version == 6:
+        if offset + 40 > end:
+            return _skip(stats)
+        l4_length, proto, _ = _IPV6_HEADER.unpack_from(buffer, offset)
+        source_ip = socket.inet_ntop(socket.AF_INET6, buffer[offset + 8:offset + 24])
+        destination_ip = socket.inet_ntop(socket.AF_INET6, buffer[offset + 24:offset + 40])
+        offset += 40
+        is_fragment = False
+        while proto in _IPV6_EXTENSIONS or proto in (_IPV6_FRAGMENT, _IPV6_AUTH):
+            if offset + 8 > end:
+                return _skip(stats)
+            next_header, size = buffer[offset], buffer[offset + 1]
+            if proto == _IPV6_FRAGMENT:
+                is_fragment = bool(_U16_BE.unpack_from(buffer, offset + 2)[0] & 0xFFF8)
+                size = 8
+            elif proto == _IPV6_AUTH:
+                size = (size + 2) * 4
+            else:
+                size = (size + 1) * 8
+            proto, offset, l4_length = next_header, offset + size, l4_length - size
+    else:
+        return _skip(stats)
+
+    if stats is not None:
+        stats.ip_packets += 1
+    if is_fragment:
+        if stats is not None:
+            stats.fragments += 1
+        return None
+
+    source_port = destination_port = flags = 0
+    if proto == _IPPROTO_TCP:
+        if offset + 14 > end:
+            return _skip(stats)
+        source_port, destination_port = _PORTS.unpack_from(buffer, offset)
+        payload = l4_length - (buffer[offset + 12] >> 4) * 4
+        flags = buffer[offset + 13] & 0x3F
+        protocol = "tcp"
+    elif proto == _IPPROTO_UDP:
+        if offset + 6 > end:
+            return _skip(stats)
+        source_port, destination_port, udp_length = struct.unpack_from(">HHH", buffer, offset)
+        payload = udp_length - 8
+        protocol = "udp"
+    elif proto in (_IPPROTO_ICMP, _IPPROTO_ICMPV6):
+        payload = l4_length - 8
+        protocol = "icmp"
+    else:
+        payload = l4_length
+        protocol = "other"
+    return Packet(timestamp, source_ip, destination_ip, source_port, destination_port, protocol, max(payload, 0), flags)
+
+
+def _skip(stats: Optional[PcapStats]) -> None:
+    """Cuenta un paquete descartado."""
+    if stats is not None:
+        stats.skipped += 1
+    return None
+
+
+class Flow:
+    """
+    Flujo bidireccional identificado por su 5-tupla.
+
+    El origen es quien envió el primer paquete. Las banderas TCP son las que envió
+    el origen, de modo que un escaneo SYN se ve como SYN sin ACK.
+    """
+    __slots__ = (
+        "source_ip", "destination_ip", "source_port", "destination_port", "protocol",
+        "first_seen", "last_seen", "packets", "bytes", "reverse_packets", "reverse_bytes",
+        "flags", "reverse_flags"
+    )
+
+    def __init__(self, packet: Packet):
+        self.source_ip = packet.source_ip
+        self.destination_ip = packet.destination_ip
+        self.source_port = packet.source_port
+        self.destination_port = packet.destination_port
+        self.protocol = packet.protocol
+        self.first_seen = self.last_seen = packet.timestamp
+        self.packets = self.bytes = self.reverse_packets = self.reverse_bytes = 0
+        self.flags = self.reverse_flags = 0
+
+    def add(self, packet: Packet) -> None:
+        """Suma un paquete en la dirección que corresponda."""
+        self.last_seen = max(self.last_seen, packet.timestamp)
+        if packet.source_ip == self.source_ip and packet.source_port == self.source_port:
+            self.packets += 1
+            self.bytes += packet.payload_size
+            self.flags |= packet.tcp_flags
+        else:
+            self.reverse_packets += 1
+            self.reverse_bytes += packet.payload_size
+            self.reverse_flags |= packet.tcp_flags
+
+    @property
+    def closed(self) -> bool:
+        """Un flujo TCP termina con RST o con FIN en ambas direcciones."""
+        return bool((self.flags | self.reverse_flags) & _TCP_RST) or bool(self.flags & self.reverse_flags & _TCP_FIN)
+
+    def to_input(self, request_id: str) -> ModelInput:
+        """Convierte el flujo en la entrada del modelo."""
+        return ModelInput(
+            request_id=request_id,
+            source_ip=self.source_ip,
+            source_port=self.source_port or None,
+            destination_ip=self.destination_ip,
+            destination_port=self.destination_port,
+            protocol=self.protocol,
+            timestamp=datetime.fromtimestamp(self.first_seen, tz=timezone.utc),
+            payload_size=self.bytes,
+            flags={name: bool(self.flags & bit) for name, bit in TCP_FLAG_BITS} if self.protocol == "tcp" else None,
+            additional_metadata={
+                "packets": self.packets,
+                "reverse_packets": self.reverse_packets,
+                "reverse_bytes": self.reverse_bytes,
+                "duration": round(self.last_seen - self.first_seen, 6),
+                "first_seen": self.first_seen,
+                "last_seen": self.last_seen
+            }
+        )
+
+
+class FlowAggregator:
+    """
+    Agrupa paquetes en flujos con memoria acotada.
+
+    Un flujo se entrega al cerrarse (RST o FIN en ambas direcciones), tras
+    ``idle_timeout`` segundos sin paquetes o ``active_timeout`` segundos desde su
+    inicio (en tiempo de la captura), o cuando hay ``max_flows`` flujos activos y
+    es el menos reciente.
+    """
+
+    def __init__(
+        self,
+        idle_timeout: float = 60.0,
+        active_timeout: float = 300.0,
+        max_flows: int = 100_000,
+        stats: Optional[PcapStats] = None
+    ):
+        """
+        Args:
+            idle_timeout: Segundos sin paquetes tras los que se cierra un flujo
+            active_timeout: Duración máxima de un flujo antes de entregarlo
+            max_flows: Flujos activos como máximo
+            stats: Contadores a actualizar (opcional)
+        """
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.max_flows = max(max_flows, 1)
+        self.stats = stats
+        # Ordenados del menos al más recientemente visto
+        self._flows: "OrderedDict[tuple, Flow]" = OrderedDict()
+        self._clock = float("-inf")
+
+    def __len__(self) -> int:
+        return len(self._flows)
+
+    def add(self, packet: Packet) -> List[Flow]:
+        """
+        Suma un paquete a su flujo.
+
+        Returns:
+            list: Flujos terminados tras este paquete
+        """
+        forward = (packet.source_ip, packet.source_port)
+        backward = (packet.destination_ip, packet.destination_port)
+        key = (packet.protocol, *(forward + backward if forward <= backward else backward + forward))
+        finished: List[Flow] = []
+
+        flow = self._flows.get(key)
+        if flow is not None and packet.timestamp - flow.first_seen >= self.active_timeout:
+            finished.append(self._flows.pop(key))
+            flow = None
+        if flow is None:
+            flow = self._flows[key] = Flow(packet)
+        else:
+            self._flows.move_to_end(key)
+        flow.add(packet)
+        if flow.closed:
+            finished.append(self._flows.pop(key))
+
+        if packet.timestamp > self._clock:
+            self._clock = packet.timestamp
+        finished.extend(self._expire())
+        return finished
+
+    def _expire(self) -> List[Flow]:
+        """Entrega los flujos inactivos y, si se supera el límite, los menos recientes."""
+        finished: List[Flow] = []
+        limit = self._clock - self.idle_timeout
+        while self._flows:
+            flow = next(iter(self._flows.values()))
+            if flow.last_seen >= limit and len(self._flows) <= self.max_flows:
+                break
+            if flow.last_seen >= limit and self.stats is not None:
+                self.stats.evicted_flows += 1
+            finished.append(self._flows.popitem(last=False)[1])
+        return finished
+
+    def flush(self) -> List[Flow]:
+        """Entrega todos los flujos activos (al terminar la captura)."""
+        finished = list(self._flows.values())
+        self._flows.clear()
+        return finished
+
+
+def iter_capture_inputs(
+    path: Union[str, Path],
+    batch_size: int = 256,
+    idle_timeout: float = 60.0,
+    active_timeout: float = 300.0,
+    max_flows: int = 100_000,
+    stats: Optional[PcapStats] = None
+) -> Iterator[List[ModelInput]]:
+    """
+    Lee una captura y entrega sus flujos terminados como lotes de ``ModelInput``.
+
+    Es un generador: la captura se lee solo a medida que se piden lotes, y en
+    memoria quedan únicamente los flujos activos y el lote en construcción.
+
+    Args:
+        path: Ruta de la captura PCAP o PCAPNG
+        batch_size: Flujos por lote
+        idle_timeout: Ver ``FlowAggregator``
+        active_timeout: Ver ``FlowAggregator``
+        max_flows: Ver ``FlowAggregator``
+        stats: Contadores a actualizar (opcional)
+
+    Yields:
+        list: Lotes de hasta ``batch_size`` entradas, con ``request_id`` ``<captura>-flow-<n>``
+
+    Raises:
+        PcapFormatError: Si el archivo no es una captura válida
+    """
+    stats = stats if stats is not None else PcapStats()
+    aggregator = FlowAggregator(idle_timeout, active_timeout, max_flows, stats)
+    prefix = Path(path).stem
+    batch: List[ModelInput] = []
+
+    def collect(flows: List[Flow]) -> Iterator[List[ModelInput]]:
+        nonlocal batch
+        for flow in flows:
+            batch.append(flow.to_input(f"{prefix}-flow-{stats.flows}"))
+            stats.flows += 1
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+    with PcapReader(path) as reader:
+        buffer = reader.buffer
+        for timestamp, linktype, offset, captured, original in reader.frames():
+            stats.packets += 1
+            stats.bytes += original
+            packet = parse_packet(buffer, timestamp, linktype, offset, captured, stats)
+            if packet is not None:
+                finished = aggregator.add(packet)
+                if finished:
+                    yield from collect(finished)
+    yield from collect(aggregator.flush())
+    if batch:
+        yield batch
+
+
+async def score_capture(
+    batches: Iterator[List[ModelInput]],
+    analyze_batch: Callable[[List[ModelInput]], Awaitable[List[Union[ModelOutput, Exception]]]]
+) -> AsyncIterator[Tuple[ModelInput, Union[ModelOutput, Exception]]]:
+    """
+    Analiza los lotes de ``iter_capture_inputs`` con la ruta de análisis por lotes.
+
+    La lectura de la captura corre en un hilo para no bloquear el event loop; el
+    lote siguiente se lee mientras se analiza el actual. Cada resultado incluye
+    ``metadata.capture`` con los contadores del flujo.
+
+    Args:
+        batches: Generador de lotes de la captura
+        analyze_batch: Función de análisis (``ml_service.analyze_batch``)
+
+    Yields:
+        tuple: (entrada, ModelOutput o la excepción que impidió analizarla)
+    """
+    loop = asyncio.get_running_loop()
+    pending = loop.run_in_executor(None, next, batches, None)
+    try:
+        while True:
+            batch = await pending
+            if batch is None:
+                break
+            pending = loop.run_in_executor(None, next, batches, None)
+            outcomes = await analyze_batch(batch)
+            for input_data, outcome in zip(batch, outcomes):
+                if isinstance(outcome, ModelOutput):
+                    outcome.metadata["capture"] = input_data.additional_metadata
+                yield input_data, outcome
+    finally:
+        # Cerrar el generador (y la captura) cuando termine la lectura en curso
+        pending.add_done_callback(lambda _: batches.close())
@@ -0,0 +1,683 @@
+"""
+Persistencia asíncrona (write-behind) de predicciones y registros de auditoría.
+
+Las solicitudes solo encolan el par ``ModelInput``/``ModelOutput`` en una cola en
+memoria acotada, después de enviar la respuesta; un hilo propio la vacía en lotes
+por tamaño (``PERSIST_BATCH_SIZE``) o por tiempo (``PERSIST_FLUSH_INTERVAL_MS``) e
+inserta cada lote en las tablas ``predictions`` y ``audit_log`` del backend. El
+destino es Postgres (COPY o INSERT de varias filas) o, en local, SQLite con el
+mismo esquema.
+
+Si la base de datos falla o se atrasa, la política ``PERSIST_OVERFLOW_POLICY``
+decide qué pasa con los registros: ``drop`` los retiene en la cola mientras se
+reintenta y descarta los nuevos cuando se llena; ``spill`` los escribe en archivos
+NDJSON de ``PERSIST_SPILL_DIR`` y los reinserta cuando la base se recupera. En
+ningún caso el event loop espera a la base de datos ni al disco.
+"""
+import collections
+import ipaddress
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple, Union
+from uuid import uuid4
+
+import numpy as np
+
+from ..core.config import settings
+from ..schemas.mcp import ModelInput, ModelOutput, ThreatLevel
+from .columnar import RISK_CODES, STATUS_CIDR, STATUS_ERROR, STATUS_INVALID, STATUS_RULE, ColumnarBatch
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Fila preparada para insertar (valores JSON ya serializados)
+PreparedRow = Dict[str, Any]
+
+_PREDICTION_COLUMNS = ("id", "model_id", "input_data", "output_data", "status", "latency_ms", "metadata", "created_at")
+_AUDIT_COLUMNS = ("action", "entity_type", "entity_id", "new_values", "ip_address", "created_at")
+
+
+class PendingPrediction:
+    """Predicción encolada, todavía sin serializar."""
+
+    __slots__ = ("input_data", "output", "error", "client_ip", "latency_ms", "created_at")
+
+    def __init__(
+        self,
+        input_data: ModelInput,
+        output: Optional[ModelOutput],
+        client_ip: Optional[str],
+        latency_ms: Optional[float],
+        error: Optional[str] = None
+    ):
+        self.input_data = input_data
+        self.output = output
+        self.error = error
+        self.client_ip = client_ip
+        self.latency_ms = latency_ms
+        self.created_at = datetime.now(timezone.utc)
+
+
+def _ip_or_none(value: Optional[str]) -> Optional[str]:
+    """Devuelve la IP si es válida para una columna INET ("testclient", "unknown" no lo son)."""
+    if not value:
+        return None
+    try:
+        return str(ipaddress.ip_address(value))
+    except ValueError:
+        return None
+
+
+def prepare_row(pending: PendingPrediction) -> PreparedRow:
+    """
+    Serializa una predicción encolada en los valores de ``predictions`` y ``audit_log``.
+
+    Returns:
+        dict: Valores de la fila; se escribe tal cual en los archivos de desborde
+    """
+    output = pending.output
+    model_version = output.metadata.get("model_version", settings.MODEL_VERSION) if output is not None else settings.MODEL_VERSION
+    summary = {"request_id": pending.input_data.request_id, "model_version": model_version}
+    if output is not None:
+        summary.update(prediction=output.prediction, confidence=output.confidence, risk_level=output.risk_level.value)
+    else:
+        summary["error"] = pending.error
+    return {
+        "id": str(uuid4()),
+        "model_name": settings.MODEL_NAME,
+        "model_version": model_version,
+        "input_data": pending.input_data.model_dump_json(),
+        "output_data": output.model_dump_json() if output is not None else None,
+        "status": "completed" if output is not None else "failed",
+        "latency_ms": int(round(pending.latency_ms)) if pending.latency_ms is not None else None,
+        "metadata": json.dumps(summary),
+        "ip_address": _ip_or_none(pending.client_ip),
+        "created_at": pending.created_at.isoformat()
+    }
+
+
+def _audit_values(row: PreparedRow) -> Tuple[Any, ...]:
+    """Valores de ``audit_log`` de una predicción persistida."""
+    return (f"prediction.{row['status']}", "prediction", row["id"], row["metadata"], row["ip_address"], row["created_at"])
+
+
+class SqliteSink:
+    """
+    Destino SQLite para desarrollo y pruebas locales.
+
+    Crea ``mlmodels``, ``predictions`` y ``audit_log`` con las columnas de las
+    migraciones del backend (JSON como texto) e inserta cada lote en una transacción.
+    """
+
+    kind = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._model_ids: Dict[Tuple[str, str], str] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS mlmodels (
+                    id TEXT PRIMARY KEY, name TEXT NOT NULL, version TEXT NOT NULL, path TEXT NOT NULL,
+                    metadata TEXT, is_active INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE (name, version)
+                );
+                CREATE TABLE IF NOT EXISTS predictions (
+                    id TEXT PRIMARY KEY, user_id TEXT, model_id TEXT NOT NULL REFERENCES mlmodels (id),
+                    input_data TEXT NOT NULL, output_data TEXT, status TEXT NOT NULL DEFAULT 'completed',
+                    latency_ms INTEGER, metadata TEXT, created_at TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS predictions_created_at ON predictions (created_at);
+                CREATE TABLE IF NOT EXISTS audit_log (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, action TEXT NOT NULL,
+                    entity_type TEXT, entity_id TEXT, old_values TEXT, new_values TEXT,
+                    ip_address TEXT, created_at TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS audit_log_entity_id ON audit_log (entity_id);
+            """)
+            self._conn = conn
+        return self._conn
+
+    def _model_id(self, conn: sqlite3.Connection, name: str, version: str) -> str:
+        key = (name, version)
+        model_id = self._model_ids.get(key)
+        if model_id is None:
+            conn.execute(
+                "INSERT OR IGNORE INTO mlmodels (id, name, version, path) VALUES (?, ?, ?, ?)",
+                (str(uuid4()), name, version, settings.MODEL_PATH)
+            )
+            model_id = self._model_ids[key] = conn.execute(
+                "SELECT id FROM mlmodels WHERE name = ? AND version = ?", key
+            ).fetchone()[0]
+        return model_id
+
+    def write(self, rows: Sequence[PreparedRow]) -> None:
+        """Inserta un lote de predicciones y su auditoría en una transacción."""
+        conn = self._connect()
+        try:
+            with conn:
+                predictions = [
+                    (row["id"], self._model_id(conn, row["model_name"], row["model_version"]), row["input_data"],
+                     row["output_data"], row["status"], row["latency_ms"], row["metadata"], row["created_at"])
+                    for row in rows
+                ]
+                conn.executemany(
+                    f"INSERT INTO predictions ({', '.join(_PREDICTION_COLUMNS)}) VALUES ({', '.join('?' * len(_PREDICTION_COLUMNS))})",
+                    predictions
+                )
+                conn.executemany(
+                    f"INSERT INTO audit_log ({', '.join(_AUDIT_COLUMNS)}) VALUES ({', '.join('?' * len(_AUDIT_COLUMNS))})",
+                    [_audit_values(row) for row in rows]
+                )
+        except sqlite3.Error:
+            self._model_ids.clear()
+            raise
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class PostgresSink:
+    """
+    Destino Postgres (tablas de las migraciones del backend) con psycopg 3.
+
+    Cada lote se inserta en una transacción con ``COPY ... FROM STDIN`` o, con
+    ``method="insert"``, con un INSERT por fila enviado en pipeline. La versión del
+    modelo se registra en ``mlmodels`` si todavía no existe.
+    """
+
+    kind = "postgres"
+
+    def __init__(self, url: str, method: str = "copy"):
+        if method not in ("copy", "insert"):
+            raise ValueError("PERSIST_POSTGRES_METHOD debe ser 'copy' o 'insert'")
+        self.url = url
+        self.method = method
+        self._conn = None
+        self._model_ids: Dict[Tuple[str, str], Any] = {}
+
+    def _connect(self):
+        if self._conn is None:
+            try:
+                import psycopg
+            except ImportError:
+                raise RuntimeError("PERSIST_BACKEND=postgres requiere el paquete psycopg (psycopg[binary])")
+            self._conn = psycopg.connect(self.url, autocommit=True)
+        return self._conn
+
+    def _model_id(self, cur, name: str, version: str) -> Any:
+        key = (name, version)
+        model_id = self._model_ids.get(key)
+        if model_id is None:
+            cur.execute(
+                "INSERT INTO mlmodels (name, version, path) VALUES (%s, %s, %s) "
+                "ON CONFLICT ON CONSTRAINT mlmodels_name_version_uk DO NOTHING",
+                (name, version, settings.MODEL_PATH)
+            )
+            cur.execute("SELECT id FROM mlmodels WHERE name = %s AND version = %s", key)
+            model_id = self._model_ids[key] = cur.fetchone()[0]
+        return model_id
+
+    def write(self, rows: Sequence[PreparedRow]) -> None:
+        """Inserta un lote de predicciones y su auditoría en una transacción."""
+        conn = self._connect()
+        try:
+            with conn.transaction(), conn.cursor() as cur:
+                predictions = [
+                    (row["id"], self._model_id(cur, row["model_name"], row["model_version"]), row["input_data"],
+                     row["output_data"], row["status"], row["latency_ms"], row["metadata"], row["created_at"])
+                    for row in rows
+                ]
+                audit = [_audit_values(row) for row in rows]
+                if self.method == "copy":
+                    with cur.copy(f"COPY predictions ({', '.join(_PREDICTION_COLUMNS)}) FROM STDIN") as copy:
+                        for values in predictions:
+                            copy.write_row(values)
+                    with cur.copy(f"COPY audit_log ({', '.join(_AUDIT_COLUMNS)}) FROM STDIN") as copy:
+                        for values in audit:
+                            copy.write_row(values)
+                else:
+                    cur.executemany(
+                        f"INSERT INTO predictions ({', '.join(_PREDICTION_COLUMNS)}) "
+                        f"VALUES ({', '.join(['%s'] * len(_PREDICTION_COLUMNS))})",
+                        predictions
+                    )
+                    cur.executemany(
+                        f"INSERT INTO audit_log ({', '.join(_AUDIT_COLUMNS)}) "
+                        f"VALUES ({', '.join(['%s'] * len(_AUDIT_COLUMNS))})",
+                        audit
+                    )
+        except Exception:
+            # Conexión en estado desconocido: se abre otra en el siguiente intento
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+            self._model_ids.clear()
+
+
+class PersistenceWriter:
+    """
+    Cola acotada de predicciones y el hilo que la vuelca en lotes a la base de datos.
+
+    ``enqueue`` se llama desde el event loop y no bloquea: agrega a un deque y, si
+    el lote está completo, despierta al hilo. Los fallos de escritura se reintentan
+    con espera exponencial hasta ``retry_max_seconds``.
+    """
+
+    def __init__(
+        self,
+        sink: Any,
+        queue_size: int = 50000,
+        batch_size: int = 500,
+        flush_interval_ms: float = 1000.0,
+        overflow_policy: str = "drop",
+        spill_dir: Optional[str] = None,
+        spill_high_watermark: float = 0.5,
+        retry_max_seconds: float = 30.0
+    ):
+        """
+        Args:
+            sink: Destino con ``write(filas)`` y ``close()``
+            queue_size: Predicciones en memoria; al llenarse se descartan las nuevas
+            batch_size: Filas por escritura
+            flush_interval_ms: Espera máxima antes de escribir un lote incompleto
+            overflow_policy: ``drop`` o ``spill``
+            spill_dir: Directorio de los archivos de desborde (política ``spill``)
+            spill_high_watermark: Fracción de la cola a partir de la cual los lotes
+                van al disco en lugar de a la base (política ``spill``)
+            retry_max_seconds: Espera máxima entre reintentos tras un fallo
+
+        Raises:
+            ValueError: Si la política no es válida o ``spill`` no tiene directorio
+        """
+        if overflow_policy not in ("drop", "spill"):
+            raise ValueError("PERSIST_OVERFLOW_POLICY debe ser 'drop' o 'spill'")
+        if overflow_policy == "spill" and not spill_dir:
+            raise ValueError("La política 'spill' requiere PERSIST_SPILL_DIR")
+        self.sink = sink
+        self.queue_size = max(queue_size, 1)
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = max(flush_interval_ms, 1.0) / 1000
+        self.overflow_policy = overflow_policy
+        self.spill_dir = spill_dir
+        self.spill_threshold = max(int(self.queue_size * spill_high_watermark), self.batch_size)
+        self.retry_max_seconds = retry_max_seconds
+
+        self._queue: Deque[PendingPrediction] = collections.deque()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._retry_at = 0.0
+        self._retry_delay = 0.0
+        self._spill_file = None
+        self._spill_path: Optional[str] = None
+
+        # Métricas acumuladas
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.failures = 0
+        self.batches = 0
+        self.last_error: Optional[str] = None
+        self.last_flush_ms = 0.0
+
+    # ========== Event loop ==========
+    def enqueue(self, pending: PendingPrediction) -> bool:
+        """
+        Encola una predicción sin bloquear.
+
+        Returns:
+            bool: False si la cola estaba llena y la predicción se descartó
+        """
+        if len(self._queue) >= self.queue_size:
+            self.dropped += 1
+            return False
+        self._queue.append(pending)
+        self.enqueued += 1
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def start(self) -> None:
+        """Inicia el hilo de escritura (una sola vez)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="persistence-writer", daemon=True)
+            self._thread.start()
+            logger.info(
+                f"Persistencia de predicciones en {self.sink.kind}: lotes de {self.batch_size}, "
+                f"política {self.overflow_policy}"
+            )
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Escribe (o desborda) lo pendiente y detiene el hilo."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning(f"El hilo de persistencia no terminó; quedan {len(self._queue)} predicciones en cola")
+            self._thread = None
+
+    @property
+    def queue_depth(self) -> int:
+        """Predicciones en espera de ser escritas."""
+        return len(self._queue)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Devuelve las métricas de la persistencia.
+
+        Returns:
+            dict: Cola, filas escritas, descartadas, desbordadas y reinsertadas, y último error
+        """
+        return {
+            "backend": self.sink.kind,
+            "overflow_policy": self.overflow_policy,
+            "queue_depth": self.queue_depth,
+            "queue_size": self.queue_size,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "spill_files": len(self._spill_files()),
+            "batches": self.batches,
+            "failures": self.failures,
+            "last_flush_ms": self.last_flush_ms,
+            "last_error": self.last_error
+        }
+
+    # ========== Hilo de escritura ==========
+    def _run(self) -> None:
+        """Bucle del hilo; un error inesperado se registra y el hilo sigue vivo."""
+        try:
+            while True:
+                try:
+                    if not self._step():
+                        break
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.exception("Error inesperado en el hilo de persistencia")
+                    if self._stopping:
+                        break
+                    time.sleep(self.flush_interval)
+        finally:
+            try:
+                self._close_spill_file()
+                self.sink.close()
+            except Exception:
+                logger.exception("Error al cerrar la persistencia de predicciones")
+
+    def _step(self) -> bool:
+        """Una vuelta del bucle de escritura; devuelve False al terminar de vaciar la cola tras close()."""
+        if len(self._queue) < self.batch_size and not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+        if not self._queue:
+            if self._stopping:
+                return False
+            self._replay_spill()
+            return True
+
+        if self._backing_off() and not self._stopping:
+            if self.overflow_policy == "spill":
+                self._spill([prepare_row(pending) for pending in self._take_batch()])
+            else:
+                # Los registros quedan en la cola; enqueue descarta cuando se llena
+                time.sleep(max(min(self._retry_at - time.monotonic(), self.flush_interval), 0.0))
+            return True
+
+        batch = self._take_batch()
+        rows = [prepare_row(pending) for pending in batch]
+        if self.overflow_policy == "spill" and len(self._queue) >= self.spill_threshold:
+            # La base no da abasto: el disco absorbe el exceso y se reinserta después
+            self._spill(rows)
+        elif self._write(rows):
+            self.written += len(rows)
+        elif self.overflow_policy == "spill" or self._stopping:
+            self._spill(rows)
+        else:
+            # Se devuelven a la cola, delante de los demás, para el siguiente intento
+            self._queue.extendleft(reversed(batch))
+        return True
+
+    def _take_batch(self) -> List[PendingPrediction]:
+        batch = []
+        while self._queue and len(batch) < self.batch_size:
+            batch.append(self._queue.popleft())
+        return batch
+
+    def _backing_off(self) -> bool:
+        return time.monotonic() < self._retry_at
+
+    def _write(self, rows: List[PreparedRow]) -> bool:
+        """Escribe un lote; ante un fallo programa el siguiente intento."""
+        started = time.perf_counter()
+        try:
+            self.sink.write(rows)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            self._retry_delay = min(max(self._retry_delay * 2, 0.5), self.retry_max_seconds)
+            self._retry_at = time.monotonic() + self._retry_delay
+            logger.warning(
+                f"No se pudo escribir un lote de {len(rows)} predicciones en {self.sink.kind}: {str(e)}; "
+                f"reintento en {self._retry_delay:.1f} s"
+            )
+            return False
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        self._retry_delay = 0.0
+        self.batches += 1
+        return True
+
+    # ========== Desborde a disco ==========
+    def _spill(self, rows: List[PreparedRow]) -> None:
+        """Agrega un lote a un archivo NDJSON del directorio de desborde (con ``drop``, lo descarta)."""
+        if not rows:
+            return
+        if self.overflow_policy != "spill":
+            self.dropped += len(rows)
+            return
+        try:
+            if self._spill_file is None:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                self._spill_path = os.path.join(self.spill_dir, f"spill-{time.time_ns()}.ndjson")
+                self._spill_file = open(self._spill_path + ".tmp", "a", encoding="utf-8")
+            self._spill_file.write("".join(json.dumps(row) + "\n" for row in rows))
+            self._spill_file.flush()
+            self.spilled += len(rows)
+        except OSError as e:
+            self.dropped += len(rows)
+            self.last_error = str(e)
+            logger.error(f"No se pudo desbordar un lote de {len(rows)} predicciones a disco: {str(e)}")
+
+    def _close_spill_file(self) -> None:
+        """Cierra el archivo de desborde actual y lo deja disponible para reinsertar."""
+        if self._spill_file is not None:
+            self._spill_file.close()
+            os.replace(self._spill_path + ".tmp", self._spill_path)
+            self._spill_file = None
+
+    def _spill_files(self) -> List[str]:
+        if not self.spill_dir or not os.path.isdir(self.spill_dir):
+            return []
+        return sorted(name for name in os.listdir(self.spill_dir) if name.startswith("spill-") and name.endswith(".ndjson"))
+
+    def _replay_spill(self) -> None:
+        """
+        Reinserta el archivo de desborde más antiguo mientras la cola esté vacía y la
+        base responda. Lo que no se alcanza a reinsertar queda en el mismo archivo.
+        """
+        if self.overflow_policy != "spill" or self._backing_off():
+            return
+        self._close_spill_file()
+        files = self._spill_files()
+        if not files:
+            return
+        path = os.path.join(self.spill_dir, files[0])
+        with open(path, encoding="utf-8") as source:
+            rows = [json.loads(line) for line in source if line.strip()]
+
+        done = 0
+        while done < len(rows) and not self._queue:
+            chunk = rows[done:done + self.batch_size]
+            if not self._write(chunk):
+                break
+            self.replayed += len(chunk)
+            done += len(chunk)
+
+        if done >= len(rows):
+            os.unlink(path)
+            logger.info(f"Reinsertadas {len(rows)} predicciones desbordadas desde {path}")
+        elif done:
+            with open(path + ".tmp", "w", encoding="utf-8") as target:
+                target.write("".join(json.dumps(row) + "\n" for row in rows[done:]))
+            os.replace(path + ".tmp", path)
+
+
+def is_suppressed(output: ModelOutput) -> bool:
+    """Indica si la alerta se sumó a un incidente abierto y no debe persistirse."""
+    return settings.INCIDENT_SUPPRESS_PERSISTENCE and output.metadata.get("incident", {}).get("suppressed", False)
+
+
+def persist_outcomes(
+    inputs: Sequence[ModelInput],
+    outcomes: Sequence[Union[ModelOutput, BaseException]],
+    client_ip: Optional[str],
+    latency_ms: Optional[float] = None
+) -> None:
+    """
+    Encola la persistencia de los resultados de un camino de análisis.
+
+    Todos los caminos (``/analyze``, lotes, columnar, flujo NDJSON, WebSocket,
+    PCAP y la repetición de tráfico) la llaman después de responder. Un resultado
+    con error se guarda con ``status="failed"``; una alerta suprimida por un
+    incidente abierto no se guarda.
+
+    Args:
+        inputs: Registros analizados
+        outcomes: Resultado o excepción de cada registro
+        client_ip: IP del cliente o del sensor
+        latency_ms: Duración del análisis en milisegundos
+    """
+    if writer is None:
+        return
+    for input_data, outcome in zip(inputs, outcomes):
+        if isinstance(outcome, ModelOutput):
+            if not is_suppressed(outcome):
+                writer.enqueue(PendingPrediction(input_data, outcome, client_ip, latency_ms))
+        else:
+            writer.enqueue(PendingPrediction(input_data, None, client_ip, latency_ms, error=str(outcome)))
+
+
+def persist_columnar(
+    batch: ColumnarBatch,
+    result: Dict[str, Any],
+    request_id: str,
+    client_ip: Optional[str],
+    latency_ms: Optional[float] = None
+) -> None:
+    """
+    Versión de ``persist_outcomes`` para un lote columnar ya respondido.
+
+    Reconstruye un ``ModelInput`` y un ``ModelOutput`` por fila válida, por lo que
+    solo trabaja si la persistencia está activa. Las filas que no superaron la
+    validación no se guardan, igual que los registros inválidos de un lote JSON.
+
+    Args:
+        batch: Lote decodificado
+        result: Columnas de ``MLService.analyze_columnar``
+        request_id: ID de la solicitud (base del ``request_id`` de cada fila)
+        client_ip: IP del cliente
+        latency_ms: Duración del análisis en milisegundos
+    """
+    if writer is None:
+        return
+    status = result["status"]
+    keep = status != STATUS_INVALID
+    if settings.INCIDENT_SUPPRESS_PERSISTENCE:
+        keep &= ~result["suppressed"]
+    rows = np.flatnonzero(keep)
+    if not len(rows):
+        return
+    levels = {code: level for level, code in RISK_CODES.items()}
+    decisions = {STATUS_CIDR: "cidr", STATUS_RULE: "rule"}
+    inputs = batch.take(rows).to_inputs(request_id, rows.tolist())
+    outcomes: List[Union[ModelOutput, Exception]] = []
+    for input_data, row in zip(inputs, rows.tolist()):
+        if status[row] == STATUS_ERROR:
+            outcomes.append(RuntimeError("Error de inferencia en el lote columnar"))
+            continue
+        decision = decisions.get(int(status[row]), "model")
+        outcomes.append(ModelOutput(
+            request_id=input_data.request_id,
+            prediction=int(result["prediction"][row]),
+            confidence=float(result["confidence"][row]),
+            risk_level=levels.get(int(result["risk_level"][row]), ThreatLevel.LOW),
+            explanation=f"Resultado de un lote columnar (decisión: {decision})",
+            metadata={"batch_id": batch.batch_id, "batch_index": row, "decision": decision}
+        ))
+    persist_outcomes(inputs, outcomes, client_ip, latency_ms)
+
+
+def build_writer() -> Optional[PersistenceWriter]:
+    """
+    Construye el escritor según ``PERSIST_BACKEND`` (``none``, ``sqlite`` o ``postgres``).
+
+    Returns:
+        PersistenceWriter o None si la persistencia está desactivada
+
+    Raises:
+        ValueError: Si la configuración no es válida
+    """
+    backend = settings.PERSIST_BACKEND
+    if backend == "none":
+        return None
+    if backend == "sqlite":
+        sink = SqliteSink(settings.PERSIST_SQLITE_PATH)
+    elif backend == "postgres":
+        if not settings.PERSIST_DATABASE_URL:
+            raise ValueError("PERSIST_BACKEND=postgres requiere PERSIST_DATABASE_URL")
+        sink = PostgresSink(settings.PERSIST_DATABASE_URL, settings.PERSIST_POSTGRES_METHOD)
+    else:
+        raise ValueError(f"PERSIST_BACKEND desconocido: {backend}")
+    return PersistenceWriter(
+        sink,
+        queue_size=settings.PERSIST_QUEUE_SIZE,
+        batch_size=settings.PERSIST_BATCH_SIZE,
+        flush_interval_ms=settings.PERSIST_FLUSH_INTERVAL_MS,
+        overflow_policy=settings.PERSIST_OVERFLOW_POLICY,
+        spill_dir=settings.PERSIST_SPILL_DIR,
+        spill_high_watermark=settings.PERSIST_SPILL_HIGH_WATERMARK,
+        retry_max_seconds=settings.PERSIST_RETRY_MAX_SECONDS
+    )
+
+
+# Escritor del proceso (None con PERSIST_BACKEND=none); el lifespan de la app lo inicia y lo cierra
+writer = build_writer()
@@ -0,0 +1,227 @@
+"""
+Caché de predicciones acotada (LRU + TTL) con agrupación de solicitudes en curso.
+Los sensores retransmiten y los escáneres envían sondas casi idénticas, por lo que
+muchas solicitudes producen el mismo vector de características.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Estimación de memoria (bytes) de una entrada además de su clave
+_ENTRY_BYTES = 200
+
+# Tiempos reportados cuando la predicción sale de la caché
+CACHE_HIT_TIMING = {"queue_wait_ms": 0.0, "execution_ms": 0.0}
+
+
+class PredictionCache:
+    """
+    Caché de (predicción, confianza) por vector de características.
+
+    La clave combina un espacio de nombres (modelo y versión de la etapa que
+    predice) con los bytes del vector canonicalizado, por lo que al cambiar el
+    modelo las entradas anteriores dejan de coincidir. Está acotada por número de
+    entradas y por memoria estimada, con expulsión LRU y expiración por TTL.
+    Las solicitudes idénticas concurrentes esperan un único cálculo.
+    """
+
+    def __init__(self, max_entries: int = 100_000, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 60.0):
+        """
+        Args:
+            max_entries: Número máximo de entradas
+            max_bytes: Memoria estimada máxima
+            ttl_seconds: Vigencia de una entrada
+        """
+        self.max_entries = max(max_entries, 1)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: "OrderedDict[bytes, Tuple[Any, float, float]]" = OrderedDict()
+        self._in_flight: Dict[bytes, asyncio.Future] = {}
+        self._bytes = 0
+
+        # Métricas acumuladas
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evicted_ttl = 0
+        self._evicted_capacity = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def key(namespace: str, row: np.ndarray) -> bytes:
+        """
+        Construye la clave de un vector de características.
+
+        El vector se lleva a float32 contiguo y se normaliza ``-0.0`` a ``0.0`` para
+        que valores equivalentes produzcan la misma clave.
+        """
+        canonical = np.ascontiguousarray(row, dtype=np.float32).reshape(-1) + np.float32(0.0)
+        return namespace.encode() + b"|" + canonical.tobytes()
+
+    def get(self, key: bytes) -> Optional[Tuple[Any, float]]:
+        """Devuelve (predicción, confianza) si la entrada existe y sigue vigente."""
+        value = self._lookup(key)
+        if value is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+        return value
+
+    def _lookup(self, key: bytes) -> Optional[Tuple[Any, float]]:
+        """Busca una entrada vigente sin contabilizar el acceso."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self._evicted_ttl += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def record_coalesced(self, count: int = 1) -> None:
+        """Contabiliza solicitudes resueltas por un cálculo compartido (p. ej. filas repetidas de un lote)."""
+        self._coalesced += count
+
+    def put(self, key: bytes, value: Tuple[Any, float]) -> None:
+        """Guarda una predicción y aplica los límites de entradas y memoria."""
+        if key in self._entries:
+            self._remove(key)
+        size = len(key) + _ENTRY_BYTES
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds, size)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self._evicted_capacity += 1
+
+    def _remove(self, key: bytes) -> None:
+        """Elimina una entrada y descuenta su memoria."""
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def claim(self, key: bytes) -> Tuple[str, Any]:
+        """
+        Consulta una clave y, si no hay resultado ni cálculo en curso, la reserva.
+
+        Es el paso previo de ``get_or_compute`` y lo usan también los lotes, que
+        calculan varias filas en una llamada: así una fila de un lote y una solicitud
+        individual con el mismo vector comparten un único cálculo.
+
+        Returns:
+            tuple: (``"hit"``, (predicción, confianza)), (``"coalesced"``, futuro del
+            cálculo en curso) o (``"miss"``, None); una clave reservada con ``miss``
+            debe cerrarse con ``resolve`` o ``fail``
+        """
+        value = self._lookup(key)
+        if value is not None:
+            self._hits += 1
+            return "hit", value
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self._coalesced += 1
+            return "coalesced", pending
+        self._misses += 1
+        self._in_flight[key] = asyncio.get_running_loop().create_future()
+        return "miss", None
+
+    def resolve(self, key: bytes, result: Tuple[Any, float, Dict[str, Any]]) -> None:
+        """Guarda el resultado de una clave reservada y lo entrega a quienes lo esperan."""
+        self.put(key, (result[0], result[1]))
+        future = self._in_flight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def fail(self, key: bytes, error: BaseException) -> None:
+        """Libera una clave reservada cuyo cálculo falló o se canceló, sin guardar nada."""
+        future = self._in_flight.pop(key, None)
+        if future is None or future.done():
+            return
+        if isinstance(error, Exception):
+            future.set_exception(error)
+            future.exception()  # Evita el aviso si nadie más esperaba el resultado
+        else:
+            # Cancelación: quienes esperaban vuelven a calcular
+            future.cancel()
+
+    async def get_or_compute(
+        self,
+        key: bytes,
+        compute: Callable[[], Awaitable[Tuple[Any, float, Dict[str, Any]]]]
+    ) -> Tuple[Tuple[Any, float, Dict[str, Any]], str]:
+        """
+        Devuelve la predicción de la caché o la calcula una sola vez.
+
+        Si ya hay un cálculo en curso para la misma clave (de otra solicitud o de
+        un lote), se espera su resultado en lugar de lanzar otro.
+
+        Args:
+            key: Clave construida con ``key``
+            compute: Corrutina que devuelve (predicción, confianza, tiempos)
+
+        Returns:
+            tuple: ((predicción, confianza, tiempos), estado) con estado ``hit``,
+                ``coalesced`` o ``miss``
+        """
+        status, value = self.claim(key)
+        if status == "hit":
+            return (value[0], value[1], CACHE_HIT_TIMING), "hit"
+        if status == "coalesced":
+            try:
+                return await asyncio.shield(value), "coalesced"
+            except asyncio.CancelledError:
+                if not value.cancelled():
+                    raise
+                # El cálculo original se canceló: se calcula de nuevo
+                return await self.get_or_compute(key, compute)
+
+        try:
+            result = await compute()
+        except BaseException as e:
+            self.fail(key, e)
+            raise
+        self.resolve(key, result)
+        return result, "miss"
+
+    def clear(self) -> None:
+        """Invalida todas las entradas (p. ej. al cambiar el modelo cargado)."""
+        self._entries.clear()
+        self._bytes = 0
+        self._invalidations += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Devuelve las métricas de la caché.
+
+        Returns:
+            dict: Entradas, memoria estimada, aciertos, fallos, agrupadas, tasas y expulsiones
+        """
+        lookups = self._hits + self._misses + self._coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "estimated_bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self._hits,
+            "misses": self._misses,
+            "coalesced": self._coalesced,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            # Fracción de solicitudes que no requirieron un cálculo propio
+            "saved_rate": (self._hits + self._coalesced) / lookups if lookups else 0.0,
+            "in_flight": len(self._in_flight),
+            "evicted_ttl": self._evicted_ttl,
+            "evicted_capacity": self._evicted_capacity,
+            "invalidations": self._invalidations
+        }
@@ -0,0 +1,112 @@
+"""
+Profiler de muestreo bajo demanda.
+
+Un hilo toma cada ``interval_ms`` la pila de todos los hilos del proceso
+(``sys._current_frames``) y cuenta las pilas repetidas. El resultado se exporta
+en formato "collapsed" (``hilo;marco;marco N`` por línea), que aceptan
+flamegraph.pl, speedscope e inferno. Fuera de una sesión no hay hilo ni ningún
+costo para las solicitudes.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType
+from typing import Dict
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+
+class ProfileResult:
+    """Pilas contadas durante una sesión de muestreo."""
+
+    def __init__(self, seconds: float, interval_ms: float):
+        self.seconds = seconds
+        self.interval_ms = interval_ms
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    def collapsed(self) -> str:
+        """Pilas en formato collapsed, de la más frecuente a la menos frecuente."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class SamplingProfiler:
+    """Sesiones de muestreo de una en una sobre el proceso actual."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._labels: Dict[CodeType, str] = {}
+        self._roots = sorted({os.path.abspath(path) for path in sys.path if path}, key=len, reverse=True)
+
+    @property
+    def running(self) -> bool:
+        """Indica si hay una sesión en curso."""
+        return self._lock.locked()
+
+    def profile(self, seconds: float, interval_ms: float = 5.0) -> ProfileResult:
+        """
+        Muestrea el proceso durante ``seconds`` segundos (bloquea el hilo que llama).
+
+        Args:
+            seconds: Duración de la sesión
+            interval_ms: Intervalo entre muestras
+
+        Returns:
+            ProfileResult: Pilas contadas
+
+        Raises:
+            RuntimeError: Si ya hay una sesión en curso
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Ya hay una sesión de perfilado en curso")
+        try:
+            return self._sample(seconds, max(interval_ms, 1.0))
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds: float, interval_ms: float) -> ProfileResult:
+        result = ProfileResult(seconds=seconds, interval_ms=interval_ms)
+        own = threading.get_ident()
+        interval = interval_ms / 1000
+        next_sample = time.perf_counter()
+        deadline = next_sample + seconds
+        logger.info(f"Perfilado iniciado: {seconds} s cada {interval_ms} ms")
+
+        while next_sample < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                result.stacks[";".join(reversed(stack))] += 1
+            result.samples += 1
+            next_sample += interval
+            time.sleep(max(next_sample - time.perf_counter(), 0.0))
+
+        logger.info(f"Perfilado terminado: {result.samples} muestras, {len(result.stacks)} pilas distintas")
+        return result
+
+    def _label(self, code: CodeType) -> str:
+        """Nombre del marco: ``función (archivo:línea)`` con la ruta relativa a sys.path."""
+        label = self._labels.get(code)
+        if label is None:
+            filename = os.path.abspath(code.co_filename)
+            for root in self._roots:
+                if filename.startswith(root + os.sep):
+                    filename = filename[len(root) + 1:]
+                    break
+            name = getattr(code, "co_qualname", code.co_name)
+            label = self._labels[code] = f"{name} ({filename}:{code.co_firstlineno})".replace(";", ",")
+        return label
+
+
+# Profiler del proceso
+profiler = SamplingProfiler()
@@ -0,0 +1,365 @@
+"""
+Prefiltro de reglas compilado a predicados vectorizados.
+Las reglas se declaran sobre las mismas fuentes que las características del modelo y
+se evalúan sobre la matriz de un lote completo antes de invocar el modelo: pueden
+decidir el veredicto directamente o añadir indicadores a la respuesta.
+"""
+import json
+import logging
+import string
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from ..schemas.mcp import ModelInput, ThreatLevel
+from .columnar import ColumnarBatch
+from .features import PROTOCOL_ENCODING, FeatureDefinition, FeatureExtractor, FeatureSpec
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+RULE_ACTIONS = ("verdict", "indicator")
+
+# Comparaciones soportadas; las fuentes ausentes (NaN) nunca cumplen una condición
+_OPERATORS = {
+    "eq": np.equal,
+    "ne": np.not_equal,
+    "gt": np.greater,
+    "ge": np.greater_equal,
+    "lt": np.less,
+    "le": np.less_equal,
+    "in": lambda column, values: np.isin(column, values),
+    "not_in": lambda column, values: ~np.isin(column, values),
+}
+
+# Campos del registro disponibles en el texto de los indicadores
+_MESSAGE_FIELDS = ("source_ip", "destination_ip", "source_port", "destination_port", "protocol", "payload_size")
+
+
+class RuleSetError(ValueError):
+    """El conjunto de reglas es inválido."""
+
+
+class RuleCondition(BaseModel):
+    """Comparación de una fuente (p. ej. ``flags.SYN`` o ``flow.60s.distinct_ports``) con un valor."""
+    source: str = Field(..., description="Fuente del valor, con la misma sintaxis que FeatureDefinition")
+    op: str = Field("eq", description="Operador: eq, ne, gt, ge, lt, le, in, not_in")
+    value: Any = Field(..., description="Valor o lista de valores (in/not_in); el protocolo admite nombres")
+
+
+class Rule(BaseModel):
+    """Regla del prefiltro: todas sus condiciones deben cumplirse."""
+    name: str = Field(..., description="Identificador único de la regla")
+    conditions: List[RuleCondition] = Field(..., description="Condiciones combinadas con AND")
+    action: str = Field("indicator", description="verdict (decide sin el modelo) o indicator")
+    indicator: str = Field(..., description="Texto del indicador; admite {destination_port}, {payload_size}, etc.")
+    prediction: int = Field(1, description="Predicción del veredicto (0 o 1)")
+    confidence: float = Field(1.0, description="Confianza del veredicto")
+    risk_level: ThreatLevel = Field(ThreatLevel.HIGH, description="Nivel de riesgo del veredicto")
+
+
+class RuleSet(BaseModel):
+    """Conjunto ordenado de reglas; ante varios veredictos gana el primero."""
+    version: int = Field(1, description="Versión del formato del conjunto de reglas")
+    rules: List[Rule] = Field(..., description="Reglas en orden de prioridad")
+
+
+_TCP_FLAGS_CLEAR = [RuleCondition(source=f"flags.{flag}", value=0) for flag in ("SYN", "ACK", "FIN", "RST", "PSH", "URG")]
+
+# Reglas por defecto: heurísticas de nmapAnalyzer.ts e indicadores históricos del servicio
+DEFAULT_RULE_SET = RuleSet(rules=[
+    Rule(
+        name="xmas_scan",
+        action="verdict",
+        conditions=[
+            RuleCondition(source="protocol", value="tcp"),
+            RuleCondition(source="flags.FIN", value=1),
+            RuleCondition(source="flags.PSH", value=1),
+            RuleCondition(source="flags.URG", value=1),
+        ],
+        indicator="Escaneo XMAS (FIN, PSH y URG activos) hacia el puerto {destination_port}",
+    ),
+    Rule(
+        name="null_scan",
+        action="verdict",
+        conditions=[
+            RuleCondition(source="protocol", value="tcp"),
+            RuleCondition(source="flags_present", value=1),
+            *_TCP_FLAGS_CLEAR,
+        ],
+        indicator="Escaneo NULL (paquete TCP sin flags) hacia el puerto {destination_port}",
+    ),
+    Rule(
+        name="full_port_scan",
+        action="verdict",
+        conditions=[RuleCondition(source="flow.60s.distinct_ports", op="ge", value=1000)],
+        indicator="Escaneo de puertos completo: {source_ip} contactó 1000 o más puertos distintos en 60s",
+    ),
+    Rule(
+        name="admin_port",
+        conditions=[RuleCondition(source="destination_port", op="in", value=[22, 23, 3389])],
+        indicator="Conexión a servicio de administración remota (puerto {destination_port})",
+    ),
+    Rule(
+        name="syn_without_ack",
+        conditions=[
+            RuleCondition(source="flags.SYN", value=1),
+            RuleCondition(source="flags.ACK", value=0),
+        ],
+        indicator="Paquete SYN sin ACK (posible escaneo de puertos)",
+    ),
+    Rule(
+        name="large_payload",
+        conditions=[RuleCondition(source="payload_size", op="gt", value=1000)],
+        indicator="Tamaño de paquete inusualmente grande: {payload_size} bytes",
+    ),
+])
+
+
+def _encode_value(source: str, value: Any) -> float:
+    """Convierte el valor de una condición al espacio float de la matriz."""
+    if source == "protocol" and isinstance(value, str):
+        if value.lower() not in PROTOCOL_ENCODING:
+            raise RuleSetError(f"Protocolo desconocido en una regla: {value}")
+        return PROTOCOL_ENCODING[value.lower()]
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise RuleSetError(f"Valor no numérico para la fuente {source}: {value!r}")
+
+
+def _check_message(rule: Rule) -> None:
+    """Comprueba que el texto del indicador solo use campos conocidos."""
+    for _, field, _, _ in string.Formatter().parse(rule.indicator):
+        if field is not None and field not in _MESSAGE_FIELDS:
+            raise RuleSetError(f"Regla {rule.name}: campo desconocido en el indicador: {{{field}}}")
+
+
+class _CompiledRule:
+    """Regla compilada: columnas, operadores y valores listos para evaluar."""
+    __slots__ = ("rule", "predicates", "hits", "decided", "rows", "cost_ns")
+
+    def __init__(self, rule: Rule, columns: Dict[str, int]):
+        if rule.action not in RULE_ACTIONS:
+            raise RuleSetError(f"Regla {rule.name}: acción desconocida {rule.action}")
+        if not rule.conditions:
+            raise RuleSetError(f"Regla {rule.name}: se requiere al menos una condición")
+        _check_message(rule)
+
+        self.rule = rule
+        self.predicates = []
+        for condition in rule.conditions:
+            operator = _OPERATORS.get(condition.op)
+            if operator is None:
+                raise RuleSetError(f"Regla {rule.name}: operador desconocido {condition.op}")
+            if condition.op in ("in", "not_in"):
+                if not isinstance(condition.value, list):
+                    raise RuleSetError(f"Regla {rule.name}: {condition.op} requiere una lista de valores")
+                value = np.array([_encode_value(condition.source, v) for v in condition.value], dtype=np.float32)
+            else:
+                value = np.float32(_encode_value(condition.source, condition.value))
+            self.predicates.append((columns[condition.source], operator, value))
+
+        # Contadores acumulados
+        self.hits = 0
+        self.decided = 0
+        self.rows = 0
+        self.cost_ns = 0
+
+    def evaluate(self, matrix: np.ndarray, present: np.ndarray) -> np.ndarray:
+        """Devuelve la máscara de filas que cumplen todas las condiciones."""
+        start_ns = time.perf_counter_ns()
+        mask = np.ones(len(matrix), dtype=bool)
+        for column, operator, value in self.predicates:
+            mask &= present[:, column]
+            mask &= operator(matrix[:, column], value)
+        self.cost_ns += time.perf_counter_ns() - start_ns
+        self.rows += len(matrix)
+        self.hits += int(mask.sum())
+        return mask
+
+
+class RuleMatches:
+    """Resultado de evaluar las reglas sobre un lote."""
+
+    def __init__(self, rules: List[Rule], hits: np.ndarray, verdicts: np.ndarray):
+        """
+        Args:
+            rules: Reglas en el orden de las columnas de ``hits``
+            hits: Matriz booleana (n_filas, n_reglas)
+            verdicts: Índice de la regla que decide cada fila, o -1
+        """
+        self.rules = rules
+        self.hits = hits
+        self.verdicts = verdicts
+
+    def verdict(self, row: int) -> Optional[Rule]:
+        """Regla que decide la fila sin el modelo, o None."""
+        index = int(self.verdicts[row]) if len(self.verdicts) else -1
+        return self.rules[index] if index >= 0 else None
+
+    def indicators(self, row: int, record: ModelInput) -> List[str]:
+        """Textos de los indicadores de todas las reglas que cumple la fila."""
+        if not self.hits.shape[1]:
+            return []
+        fields = {
+            "source_ip": record.source_ip,
+            "destination_ip": record.destination_ip,
+            "source_port": record.source_port,
+            "destination_port": record.destination_port,
+            "protocol": record.protocol.value,
+            "payload_size": record.payload_size,
+        }
+        return [
+            self.rules[index].indicator.format_map(fields)
+            for index in np.flatnonzero(self.hits[row])
+        ]
+
+
+class RuleEngine:
+    """
+    Conjunto de reglas compilado sobre una matriz propia de características.
+
+    Las fuentes que usan las reglas se reúnen en una FeatureSpec interna y se
+    extraen una sola vez por lote con un FeatureExtractor; las fuentes ausentes
+    valen NaN y no cumplen ninguna condición. Cada regla se reduce a una máscara
+    booleana sobre esa matriz.
+    """
+
+    def __init__(self, rule_set: RuleSet, short_circuit: bool = True):
+        """
+        Args:
+            rule_set: Conjunto de reglas
+            short_circuit: Si los veredictos evitan la llamada al modelo; si es False
+                las reglas de veredicto solo aportan indicadores
+
+        Raises:
+            RuleSetError: Si alguna regla o fuente no es válida
+        """
+        names = [rule.name for rule in rule_set.rules]
+        duplicated = {name for name in names if names.count(name) > 1}
+        if duplicated:
+            raise RuleSetError(f"Nombres de regla repetidos: {', '.join(sorted(duplicated))}")
+
+        self.rule_set = rule_set
+        self.short_circuit = short_circuit
+
+        sources = list(dict.fromkeys(
+            condition.source for rule in rule_set.rules for condition in rule.conditions
+        ))
+        self._columns = {source: column for column, source in enumerate(sources)}
+        try:
+            self.extractor = FeatureExtractor(FeatureSpec(features=[
+                FeatureDefinition(
+                    name=source,
+                    source=source,
+                    default=float("nan"),
+                    encoding=PROTOCOL_ENCODING if source == "protocol" else None
+                )
+                for source in sources
+            ]))
+        except ValueError as e:
+            raise RuleSetError(str(e))
+
+        self._compiled = [_CompiledRule(rule, self._columns) for rule in rule_set.rules]
+        self._verdict_positions = np.array(
+            [position for position, rule in enumerate(rule_set.rules) if rule.action == "verdict"],
+            dtype=np.int64
+        )
+        self._batches = 0
+        self._extraction_ns = 0
+
+    @property
+    def context_sources(self) -> List[str]:
+        """Fuentes de contexto (``flow.*``) que usan las reglas."""
+        return self.extractor.context_sources
+
+    def evaluate(
+        self,
+        records: Union[Sequence[ModelInput], ColumnarBatch],
+        context: Optional[Dict[str, np.ndarray]] = None
+    ) -> RuleMatches:
+        """
+        Evalúa todas las reglas sobre un lote.
+
+        Args:
+            records: Lote de datos de entrada (registros o lote columnar)
+            context: Columnas precalculadas (agregados ``flow.*``)
+
+        Returns:
+            RuleMatches: Reglas cumplidas por fila y veredicto de cada fila
+        """
+        rules = self.rule_set.rules
+        hits = np.zeros((len(records), len(rules)), dtype=bool)
+        verdicts = np.full(len(records), -1, dtype=np.int64)
+        if not records or not rules:
+            return RuleMatches(rules, hits, verdicts)
+
+        start_ns = time.perf_counter_ns()
+        matrix = self.extractor.transform(records, context=context)
+        present = ~np.isnan(matrix)
+        self._extraction_ns += time.perf_counter_ns() - start_ns
+        self._batches += 1
+
+        for position, compiled in enumerate(self._compiled):
+            hits[:, position] = compiled.evaluate(matrix, present)
+
+        if self.short_circuit and len(self._verdict_positions):
+            verdict_hits = hits[:, self._verdict_positions]
+            decided = verdict_hits.any(axis=1)
+            first = self._verdict_positions[np.argmax(verdict_hits, axis=1)]
+            verdicts[decided] = first[decided]
+            for position, count in zip(*np.unique(first[decided], return_counts=True)):
+                self._compiled[position].decided += int(count)
+
+        return RuleMatches(rules, hits, verdicts)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Devuelve las métricas por regla.
+
+        Returns:
+            dict: Aciertos, filas decididas sin el modelo y costo de evaluación por regla
+        """
+        return {
+            "short_circuit": self.short_circuit,
+            "batches": self._batches,
+            "extraction_ms": self._extraction_ns / 1e6,
+            "rules": [
+                {
+                    "name": compiled.rule.name,
+                    "action": compiled.rule.action,
+                    "rows": compiled.rows,
+                    "hits": compiled.hits,
+                    "decided": compiled.decided,
+                    "cost_ms": compiled.cost_ns / 1e6,
+                    "avg_ns_per_row": compiled.cost_ns / compiled.rows if compiled.rows else 0.0
+                }
+                for compiled in self._compiled
+            ]
+        }
+
+
+def load_rule_set(path: Optional[str]) -> RuleSet:
+    """
+    Carga el conjunto de reglas desde un archivo JSON, o el predeterminado.
+
+    Args:
+        path: Ruta del archivo (``{"version": 1, "rules": [...]}``) o None
+
+    Returns:
+        RuleSet: Conjunto de reglas
+
+    Raises:
+        RuleSetError: Si el archivo no existe o no es válido
+    """
+    if not path:
+        return DEFAULT_RULE_SET
+    try:
+        with open(Path(path), encoding="utf-8") as handle:
+            return RuleSet.model_validate(json.load(handle))
+    except (OSError, ValueError) as e:
+        raise RuleSetError(f"No se pudo cargar el conjunto de reglas {path}: {str(e)}")
@@ -0,0 +1,270 @@
+"""
+Almacén de modelos compilados compartido entre los procesos worker de un host.
+El supervisor (``python -m app.supervisor``) carga y compila cada versión una sola
+vez y la publica como arreglos .npy; los workers la abren con memoria mapeada de
+solo lectura, por lo que todos comparten las mismas páginas físicas del modelo.
+"""
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from .features import FeatureSpec, spec_path_for
+from .inference import SklearnEngine, load_model_artifact
+from .tree_engine import CompiledForest
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+_CURRENT_FILE = "CURRENT"
+_MANIFEST_FILE = "manifest.json"
+_SPEC_FILE = "features.json"
+_FOREST_DIR = "forest"
+_ARTIFACT_STEM = "model"
+
+
+def _write_atomic(path: Path, content: str) -> None:
+    """Escribe un archivo pequeño de forma atómica (archivo temporal + rename)."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as handle:
+        handle.write(content)
+    os.replace(tmp, path)
+
+
+def process_memory() -> Dict[str, Optional[float]]:
+    """
+    Memoria del proceso actual en MB.
+
+    ``shared_mb`` incluye las páginas mapeadas de archivos (el modelo compartido),
+    que el sistema cuenta una sola vez aunque aparezcan en el RSS de cada worker.
+    """
+    try:
+        with open("/proc/self/statm", encoding="ascii") as handle:
+            _, resident, shared = (int(value) for value in handle.read().split()[:3])
+    except (OSError, ValueError):
+        return {"rss_mb": None, "shared_mb": None}
+    page_mb = os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    return {"rss_mb": round(resident * page_mb, 2), "shared_mb": round(shared * page_mb, 2)}
+
+
+class SharedModelStore:
+    """
+    Versiones publicadas del modelo principal y versión activa, en un directorio.
+
+    Estructura::
+
+        <root>/CURRENT                    versión activa
+        <root>/versions/<versión>/        manifest.json, features.json y forest/*.npy
+                                          (o model.<ext>, copia del artefacto no compilable)
+        <root>/workers/<pid>.json         latido de cada worker
+
+    La publicación escribe en un directorio temporal y lo renombra, y ``CURRENT`` se
+    reemplaza de forma atómica, por lo que un worker nunca ve una versión a medias.
+    Los modelos que no pueden compilarse se publican con una copia del artefacto,
+    que cada worker abre con ``joblib`` en modo mmap; así una versión publicada no
+    cambia aunque se sobrescriba ``MODEL_PATH``.
+    """
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+        self._versions_dir = self.root / "versions"
+        self._workers_dir = self.root / "workers"
+        self._versions_dir.mkdir(parents=True, exist_ok=True)
+        self._workers_dir.mkdir(parents=True, exist_ok=True)
+
+    # ---------- Versiones ----------
+
+    def clear(self) -> None:
+        """Elimina las versiones, la versión activa y los latidos (al iniciar el supervisor)."""
+        shutil.rmtree(self._versions_dir, ignore_errors=True)
+        shutil.rmtree(self._workers_dir, ignore_errors=True)
+        try:
+            (self.root / _CURRENT_FILE).unlink()
+        except FileNotFoundError:
+            pass
+        self._versions_dir.mkdir(parents=True, exist_ok=True)
+        self._workers_dir.mkdir(parents=True, exist_ok=True)
+
+    def publish(
+        self,
+        version: str,
+        engine: Any,
+        spec: FeatureSpec,
+        name: str,
+        source: Optional[str],
+        updated_at: datetime
+    ) -> Path:
+        """
+        Publica una versión del modelo.
+
+        Args:
+            version: Identificador de la versión
+            engine: Motor construido con ``build_engine``
+            spec: Especificación de características del modelo
+            name: Nombre de la etapa (nombre del artefacto)
+            source: Ruta del artefacto original
+            updated_at: Fecha de modificación del artefacto
+
+        Returns:
+            Path: Directorio de la versión publicada
+
+        Raises:
+            ValueError: Si la versión ya existe o el motor no es compilado y no hay artefacto
+        """
+        target = self._versions_dir / version
+        if target.exists():
+            raise ValueError(f"La versión {version} ya está publicada")
+        if not isinstance(engine, CompiledForest) and source is None:
+            raise ValueError("Un modelo no compilado solo puede publicarse con la ruta de su artefacto")
+
+        tmp = self._versions_dir / f".{version}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        artifact = None
+        try:
+            if isinstance(engine, CompiledForest):
+                engine.save(tmp / _FOREST_DIR)
+            else:
+                # Copia propia: MODEL_PATH puede sobrescribirse mientras la versión siga publicada
+                artifact = _ARTIFACT_STEM + Path(source).suffix
+                shutil.copy2(source, tmp / artifact)
+                copied_at = datetime.fromtimestamp((tmp / artifact).stat().st_mtime, tz=updated_at.tzinfo)
+                if copied_at != updated_at:
+                    raise ValueError(f"El artefacto {source} cambió durante la publicación de la versión {version}")
+                with open(spec_path_for(tmp / artifact), "w", encoding="utf-8") as handle:
+                    handle.write(spec.model_dump_json())
+            with open(tmp / _SPEC_FILE, "w", encoding="utf-8") as handle:
+                handle.write(spec.model_dump_json())
+            with open(tmp / _MANIFEST_FILE, "w", encoding="utf-8") as handle:
+                json.dump({
+                    "version": version,
+                    "name": name,
+                    "engine": engine.kind,
+                    "source": source,
+                    "artifact": artifact,
+                    "updated_at": updated_at.isoformat(),
+                    "published_at": time.time()
+                }, handle)
+            os.rename(tmp, target)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        logger.info(f"Versión {version} publicada en {target} (motor {engine.kind})")
+        return target
+
+    def activate(self, version: str) -> None:
+        """
+        Marca una versión publicada como activa para todos los workers.
+
+        Raises:
+            KeyError: Si la versión no está publicada
+        """
+        if not (self._versions_dir / version / _MANIFEST_FILE).exists():
+            raise KeyError(version)
+        _write_atomic(self.root / _CURRENT_FILE, version)
+
+    def current(self) -> Optional[str]:
+        """Versión activa, o None si aún no se publicó ninguna."""
+        try:
+            return (self.root / _CURRENT_FILE).read_text(encoding="utf-8").strip() or None
+        except OSError:
+            return None
+
+    def versions(self) -> List[str]:
+        """Versiones publicadas, de la más antigua a la más reciente."""
+        manifests = [path / _MANIFEST_FILE for path in self._versions_dir.iterdir() if not path.name.startswith(".")]
+        manifests = [manifest for manifest in manifests if manifest.exists()]
+        return [manifest.parent.name for manifest in sorted(manifests, key=lambda manifest: manifest.stat().st_mtime)]
+
+    def has_version(self, version: str) -> bool:
+        """Indica si una versión está publicada."""
+        return (self._versions_dir / version / _MANIFEST_FILE).exists()
+
+    def attach(self, version: str) -> Tuple[Any, FeatureSpec, Dict[str, Any]]:
+        """
+        Abre una versión publicada sin copiar sus arreglos.
+
+        Returns:
+            tuple: (motor, especificación, manifiesto)
+
+        Raises:
+            KeyError: Si la versión no está publicada
+        """
+        directory = self._versions_dir / version
+        try:
+            with open(directory / _MANIFEST_FILE, encoding="utf-8") as handle:
+                manifest = json.load(handle)
+        except FileNotFoundError:
+            raise KeyError(version)
+        with open(directory / _SPEC_FILE, encoding="utf-8") as handle:
+            spec = FeatureSpec.model_validate_json(handle.read())
+
+        if manifest["engine"] == CompiledForest.kind:
+            engine = CompiledForest.load(directory / _FOREST_DIR, mmap_mode="r")
+        else:
+            # Las versiones publicadas antes de guardar la copia solo tienen la ruta original
+            artifact = directory / manifest["artifact"] if manifest.get("artifact") else Path(manifest["source"])
+            model, _ = load_model_artifact(artifact, mmap=True)
+            engine = SklearnEngine(model)
+        return engine, spec, manifest
+
+    def prune(self, keep: int) -> List[str]:
+        """
+        Elimina las versiones más antiguas, conservando ``keep`` y siempre la activa.
+
+        Los workers que aún tengan mapeada una versión eliminada pueden seguir
+        usándola: el sistema libera las páginas cuando se cierra el último mapeo.
+
+        Returns:
+            list: Versiones eliminadas
+        """
+        current = self.current()
+        versions = self.versions()
+        removed = []
+        for version in versions[:max(len(versions) - keep, 0)]:
+            if version == current:
+                continue
+            shutil.rmtree(self._versions_dir / version, ignore_errors=True)
+            removed.append(version)
+        if removed:
+            logger.info(f"Versiones retiradas del almacén compartido: {', '.join(removed)}")
+        return removed
+
+    # ---------- Latidos de los workers ----------
+
+    def write_heartbeat(self, pid: int, status: Dict[str, Any]) -> None:
+        """Publica el estado de un worker."""
+        _write_atomic(self._workers_dir / f"{pid}.json", json.dumps({**status, "pid": pid, "updated_at": time.time()}))
+
+    def remove_heartbeat(self, pid: int) -> None:
+        """Elimina el latido de un worker terminado."""
+        try:
+            (self._workers_dir / f"{pid}.json").unlink()
+        except FileNotFoundError:
+            pass
+
+    def heartbeats(self, stale_after: float) -> List[Dict[str, Any]]:
+        """
+        Estado reportado por cada worker.
+
+        Args:
+            stale_after: Segundos sin latido tras los que un worker se marca ``stale``
+
+        Returns:
+            list: Latidos ordenados por pid, con ``age_seconds`` y ``stale``
+        """
+        now = time.time()
+        workers = []
+        for path in self._workers_dir.glob("*.json"):
+            try:
+                with open(path, encoding="utf-8") as handle:
+                    status = json.load(handle)
+            except (OSError, ValueError):
+                continue
+            age = now - status.get("updated_at", 0.0)
+            workers.append({**status, "age_seconds": round(age, 2), "stale": age > stale_after})
+        return sorted(workers, key=lambda status: status["pid"])
@@ -0,0 +1,371 @@
+"""
+Estructuras probabilísticas para agregación de tráfico con memoria fija.
+Count-Min Sketch para los orígenes más activos (top-K) y HyperLogLog para contar
+puertos de destino distintos por origen. Todas las estructuras son combinables,
+de modo que los resultados de varios workers pueden sumarse.
+"""
+import hashlib
+import logging
+import math
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+_MASK64 = (1 << 64) - 1
+
+
+def hash_key(key: str) -> tuple[int, int]:
+    """
+    Hash determinista de 128 bits de una clave, dividido en dos enteros de 64 bits.
+
+    Se usa blake2b en lugar de ``hash()`` para que los sketches de distintos procesos
+    sean combinables.
+    """
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+
+def mix64(value: int) -> int:
+    """Mezclador splitmix64 para obtener un hash de 64 bits de un entero (p. ej. un puerto)."""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+class CountMinSketch:
+    """
+    Count-Min Sketch con ``depth`` filas de ``width`` contadores.
+
+    Las estimaciones nunca subestiman; con probabilidad ``1 - delta`` sobreestiman
+    como máximo ``epsilon * total``, con ``epsilon = e / width`` y ``delta = e^-depth``.
+    """
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+        self._rows = np.arange(depth, dtype=np.uint64)[:, None]
+
+    @property
+    def epsilon(self) -> float:
+        """Error relativo máximo respecto del total."""
+        return math.e / self.width
+
+    @property
+    def delta(self) -> float:
+        """Probabilidad de superar el error máximo."""
+        return math.exp(-self.depth)
+
+    def _columns(self, h1: np.ndarray, h2: np.ndarray) -> np.ndarray:
+        """Columnas de cada fila para cada clave (doble hashing), forma (depth, n)."""
+        with np.errstate(over="ignore"):
+            return ((h1[None, :] + self._rows * h2[None, :]) % np.uint64(self.width)).astype(np.intp)
+
+    def add(self, h1: np.ndarray, h2: np.ndarray, counts: Optional[np.ndarray] = None) -> None:
+        """
+        Suma ocurrencias de un conjunto de claves ya hasheadas.
+
+        Args:
+            h1: Primera mitad del hash de cada clave (uint64)
+            h2: Segunda mitad del hash de cada clave (uint64)
+            counts: Ocurrencias por clave (por defecto 1)
+        """
+        if counts is None:
+            counts = np.ones(len(h1), dtype=np.int64)
+        columns = self._columns(h1, h2)
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], counts)
+        self.total += int(counts.sum())
+
+    def estimate(self, h1: np.ndarray, h2: np.ndarray) -> np.ndarray:
+        """Estimación (cota superior) de ocurrencias de cada clave."""
+        columns = self._columns(h1, h2)
+        return self.table[np.arange(self.depth)[:, None], columns].min(axis=0)
+
+    def merge(self, other: "CountMinSketch") -> None:
+        """Combina otro sketch de las mismas dimensiones en este."""
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Solo se pueden combinar sketches de las mismas dimensiones")
+        self.table += other.table
+        self.total += other.total
+
+    def copy(self) -> "CountMinSketch":
+        """Copia independiente del sketch."""
+        clone = CountMinSketch(self.width, self.depth)
+        clone.table[:] = self.table
+        clone.total = self.total
+        return clone
+
+
+class HyperLogLog:
+    """HyperLogLog con ``2**precision`` registros de un byte."""
+
+    def __init__(self, precision: int = 10):
+        if not 4 <= precision <= 16:
+            raise ValueError("La precisión de HyperLogLog debe estar entre 4 y 16")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+        self._shift = 64 - precision
+        self._mask = (1 << self._shift) - 1
+
+    @property
+    def relative_error(self) -> float:
+        """Error estándar relativo de la estimación."""
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add_hash(self, value: int) -> None:
+        """Registra un elemento a partir de su hash de 64 bits."""
+        index = value >> self._shift
+        rank = self._shift - (value & self._mask).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> float:
+        """Estimación del número de elementos distintos."""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.ldexp(1.0, -self.registers.astype(np.int64)).sum()
+        zeros = int((self.registers == 0).sum())
+        if estimate <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)  # Corrección para cardinalidades pequeñas
+        return float(estimate)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        """Combina otro HyperLogLog de la misma precisión en este."""
+        if self.precision != other.precision:
+            raise ValueError("Solo se pueden combinar HyperLogLog de la misma precisión")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def copy(self) -> "HyperLogLog":
+        """Copia independiente del HyperLogLog."""
+        clone = HyperLogLog(self.precision)
+        clone.registers[:] = self.registers
+        return clone
+
+
+class _Epoch:
+    """Sketches de un intervalo de tiempo fijo."""
+    __slots__ = ("start", "cms", "candidates", "ports", "min_candidate")
+
+    def __init__(self, start: float, width: int, depth: int):
+        self.start = start
+        self.cms = CountMinSketch(width, depth)
+        self.candidates: Dict[str, int] = {}   # Origen -> conteo estimado
+        self.ports: Dict[str, HyperLogLog] = {}
+        self.min_candidate = 0
+
+
+class TopSourcesTracker:
+    """
+    Orígenes más activos y sus puertos de destino distintos por ventana de tiempo.
+
+    El tiempo se divide en épocas de ``epoch_seconds``; cada época tiene su propio
+    Count-Min Sketch, un conjunto acotado de candidatos a heavy hitter y un
+    HyperLogLog de puertos por candidato. Una consulta combina las épocas que cubren
+    la ventana pedida, por lo que la memoria no depende del volumen de tráfico.
+    Los puertos de un origen se cuentan desde que entra en el conjunto de candidatos.
+    """
+
+    def __init__(
+        self,
+        epoch_seconds: float = 60.0,
+        n_epochs: int = 60,
+        width: int = 2048,
+        depth: int = 4,
+        capacity: int = 100,
+        hll_precision: int = 10
+    ):
+        """
+        Args:
+            epoch_seconds: Duración de cada época
+            n_epochs: Número de épocas retenidas (ventana máxima = epoch_seconds * n_epochs)
+            width: Contadores por fila del Count-Min Sketch
+            depth: Filas del Count-Min Sketch
+            capacity: Candidatos a heavy hitter retenidos por época
+            hll_precision: Precisión de los HyperLogLog de puertos
+        """
+        self.epoch_seconds = epoch_seconds
+        self.n_epochs = max(n_epochs, 1)
+        self.width = width
+        self.depth = depth
+        self.capacity = max(capacity, 1)
+        self.hll_precision = hll_precision
+        self._epochs: List[_Epoch] = []
+
+    @property
+    def max_window_seconds(self) -> float:
+        """Ventana máxima que puede consultarse."""
+        return self.epoch_seconds * self.n_epochs
+
+    def _current_epoch(self, now: float) -> _Epoch:
+        """Devuelve la época activa, creando una nueva y descartando las viejas si hace falta."""
+        start = now - (now % self.epoch_seconds)
+        if not self._epochs or self._epochs[-1].start < start:
+            self._epochs.append(_Epoch(start, self.width, self.depth))
+            if len(self._epochs) > self.n_epochs:
+                del self._epochs[:-self.n_epochs]
+        return self._epochs[-1]
+
+    def observe(self, source_ips: Sequence[str], destination_ports: Sequence[int], now: Optional[float] = None) -> None:
+        """
+        Registra un lote de conexiones.
+
+        Args:
+            source_ips: IP de origen de cada conexión
+            destination_ports: Puerto de destino de cada conexión
+            now: Marca de tiempo (por defecto, la actual)
+        """
+        if not source_ips:
+            return
+        epoch = self._current_epoch(time.time() if now is None else now)
+
+        # Agregar el lote por origen antes de tocar el sketch
+        ports_by_source: Dict[str, List[int]] = {}
+        for source_ip, port in zip(source_ips, destination_ports):
+            ports_by_source.setdefault(source_ip, []).append(port)
+
+        keys = list(ports_by_source)
+        hashes = [hash_key(key) for key in keys]
+        h1 = np.fromiter((h[0] for h in hashes), dtype=np.uint64, count=len(keys))
+        h2 = np.fromiter((h[1] for h in hashes), dtype=np.uint64, count=len(keys))
+        counts = np.fromiter((len(ports_by_source[key]) for key in keys), dtype=np.int64, count=len(keys))
+        epoch.cms.add(h1, h2, counts)
+        estimates = epoch.cms.estimate(h1, h2)
+
+        for key, estimate in zip(keys, estimates.tolist()):
+            if self._offer(epoch, key, estimate):
+                hll = epoch.ports.get(key)
+                if hll is None:
+                    hll = epoch.ports[key] = HyperLogLog(self.hll_precision)
+                for port in ports_by_source[key]:
+                    hll.add_hash(mix64(port))
+
+    def _offer(self, epoch: _Epoch, key: str, estimate: int) -> bool:
+        """Actualiza el conjunto de candidatos; devuelve True si la clave es candidata."""
+        candidates = epoch.candidates
+        if key in candidates:
+            candidates[key] = estimate
+            return True
+        if len(candidates) < self.capacity:
+            candidates[key] = estimate
+            epoch.min_candidate = min(epoch.min_candidate, estimate) if len(candidates) > 1 else estimate
+            return True
+        if estimate <= epoch.min_candidate:
+            return False
+
+        # El mínimo en caché puede estar desactualizado: se recalcula antes de expulsar
+        weakest = min(candidates, key=candidates.__getitem__)
+        if candidates[weakest] >= estimate:
+            epoch.min_candidate = candidates[weakest]
+            return False
+        del candidates[weakest]
+        epoch.ports.pop(weakest, None)
+        candidates[key] = estimate
+        epoch.min_candidate = min(candidates.values())
+        return True
+
+    def merge(self, other: "TopSourcesTracker") -> None:
+        """
+        Combina las épocas de otro tracker (p. ej. de otro worker) en este.
+
+        Las épocas se alinean por su marca de inicio; ambos trackers deben usar las
+        mismas dimensiones y duración de época.
+        """
+        if (self.epoch_seconds, self.width, self.depth, self.hll_precision) != (
+            other.epoch_seconds, other.width, other.depth, other.hll_precision
+        ):
+            raise ValueError("Solo se pueden combinar trackers con la misma configuración")
+
+        by_start = {epoch.start: epoch for epoch in self._epochs}
+        for theirs in other._epochs:
+            mine = by_start.get(theirs.start)
+            if mine is None:
+                mine = by_start[theirs.start] = _Epoch(theirs.start, self.width, self.depth)
+            mine.cms.merge(theirs.cms)
+            for key, hll in theirs.ports.items():
+                if key in mine.ports:
+                    mine.ports[key].merge(hll)
+                else:
+                    mine.ports[key] = hll.copy()
+            keys = list(set(mine.candidates) | set(theirs.candidates))
+            if keys:
+                hashes = [hash_key(key) for key in keys]
+                estimates = mine.cms.estimate(
+                    np.array([h[0] for h in hashes], dtype=np.uint64),
+                    np.array([h[1] for h in hashes], dtype=np.uint64)
+                ).tolist()
+                ranked = sorted(zip(keys, estimates), key=lambda item: item[1], reverse=True)[:self.capacity]
+                mine.candidates = dict(ranked)
+                mine.ports = {key: hll for key, hll in mine.ports.items() if key in mine.candidates}
+                mine.min_candidate = min(mine.candidates.values())
+
+        self._epochs = sorted(by_start.values(), key=lambda epoch: epoch.start)[-self.n_epochs:]
+
+    def top(self, k: int = 10, window_seconds: Optional[float] = None, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Devuelve los ``k`` orígenes más activos de la ventana indicada.
+
+        Args:
+            k: Número de orígenes a devolver
+            window_seconds: Ventana a consultar (por defecto, la máxima)
+            now: Marca de tiempo de referencia (por defecto, la actual)
+
+        Returns:
+            dict: Total de conexiones, cota de error y lista de orígenes con su conteo
+            estimado, su cota inferior y sus puertos distintos estimados
+        """
+        now = time.time() if now is None else now
+        window = min(window_seconds or self.max_window_seconds, self.max_window_seconds)
+        first_start = now - window - self.epoch_seconds
+        epochs = [epoch for epoch in self._epochs if epoch.start > first_start]
+
+        cms = CountMinSketch(self.width, self.depth)
+        ports: Dict[str, HyperLogLog] = {}
+        for epoch in epochs:
+            cms.merge(epoch.cms)
+            for key, hll in epoch.ports.items():
+                if key in ports:
+                    ports[key].merge(hll)
+                else:
+                    ports[key] = hll.copy()
+
+        keys = list({key for epoch in epochs for key in epoch.candidates})
+        error_bound = int(math.ceil(cms.epsilon * cms.total))
+        sources = []
+        if keys:
+            hashes = [hash_key(key) for key in keys]
+            estimates = cms.estimate(
+                np.array([h[0] for h in hashes], dtype=np.uint64),
+                np.array([h[1] for h in hashes], dtype=np.uint64)
+            ).tolist()
+            for key, count in sorted(zip(keys, estimates), key=lambda item: item[1], reverse=True)[:k]:
+                hll = ports.get(key)
+                sources.append({
+                    "source_ip": key,
+                    "count": int(count),
+                    "count_lower_bound": max(int(count) - error_bound, 0),
+                    "distinct_ports": round(hll.count()) if hll is not None else None,
+                    "distinct_ports_relative_error": hll.relative_error if hll is not None else None
+                })
+
+        return {
+            "window_seconds": window,
+            "epoch_seconds": self.epoch_seconds,
+            "total": cms.total,
+            "error_bound": error_bound,
+            "error_probability": cms.delta,
+            "sources": sources
+        }
+
+    def memory_bytes(self) -> int:
+        """Memoria aproximada de los arreglos de los sketches."""
+        return sum(
+            epoch.cms.table.nbytes + sum(hll.registers.nbytes for hll in epoch.ports.values())
+            for epoch in self._epochs
+        )
@@ -0,0 +1,138 @@
+"""
+Utilidades para la ingesta en streaming de registros NDJSON.
+Dividen el cuerpo de la solicitud en líneas a medida que llega y lo agrupan en
+micro-lotes, con memoria acotada y contrapresión hacia el cliente.
+"""
+import asyncio
+import logging
+from typing import AsyncIterator, List, TypeVar, Union
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Marca de fin de la secuencia de entrada en la cola del lector
+_END = object()
+
+
+class LineTooLongError(ValueError):
+    """Una línea NDJSON supera el tamaño máximo permitido."""
+
+
+async def iter_ndjson_lines(
+    chunks: AsyncIterator[bytes],
+    max_line_bytes: int
+) -> AsyncIterator[Union[bytes, LineTooLongError]]:
+    """
+    Divide un cuerpo recibido por fragmentos en líneas, sin acumularlo completo.
+
+    Una línea que supera ``max_line_bytes`` se descarta hasta el siguiente salto de
+    línea y se entrega como ``LineTooLongError``, de modo que el buffer nunca crece
+    más allá de ese límite.
+
+    Args:
+        chunks: Fragmentos del cuerpo (p. ej. ``request.stream()``)
+        max_line_bytes: Tamaño máximo de una línea
+
+    Yields:
+        bytes o LineTooLongError: Cada línea sin el salto de línea final
+    """
+    buffer = bytearray()
+    discarding = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end < 0:
+                if not discarding:
+                    buffer += chunk[start:]
+                    if len(buffer) > max_line_bytes:
+                        buffer.clear()
+                        discarding = True
+                break
+            if discarding:
+                discarding = False
+                yield LineTooLongError(f"La línea supera el máximo de {max_line_bytes} bytes")
+            elif len(buffer) + end - start > max_line_bytes:
+                buffer.clear()
+                yield LineTooLongError(f"La línea supera el máximo de {max_line_bytes} bytes")
+            else:
+                buffer += chunk[start:end]
+                yield bytes(buffer)
+                buffer.clear()
+            start = end + 1
+    if discarding:
+        yield LineTooLongError(f"La línea supera el máximo de {max_line_bytes} bytes")
+    elif buffer:
+        yield bytes(buffer)
+
+
+async def stream_micro_batches(
+    items: AsyncIterator[T],
+    batch_size: int,
+    window_ms: float,
+    max_pending: int
+) -> AsyncIterator[List[T]]:
+    """
+    Agrupa una secuencia asíncrona en micro-lotes mientras sigue leyéndola.
+
+    Un lector en segundo plano consume ``items`` y los deja en una cola acotada a
+    ``max_pending`` elementos; el lote se entrega al reunir ``batch_size`` elementos
+    o cuando pasan ``window_ms`` desde su primer elemento. Mientras quien consume
+    los lotes procesa uno, el lector adelanta la lectura del siguiente; si la cola
+    se llena, el lector deja de consumir ``items`` y la contrapresión llega al origen.
+
+    Args:
+        items: Secuencia de entrada
+        batch_size: Tamaño máximo de un lote
+        window_ms: Espera máxima para completar un lote iniciado
+        max_pending: Elementos leídos por adelantado como máximo
+
+    Yields:
+        list: Lotes en el orden de entrada
+
+    Raises:
+        Exception: La excepción del lector, tras entregar los lotes ya leídos
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(max_pending, batch_size))
+    failure: List[BaseException] = []
+
+    async def pump() -> None:
+        try:
+            async for item in items:
+                await queue.put(item)
+        except asyncio.CancelledError:
+            aclose = getattr(items, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            raise
+        except Exception as e:
+            failure.append(e)
+        await queue.put(_END)
+
+    reader = asyncio.create_task(pump())
+    loop = asyncio.get_running_loop()
+    try:
+        finished = False
+        while not finished:
+            item = await queue.get()
+            if item is _END:
+                break
+            batch = [item]
+            deadline = loop.time() + window_ms / 1000.0
+            while len(batch) < batch_size:
+                remaining = deadline - loop.time()
+                try:
+                    item = queue.get_nowait() if remaining <= 0 else await asyncio.wait_for(queue.get(), remaining)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if item is _END:
+                    finished = True
+                    break
+                batch.append(item)
+            yield batch
+        if failure:
+            raise failure[0]
+    finally:
+        reader.cancel()
@@ -0,0 +1,249 @@
+"""
+Trazas por solicitud: desglose de tiempos por etapa de una muestra de solicitudes.
+
+Una solicitud muestreada lleva un ``Trace`` en una ContextVar y las etapas medidas
+para las métricas (``red_sentinel_stage_duration_seconds``) se agregan también al
+trace activo. Con la muestra en 0 no se crea ningún trace: cada etapa solo paga la
+lectura de la ContextVar. Los spans se escriben en NDJSON desde un hilo propio, de
+modo que el disco nunca bloquea el event loop; si la cola se llena se descartan.
+"""
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from ..core.config import settings
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Spans individuales guardados por trace; el resto solo suma en los totales
+MAX_SPANS_PER_TRACE = 256
+
+
+class Trace:
+    """Tiempos por etapa de una solicitud."""
+
+    __slots__ = ("trace_id", "started_ns", "started_at", "spans", "totals", "dropped_spans")
+
+    def __init__(self):
+        self.trace_id = uuid4().hex[:16]
+        self.started_ns = time.perf_counter_ns()
+        self.started_at = datetime.now(timezone.utc)
+        self.spans: List[Tuple[str, int, int]] = []
+        self.totals: Dict[str, List[int]] = {}
+        self.dropped_spans = 0
+
+    def add(self, stage: str, elapsed_ns: int, ended_ns: Optional[int] = None) -> None:
+        """
+        Agrega una etapa que terminó en ``ended_ns`` (por defecto, ahora).
+
+        Args:
+            stage: Nombre de la etapa
+            elapsed_ns: Duración en nanosegundos
+            ended_ns: Fin de la etapa según ``time.perf_counter_ns``
+        """
+        if ended_ns is None:
+            ended_ns = time.perf_counter_ns()
+        total = self.totals.get(stage)
+        if total is None:
+            self.totals[stage] = [elapsed_ns, 1]
+        else:
+            total[0] += elapsed_ns
+            total[1] += 1
+        if len(self.spans) < MAX_SPANS_PER_TRACE:
+            self.spans.append((stage, ended_ns - elapsed_ns - self.started_ns, elapsed_ns))
+        else:
+            self.dropped_spans += 1
+
+    def server_timing(self) -> str:
+        """
+        Valor del header ``Server-Timing`` con los tiempos acumulados hasta ahora.
+
+        Las etapas que se repiten (bloques de un lote, explicaciones por registro)
+        se informan sumadas; ``total`` es el tiempo transcurrido desde el inicio.
+        """
+        elapsed_ms = (time.perf_counter_ns() - self.started_ns) / 1e6
+        entries = [f"{stage};dur={total[0] / 1e6:.3f}" for stage, total in self.totals.items()]
+        entries.append(f"total;dur={elapsed_ms:.3f}")
+        return ", ".join(entries)
+
+    def to_dict(self, **attributes: Any) -> Dict[str, Any]:
+        """
+        Registro del trace terminado.
+
+        Args:
+            **attributes: Datos de la solicitud (ruta, método, código de estado)
+
+        Returns:
+            dict: Identificador, inicio, duración, totales por etapa y spans
+        """
+        return {
+            "trace_id": self.trace_id,
+            "timestamp": self.started_at.isoformat(),
+            **attributes,
+            "duration_ms": round((time.perf_counter_ns() - self.started_ns) / 1e6, 3),
+            "stages": {
+                stage: {"total_ms": round(total[0] / 1e6, 3), "count": total[1]}
+                for stage, total in self.totals.items()
+            },
+            "spans": [
+                {"stage": stage, "start_ms": round(start_ns / 1e6, 3), "duration_ms": round(elapsed_ns / 1e6, 3)}
+                for stage, start_ns, elapsed_ns in self.spans
+            ],
+            "dropped_spans": self.dropped_spans
+        }
+
+
+# Trace de la solicitud en curso (None si no fue muestreada)
+current_trace: ContextVar[Optional[Trace]] = ContextVar("red_sentinel_trace", default=None)
+
+
+def record_since_start(stage: str) -> None:
+    """Agrega al trace activo una etapa que va desde el inicio de la solicitud hasta ahora."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(stage, time.perf_counter_ns() - trace.started_ns)
+
+
+def record_batched_row(timing: Dict[str, Any]) -> None:
+    """
+    Agrega al trace activo los tiempos de una fila resuelta por el micro-batcher.
+
+    El lote corre fuera del contexto de la solicitud, así que las etapas se
+    reconstruyen hacia atrás desde ahora a partir de los tiempos devueltos.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        return
+    ended_ns = time.perf_counter_ns()
+    for stage, key in (("inference", "execution_ms"), ("queue_wait", "queue_wait_ms"), ("batch_wait", "batch_wait_ms")):
+        elapsed_ns = int(timing.get(key, 0.0) * 1e6)
+        trace.add(stage, elapsed_ns, ended_ns)
+        ended_ns -= elapsed_ns
+
+
+class _SpanWriter:
+    """Hilo que escribe los traces terminados en un archivo NDJSON."""
+
+    def __init__(self, path: str, queue_size: int):
+        self.path = path
+        self.written = 0
+        self.dropped = 0
+        self.error: Optional[str] = None
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=max(queue_size, 1))
+        self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, record: Dict[str, Any]) -> None:
+        """Encola un trace sin bloquear; si la cola está llena se descarta."""
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        try:
+            with open(self.path, "a", encoding="utf-8") as output:
+                while True:
+                    record = self._queue.get()
+                    if record is None:
+                        break
+                    output.write(json.dumps(record) + "\n")
+                    self.written += 1
+                    if self._queue.empty():
+                        output.flush()
+        except OSError as e:
+            self.error = str(e)
+            logger.error(f"No se pudo escribir el archivo de trazas {self.path}: {str(e)}")
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Escribe los traces pendientes y detiene el hilo."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+
+class Tracer:
+    """
+    Decide qué solicitudes se trazan y entrega los traces terminados al archivo.
+
+    La tasa de muestreo puede cambiarse en caliente (``POST /api/v1/admin/tracing``).
+    """
+
+    def __init__(self, sample_rate: float = 0.0, spans_path: Optional[str] = None, queue_size: int = 10000):
+        """
+        Args:
+            sample_rate: Fracción de solicitudes trazadas (0 desactiva)
+            spans_path: Archivo NDJSON de spans (None: solo el header Server-Timing)
+            queue_size: Traces en espera de escritura antes de descartar
+        """
+        self.sample_rate = 0.0
+        self.set_sample_rate(sample_rate)
+        self.spans_path = spans_path
+        self.queue_size = queue_size
+        self.traced = 0
+        self._writer: Optional[_SpanWriter] = None
+
+    def set_sample_rate(self, sample_rate: float) -> None:
+        """
+        Cambia la fracción de solicitudes trazadas.
+
+        Raises:
+            ValueError: Si la tasa no está entre 0 y 1
+        """
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("La tasa de muestreo debe estar entre 0 y 1")
+        self.sample_rate = float(sample_rate)
+
+    def start(self) -> Optional[Trace]:
+        """Devuelve un trace nuevo si la solicitud entra en la muestra, o None."""
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+        self.traced += 1
+        return Trace()
+
+    def finish(self, trace: Trace, **attributes: Any) -> None:
+        """Entrega un trace terminado al archivo de spans, si está configurado."""
+        if self.spans_path is None:
+            return
+        if self._writer is None:
+            self._writer = _SpanWriter(self.spans_path, self.queue_size)
+        self._writer.put(trace.to_dict(**attributes))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Estado del muestreo y del archivo de spans.
+
+        Returns:
+            dict: Tasa, traces creados y escritos/descartados en el archivo
+        """
+        writer = self._writer
+        return {
+            "sample_rate": self.sample_rate,
+            "spans_path": self.spans_path,
+            "traced": self.traced,
+            "written": writer.written if writer is not None else 0,
+            "dropped": writer.dropped if writer is not None else 0,
+            "writer_error": writer.error if writer is not None else None
+        }
+
+    def close(self) -> None:
+        """Vacía la cola de spans y detiene el hilo de escritura."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+# Trazador del proceso
+tracer = Tracer(
+    sample_rate=settings.TRACE_SAMPLE_RATE,
+    spans_path=settings.TRACE_SPANS_PATH,
+    queue_size=settings.TRACE_QUEUE_SIZE
+)
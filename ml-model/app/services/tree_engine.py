@@ -0,0 +1,276 @@
+"""
+Motor de inferencia compilado para ensambles de árboles.
+Aplana los árboles de un bosque entrenado con scikit-learn en arreglos contiguos de
+NumPy y resuelve predicción y confianza con un único recorrido vectorizado.
+"""
+import json
+import logging
+from pathlib import Path
+from typing import Any, Optional, Union
+
+import numpy as np
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Valor que scikit-learn usa para marcar hojas en ``tree_.children_left``
+_TREE_LEAF = -1
+
+# Arreglos que se guardan como .npy al serializar un bosque compilado
+_FOREST_ARRAYS = ("feature", "threshold", "left", "right", "value", "roots", "classes_")
+_FOREST_META = "forest.json"
+
+
+class UnsupportedModelError(ValueError):
+    """El estimador no puede compilarse al motor de árboles."""
+
+
+class CompiledForest:
+    """
+    Bosque de árboles de clasificación compilado en arreglos planos.
+
+    Los nodos de todos los árboles se concatenan en arreglos contiguos
+    (característica, umbral, hijo izquierdo, hijo derecho y valores de hoja). Las
+    hojas apuntan a sí mismas, de modo que el recorrido avanza todos los árboles a
+    la vez durante ``max_depth`` pasos sin ramas por fila.
+    """
+
+    kind = "compiled"
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        classes: np.ndarray,
+        n_features: int,
+        max_depth: int
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.n_features = n_features
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_estimator(cls, model: Any) -> "CompiledForest":
+        """
+        Compila un RandomForestClassifier, ExtraTreesClassifier o DecisionTreeClassifier.
+
+        Args:
+            model: Estimador de clasificación ya entrenado
+
+        Returns:
+            CompiledForest: Bosque compilado equivalente
+
+        Raises:
+            UnsupportedModelError: Si el estimador no es un ensamble de árboles soportado
+        """
+        if hasattr(model, "tree_"):
+            trees = [model]
+        elif hasattr(model, "estimators_") and all(hasattr(est, "tree_") for est in np.ravel(model.estimators_)):
+            trees = list(np.ravel(model.estimators_))
+        else:
+            raise UnsupportedModelError(f"Estimador no soportado: {type(model).__name__}")
+
+        if not hasattr(model, "classes_") or getattr(model, "n_outputs_", 1) != 1:
+            raise UnsupportedModelError("Solo se soportan clasificadores de una salida")
+        if any(tree.tree_.n_outputs != 1 or tree.tree_.value.shape[2] != len(model.classes_) for tree in trees):
+            raise UnsupportedModelError("Los árboles no comparten las clases del ensamble")
+
+        n_nodes = [tree.tree_.node_count for tree in trees]
+        offsets = np.concatenate(([0], np.cumsum(n_nodes)[:-1])).astype(np.int64)
+
+        features, thresholds, lefts, rights, values = [], [], [], [], []
+        for tree, offset in zip(trees, offsets):
+            t = tree.tree_
+            node_ids = np.arange(t.node_count, dtype=np.int64)
+            is_leaf = t.children_left == _TREE_LEAF
+
+            # Las hojas se enlazan a sí mismas para que el recorrido sea estable
+            features.append(np.where(is_leaf, 0, t.feature))
+            thresholds.append(np.where(is_leaf, np.inf, t.threshold))
+            lefts.append(np.where(is_leaf, node_ids, t.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, t.children_right) + offset)
+
+            # Valores de hoja normalizados a probabilidades, como en predict_proba
+            leaf_values = t.value[:, 0, :].astype(np.float64)
+            normalizer = leaf_values.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(leaf_values / normalizer)
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp),
+            right=np.ascontiguousarray(np.concatenate(rights), dtype=np.intp),
+            value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            roots=offsets.astype(np.intp),
+            classes=np.asarray(model.classes_),
+            n_features=int(model.n_features_in_),
+            max_depth=max(int(tree.tree_.max_depth) for tree in trees)
+        )
+
+    def save(self, directory: Union[str, Path]) -> None:
+        """
+        Guarda los arreglos del bosque como archivos .npy en un directorio.
+
+        El formato permite abrirlos después con ``load`` en modo de memoria mapeada.
+
+        Args:
+            directory: Directorio de destino (se crea si no existe)
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in _FOREST_ARRAYS:
+            array = getattr(self, name)
+            if array.dtype == object:
+                array = np.asarray(array.tolist())  # Clases de texto: .npy sin pickle
+            np.save(directory / f"{name.rstrip('_')}.npy", array, allow_pickle=False)
+        with open(directory / _FOREST_META, "w", encoding="utf-8") as handle:
+            json.dump({"n_features": self.n_features, "max_depth": self.max_depth}, handle)
+
+    @classmethod
+    def load(cls, directory: Union[str, Path], mmap_mode: Optional[str] = "r") -> "CompiledForest":
+        """
+        Abre un bosque guardado con ``save``.
+
+        Con ``mmap_mode="r"`` los arreglos se mapean de solo lectura sin copiarlos,
+        por lo que los procesos que abren el mismo directorio comparten sus páginas.
+
+        Args:
+            directory: Directorio del bosque guardado
+            mmap_mode: Modo de ``np.load`` (None carga los arreglos en memoria)
+
+        Returns:
+            CompiledForest: Bosque listo para predecir
+        """
+        directory = Path(directory)
+        with open(directory / _FOREST_META, encoding="utf-8") as handle:
+            meta = json.load(handle)
+        arrays = {
+            name: np.asarray(np.load(directory / f"{name.rstrip('_')}.npy", mmap_mode=mmap_mode, allow_pickle=False))
+            for name in _FOREST_ARRAYS
+        }
+        return cls(
+            feature=arrays["feature"],
+            threshold=arrays["threshold"],
+            left=arrays["left"],
+            right=arrays["right"],
+            value=arrays["value"],
+            roots=arrays["roots"],
+            classes=arrays["classes_"],
+            n_features=int(meta["n_features"]),
+            max_depth=int(meta["max_depth"])
+        )
+
+    @property
+    def n_trees(self) -> int:
+        """Número de árboles del bosque."""
+        return len(self.roots)
+
+    def _leaves(self, X: np.ndarray) -> np.ndarray:
+        """Devuelve el índice de hoja alcanzado por cada fila en cada árbol."""
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(
+                f"X tiene {X.shape[-1]} características, pero el modelo espera {self.n_features}"
+            )
+
+        # scikit-learn evalúa los árboles en float32; se replica para obtener los mismos umbrales
+        X = np.asarray(X, dtype=np.float32)
+        nodes = np.broadcast_to(self.roots, (X.shape[0], self.n_trees))
+        for _ in range(self.max_depth):
+            values = np.take_along_axis(X, self.feature[nodes], axis=1)
+            nodes = np.where(values <= self.threshold[nodes], self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """
+        Calcula las probabilidades por clase promediando las hojas de todos los árboles.
+
+        Args:
+            X: Matriz de características de forma (n_filas, n_características)
+
+        Returns:
+            np.ndarray: Probabilidades de forma (n_filas, n_clases)
+        """
+        return self.value[self._leaves(X)].mean(axis=1)
+
+    def predict(self, X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Obtiene predicción y confianza con un único recorrido de los árboles.
+
+        Args:
+            X: Matriz de características de forma (n_filas, n_características)
+
+        Returns:
+            tuple: (predicciones, confianzas) como arreglos de longitud n_filas
+        """
+        proba = self.predict_proba(X)
+        best = proba.argmax(axis=1)
+        return self.classes_.take(best), proba[np.arange(len(best)), best]
+
+
+def probe_features(engine: CompiledForest, n_samples: int = 512, seed: int = 0) -> np.ndarray:
+    """
+    Genera filas de prueba que ejercitan los umbrales del bosque.
+
+    Mezcla valores aleatorios dentro del rango de los umbrales de cada característica
+    con valores exactamente iguales a un umbral, que es donde una discrepancia en la
+    comparación cambiaría el recorrido.
+
+    Args:
+        engine: Bosque compilado
+        n_samples: Número de filas a generar
+        seed: Semilla del generador aleatorio
+
+    Returns:
+        np.ndarray: Matriz de forma (n_samples, n_características)
+    """
+    rng = np.random.default_rng(seed)
+    probe = np.zeros((n_samples, engine.n_features))
+    internal = np.isfinite(engine.threshold)
+
+    for column in range(engine.n_features):
+        thresholds = engine.threshold[internal & (engine.feature == column)]
+        if thresholds.size == 0:
+            probe[:, column] = rng.normal(size=n_samples)
+            continue
+        low, high = thresholds.min() - 1.0, thresholds.max() + 1.0
+        probe[:, column] = rng.uniform(low, high, size=n_samples)
+        exact = rng.random(n_samples) < 0.25
+        probe[exact, column] = rng.choice(thresholds, size=int(exact.sum()))
+
+    return probe
+
+
+def verify_compiled(engine: CompiledForest, model: Any, probe: Optional[np.ndarray] = None) -> bool:
+    """
+    Comprueba que el bosque compilado reproduce las salidas de scikit-learn.
+
+    Args:
+        engine: Bosque compilado
+        model: Estimador original
+        probe: Filas de prueba (por defecto, generadas con ``probe_features``)
+
+    Returns:
+        bool: True si predicciones y probabilidades coinciden
+    """
+    if probe is None:
+        probe = probe_features(engine)
+
+    expected_proba = model.predict_proba(probe)
+    expected_predictions = model.predict(probe)
+    predictions, _ = engine.predict(probe)
+
+    return (
+        np.array_equal(predictions, expected_predictions)
+        and np.allclose(engine.predict_proba(probe), expected_proba, rtol=1e-9, atol=1e-12)
+    )
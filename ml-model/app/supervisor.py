@@ -0,0 +1,221 @@
+"""
+Supervisor pre-fork: compila el modelo una sola vez y sirve la API con varios workers.
+
+Uso (desde ``ml-model/``)::
+
+    python -m app.supervisor --workers 4 --port 8000
+
+El supervisor publica el modelo compilado en el almacén compartido
+(``SHARED_MODEL_DIR``), abre el socket y lanza los workers de uvicorn, que adjuntan
+el modelo con memoria mapeada en lugar de cargar cada uno su copia. Reinicia los
+workers que terminan y publica una versión nueva cuando cambia ``MODEL_PATH``; los
+workers la activan en su siguiente ciclo de seguimiento.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+import uvicorn
+
+from .core.config import settings
+from .services.inference import build_engine, load_model_artifact
+from .services.shared_model import SharedModelStore
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+# Los workers se crean con spawn: no heredan el estado del supervisor salvo el socket
+_SPAWN = multiprocessing.get_context("spawn")
+
+
+def _run_worker(config: uvicorn.Config, sockets: List[socket.socket]) -> None:
+    """Punto de entrada de un worker: sirve la aplicación sobre el socket heredado."""
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+def _artifact_mtime(path: Path) -> Optional[datetime]:
+    """Fecha de modificación de un artefacto, o None si no existe."""
+    try:
+        return datetime.fromtimestamp(path.stat().st_mtime, tz=timezone.utc)
+    except OSError:
+        return None
+
+
+class WorkerSupervisor:
+    """
+    Mantiene ``workers`` procesos de uvicorn y el modelo publicado en el almacén.
+
+    El modelo se carga y compila solo en el supervisor; los workers reciben la ruta
+    del almacén por ``SHARED_MODEL_DIR`` y siguen su versión activa.
+    """
+
+    def __init__(
+        self,
+        config: uvicorn.Config,
+        store: SharedModelStore,
+        workers: int,
+        model_path: Path,
+        poll_seconds: float = 1.0,
+        shutdown_timeout: float = 30.0
+    ):
+        """
+        Args:
+            config: Configuración de uvicorn de cada worker
+            store: Almacén compartido de modelos
+            workers: Número de procesos worker
+            model_path: Artefacto vigilado (``MODEL_PATH``)
+            poll_seconds: Intervalo de revisión de workers y artefacto
+            shutdown_timeout: Espera máxima a que un worker termine al detener
+        """
+        self.config = config
+        self.store = store
+        self.workers = max(workers, 1)
+        self.model_path = model_path
+        self.poll_seconds = poll_seconds
+        self.shutdown_timeout = shutdown_timeout
+        self.restarts = 0
+        self._processes: List[Optional[multiprocessing.process.BaseProcess]] = [None] * self.workers
+        self._sockets: List[socket.socket] = []
+        self._published_mtime: Optional[datetime] = None
+        self._stop = threading.Event()
+
+    def publish(self, version: str) -> bool:
+        """
+        Carga y compila ``MODEL_PATH``, lo publica como ``version`` y lo activa.
+
+        Returns:
+            bool: True si se publicó; si falla, los workers conservan la versión activa
+        """
+        updated_at = _artifact_mtime(self.model_path)
+        if updated_at is None:
+            logger.warning(f"Modelo no encontrado en {self.model_path.absolute()}; cada worker usará el modelo dummy")
+            return False
+        try:
+            model, spec = load_model_artifact(self.model_path, mmap=settings.MODEL_MMAP)
+            engine = build_engine(model, compiled=settings.MODEL_COMPILED_INFERENCE)
+            self.store.publish(version, engine, spec, self.model_path.stem, str(self.model_path), updated_at)
+            self.store.activate(version)
+        except Exception as e:
+            logger.error(f"No se pudo publicar la versión {version}: {str(e)}", exc_info=True)
+            return False
+        finally:
+            # Un artefacto inválido no se reintenta hasta que vuelva a cambiar
+            self._published_mtime = updated_at
+        self.store.prune(keep=settings.MODEL_REGISTRY_MAX_VERSIONS)
+        return True
+
+    def _spawn(self, slot: int) -> None:
+        """Lanza el worker de una posición."""
+        process = _SPAWN.Process(
+            target=_run_worker,
+            kwargs={"config": self.config, "sockets": self._sockets},
+            name=f"red-sentinel-worker-{slot}"
+        )
+        process.start()
+        self._processes[slot] = process
+        logger.info(f"Worker {slot} iniciado (pid {process.pid})")
+
+    def _check_workers(self) -> None:
+        """Reinicia los workers que terminaron."""
+        for slot, process in enumerate(self._processes):
+            if process is None or process.is_alive():
+                continue
+            logger.warning(f"Worker {slot} (pid {process.pid}) terminó con código {process.exitcode}, reiniciando")
+            self.store.remove_heartbeat(process.pid)
+            self.restarts += 1
+            self._spawn(slot)
+
+    def _check_model(self) -> None:
+        """Publica una versión nueva si cambió el artefacto."""
+        mtime = _artifact_mtime(self.model_path)
+        if mtime is None or mtime == self._published_mtime:
+            return
+        version = f"{self.model_path.stem}-{mtime:%Y%m%d%H%M%S}"
+        logger.info(f"Cambio detectado en {self.model_path}, publicando versión {version}")
+        self.publish(version)
+
+    def stop(self, *_: object) -> None:
+        """Solicita la detención (manejador de SIGINT/SIGTERM)."""
+        self._stop.set()
+
+    def run(self) -> None:
+        """Publica el modelo, lanza los workers y los supervisa hasta recibir una señal."""
+        self.store.clear()
+        self.publish(settings.MODEL_VERSION)
+
+        self._sockets = [self.config.bind_socket()]
+        for slot in range(self.workers):
+            self._spawn(slot)
+
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        logger.info(
+            f"Supervisor (pid {os.getpid()}) sirviendo en {self.config.host}:{self.config.port} "
+            f"con {self.workers} workers"
+        )
+        try:
+            while not self._stop.wait(self.poll_seconds):
+                self._check_workers()
+                self._check_model()
+        finally:
+            self._shutdown()
+
+    def _shutdown(self) -> None:
+        """Detiene los workers (SIGTERM y, si no terminan a tiempo, SIGKILL)."""
+        logger.info("Deteniendo workers")
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(self.shutdown_timeout)
+            if process.is_alive():
+                process.kill()
+                process.join()
+            self.store.remove_heartbeat(process.pid)
+        for sock in self._sockets:
+            sock.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Servicio ML con workers que comparten el modelo")
+    parser.add_argument("--host", default="127.0.0.1", help="Dirección de escucha")
+    parser.add_argument("--port", type=int, default=8000, help="Puerto de escucha")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.SERVE_WORKERS or os.cpu_count() or 1,
+        help="Procesos worker (por defecto SERVE_WORKERS o uno por núcleo)"
+    )
+    parser.add_argument(
+        "--store",
+        default=settings.SHARED_MODEL_DIR or str(Path(settings.MODEL_REGISTRY_DIR) / ".shared"),
+        help="Directorio del almacén compartido de modelos"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.LOG_LEVEL, format=settings.LOG_FORMAT)
+    store = SharedModelStore(args.store)
+    # Los workers leen la configuración del entorno al importarse
+    os.environ["SHARED_MODEL_DIR"] = str(store.root.resolve())
+
+    config = uvicorn.Config("app.main:app", host=args.host, port=args.port, log_level=settings.LOG_LEVEL.lower())
+    WorkerSupervisor(
+        config,
+        store,
+        workers=args.workers,
+        model_path=Path(settings.MODEL_PATH),
+        poll_seconds=settings.SHARED_MODEL_POLL_SECONDS
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+# ml-model/benchmark_hot_path.py
+"""
+Benchmark de cada etapa del camino de análisis, sin servicios externos.
+
+Mide por separado la construcción de características, la predicción (motor
+compilado y scikit-learn, con modelos de varios tamaños), las reglas, la
+explicación, la construcción y serialización de ``ModelOutput`` y
+``analyze_batch``, con varios tamaños de lote; después mide los endpoints HTTP en
+el mismo proceso (``/analyze`` secuencial, ``/analyze/batch`` y clientes
+concurrentes) con p50/p99 y throughput. Uso:
+
+    python benchmark_hot_path.py --output baseline.json
+    python benchmark_hot_path.py --compare baseline.json --threshold 0.2
+
+Con ``--compare`` se marca como regresión cada caso cuya mediana empeora más que
+``--threshold`` respecto a la línea base, y el proceso termina con código 1.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.main import app
+from app.schemas.mcp import ModelInput, ModelOutput, ThreatLevel
+from app.services.features import FeatureExtractor, FeatureSpec
+from app.services.inference import build_engine, predict_features
+from app.services.ml_service import ml_service
+
+# Modelos sintéticos: (árboles, profundidad máxima)
+MODEL_SIZES = {
+    "small": (10, 6),
+    "medium": (100, 10),
+    "large": (300, 16)
+}
+
+# Especificación de características de models/dummy_model.features.json
+FEATURE_SPEC = FeatureSpec.model_validate({
+    "version": 1,
+    "features": [
+        {"name": "source_port", "source": "source_port", "default": 0.0},
+        {"name": "destination_port", "source": "destination_port", "default": 0.0},
+        {"name": "protocol", "source": "protocol", "default": 3.0,
+         "encoding": {"tcp": 0.0, "udp": 1.0, "icmp": 2.0, "other": 3.0}},
+        {"name": "payload_size", "source": "payload_size", "default": 0.0},
+        {"name": "ttl", "source": "metadata.ttl", "default": 64.0}
+    ]
+})
+
+API_HEADERS = {"X-API-Key": "test-key"}
+
+
+def make_records(n: int, seed: int = 0) -> List[dict]:
+    """Registros sintéticos variados (no se repiten en la caché de predicciones)."""
+    rng = random.Random(seed)
+    records = []
+    for index in range(n):
+        scan = rng.random() < 0.1
+        records.append({
+            "request_id": f"bench-{seed}-{index}",
+            "source_ip": f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+            "destination_ip": f"192.168.{rng.randint(0, 3)}.{rng.randint(1, 254)}",
+            "source_port": rng.randint(1024, 65535),
+            "destination_port": rng.choice([22, 23, 3389, 445]) if scan else rng.choice([80, 443, 53, 8080]),
+            "protocol": rng.choice(["tcp", "tcp", "udp", "icmp"]),
+            "payload_size": 0 if scan else rng.randint(40, 9000),
+            "flags": {"SYN": True, "ACK": not scan},
+            "additional_metadata": {"ttl": rng.randint(32, 128)}
+        })
+    return records
+
+
+def train_model(n_trees: int, max_depth: int) -> Any:
+    """Entrena un bosque sintético con el ancho de ``FEATURE_SPEC``."""
+    from sklearn.ensemble import RandomForestClassifier
+
+    rng = np.random.default_rng(42)
+    X = rng.random((5000, FEATURE_SPEC.width)) * [65535, 65535, 3, 9000, 128]
+    y = ((X[:, 1] < 2000) ^ (X[:, 3] > 6000) ^ (rng.random(5000) < 0.1)).astype(int)
+    return RandomForestClassifier(n_estimators=n_trees, max_depth=max_depth, random_state=42).fit(X, y)
+
+
+def summarize(samples_ms: List[float], rows: int, wall_seconds: Optional[float] = None) -> Dict[str, float]:
+    """
+    Resume las mediciones de un caso.
+
+    Args:
+        samples_ms: Duración de cada repetición en milisegundos
+        rows: Registros procesados por repetición
+        wall_seconds: Duración total, si las repeticiones se solapan (clientes concurrentes)
+
+    Returns:
+        dict: Repeticiones, p50, p99, media y registros por segundo
+    """
+    samples = np.asarray(samples_ms)
+    p50, p99 = np.percentile(samples, [50, 99])
+    if wall_seconds is None:
+        wall_seconds = samples.sum() / 1000
+    return {
+        "runs": len(samples),
+        "rows": rows,
+        "p50_ms": round(float(p50), 4),
+        "p99_ms": round(float(p99), 4),
+        "mean_ms": round(float(samples.mean()), 4),
+        "rows_per_second": round(rows * len(samples) / wall_seconds, 1) if wall_seconds > 0 else None
+    }
+
+
+def measure(fn: Callable[[], Any], min_seconds: float, min_runs: int = 5) -> List[float]:
+    """Ejecuta ``fn`` hasta cubrir ``min_seconds`` y ``min_runs`` repeticiones (tras una de calentamiento)."""
+    fn()
+    samples: List[float] = []
+    deadline = time.perf_counter() + min_seconds
+    while len(samples) < min_runs or time.perf_counter() < deadline:
+        start = time.perf_counter_ns()
+        fn()
+        samples.append((time.perf_counter_ns() - start) / 1e6)
+    return samples
+
+
+async def measure_async(fn: Callable[[], Awaitable[Any]], min_seconds: float, min_runs: int = 5) -> List[float]:
+    """Equivalente asíncrono de ``measure``."""
+    await fn()
+    samples: List[float] = []
+    deadline = time.perf_counter() + min_seconds
+    while len(samples) < min_runs or time.perf_counter() < deadline:
+        start = time.perf_counter_ns()
+        await fn()
+        samples.append((time.perf_counter_ns() - start) / 1e6)
+    return samples
+
+
+def bench_stages(batch_sizes: List[int], model_sizes: List[str], min_seconds: float) -> Dict[str, Any]:
+    """Mide las etapas del análisis por separado."""
+    results: Dict[str, Any] = {}
+    extractor = FeatureExtractor(FEATURE_SPEC)
+    for batch_size in batch_sizes:
+        records = [ModelInput.model_validate(record) for record in make_records(batch_size)]
+        raw = make_records(batch_size)
+        results[f"validate/batch={batch_size}"] = summarize(
+            measure(lambda: [ModelInput.model_validate(record) for record in raw], min_seconds), batch_size
+        )
+        results[f"features/batch={batch_size}"] = summarize(
+            measure(lambda: extractor.transform(records), min_seconds), batch_size
+        )
+        results[f"rules/batch={batch_size}"] = summarize(
+            measure(lambda: ml_service.rules.evaluate(records, None), min_seconds), batch_size
+        )
+
+        predictions = [index % 2 for index in range(batch_size)]
+        levels = [ThreatLevel.HIGH if prediction else ThreatLevel.LOW for prediction in predictions]
+        results[f"explanation/batch={batch_size}"] = summarize(measure(lambda: [
+            ml_service._generate_explanation(record, prediction, 0.8, level)
+            for record, prediction, level in zip(records, predictions, levels)
+        ], min_seconds), batch_size)
+
+        def build_outputs() -> List[ModelOutput]:
+            return [
+                ModelOutput(
+                    request_id=record.request_id,
+                    timestamp=datetime.now(timezone.utc),
+                    prediction=prediction,
+                    confidence=0.8,
+                    risk_level=level,
+                    explanation="Se detectó una posible amenaza de nivel HIGH. Confianza del modelo: 80.0%.",
+                    indicators=["Patrón de tráfico inusual detectado por el modelo"] if prediction else [],
+                    metadata={"batch_index": index, "queue_wait_ms": 0.1, "execution_ms": 0.2, "model_version": "1.0.0"}
+                )
+                for index, (record, prediction, level) in enumerate(zip(records, predictions, levels))
+            ]
+
+        outputs = build_outputs()
+        results[f"output/build/batch={batch_size}"] = summarize(measure(build_outputs, min_seconds), batch_size)
+        results[f"output/json/batch={batch_size}"] = summarize(
+            measure(lambda: [output.model_dump_json() for output in outputs], min_seconds), batch_size
+        )
+
+    for size in model_sizes:
+        model = train_model(*MODEL_SIZES[size])
+        for engine_kind, engine in (("compiled", build_engine(model)), ("sklearn", build_engine(model, compiled=False))):
+            if engine_kind == "compiled" and engine.kind != "compiled":
+                continue  # El modelo no pudo compilarse
+            for batch_size in batch_sizes:
+                features = extractor.transform([ModelInput.model_validate(r) for r in make_records(batch_size)])
+                results[f"predict/{engine_kind}/{size}/batch={batch_size}"] = summarize(
+                    measure(lambda: predict_features(engine, features), min_seconds), batch_size
+                )
+    return results
+
+
+async def bench_service(batch_sizes: List[int], min_seconds: float) -> Dict[str, Any]:
+    """Mide ``analyze_threat`` y ``analyze_batch`` del servicio, sin HTTP."""
+    results: Dict[str, Any] = {}
+    single = [ModelInput.model_validate(record) for record in make_records(1000, seed=1)]
+    position = 0
+
+    async def analyze_one() -> None:
+        nonlocal position
+        position = (position + 1) % len(single)
+        await ml_service.analyze_threat(single[position])
+
+    results["service/analyze_threat"] = summarize(await measure_async(analyze_one, min_seconds), 1)
+    for batch_size in batch_sizes:
+        records = [ModelInput.model_validate(record) for record in make_records(batch_size, seed=2)]
+        results[f"service/analyze_batch/batch={batch_size}"] = summarize(
+            await measure_async(lambda: ml_service.analyze_batch(records), min_seconds), batch_size
+        )
+    return results
+
+
+async def bench_http(batch_sizes: List[int], concurrency: List[int], min_seconds: float) -> Dict[str, Any]:
+    """Mide los endpoints con un cliente HTTP en el mismo proceso (ASGI, sin red)."""
+    import httpx
+
+    results: Dict[str, Any] = {}
+    records = make_records(5000, seed=3)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=API_HEADERS) as client:
+        position = 0
+
+        async def post_one() -> None:
+            nonlocal position
+            position = (position + 1) % len(records)
+            response = await client.post("/api/v1/analyze", json=records[position])
+            response.raise_for_status()
+
+        results["http/analyze/single"] = summarize(await measure_async(post_one, min_seconds), 1)
+
+        for batch_size in batch_sizes:
+            body = records[:batch_size]
+
+            async def post_batch() -> None:
+                response = await client.post("/api/v1/analyze/batch", json=body)
+                response.raise_for_status()
+
+            results[f"http/analyze_batch/batch={batch_size}"] = summarize(
+                await measure_async(post_batch, min_seconds), batch_size
+            )
+
+        for clients in concurrency:
+            samples: List[float] = []
+            deadline = time.perf_counter() + min_seconds
+
+            async def run_client() -> None:
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter_ns()
+                    await post_one()
+                    samples.append((time.perf_counter_ns() - start) / 1e6)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(run_client() for _ in range(clients)))
+            results[f"http/analyze/concurrent={clients}"] = summarize(samples, 1, time.perf_counter() - started)
+    return results
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """
+    Compara la mediana de cada caso con la línea base.
+
+    Returns:
+        list: Por cada caso presente en ambas, la razón actual/base y su estado
+            (``regression``, ``improvement`` u ``ok``)
+    """
+    rows = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or not base.get("p50_ms"):
+            continue
+        ratio = result["p50_ms"] / base["p50_ms"]
+        status = "regression" if ratio > 1 + threshold else "improvement" if ratio < 1 - threshold else "ok"
+        rows.append({
+            "case": name,
+            "baseline_p50_ms": base["p50_ms"],
+            "p50_ms": result["p50_ms"],
+            "baseline_p99_ms": base.get("p99_ms"),
+            "p99_ms": result["p99_ms"],
+            "ratio": round(ratio, 3),
+            "status": status
+        })
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de las etapas del análisis y de los endpoints")
+    parser.add_argument("--output", help="Archivo JSON donde se guardan los resultados (sirve como línea base)")
+    parser.add_argument("--compare", help="Resultados de una ejecución anterior contra los que comparar")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Empeoramiento relativo de la mediana tolerado")
+    parser.add_argument("--only", action="append", default=[], help="Ejecutar solo los casos que empiezan con este prefijo")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32, 256, 1024], help="Tamaños de lote")
+    parser.add_argument(
+        "--model-sizes",
+        nargs="+",
+        choices=list(MODEL_SIZES),
+        default=list(MODEL_SIZES),
+        help="Tamaños de modelo sintético para la predicción"
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32], help="Clientes HTTP concurrentes")
+    parser.add_argument("--min-seconds", type=float, default=1.0, help="Duración mínima de cada caso")
+    parser.add_argument("--quick", action="store_true", help="Casos reducidos y 0.2 s por caso")
+    args = parser.parse_args()
+    if args.quick:
+        args.batch_sizes, args.model_sizes, args.concurrency = [1, 256], ["small"], [8]
+        args.min_seconds = 0.2
+
+    logging.basicConfig(level=logging.WARNING)
+
+    def wanted(group: str) -> bool:
+        return not args.only or any(prefix.startswith(group) or group.startswith(prefix) for prefix in args.only)
+
+    async def run() -> Dict[str, Any]:
+        results: Dict[str, Any] = {}
+        async with app.router.lifespan_context(app):
+            await ml_service.ensure_ready()
+            if any(wanted(group) for group in ("validate", "features", "rules", "explanation", "output", "predict")):
+                model_sizes = args.model_sizes if wanted("predict") else []
+                results.update(bench_stages(args.batch_sizes, model_sizes, args.min_seconds))
+            if wanted("service"):
+                results.update(await bench_service(args.batch_sizes, args.min_seconds))
+            if wanted("http"):
+                http_batches = [size for size in args.batch_sizes if size > 1]
+                results.update(await bench_http(http_batches, args.concurrency, args.min_seconds))
+        return {name: result for name, result in results.items() if not args.only or any(
+            name.startswith(prefix) for prefix in args.only
+        )}
+
+    import sklearn
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+        "machine": f"{platform.system()} {platform.machine()} {platform.processor()}".strip(),
+        "results": asyncio.run(run())
+    }
+    for name, result in report["results"].items():
+        print(
+            f"{name:<45} p50 {result['p50_ms']:>10.4f} ms  p99 {result['p99_ms']:>10.4f} ms  "
+            f"{result['rows_per_second'] or 0:>12.0f} registros/s",
+            file=sys.stderr
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.threshold)
+        regressions = [row for row in rows if row["status"] == "regression"]
+        for row in rows:
+            print(
+                f"{row['status']:<12} {row['case']:<45} {row['baseline_p50_ms']:>10.4f} -> {row['p50_ms']:>10.4f} ms "
+                f"(x{row['ratio']})",
+                file=sys.stderr
+            )
+        print(json.dumps({"compared": len(rows), "regressions": [row["case"] for row in regressions]}, indent=2))
+        if regressions:
+            sys.exit(1)
+    elif not args.output:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
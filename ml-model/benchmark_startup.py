@@ -0,0 +1,96 @@
+# ml-model/benchmark_startup.py
+"""
+Mide el arranque en frío del servicio: tiempo de importación de ``app.main`` y
+tiempo hasta la primera predicción (lifespan + carga + calentamiento + /analyze).
+
+Cada repetición se ejecuta en un proceso nuevo para no reutilizar módulos ya
+importados. Uso:
+
+    python benchmark_startup.py --runs 5 --output startup_history.jsonl
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+# Código ejecutado en cada proceso hijo; imprime una línea JSON con sus mediciones
+_PROBE = r"""
+import asyncio, json, sys, time
+
+start = time.perf_counter()
+from app.main import app
+import_ms = (time.perf_counter() - start) * 1000
+sklearn_on_import = "sklearn" in sys.modules
+
+from app.schemas.mcp import ModelInput
+from app.services.ml_service import ml_service
+
+async def first_prediction():
+    async with app.router.lifespan_context(app):
+        await ml_service.analyze_threat(ModelInput(
+            request_id="benchmark-startup",
+            source_ip="192.168.1.10",
+            destination_ip="10.0.0.5",
+            source_port=51234,
+            destination_port=443,
+            protocol="tcp",
+            payload_size=512
+        ))
+        return ml_service.get_readiness()
+
+readiness = asyncio.run(first_prediction())
+print(json.dumps({
+    "import_ms": import_ms,
+    "first_prediction_ms": (time.perf_counter() - start) * 1000,
+    "sklearn_on_import": sklearn_on_import,
+    "startup_ms": readiness.get("startup_ms"),
+    "warmup_ms": readiness.get("warmup_ms")
+}))
+"""
+
+
+def run_once() -> dict:
+    """Ejecuta una medición en un proceso nuevo."""
+    env = {**os.environ, "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING")}
+    completed = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de arranque del servicio ML")
+    parser.add_argument("--runs", type=int, default=5, help="Repeticiones (procesos nuevos)")
+    parser.add_argument("--output", help="Archivo JSONL al que se agrega el resultado")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(max(args.runs, 1))]
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "runs": len(runs),
+        "model_path": os.environ.get("MODEL_PATH", "models/dummy_model.pkl"),
+        "sklearn_on_import": any(run["sklearn_on_import"] for run in runs)
+    }
+    for metric in ("import_ms", "first_prediction_ms", "startup_ms", "warmup_ms"):
+        values = [run[metric] for run in runs if run[metric] is not None]
+        if values:
+            result[f"{metric}_median"] = round(statistics.median(values), 2)
+            result[f"{metric}_max"] = round(max(values), 2)
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
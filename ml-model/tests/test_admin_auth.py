@@ -0,0 +1,61 @@
+"""
+Pruebas de autenticación de los endpoints de administración.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.services.tracing import tracer
+
+ADMIN_KEY = "admin-test-key"
+
+
+@pytest.fixture
+def client():
+    # Sin ``with``: no se ejecuta el lifespan ni se carga el modelo
+    return TestClient(app)
+
+
+@pytest.fixture
+def admin_keys(monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_API_KEYS", {"ops": ADMIN_KEY})
+
+
+@pytest.mark.parametrize("method, path", [
+    ("post", "/api/v1/admin/profile?seconds=1"),
+    ("get", "/api/v1/admin/tracing"),
+    ("post", "/api/v1/admin/tracing"),
+    ("post", "/api/v1/admin/models/rollback"),
+])
+def test_admin_disabled_without_admin_keys(client, monkeypatch, method, path):
+    monkeypatch.setattr(settings, "ADMIN_API_KEYS", {})
+    monkeypatch.setattr(settings, "ENVIRONMENT", "development")
+    response = getattr(client, method)(path, headers={"X-API-Key": settings.API_KEYS.get("default", "")})
+    assert response.status_code == 403
+
+
+@pytest.mark.parametrize("method, path", [
+    ("post", "/api/v1/admin/profile?seconds=1"),
+    ("get", "/api/v1/admin/tracing"),
+    ("post", "/api/v1/admin/tracing"),
+])
+def test_admin_requires_admin_key(client, admin_keys, method, path):
+    assert getattr(client, method)(path).status_code == 401
+    # Una API key de cliente no da acceso a la administración
+    response = getattr(client, method)(path, headers={"X-API-Key": "test-key"})
+    assert response.status_code == 401
+
+
+def test_tracing_sample_rate_with_admin_key(client, admin_keys):
+    previous = tracer.sample_rate
+    try:
+        response = client.post(
+            "/api/v1/admin/tracing",
+            json={"sample_rate": 0.25},
+            headers={"X-API-Key": ADMIN_KEY}
+        )
+        assert response.status_code == 200
+        assert tracer.sample_rate == 0.25
+    finally:
+        tracer.set_sample_rate(previous)
@@ -0,0 +1,185 @@
+"""
+Pruebas del control de admisión: rechazo, desplazamiento por prioridad, espera
+máxima, Retry-After en HTTP y respuesta 429 en el canal WebSocket.
+"""
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.services import admission as admission_module
+from app.services.admission import (
+    REJECT_DISPLACED,
+    REJECT_QUEUE_FULL,
+    REJECT_TIMEOUT,
+    AdmissionController,
+    AdmissionRejected,
+    admission_capacity,
+    admission_slot,
+    resolve_priority,
+)
+
+RECORD = {
+    "request_id": "req-1",
+    "source_ip": "10.0.0.1",
+    "destination_ip": "10.0.0.2",
+    "destination_port": 443,
+    "protocol": "tcp"
+}
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_rejects_when_queue_is_full():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, queue_size=0)
+        await controller.acquire("interactive")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("interactive")
+        controller.release("interactive", 0.01)
+        return controller, rejected.value
+
+    controller, rejected = _run(scenario())
+    assert rejected.reason == REJECT_QUEUE_FULL
+    assert 1 <= rejected.retry_after <= 60
+    assert controller.rejected[("interactive", REJECT_QUEUE_FULL)] == 1
+    assert controller.in_flight == 0
+
+
+def test_higher_priority_displaces_the_newest_lower_priority_wait():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, queue_size=2, max_wait_seconds=5)
+        await controller.acquire("critical")
+        first = asyncio.create_task(controller.acquire("bulk"))
+        second = asyncio.create_task(controller.acquire("bulk"))
+        await asyncio.sleep(0)
+        critical = asyncio.create_task(controller.acquire("critical"))
+        await asyncio.sleep(0)
+        controller.release("critical", 0.01)
+        await critical
+        # El cupo liberado fue para la clase más prioritaria; bulk sigue esperando detrás
+        assert not first.done()
+        controller.release("critical", 0.01)
+        results = await asyncio.gather(first, second, return_exceptions=True)
+        return controller, results
+
+    controller, (first, second) = _run(scenario())
+    assert first is None
+    assert isinstance(second, AdmissionRejected) and second.reason == REJECT_DISPLACED
+    assert controller.admitted == {"critical": 2, "bulk": 1}
+
+
+def test_times_out_after_max_wait():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, queue_size=5, max_wait_seconds=0.05)
+        await controller.acquire("interactive")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("interactive")
+        return controller, rejected.value
+
+    controller, rejected = _run(scenario())
+    assert rejected.reason == REJECT_TIMEOUT
+    assert controller.waiting == 0
+
+
+def test_class_share_leaves_slots_for_higher_classes():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=4, queue_size=0, class_max_share={"bulk": 0.5})
+        for _ in range(2):
+            await controller.acquire("bulk")
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire("bulk")
+        await controller.acquire("interactive")
+        return controller
+
+    controller = _run(scenario())
+    assert controller.stats()["classes"]["bulk"]["in_flight"] == 2
+    assert controller.in_flight == 3
+
+
+def test_retry_after_grows_with_the_backlog():
+    controller = AdmissionController(max_concurrent=2, queue_size=10)
+    controller._service_seconds = 4.0
+    controller._in_flight = 2
+    assert controller.retry_after() == 4
+    controller._in_flight = 100
+    assert controller.retry_after() == 60
+
+
+def test_resolve_priority_prefers_key_over_route(monkeypatch):
+    monkeypatch.setattr(settings, "API_KEYS", {"dashboard": "k1", "sensor": "k2"})
+    monkeypatch.setattr(settings, "ADMISSION_KEY_PRIORITIES", {"dashboard": "critical"})
+    assert resolve_priority("k1", "/api/v1/analyze/batch") == "critical"
+    assert resolve_priority("k2", "/api/v1/analyze/batch") == "bulk"
+    assert resolve_priority("k2", "/api/v1/analyze/stream") == "bulk"
+    assert resolve_priority("k2", "/api/v1/analyze") == settings.ADMISSION_DEFAULT_PRIORITY
+
+
+def test_capacity_defaults_to_workers_and_batching_headroom_is_opt_in(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_MAX_CONCURRENT", None)
+    monkeypatch.setattr(settings, "MODEL_BATCH_SIZE", 32)
+    monkeypatch.setattr(settings, "MODEL_MAX_CONCURRENT_REQUESTS", 10)
+    for micro_batching in (True, False):
+        monkeypatch.setattr(settings, "MODEL_MICRO_BATCHING", micro_batching)
+        assert admission_capacity() == 10
+    monkeypatch.setattr(settings, "ADMISSION_MAX_CONCURRENT", 320)
+    assert admission_capacity() == 320
+
+
+@pytest.fixture
+def saturated(monkeypatch):
+    """Control de admisión del proceso con su único cupo ocupado y sin cola."""
+    controller = AdmissionController(max_concurrent=1, queue_size=0)
+    _run(controller.acquire("critical"))
+    monkeypatch.setattr(admission_module, "admission", controller)
+    return controller
+
+
+def test_admission_slot_degrades_only_when_enabled(saturated, monkeypatch):
+    async def enter(degradable):
+        async with admission_slot("interactive", degradable) as degraded:
+            return degraded
+
+    monkeypatch.setattr(settings, "ADMISSION_DEGRADED_MODE", False)
+    with pytest.raises(AdmissionRejected):
+        _run(enter(True))
+
+    monkeypatch.setattr(settings, "ADMISSION_DEGRADED_MODE", True)
+    assert _run(enter(True)) is True
+    assert saturated.degraded["interactive"] == 1
+    with pytest.raises(AdmissionRejected):
+        _run(enter(False))
+    assert saturated.in_flight == 1
+
+
+@pytest.mark.parametrize("reject_status", [503, 429])
+def test_http_rejection_sets_status_and_retry_after(saturated, monkeypatch, reject_status):
+    monkeypatch.setattr(settings, "ADMISSION_DEGRADED_MODE", False)
+    monkeypatch.setattr(settings, "ADMISSION_REJECT_STATUS", reject_status)
+    client = TestClient(app)
+    response = client.post("/api/v1/analyze", json=RECORD, headers={"X-API-Key": settings.API_KEYS["default"]})
+
+    assert response.status_code == reject_status
+    assert int(response.headers["Retry-After"]) == saturated.retry_after()
+    assert "queue_full" in response.json()["detail"]
+    assert saturated.rejected[("interactive", REJECT_QUEUE_FULL)] == 1
+
+
+def test_websocket_rejection_replies_429(saturated, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_DEGRADED_MODE", False)
+    client = TestClient(app)
+    with client.websocket_connect(f"/api/v1/ws/analyze?api_key={settings.API_KEYS['default']}") as websocket:
+        websocket.send_text(json.dumps(RECORD))
+        reply = json.loads(websocket.receive_text())
+        stats = client.get("/api/v1/stats/websocket", headers={"X-API-Key": settings.API_KEYS["default"]}).json()
+
+    assert reply["request_id"] == RECORD["request_id"]
+    assert reply["code"] == 429
+    assert reply["retry_after"] == saturated.retry_after()
+    # Un rechazo se cuenta una sola vez
+    assert (stats["sessions"][0]["rejected"], stats["sessions"][0]["failed"]) == (1, 0)
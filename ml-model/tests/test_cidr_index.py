@@ -0,0 +1,162 @@
+"""
+Pruebas del índice CIDR: coincidencia del prefijo más largo, prioridad entre
+bloqueos y permisos, y recarga de la lista.
+"""
+import ipaddress
+
+import numpy as np
+import pytest
+
+from app.services.cidr_index import CidrListManager, PrefixIndex, parse_cidr_rules
+
+RULES = """
+allow 0.0.0.0/0          todo
+allow 10.0.0.0/8         interna
+deny  10.1.0.0/16        laboratorio
+allow 10.1.2.0/24        bastión
+deny  10.1.2.3/32        host comprometido
+deny  192.0.2.0/24       escáneres
+allow 192.0.2.0/24       duplicado   # el bloqueo prevalece
+allow 2001:db8::/32      v6
+deny  2001:db8:bad::/48  v6 bloqueada
+deny  ::ffff:0:0/96      v4 mapeadas
+"""
+
+
+@pytest.fixture(scope="module")
+def index():
+    return PrefixIndex(parse_cidr_rules(RULES.splitlines()))
+
+
+def _label(index, ip):
+    rule = index.lookup(ip)
+    return rule.label if rule else None
+
+
+@pytest.mark.parametrize("ip, label", [
+    # El prefijo más largo gana en cualquier orden de anidamiento
+    ("10.1.2.3", "host comprometido"),
+    ("10.1.2.4", "bastión"),
+    ("10.1.3.1", "laboratorio"),
+    ("10.2.0.1", "interna"),
+    ("8.8.8.8", "todo"),
+    # Límites de red: primera y última dirección, y la siguiente
+    ("10.1.2.0", "bastión"),
+    ("10.1.2.255", "bastión"),
+    ("10.1.255.255", "laboratorio"),
+    ("10.255.255.255", "interna"),
+    ("11.0.0.0", "todo"),
+    ("0.0.0.0", "todo"),
+    ("255.255.255.255", "todo"),
+    # Mismo prefijo con las dos acciones
+    ("192.0.2.10", "escáneres"),
+    # IPv6
+    ("2001:db8::1", "v6"),
+    ("2001:db8:bad::1", "v6 bloqueada"),
+    ("2001:db8:bad:ffff:ffff:ffff:ffff:ffff", "v6 bloqueada"),
+    ("2001:db9::1", None),
+    # Una IPv4 mapeada en IPv6 se compara con las reglas IPv6, no con las IPv4
+    ("::ffff:10.1.2.3", "v4 mapeadas"),
+    # IPs inválidas
+    ("", None),
+    ("10.1.2", None),
+    ("10.1.2.3/32", None),
+    ("no-es-ip", None),
+])
+def test_longest_prefix_match(index, ip, label):
+    assert _label(index, ip) == label
+
+
+def test_duplicate_prefix_prefers_deny_regardless_of_order():
+    for lines in (["allow 192.0.2.0/24 a", "deny 192.0.2.0/24 b"], ["deny 192.0.2.0/24 b", "allow 192.0.2.0/24 a"]):
+        rule = PrefixIndex(parse_cidr_rules(lines)).lookup("192.0.2.1")
+        assert (rule.action, rule.label) == ("deny", "b")
+
+
+def test_host_bits_are_normalized_and_empty_index_matches_nothing():
+    rules = parse_cidr_rules(["deny 10.1.2.3/24"])
+    assert rules[0].network == "10.1.2.0/24"
+    assert PrefixIndex(rules).lookup("10.1.2.200").action == "deny"
+    assert PrefixIndex([]).lookup("10.1.2.3") is None
+    assert PrefixIndex([]).lookup_many(["10.1.2.3", "::1"]) == [None, None]
+
+
+@pytest.mark.parametrize("line, message", [
+    ("block 10.0.0.0/8", "Línea 2"),
+    ("deny 10.0.0.0/33", "Línea 2"),
+    ("deny", "Línea 2"),
+])
+def test_invalid_rules_report_the_line(line, message):
+    with pytest.raises(ValueError, match=message):
+        parse_cidr_rules(["# comentario", line])
+
+
+def test_vectorized_v4_lookup_agrees_with_scalar_lookup(index):
+    rng = np.random.default_rng(0)
+    anchors = [int(ipaddress.ip_address(ip)) for ip in ("10.1.2.3", "10.1.2.0", "10.1.0.0", "192.0.2.255", "0.0.0.0", "255.255.255.255")]
+    values = np.concatenate([
+        rng.integers(0, 2 ** 32, size=2000, dtype=np.uint64),
+        rng.integers(int(ipaddress.ip_address("10.0.0.0")), int(ipaddress.ip_address("10.2.0.0")), size=2000, dtype=np.uint64),
+        np.array(anchors, dtype=np.uint64),
+    ]).astype(np.uint32)
+    ips = [str(ipaddress.ip_address(int(value))) for value in values]
+
+    expected = [index.lookup(ip) for ip in ips]
+    assert index.lookup_many(ips) == expected
+    assert [index.rules[p] if p >= 0 else None for p in index.lookup_v4(values).tolist()] == expected
+
+
+def test_mixed_batch_resolves_v4_v6_and_invalid(index):
+    ips = ["10.1.2.3", "2001:db8:bad::1", "no-es-ip", "10.2.0.1", "::1"]
+    assert [rule.label if rule else None for rule in index.lookup_many(ips)] == [
+        "host comprometido", "v6 bloqueada", None, "interna", None
+    ]
+
+
+@pytest.fixture
+def cidr_list(tmp_path):
+    path = tmp_path / "cidr.txt"
+    path.write_text("allow 10.0.0.0/8 interna\ndeny 203.0.113.0/24 escáneres\ndeny 198.51.100.7/32 c2\n", encoding="utf-8")
+    return CidrListManager(str(path), check_interval=0)
+
+
+@pytest.mark.parametrize("source, destination, field, label", [
+    # Un bloqueo prevalece sobre un permiso, esté en el origen o en el destino
+    ("10.0.0.5", "203.0.113.9", "destination_ip", "escáneres"),
+    ("203.0.113.9", "10.0.0.5", "source_ip", "escáneres"),
+    # A igualdad de acción, el origen sobre el destino
+    ("203.0.113.9", "198.51.100.7", "source_ip", "escáneres"),
+    ("10.0.0.5", "10.0.0.6", "source_ip", "interna"),
+    ("8.8.8.8", "10.0.0.6", "destination_ip", "interna"),
+    ("8.8.8.8", "1.1.1.1", None, None),
+])
+def test_match_priority(cidr_list, source, destination, field, label):
+    match = cidr_list.match(source, destination)
+    assert (match.field if match else None, match.rule.label if match else None) == (field, label)
+
+
+def test_match_positions_agrees_with_match_many(cidr_list):
+    sources = ["10.0.0.5", "203.0.113.9", "203.0.113.9", "10.0.0.5", "8.8.8.8", "8.8.8.8"]
+    destinations = ["203.0.113.9", "10.0.0.5", "198.51.100.7", "10.0.0.6", "10.0.0.6", "1.1.1.1"]
+    expected = [match.rule if match else None for match in cidr_list.match_many(sources, destinations)]
+
+    for source_ips, destination_ips in (
+        (sources, destinations),
+        (np.array([int(ipaddress.ip_address(ip)) for ip in sources], dtype=np.uint32),
+         np.array([int(ipaddress.ip_address(ip)) for ip in destinations], dtype=np.uint32)),
+    ):
+        chosen, rules = cidr_list.match_positions(source_ips, destination_ips)
+        assert [rules[p] if p >= 0 else None for p in chosen.tolist()] == expected
+
+
+def test_invalid_reload_keeps_previous_index(cidr_list):
+    cidr_list.path.write_text("deny 10.0.0.0/99\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        cidr_list.reload()
+    assert cidr_list.match("10.0.0.5", "8.8.8.8").rule.label == "interna"
+    assert cidr_list.stats()["last_error"]
+
+    cidr_list.path.write_text("deny 10.0.0.0/8 cuarentena\n", encoding="utf-8")
+    assert cidr_list.reload() == 1
+    assert cidr_list.match("10.0.0.5", "8.8.8.8").rule.label == "cuarentena"
+    assert cidr_list.stats()["last_error"] is None
@@ -0,0 +1,139 @@
+"""
+Pruebas del formato columnar: ida y vuelta de lotes y resultados, IPv6 con bytes
+nulos al final, validación vectorizada y cabeceras inválidas.
+"""
+import struct
+
+import numpy as np
+import pytest
+
+from app.services.columnar import (
+    FLAGS_PRESENT,
+    PAYLOAD_ABSENT,
+    STATUS_ERROR,
+    STATUS_INVALID,
+    STATUS_MODEL,
+    ColumnarFormatError,
+    decode_columnar_batch,
+    decode_columnar_result,
+    encode_columnar_batch,
+    encode_columnar_result,
+    validate_columnar_batch,
+)
+
+SOURCES = ["10.0.0.1", "192.0.2.200", "203.0.113.7"]
+DESTINATIONS = ["10.0.0.2", "198.51.100.1", "8.8.8.8"]
+
+
+def _batch(sources=SOURCES, destinations=DESTINATIONS, **kwargs):
+    rows = len(sources)
+    return encode_columnar_batch(
+        sources,
+        destinations,
+        kwargs.pop("destination_ports", [443, 22, 53][:rows]),
+        kwargs.pop("protocols", ["tcp", "TCP", "udp"][:rows]),
+        **kwargs
+    )
+
+
+def test_ipv4_round_trip_keeps_every_column():
+    body = _batch(
+        source_ports=[51000, None, 53],
+        payload_sizes=[0, None, 1500],
+        flags=[{"SYN": True, "ACK": True}, None, {}],
+        time_offsets_us=[0, 250, 1_000_000],
+        base_time=1_700_000_000.0,
+        batch_id=42
+    )
+    batch = decode_columnar_batch(body)
+
+    assert (len(batch), batch.ip_width, batch.batch_id) == (3, 4, 42)
+    assert batch.ip_strings("source_ip") == SOURCES
+    assert batch.ip_strings("destination_ip") == DESTINATIONS
+    assert batch["destination_port"].tolist() == [443, 22, 53]
+    assert batch["protocol"].tolist() == [0, 0, 1]
+    assert batch["source_port"].tolist() == [51000, 0, 53]
+    assert batch["payload_size"].tolist() == [0, PAYLOAD_ABSENT, 1500]
+    # Un diccionario vacío equivale a no traer banderas
+    assert batch["flags"].tolist() == [FLAGS_PRESENT | 0b11, 0, 0]
+    np.testing.assert_allclose(batch.timestamps(), [1_700_000_000.0, 1_700_000_000.00025, 1_700_000_001.0])
+    # Las columnas son vistas de solo lectura sobre el cuerpo
+    assert not batch["destination_port"].flags.writeable
+    assert validate_columnar_batch(batch).all()
+
+
+def test_ipv6_round_trip_with_trailing_nul_bytes():
+    # Direcciones terminadas en ceros: la columna S16 descarta los bytes nulos finales
+    sources = ["2001:db8::", "::"]
+    destinations = ["fe80::1:0", "2001:db8:0:0:1::"]
+    batch = decode_columnar_batch(_batch(sources, destinations))
+
+    assert batch.ip_width == 16
+    assert batch["source_ip"].tolist() == [bytes.fromhex("20010db8"), b""]
+    assert batch.ip_strings("source_ip") == sources
+    assert batch.ip_strings("destination_ip") == ["fe80::1:0", "2001:db8:0:0:1::"]
+    # take() conserva el relleno de cada fila
+    assert batch.take(np.array([1])).ip_strings("destination_ip") == ["2001:db8:0:0:1::"]
+
+
+def test_ipv4_in_an_ipv6_batch_is_mapped_and_returned_as_ipv4():
+    batch = decode_columnar_batch(_batch(["10.0.0.1", "2001:db8::1"], ["0.0.0.0", "2001:db8::ff00"]))
+
+    assert batch.ip_width == 16
+    assert batch.ip_strings("source_ip") == ["10.0.0.1", "2001:db8::1"]
+    assert batch.ip_strings("destination_ip") == ["0.0.0.0", "2001:db8::ff00"]
+
+
+def test_rows_with_invalid_port_protocol_or_flags_are_rejected():
+    body = bytearray(_batch(
+        SOURCES * 2,
+        DESTINATIONS * 2,
+        destination_ports=[443, 0, 22, 53, 80, 8080],
+        protocols=["tcp", "tcp", "udp", "icmp", "tcp", "other"],
+        flags=[{"SYN": True}, None, None, None, None, None]
+    ))
+    batch = decode_columnar_batch(body)
+    # Se escriben a mano los valores que encode_columnar_batch no produce
+    batch["protocol"][2] = 4
+    batch["flags"][3] = FLAGS_PRESENT | 0x40
+    batch["flags"][4] = 0x01
+
+    assert validate_columnar_batch(batch).tolist() == [True, False, False, False, False, True]
+
+
+def test_result_round_trip_counts_invalid_and_failed_rows():
+    status = np.array([STATUS_MODEL, STATUS_INVALID, STATUS_ERROR, STATUS_MODEL], dtype=np.uint8)
+    body = encode_columnar_result(
+        7,
+        confidence=np.array([0.9, 0.0, 0.0, 0.25]),
+        prediction=np.array([1, 0, 0, 0]),
+        risk_level=np.array([3, 255, 255, 0]),
+        status=status
+    )
+    result = decode_columnar_result(body)
+
+    assert result["batch_id"] == 7
+    np.testing.assert_allclose(result["confidence"], [0.9, 0.0, 0.0, 0.25], rtol=1e-6)
+    assert result["prediction"].tolist() == [1, 0, 0, 0]
+    assert result["risk_level"].tolist() == [3, 255, 255, 0]
+    assert result["status"].tolist() == status.tolist()
+    assert struct.unpack_from("<II", body, 20) == (1, 1)
+
+
+def test_empty_batch_round_trips():
+    batch = decode_columnar_batch(_batch([], [], destination_ports=[], protocols=[]))
+    assert len(batch) == 0
+    assert validate_columnar_batch(batch).tolist() == []
+
+
+@pytest.mark.parametrize("mutate, message", [
+    (lambda body: body[:20], "cabecera"),
+    (lambda body: b"XXXX" + body[4:], "RSC1"),
+    (lambda body: body[:4] + b"\x02" + body[5:], "Versión"),
+    (lambda body: body[:5] + b"\x08" + body[6:], "Ancho de IP"),
+    (lambda body: body[:-1], "Longitud"),
+    (lambda body: body + b"\x00", "Longitud"),
+])
+def test_malformed_bodies_are_rejected(mutate, message):
+    with pytest.raises(ColumnarFormatError, match=message):
+        decode_columnar_batch(mutate(_batch()))
@@ -0,0 +1,85 @@
+"""
+Pruebas de equivalencia entre ``CompiledForest`` y ``predict_proba`` de scikit-learn.
+"""
+import numpy as np
+import pytest
+from sklearn.datasets import make_classification
+from sklearn.ensemble import ExtraTreesClassifier, GradientBoostingClassifier, RandomForestClassifier
+from sklearn.model_selection import train_test_split
+from sklearn.tree import DecisionTreeClassifier
+
+from app.services.tree_engine import CompiledForest, UnsupportedModelError, probe_features, verify_compiled
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    X, y = make_classification(
+        n_samples=1500, n_features=12, n_informative=6, n_classes=3, random_state=7
+    )
+    return train_test_split(X, y, test_size=0.4, random_state=7)
+
+
+ESTIMATORS = [
+    pytest.param(RandomForestClassifier(n_estimators=25, random_state=0), id="random-forest"),
+    pytest.param(RandomForestClassifier(n_estimators=10, max_depth=4, random_state=0), id="shallow-forest"),
+    pytest.param(ExtraTreesClassifier(n_estimators=25, random_state=0), id="extra-trees"),
+    pytest.param(DecisionTreeClassifier(random_state=0), id="decision-tree"),
+]
+
+
+def _assert_equivalent(engine: CompiledForest, model, X: np.ndarray) -> None:
+    np.testing.assert_allclose(engine.predict_proba(X), model.predict_proba(X), rtol=1e-9, atol=1e-12)
+    predictions, confidences = engine.predict(X)
+    np.testing.assert_array_equal(predictions, model.predict(X))
+    np.testing.assert_allclose(confidences, model.predict_proba(X).max(axis=1), rtol=1e-9, atol=1e-12)
+
+
+@pytest.mark.parametrize("model", ESTIMATORS)
+def test_matches_predict_proba_on_held_out_data(dataset, model):
+    X_train, X_test, y_train, _ = dataset
+    model.fit(X_train, y_train)
+    engine = CompiledForest.from_estimator(model)
+
+    _assert_equivalent(engine, model, X_test)
+    # Filas con valores exactamente en los umbrales, donde una comparación distinta cambiaría la hoja
+    probe = probe_features(engine, n_samples=2000, seed=3)
+    _assert_equivalent(engine, model, probe)
+    assert verify_compiled(engine, model)
+
+
+def test_matches_with_string_labels_and_single_row(dataset):
+    X_train, X_test, y_train, _ = dataset
+    labels = np.array(["benign", "scan", "exfil"])[y_train]
+    model = RandomForestClassifier(n_estimators=15, random_state=1).fit(X_train, labels)
+    engine = CompiledForest.from_estimator(model)
+
+    _assert_equivalent(engine, model, X_test)
+    _assert_equivalent(engine, model, X_test[:1])
+
+
+def test_saved_forest_loaded_with_mmap_is_equivalent(dataset, tmp_path):
+    X_train, X_test, y_train, _ = dataset
+    model = RandomForestClassifier(n_estimators=15, random_state=2).fit(X_train, y_train)
+    CompiledForest.from_estimator(model).save(tmp_path / "forest")
+
+    engine = CompiledForest.load(tmp_path / "forest", mmap_mode="r")
+    assert not engine.threshold.flags.writeable
+    _assert_equivalent(engine, model, X_test)
+
+
+def test_rejects_unsupported_estimators(dataset):
+    X_train, _, y_train, _ = dataset
+    boosting = GradientBoostingClassifier(n_estimators=5, random_state=0).fit(X_train, y_train)
+    with pytest.raises(UnsupportedModelError):
+        CompiledForest.from_estimator(boosting)
+
+    multi_output = RandomForestClassifier(n_estimators=3, random_state=0).fit(X_train, np.c_[y_train, y_train])
+    with pytest.raises(UnsupportedModelError):
+        CompiledForest.from_estimator(multi_output)
+
+
+def test_rejects_wrong_number_of_features(dataset):
+    X_train, X_test, y_train, _ = dataset
+    engine = CompiledForest.from_estimator(DecisionTreeClassifier(random_state=0).fit(X_train, y_train))
+    with pytest.raises(ValueError):
+        engine.predict_proba(X_test[:, :-1])
@@ -0,0 +1,198 @@
+"""
+Pruebas de la lectura de capturas PCAP/PCAPNG y de la agregación en flujos:
+registros truncados, snaplen corto, IPv6, fragmentos y cierre de flujos.
+"""
+import socket
+import struct
+
+import pytest
+
+from app.services.pcap import (
+    LINKTYPE_ETHERNET,
+    FlowAggregator,
+    Packet,
+    PcapFormatError,
+    PcapReader,
+    PcapStats,
+    iter_capture_inputs,
+    parse_packet,
+)
+
+SYN, ACK, FIN, RST = 0x02, 0x10, 0x01, 0x04
+
+
+def _ethernet(payload: bytes, ethertype: int = 0x0800) -> bytes:
+    return b"\x02" * 12 + struct.pack(">H", ethertype) + payload
+
+
+def _ipv4(source: str, destination: str, proto: int, l4: bytes, fragment: int = 0) -> bytes:
+    header = struct.pack(
+        ">BBHHHBBH4s4s", 0x45, 0, 20 + len(l4), 0, fragment, 64, proto, 0,
+        socket.inet_aton(source), socket.inet_aton(destination)
+    )
+    return header + l4
+
+
+def _ipv6(source: str, destination: str, proto: int, l4: bytes) -> bytes:
+    header = struct.pack(
+        ">IHBB16s16s", 6 << 28, len(l4), proto, 64,
+        socket.inet_pton(socket.AF_INET6, source), socket.inet_pton(socket.AF_INET6, destination)
+    )
+    return header + l4
+
+
+def _tcp(source_port: int, destination_port: int, flags: int, payload: bytes = b"") -> bytes:
+    return struct.pack(">HHIIBBHHH", source_port, destination_port, 0, 0, 5 << 4, flags, 0, 0, 0) + payload
+
+
+def _udp(source_port: int, destination_port: int, payload: bytes = b"") -> bytes:
+    return struct.pack(">HHHH", source_port, destination_port, 8 + len(payload), 0) + payload
+
+
+# (segundos, trama Ethernet)
+PACKETS = [
+    # Sesión TCP completa: se entrega al ver FIN en ambas direcciones
+    (1.0, _ethernet(_ipv4("10.0.0.1", "10.0.0.3", 6, _tcp(50000, 443, SYN)))),
+    (1.1, _ethernet(_ipv4("10.0.0.3", "10.0.0.1", 6, _tcp(443, 50000, SYN | ACK)))),
+    (1.2, _ethernet(_ipv4("10.0.0.1", "10.0.0.3", 6, _tcp(50000, 443, ACK, b"x" * 100)))),
+    (1.3, _ethernet(_ipv4("10.0.0.3", "10.0.0.1", 6, _tcp(443, 50000, ACK, b"y" * 40)))),
+    (1.4, _ethernet(_ipv4("10.0.0.1", "10.0.0.3", 6, _tcp(50000, 443, FIN | ACK)))),
+    (1.5, _ethernet(_ipv4("10.0.0.3", "10.0.0.1", 6, _tcp(443, 50000, FIN | ACK)))),
+    # Barrido SYN sin respuesta: un flujo por puerto
+    (2.0, _ethernet(_ipv4("192.0.2.9", "10.0.0.2", 6, _tcp(40000, 22, SYN)))),
+    (2.1, _ethernet(_ipv4("192.0.2.9", "10.0.0.2", 6, _tcp(40000, 80, SYN)))),
+    # UDP sobre IPv6
+    (3.0, _ethernet(_ipv6("2001:db8::1", "2001:db8::53", 17, _udp(5353, 53, b"q" * 30)), ethertype=0x86DD)),
+    # ARP: enlace sin IP, se descarta
+    (3.5, _ethernet(b"\x00" * 28, ethertype=0x0806)),
+    # Fragmento IPv4 que no es el primero: sin cabecera de capa 4
+    (4.0, _ethernet(_ipv4("10.0.0.7", "10.0.0.8", 17, b"\x00" * 16, fragment=185))),
+]
+
+
+def _pcap(packets, snaplen: int = 65535, truncate_last: bool = True) -> bytes:
+    body = struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, snaplen, LINKTYPE_ETHERNET)
+    for seconds, frame in packets:
+        captured = frame[:snaplen]
+        body += struct.pack("<IIII", int(seconds), round(seconds % 1 * 1e6), len(captured), len(frame)) + captured
+    if truncate_last:
+        # Registro cortado a mitad (captura interrumpida): se ignora
+        frame = packets[0][1]
+        body += struct.pack("<IIII", 9, 0, len(frame), len(frame)) + frame[:10]
+    return body
+
+
+def _block(block_type: int, body: bytes) -> bytes:
+    body += b"\x00" * (-len(body) % 4)
+    return struct.pack("<II", block_type, len(body) + 12) + body + struct.pack("<I", len(body) + 12)
+
+
+def _pcapng(packets) -> bytes:
+    section = _block(0x0A0D0D0A, struct.pack("<IHHq", 0x1A2B3C4D, 1, 0, -1))
+    # if_tsresol = 9: marcas de tiempo en nanosegundos
+    options = struct.pack("<HHB3x", 9, 1, 9) + struct.pack("<HH", 0, 0)
+    interface = _block(1, struct.pack("<HHI", LINKTYPE_ETHERNET, 0, 0) + options)
+    body = section + interface
+    for seconds, frame in packets:
+        stamp = round(seconds * 1e9)
+        body += _block(6, struct.pack("<IIIII", 0, stamp >> 32, stamp & 0xFFFFFFFF, len(frame), len(frame)) + frame)
+    # Bloque cuyo tamaño declarado excede el archivo
+    body += struct.pack("<II", 6, 64) + b"\x00" * 20
+    return body
+
+
+@pytest.fixture(params=["pcap", "pcapng"])
+def capture(request, tmp_path):
+    path = tmp_path / f"captura.{request.param}"
+    path.write_bytes(_pcap(PACKETS) if request.param == "pcap" else _pcapng(PACKETS))
+    return path
+
+
+def test_reader_skips_the_truncated_record(capture):
+    with PcapReader(capture) as reader:
+        frames = list(reader.frames())
+    assert reader.format == capture.suffix[1:]
+    assert len(frames) == len(PACKETS)
+    assert [round(timestamp, 6) for timestamp, *_ in frames] == [seconds for seconds, _ in PACKETS]
+
+
+def test_capture_is_aggregated_into_flows(capture):
+    stats = PcapStats()
+    batches = list(iter_capture_inputs(capture, batch_size=2, stats=stats))
+    flows = {(item.source_ip, item.destination_port): item for batch in batches for item in batch}
+
+    assert [len(batch) for batch in batches] == [2, 2]
+    assert (stats.packets, stats.ip_packets, stats.skipped, stats.fragments, stats.flows) == (11, 10, 1, 1, 4)
+    assert sorted(item.request_id for batch in batches for item in batch) == [f"captura-flow-{n}" for n in range(4)]
+
+    session = flows[("10.0.0.1", 443)]
+    assert (session.source_port, session.protocol, session.payload_size) == (50000, "tcp", 100)
+    assert session.additional_metadata["packets"] == 3
+    assert (session.additional_metadata["reverse_packets"], session.additional_metadata["reverse_bytes"]) == (3, 40)
+    assert session.additional_metadata["duration"] == pytest.approx(0.5)
+    assert session.flags["SYN"] and session.flags["FIN"] and session.flags["ACK"]
+
+    scan = flows[("192.0.2.9", 22)]
+    assert scan.flags == {"FIN": False, "SYN": True, "RST": False, "PSH": False, "ACK": False, "URG": False}
+    assert ("192.0.2.9", 80) in flows
+
+    dns = flows[("2001:db8::1", 53)]
+    assert (dns.protocol, dns.source_port, dns.payload_size, dns.flags) == ("udp", 5353, 30, None)
+
+
+def test_payload_size_comes_from_headers_with_short_snaplen(tmp_path):
+    path = tmp_path / "snaplen.pcap"
+    path.write_bytes(_pcap(PACKETS[2:3], snaplen=64, truncate_last=False))
+    with PcapReader(path) as reader:
+        (timestamp, linktype, offset, captured, original), = reader.frames()
+        packet = parse_packet(reader.buffer, timestamp, linktype, offset, captured)
+
+    assert (captured, original) == (64, 14 + 20 + 20 + 100)
+    assert packet == Packet(1.2, "10.0.0.1", "10.0.0.3", 50000, 443, "tcp", 100, ACK)
+
+
+def test_packet_truncated_inside_the_headers_is_skipped():
+    frame = _ethernet(_ipv4("10.0.0.1", "10.0.0.3", 6, _tcp(50000, 443, SYN)))
+    stats = PcapStats()
+    assert parse_packet(frame, 0.0, LINKTYPE_ETHERNET, 0, 14 + 20 + 10, stats) is None
+    assert parse_packet(frame, 0.0, LINKTYPE_ETHERNET, 0, 14 + 12, stats) is None
+    assert stats.skipped == 2
+
+
+@pytest.mark.parametrize("content, message", [(b"", "vacía"), (b"no es una captura", "PCAP ni PCAPNG")])
+def test_invalid_files_are_rejected(tmp_path, content, message):
+    path = tmp_path / "invalida.pcap"
+    path.write_bytes(content)
+    with pytest.raises(PcapFormatError, match=message):
+        PcapReader(path)
+
+
+def _packet(timestamp: float, source_port: int, flags: int = SYN) -> Packet:
+    return Packet(timestamp, "192.0.2.9", "10.0.0.2", source_port, 22, "tcp", 0, flags)
+
+
+def test_aggregator_expires_idle_flows_and_evicts_beyond_the_limit():
+    stats = PcapStats()
+    aggregator = FlowAggregator(idle_timeout=10.0, active_timeout=60.0, max_flows=2, stats=stats)
+    assert aggregator.add(_packet(0.0, 1)) == []
+    assert aggregator.add(_packet(1.0, 2)) == []
+    # Tercer flujo activo: se entrega el menos reciente
+    evicted = aggregator.add(_packet(2.0, 3))
+    assert [flow.source_port for flow in evicted] == [1]
+    assert stats.evicted_flows == 1
+    # Un paquete 10 s después cierra por inactividad los flujos anteriores
+    expired = aggregator.add(_packet(12.5, 4))
+    assert [flow.source_port for flow in expired] == [2, 3]
+    assert stats.evicted_flows == 1
+    assert [flow.source_port for flow in aggregator.flush()] == [4]
+
+
+def test_aggregator_splits_long_flows_and_closes_on_reset():
+    aggregator = FlowAggregator(idle_timeout=100.0, active_timeout=5.0)
+    aggregator.add(_packet(0.0, 1))
+    aggregator.add(_packet(3.0, 1))
+    split = aggregator.add(_packet(5.0, 1))
+    assert [(flow.first_seen, flow.packets) for flow in split] == [(0.0, 2)]
+    reset = aggregator.add(Packet(5.5, "10.0.0.2", "192.0.2.9", 22, 1, "tcp", 0, RST | ACK))
+    assert [(flow.packets, flow.reverse_packets) for flow in reset] == [(1, 1)]
+    assert len(aggregator) == 0
@@ -0,0 +1,289 @@
+"""
+Pruebas de la persistencia write-behind contra SQLite: escritura por lotes,
+desborde a disco con la base caída, reinserción al recuperarse y registro de
+los caminos de análisis distintos de ``/analyze``.
+"""
+import itertools
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.schemas.mcp import ModelInput, ModelOutput, ThreatLevel
+from app.services import persistence
+from app.services.columnar import (
+    STATUS_CIDR,
+    STATUS_ERROR,
+    STATUS_INVALID,
+    STATUS_MODEL,
+    decode_columnar_batch,
+    encode_columnar_batch,
+)
+from app.services.ml_service import ml_service
+from app.services.persistence import PendingPrediction, PersistenceWriter, SqliteSink, persist_columnar
+
+
+class FlakySink(SqliteSink):
+    """SqliteSink que falla mientras ``down`` es True."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.down = False
+
+    def write(self, rows):
+        if self.down:
+            raise sqlite3.OperationalError("database is locked")
+        super().write(rows)
+
+
+def _pending(index: int, failed: bool = False) -> PendingPrediction:
+    input_data = ModelInput(
+        request_id=f"req-{index}",
+        source_ip="10.0.0.1",
+        destination_ip="10.0.0.2",
+        destination_port=443,
+        protocol="tcp"
+    )
+    if failed:
+        return PendingPrediction(input_data, None, "testclient", 1.0, error="fallo")
+    output = ModelOutput(
+        request_id=input_data.request_id,
+        prediction=1,
+        confidence=0.9,
+        risk_level=ThreatLevel.HIGH,
+        explanation="prueba"
+    )
+    return PendingPrediction(input_data, output, "192.0.2.7", 2.4)
+
+
+def _count(path: str, table: str) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def _wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "la condición no se cumplió a tiempo"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "predictions.db")
+
+
+def test_writes_predictions_and_audit_in_batches(db_path):
+    writer = PersistenceWriter(SqliteSink(db_path), batch_size=4, flush_interval_ms=10)
+    writer.start()
+    for index in range(9):
+        assert writer.enqueue(_pending(index, failed=index == 8))
+    writer.close()
+
+    assert writer.written == 9
+    assert _count(db_path, "predictions") == 9
+    assert _count(db_path, "audit_log") == 9
+    with sqlite3.connect(db_path) as conn:
+        statuses = dict(conn.execute("SELECT status, COUNT(*) FROM predictions GROUP BY status").fetchall())
+        ips = {row[0] for row in conn.execute("SELECT ip_address FROM audit_log")}
+    assert statuses == {"completed": 8, "failed": 1}
+    # "testclient" no es una IP válida para la columna
+    assert ips == {"192.0.2.7", None}
+
+
+def test_spills_while_database_is_down_and_replays_on_recovery(db_path, tmp_path):
+    spill_dir = str(tmp_path / "spill")
+    sink = FlakySink(db_path)
+    sink.down = True
+    writer = PersistenceWriter(
+        sink,
+        batch_size=5,
+        flush_interval_ms=10,
+        overflow_policy="spill",
+        spill_dir=spill_dir,
+        retry_max_seconds=0.05
+    )
+    writer.start()
+    for index in range(20):
+        writer.enqueue(_pending(index))
+    _wait_for(lambda: writer.spilled == 20)
+    assert writer.written == 0
+    assert writer.failures >= 1
+
+    sink.down = False
+    _wait_for(lambda: writer.replayed == 20)
+    writer.close()
+
+    assert _count(db_path, "predictions") == 20
+    assert writer.dropped == 0
+    assert os.listdir(spill_dir) == []
+
+
+def test_spill_on_close_is_replayed_by_the_next_writer(db_path, tmp_path):
+    spill_dir = str(tmp_path / "spill")
+    sink = FlakySink(db_path)
+    sink.down = True
+    writer = PersistenceWriter(sink, batch_size=3, flush_interval_ms=10, overflow_policy="spill", spill_dir=spill_dir)
+    writer.start()
+    for index in range(7):
+        writer.enqueue(_pending(index))
+    writer.close()
+    assert writer.spilled == 7
+    assert len(writer._spill_files()) == 1
+
+    writer = PersistenceWriter(SqliteSink(db_path), batch_size=3, flush_interval_ms=10, overflow_policy="spill", spill_dir=spill_dir)
+    writer.start()
+    _wait_for(lambda: writer.replayed == 7)
+    writer.close()
+    assert _count(db_path, "predictions") == 7
+    assert writer._spill_files() == []
+
+
+def test_drop_policy_keeps_the_queue_and_discards_new_records_when_full(db_path):
+    sink = FlakySink(db_path)
+    sink.down = True
+    writer = PersistenceWriter(sink, queue_size=6, batch_size=2, flush_interval_ms=10, retry_max_seconds=0.05)
+    accepted = [writer.enqueue(_pending(index)) for index in range(10)]
+    assert accepted == [True] * 6 + [False] * 4
+    assert writer.dropped == 4
+
+    writer.start()
+    _wait_for(lambda: writer.failures >= 2)
+    assert writer.written == 0
+
+    sink.down = False
+    _wait_for(lambda: writer.queue_depth == 0)
+    writer.close()
+    assert _count(db_path, "predictions") == 6
+
+
+def test_backoff_sleep_is_clamped_when_the_retry_deadline_passes(db_path, monkeypatch):
+    writer = PersistenceWriter(SqliteSink(db_path), batch_size=1)
+    writer.enqueue(_pending(0))
+    writer._retry_at = 1.0
+    # _backing_off() ve el plazo pendiente; al calcular la espera ya venció
+    clock = itertools.chain([0.0], itertools.repeat(2.0))
+    monkeypatch.setattr(persistence.time, "monotonic", lambda: next(clock))
+    sleeps = []
+    monkeypatch.setattr(persistence.time, "sleep", sleeps.append)
+
+    assert writer._step()
+    assert sleeps == [0.0]
+    assert writer.queue_depth == 1
+
+
+def test_writer_thread_survives_unexpected_errors(db_path, monkeypatch):
+    prepare_row = persistence.prepare_row
+    calls = []
+
+    def failing_once(pending):
+        calls.append(pending)
+        if len(calls) == 1:
+            raise RuntimeError("error inesperado")
+        return prepare_row(pending)
+
+    monkeypatch.setattr(persistence, "prepare_row", failing_once)
+    writer = PersistenceWriter(SqliteSink(db_path), batch_size=1, flush_interval_ms=10)
+    writer.start()
+    writer.enqueue(_pending(0))
+    _wait_for(lambda: writer.last_error == "error inesperado")
+    writer.enqueue(_pending(1))
+    _wait_for(lambda: writer.written == 1)
+    assert writer._thread.is_alive()
+    writer.close()
+    assert _count(db_path, "predictions") == 1
+
+
+class RecordingWriter:
+    """Escritor que solo guarda lo encolado."""
+
+    def __init__(self):
+        self.pending = []
+
+    def enqueue(self, pending):
+        self.pending.append(pending)
+        return True
+
+
+@pytest.fixture
+def recording(monkeypatch):
+    recorder = RecordingWriter()
+    monkeypatch.setattr(persistence, "writer", recorder)
+    return recorder
+
+
+def test_websocket_persists_results_and_failures(recording, monkeypatch):
+    async def analyze_threat(input_data, rules_only=False):
+        if input_data.request_id == "ws-fail":
+            raise RuntimeError("modelo caído")
+        suppressed = input_data.request_id == "ws-suppressed"
+        return ModelOutput(
+            request_id=input_data.request_id,
+            prediction=1,
+            confidence=0.8,
+            risk_level=ThreatLevel.HIGH,
+            explanation="prueba",
+            metadata={"incident": {"suppressed": suppressed}}
+        )
+
+    monkeypatch.setattr(ml_service, "analyze_threat", analyze_threat)
+    monkeypatch.setattr(settings, "INCIDENT_SUPPRESS_PERSISTENCE", True)
+    client = TestClient(app)
+    with client.websocket_connect(f"/api/v1/ws/analyze?api_key={settings.API_KEYS['default']}") as websocket:
+        for request_id in ("ws-ok", "ws-fail", "ws-suppressed"):
+            websocket.send_text(json.dumps({
+                "request_id": request_id,
+                "source_ip": "10.0.0.1",
+                "destination_ip": "10.0.0.2",
+                "destination_port": 443,
+                "protocol": "tcp"
+            }))
+            websocket.receive_text()
+
+    persisted = {pending.input_data.request_id: pending for pending in recording.pending}
+    assert set(persisted) == {"ws-ok", "ws-fail"}
+    assert persisted["ws-ok"].output.risk_level == ThreatLevel.HIGH
+    assert persisted["ws-fail"].output is None
+    assert persisted["ws-fail"].error == "modelo caído"
+    assert persisted["ws-ok"].client_ip == "testclient"
+
+
+def test_columnar_batch_persists_valid_rows_with_their_index(recording, monkeypatch):
+    monkeypatch.setattr(settings, "INCIDENT_SUPPRESS_PERSISTENCE", True)
+    batch = decode_columnar_batch(encode_columnar_batch(
+        ["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.4", "2001:db8::5"],
+        ["10.0.1.1", "10.0.1.2", "10.0.1.3", "10.0.1.4", "10.0.1.5"],
+        [443, 0, 22, 80, 53],
+        ["tcp", "tcp", "tcp", "udp", "udp"],
+        source_ports=[5000, None, None, None, 53],
+        payload_sizes=[10, None, None, 0, None],
+        flags=[{"SYN": True}, None, None, None, None],
+        base_time=1_700_000_000.0,
+        batch_id=9
+    ))
+    result = {
+        "prediction": np.array([1, 0, 0, 1, 0], dtype=np.uint8),
+        "confidence": np.array([0.9, 0.0, 1.0, 0.7, 0.6], dtype=np.float32),
+        "risk_level": np.array([3, 0, 0, 2, 0], dtype=np.uint8),
+        "status": np.array([STATUS_MODEL, STATUS_INVALID, STATUS_CIDR, STATUS_MODEL, STATUS_ERROR], dtype=np.uint8),
+        "suppressed": np.array([False, False, False, True, False])
+    }
+
+    persist_columnar(batch, result, "col", "192.0.2.7", 3.0)
+
+    persisted = {pending.input_data.request_id: pending for pending in recording.pending}
+    assert set(persisted) == {"col-0", "col-2", "col-4"}
+    first = persisted["col-0"]
+    assert (first.input_data.source_port, first.input_data.payload_size) == (5000, 10)
+    assert first.input_data.flags["SYN"] and not first.input_data.flags["FIN"]
+    assert first.output.risk_level == ThreatLevel.CRITICAL
+    assert first.output.metadata == {"batch_id": 9, "batch_index": 0, "decision": "model"}
+    assert persisted["col-2"].output.metadata["decision"] == "cidr"
+    assert persisted["col-4"].output is None and persisted["col-4"].error
+    assert persisted["col-4"].input_data.source_ip == "2001:db8::5"
@@ -0,0 +1,211 @@
+"""
+Pruebas de la caché de predicciones: agrupación de fallos concurrentes idénticos,
+propagación de errores y cancelaciones, expulsión LRU/TTL y claves canónicas.
+"""
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.schemas.mcp import ModelInput
+from app.services import prediction_cache
+from app.services.cascade import ModelCascade, ModelStage
+from app.services.features import DEFAULT_FEATURE_SPEC
+from app.services.prediction_cache import PredictionCache
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class SlowModel:
+    """Cálculo que cuenta sus llamadas y termina cuando se libera ``gate``."""
+
+    def __init__(self, result=(1, 0.9, {"execution_ms": 1.0})):
+        self.calls = 0
+        self.result = result
+        self.gate = asyncio.Event()
+
+    async def compute(self):
+        self.calls += 1
+        await self.gate.wait()
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def test_concurrent_identical_misses_compute_once():
+    async def scenario():
+        cache = PredictionCache()
+        model = SlowModel()
+        key = cache.key("m:v1", np.array([1.0, 2.0]))
+        tasks = [asyncio.create_task(cache.get_or_compute(key, model.compute)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert cache.stats()["in_flight"] == 1
+        model.gate.set()
+        results = await asyncio.gather(*tasks)
+        # Ya en la caché: no se vuelve a calcular
+        again = await cache.get_or_compute(key, model.compute)
+        return cache, model, results, again
+
+    cache, model, results, again = _run(scenario())
+    assert model.calls == 1
+    assert sorted(status for _, status in results) == ["coalesced"] * 4 + ["miss"]
+    assert all(value == (1, 0.9, {"execution_ms": 1.0}) for value, _ in results)
+    assert again == ((1, 0.9, prediction_cache.CACHE_HIT_TIMING), "hit")
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"], stats["in_flight"]) == (1, 4, 1, 0)
+    assert stats["saved_rate"] == pytest.approx(5 / 6)
+
+
+def test_failure_reaches_every_waiter_and_is_not_cached():
+    async def scenario():
+        cache = PredictionCache()
+        model = SlowModel(result=RuntimeError("modelo caído"))
+        key = cache.key("m:v1", np.array([1.0]))
+        tasks = [asyncio.create_task(cache.get_or_compute(key, model.compute)) for _ in range(3)]
+        await asyncio.sleep(0)
+        model.gate.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return cache, model, results
+
+    cache, model, results = _run(scenario())
+    assert model.calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(cache) == 0 and cache.stats()["in_flight"] == 0
+
+
+def test_waiters_recompute_when_the_original_request_is_cancelled():
+    async def scenario():
+        cache = PredictionCache()
+        model = SlowModel()
+        key = cache.key("m:v1", np.array([3.0]))
+        owner = asyncio.create_task(cache.get_or_compute(key, model.compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_compute(key, model.compute))
+        await asyncio.sleep(0)
+        owner.cancel()
+        await asyncio.sleep(0)
+        model.gate.set()
+        return model, await waiter, owner.cancelled()
+
+    model, (value, status), owner_cancelled = _run(scenario())
+    assert owner_cancelled
+    assert model.calls == 2
+    assert (value[:2], status) == ((1, 0.9), "miss")
+
+
+def test_cancelling_a_waiter_does_not_cancel_the_shared_computation():
+    async def scenario():
+        cache = PredictionCache()
+        model = SlowModel()
+        key = cache.key("m:v1", np.array([4.0]))
+        owner = asyncio.create_task(cache.get_or_compute(key, model.compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_compute(key, model.compute))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        model.gate.set()
+        return model, await owner
+
+    model, (_, status) = _run(scenario())
+    assert (model.calls, status) == (1, "miss")
+
+
+class GatedExecutor:
+    """Ejecutor de prueba que cuenta las filas predichas y espera a ``gate``."""
+
+    def __init__(self):
+        self.rows = []
+        self.gate = asyncio.Event()
+
+    async def run(self, features):
+        self.rows.append(len(features))
+        await self.gate.wait()
+        return (np.ones(len(features), dtype=np.int64), np.full(len(features), 0.9)), {"queue_wait_ms": 0.0, "execution_ms": 1.0}
+
+
+def _input(port):
+    return ModelInput(
+        request_id=f"r-{port}",
+        source_ip="10.0.0.1",
+        destination_ip="10.0.0.2",
+        destination_port=port,
+        protocol="tcp"
+    )
+
+
+def test_batch_rows_join_in_flight_single_row_computations():
+    async def scenario():
+        cache = PredictionCache()
+        executor = GatedExecutor()
+        stage = ModelStage("m", None, DEFAULT_FEATURE_SPEC, None, executor, cache=cache, version="v1")
+        cascade = ModelCascade([stage])
+        single = asyncio.create_task(stage.predict_row(stage.extractor.transform([_input(443)])))
+        await asyncio.sleep(0)
+        batch = asyncio.create_task(cascade.predict_many([_input(443), _input(22), _input(443)]))
+        await asyncio.sleep(0)
+        # Una fila individual del lote en curso también espera al lote
+        other = asyncio.create_task(stage.predict_row(stage.extractor.transform([_input(22)])))
+        await asyncio.sleep(0)
+        executor.gate.set()
+        return cache, executor, await single, await batch, await other
+
+    cache, executor, single, batch, other = _run(scenario())
+    assert executor.rows == [1, 1]
+    assert single[2]["cache"] == "miss" and other[2]["cache"] == "coalesced"
+    assert batch.cache_status.tolist() == ["coalesced", "miss", "coalesced"]
+    assert batch.predictions.tolist() == [1, 1, 1] and not batch.errors
+    assert cache.stats()["in_flight"] == 0 and len(cache) == 2
+
+
+def test_batch_recomputes_rows_whose_shared_computation_was_cancelled():
+    async def scenario():
+        cache = PredictionCache()
+        executor = GatedExecutor()
+        stage = ModelStage("m", None, DEFAULT_FEATURE_SPEC, None, executor, cache=cache, version="v1")
+        single = asyncio.create_task(stage.predict_row(stage.extractor.transform([_input(443)])))
+        await asyncio.sleep(0)
+        batch = asyncio.create_task(ModelCascade([stage]).predict_many([_input(443)]))
+        await asyncio.sleep(0)
+        single.cancel()
+        await asyncio.sleep(0)
+        executor.gate.set()
+        return cache, executor, await batch
+
+    cache, executor, batch = _run(scenario())
+    assert executor.rows == [1, 1]
+    assert (batch.cache_status.tolist(), batch.errors) == (["miss"], {})
+    assert cache.stats()["in_flight"] == 0 and len(cache) == 1
+
+
+def test_keys_are_canonical_and_namespaced():
+    key = PredictionCache.key("m:v1", np.array([0.0, 1.5], dtype=np.float64))
+    assert PredictionCache.key("m:v1", np.array([-0.0, 1.5], dtype=np.float32)) == key
+    assert PredictionCache.key("m:v1", np.array([[0.0], [1.5]])) == key
+    assert PredictionCache.key("m:v2", np.array([0.0, 1.5])) != key
+
+
+def test_entries_expire_and_are_evicted_least_recently_used(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(prediction_cache.time, "monotonic", lambda: now[0])
+    cache = PredictionCache(max_entries=2, ttl_seconds=10.0)
+    cache.put(b"a", (1, 0.9))
+    cache.put(b"b", (0, 0.8))
+    assert cache.get(b"a") == (1, 0.9)
+    # "a" se usó más recientemente: al llenarse se expulsa "b"
+    cache.put(b"c", (1, 0.7))
+    assert (cache.get(b"b"), cache.get(b"a")) == (None, (1, 0.9))
+    now[0] += 10.0
+    assert cache.get(b"a") is None
+    stats = cache.stats()
+    assert (stats["evicted_capacity"], stats["evicted_ttl"], stats["entries"]) == (1, 1, 1)
+
+
+def test_memory_bound_limits_entries():
+    cache = PredictionCache(max_entries=1000, max_bytes=3 * (8 + prediction_cache._ENTRY_BYTES))
+    for index in range(5):
+        cache.put(b"%08d" % index, (0, 0.5))
+    assert len(cache) == 3
+    assert cache.stats()["estimated_bytes"] <= cache.max_bytes
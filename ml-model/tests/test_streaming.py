@@ -0,0 +1,182 @@
+"""
+Pruebas de la ingesta NDJSON: líneas partidas entre fragmentos, líneas que
+superan el máximo, micro-lotes con contrapresión y errores del flujo.
+"""
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api import endpoints
+from app.core.config import settings
+from app.main import app
+from app.schemas.mcp import ModelOutput, ThreatLevel
+from app.services.ml_service import ml_service
+from app.services.streaming import LineTooLongError, iter_ndjson_lines, stream_micro_batches
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def _chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def _lines(*chunks, max_line_bytes=8):
+    async def collect():
+        return [
+            "demasiado larga" if isinstance(line, LineTooLongError) else line
+            async for line in iter_ndjson_lines(_chunks(*chunks), max_line_bytes)
+        ]
+    return _run(collect())
+
+
+@pytest.mark.parametrize("chunks", [
+    [b"uno\ndos\ntres\n"],
+    [b"uno\nd", b"os\ntr", b"es"],
+    [b"u", b"n", b"o", b"\n", b"dos\n", b"tres"],
+    [b"uno\n", b"", b"dos\ntres\n", b""],
+])
+def test_lines_split_across_chunks_are_rejoined(chunks):
+    assert _lines(*chunks) == [b"uno", b"dos", b"tres"]
+
+
+def test_blank_lines_and_carriage_returns_are_kept_for_the_parser():
+    assert _lines(b"a\r\n\n", b"\nb") == [b"a\r", b"", b"", b"b"]
+
+
+@pytest.mark.parametrize("chunks, expected", [
+    # Exactamente en el límite se acepta; un byte más no
+    ([b"12345678\n123456789\nok\n"], [b"12345678", "demasiado larga", b"ok"]),
+    # La línea larga se completa en otro fragmento sin superar el límite en ninguno
+    ([b"ok\n12345", b"6789\nfin"], [b"ok", "demasiado larga", b"fin"]),
+    # Se descarta a lo largo de varios fragmentos hasta el salto de línea
+    ([b"0123456789", b"abcdefghij", b"klm\nfin\n"], ["demasiado larga", b"fin"]),
+    # Línea larga al final del cuerpo, sin salto de línea
+    ([b"ok\n", b"0123456789"], [b"ok", "demasiado larga"]),
+])
+def test_oversize_lines_are_reported_and_skipped(chunks, expected):
+    assert _lines(*chunks) == expected
+
+
+def test_micro_batches_respect_size_and_window():
+    async def slow_items():
+        for item in range(5):
+            yield item
+        await asyncio.sleep(0.1)
+        yield 5
+
+    async def collect():
+        return [batch async for batch in stream_micro_batches(slow_items(), batch_size=2, window_ms=20, max_pending=10)]
+
+    assert _run(collect()) == [[0, 1], [2, 3], [4], [5]]
+
+
+def test_micro_batches_deliver_read_items_before_the_reader_error():
+    async def failing_items():
+        yield 1
+        yield 2
+        raise ConnectionError("cuerpo interrumpido")
+
+    async def collect(batches):
+        async for batch in stream_micro_batches(failing_items(), batch_size=10, window_ms=10, max_pending=10):
+            batches.append(batch)
+
+    batches = []
+    with pytest.raises(ConnectionError):
+        _run(collect(batches))
+    assert batches == [[1, 2]]
+
+
+def test_reader_stops_when_pending_items_reach_the_limit():
+    read = []
+
+    async def items():
+        for item in range(100):
+            read.append(item)
+            yield item
+
+    async def first_batch():
+        batches = stream_micro_batches(items(), batch_size=2, window_ms=0, max_pending=4)
+        batch = await batches.__anext__()
+        await asyncio.sleep(0.05)
+        await batches.aclose()
+        return batch
+
+    assert _run(first_batch()) == [0, 1]
+    # Lote entregado + cola llena + el elemento que el lector espera encolar
+    assert len(read) <= 2 + 4 + 1
+
+
+def _record(index):
+    return {
+        "request_id": f"s-{index}",
+        "source_ip": "10.0.0.1",
+        "destination_ip": "10.0.0.2",
+        "destination_port": 443,
+        "protocol": "tcp"
+    }
+
+
+@pytest.fixture
+def stream_client(monkeypatch):
+    async def analyze_batch(inputs, rules_only=False):
+        return [
+            ModelOutput(
+                request_id=item.request_id,
+                prediction=0,
+                confidence=0.9,
+                risk_level=ThreatLevel.LOW,
+                explanation="prueba"
+            )
+            for item in inputs
+        ]
+
+    monkeypatch.setattr(ml_service, "analyze_batch", analyze_batch)
+    monkeypatch.setattr(settings, "STREAM_MAX_LINE_BYTES", 512)
+    return TestClient(app)
+
+
+def _post_stream(client, body):
+    response = client.post(
+        "/api/v1/analyze/stream",
+        content=body,
+        headers={"X-API-Key": settings.API_KEYS["default"], "Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_stream_answers_each_line_in_order(stream_client):
+    body = "\n".join([
+        json.dumps(_record(0)),
+        "{no es json",
+        "",
+        json.dumps({**_record(2), "padding": "x" * 600}),
+        json.dumps(_record(3))
+    ]).encode()
+    lines = _post_stream(stream_client, body)
+
+    assert [line.get("request_id") for line in lines] == ["s-0", None, None, "s-3"]
+    assert lines[0]["metadata"]["stream_index"] == 0
+    assert lines[1]["index"] == 1 and "JSON inválido" in lines[1]["error"]
+    assert lines[2]["index"] == 2 and "máximo de 512 bytes" in lines[2]["error"]
+    assert lines[3]["metadata"]["stream_index"] == 3
+
+
+def test_stream_ends_with_an_error_line_on_service_failures(stream_client, monkeypatch):
+    validate_record = endpoints._validate_record
+
+    def failing(record, index, request_id):
+        if index == 1:
+            raise RuntimeError("fallo inesperado")
+        return validate_record(record, index, request_id)
+
+    monkeypatch.setattr(endpoints, "_validate_record", failing)
+    lines = _post_stream(stream_client, "\n".join(json.dumps(_record(i)) for i in range(3)).encode())
+
+    assert lines[0]["request_id"] == "s-0"
+    assert lines[-1] == {"error": "Error al procesar el flujo: fallo inesperado", "records": 1}
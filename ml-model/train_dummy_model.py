@@ -1,14 +1,29 @@
 # ml-model/train_dummy_model.py
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.tree import DecisionTreeClassifier
 import numpy as np
 import joblib
+import json
 import os
 
 print("Entrenando modelo de ejemplo...")
 
+# Especificación de características que acompaña al modelo (models/dummy_model.features.json)
+feature_spec = {
+    "version": 1,
+    "features": [
+        {"name": "source_port", "source": "source_port", "default": 0.0},
+        {"name": "destination_port", "source": "destination_port", "default": 0.0},
+        {"name": "protocol", "source": "protocol", "default": 3.0,
+         "encoding": {"tcp": 0.0, "udp": 1.0, "icmp": 2.0, "other": 3.0}},
+        {"name": "payload_size", "source": "payload_size", "default": 0.0},
+        {"name": "ttl", "source": "metadata.ttl", "default": 64.0}
+    ]
+}
+
 # Crear datos de ejemplo
 np.random.seed(42)  # Para resultados reproducibles
-X = np.random.rand(100, 5)  # 100 muestras, 5 características
+X = np.random.rand(100, len(feature_spec["features"]))  # 100 muestras, 5 características
 y = np.random.randint(0, 2, 100)  # Clases binarias (0 o 1)
 
 # Entrenar modelo simple
@@ -19,8 +34,22 @@ model.fit(X, y)
 # Crear carpeta models si no existe
 os.makedirs("models", exist_ok=True)
 
-# Guardar modelo
+# Guardar modelo y su especificación de características
 model_path = "models/dummy_model.pkl"
 joblib.dump(model, model_path)
+with open("models/dummy_model.features.json", "w", encoding="utf-8") as f:
+    json.dump(feature_spec, f, indent=2)
 print(f"✅ Modelo guardado en: {os.path.abspath(model_path)}")
-print("Puedes usar este modelo en tu aplicación con MODEL_PATH='models/dummy_model.pkl'")
\ No newline at end of file
+
+# Etapa barata para la cascada: un árbol poco profundo con las mismas características
+print("Entrenando árbol de primera etapa...")
+fast_model = DecisionTreeClassifier(max_depth=3, random_state=42)
+fast_model.fit(X, y)
+fast_model_path = "models/dummy_model_fast.pkl"
+joblib.dump(fast_model, fast_model_path)
+with open("models/dummy_model_fast.features.json", "w", encoding="utf-8") as f:
+    json.dump(feature_spec, f, indent=2)
+print(f"✅ Etapa de cascada guardada en: {os.path.abspath(fast_model_path)}")
+
+print("Puedes usar este modelo en tu aplicación con MODEL_PATH='models/dummy_model.pkl'")
+print("y la cascada con MODEL_CASCADE_PATHS='[\"models/dummy_model_fast.pkl\"]'")